@@ -2,10 +2,12 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+from services.query_monitor import QueryMonitor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# كل أمر يُنسب للطلب الحالي - عدد الأوامر وزمنها وكشف N+1 (services/query_monitor.py)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[QueryMonitor()])
 db = client[os.environ['DB_NAME']]
@@ -8,10 +8,13 @@ Admin Routes - إدارة النظام
 - التزامن التلقائي
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from database import db
+from services.session_cache import refresh_users
+from services.data_transfer import NdjsonImporter, export_lines, gzip_stream
 from utils.auth import require_roles
 from datetime import datetime, timezone
 from services.hr_policy import (
@@ -22,6 +25,7 @@ from services.hr_policy import (
 from services.auto_sync import auto_sync_database, force_full_sync
 import uuid
 import os
+import zlib
 
 # مفتاح الطوارئ من البيئة
 EMERGENCY_AUTH_KEY = os.environ.get('EMERGENCY_AUTH_KEY', '')
@@ -260,7 +264,7 @@ async def emergency_reset_stas_password(body: ResetStasPasswordRequest):
     
     إذا لم يكن المستخدم موجوداً، سيتم إنشاؤه
     """
-    from utils.auth import hash_password
+    from utils.auth import hash_password_async
     import uuid as uuid_module
     
     # مفتاح الطوارئ
@@ -268,7 +272,7 @@ async def emergency_reset_stas_password(body: ResetStasPasswordRequest):
         raise HTTPException(status_code=403, detail="مفتاح غير صحيح")
     
     # تشفير كلمة المرور
-    new_hash = hash_password("654321")
+    new_hash = await hash_password_async("654321")
     now = datetime.now(timezone.utc).isoformat()
     
     # البحث عن أي مستخدم stas
@@ -290,6 +294,7 @@ async def emergency_reset_stas_password(body: ResetStasPasswordRequest):
                 "is_active": True
             }}
         )
+        await refresh_users({"_id": stas_user["_id"]})
         action = "updated"
     else:
         # إنشاء مستخدم جديد
@@ -598,68 +603,69 @@ async def force_full_sync_endpoint(body: dict):
 # تصدير/استيراد البيانات للتزامن بين البيئات
 # ============================================================
 
+# الجداول التي تُصدَّر للتزامن مع بيئة أخرى
+EXPORT_COLLECTIONS = [
+    "settings", "users", "employees", "contracts_v2",
+    "work_locations", "departments", "positions"
+]
+
+
 @router.get("/export-data")
-async def export_all_data(user=Depends(require_roles('stas'))):
+async def export_all_data(collections: Optional[str] = None, user=Depends(require_roles('stas'))):
     """
-    تصدير جميع البيانات للتزامن مع بيئة أخرى
+    تصدير البيانات للتزامن مع بيئة أخرى - NDJSON مضغوط (gzip) متدفق
+    سطر لكل مستند: {"collection": ..., "doc": {...}} (services.data_transfer)
+    collections: قائمة مفصولة بفواصل (افتراضياً كل جداول التزامن)
     """
-    now = datetime.now(timezone.utc).isoformat()
-    
-    export_data = {
-        "export_timestamp": now,
-        "export_source": "preview",
-        "data": {}
-    }
+    names = [c.strip() for c in collections.split(",") if c.strip()] if collections else EXPORT_COLLECTIONS
+    unknown = [c for c in names if c not in EXPORT_COLLECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"جداول غير مدعومة للتصدير: {', '.join(unknown)}")
     
-    # تصدير الجداول المهمة
-    collections = [
-        "settings", "users", "employees", "contracts_v2", 
-        "work_locations", "departments", "positions"
-    ]
-    
-    for coll_name in collections:
-        try:
-            docs = await db[coll_name].find({}, {"_id": 0}).to_list(1000)
-            export_data["data"][coll_name] = docs
-        except Exception as e:
-            export_data["data"][coll_name] = {"error": str(e)}
+    now = datetime.now(timezone.utc)
+    meta = {"export_timestamp": now.isoformat(), "export_source": "preview"}
     
-    return export_data
+    return StreamingResponse(
+        gzip_stream(export_lines(db, names, meta)),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="export-{now.strftime("%Y%m%d-%H%M%S")}.ndjson.gz"'}
+    )
 
 
 @router.post("/import-data")
-async def import_all_data(body: dict):
+async def import_all_data(request: Request, x_emergency_key: Optional[str] = Header(None)):
     """
-    استيراد البيانات من بيئة أخرى
+    استيراد البيانات من بيئة أخرى - جسم الطلب NDJSON (أو gzip) بصيغة export-data
+    يُقرأ على أجزاء ويُكتب بدفعات upsert بالمعرف (id، والإعدادات بـ type) - الأخطاء لكل سطر
+    المفتاح في الترويسة X-Emergency-Key
     """
-    if body.get("emergency_key") != EMERGENCY_AUTH_KEY:
+    if x_emergency_key != EMERGENCY_AUTH_KEY:
         raise HTTPException(status_code=403, detail="مفتاح غير صحيح")
     
-    import_data = body.get("data", {})
-    if not import_data:
+    now = datetime.now(timezone.utc).isoformat()
+    importer = NdjsonImporter(db, stamp={"imported_at": now})
+    
+    try:
+        async for chunk in request.stream():
+            await importer.feed(chunk)
+        result = await importer.finish()
+    except (ValueError, zlib.error) as e:
+        raise HTTPException(status_code=400, detail=f"ملف غير صالح: {e}")
+    
+    if not result["collections"]:
         raise HTTPException(status_code=400, detail="لا توجد بيانات للاستيراد")
     
-    now = datetime.now(timezone.utc).isoformat()
-    results = {}
-    
-    # استيراد كل collection
-    for coll_name, docs in import_data.items():
-        if isinstance(docs, list) and docs:
-            try:
-                # حذف البيانات القديمة
-                await db[coll_name].delete_many({})
-                # إدراج البيانات الجديدة
-                for doc in docs:
-                    doc["imported_at"] = now
-                await db[coll_name].insert_many(docs)
-                results[coll_name] = {"imported": len(docs)}
-            except Exception as e:
-                results[coll_name] = {"error": str(e)}
+    if "users" in result["collections"]:
+        await refresh_users({})
     
     return {
-        "success": True,
-        "message_ar": "تم استيراد البيانات بنجاح",
-        "results": results,
+        "success": result["error_count"] == 0,
+        "message_ar": "تم استيراد البيانات بنجاح" if result["error_count"] == 0 else "تم الاستيراد مع أخطاء في بعض الأسطر",
+        "results": result["collections"],
+        "lines": result["lines"],
+        "total_written": result["total_written"],
+        "error_count": result["error_count"],
+        "errors": result["errors"],
         "timestamp": now
     }
 
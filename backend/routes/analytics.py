@@ -2,12 +2,19 @@
 Executive Analytics API
 لوحة الحوكمة الذكية - المؤشرات التنفيذية
 تعمل بشكل سنوي: من أول يوم في السنة إلى اليوم الحالي
+اللوحة وأفضل/أسوأ الموظفين والاتجاه الشهري من جدول الحقائق (services/analytics_facts.py)
 """
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Optional, List
 from datetime import datetime, timezone, timedelta
 from database import db
 from utils.auth import get_current_user, require_roles
+from services.analytics_facts import (
+    new_counters, sum_counters, add_attendance, add_task, add_custody, add_request, add_excuse,
+    attendance_score, task_score, financial_score, request_score, excuse_score,
+    health_score, performer_score, employee_totals, month_totals, last_built_at,
+    year_months, recent_months, EXCUSE_TYPES,
+)
 import calendar
 
 router = APIRouter(prefix="/api/analytics", tags=["Executive Analytics"])
@@ -73,31 +80,14 @@ async def calculate_attendance_score(employee_id: str = None, month: str = None,
     if not records:
         return {"score": 0, "present_days": 0, "work_days": 0, "late_minutes": 0, "absent_days": 0, "start_date": start_date, "end_date": end_date}
     
-    # حساب الأيام
-    present_statuses = ["PRESENT", "LATE", "LATE_EXCUSED", "EARLY_LEAVE", "EARLY_EXCUSED", "PERMISSION", "ON_MISSION"]
-    work_statuses = present_statuses + ["ABSENT"]
+    counters = new_counters()
+    for r in records:
+        add_attendance(counters, r)
     
-    work_days = len([r for r in records if r.get('final_status') in work_statuses])
-    present_days = len([r for r in records if r.get('final_status') in present_statuses])
-    absent_days = len([r for r in records if r.get('final_status') == "ABSENT"])
-    total_late_minutes = sum(r.get('late_minutes', 0) for r in records)
-    
-    if work_days == 0:
-        return {"score": 0, "present_days": 0, "work_days": 0, "late_minutes": 0, "absent_days": 0, "no_data": True, "start_date": start_date, "end_date": end_date}
-    
-    # الصيغة
-    presence_rate = (present_days / work_days) * 100
-    late_penalty = min(total_late_minutes * 0.05, 20)  # حد أقصى 20 نقطة خصم
-    score = max(0, min(100, presence_rate - late_penalty))
-    
-    return {
-        "score": round(score, 1),
-        "present_days": present_days,
-        "work_days": work_days,
-        "late_minutes": total_late_minutes,
-        "absent_days": absent_days,
-        "presence_rate": round(presence_rate, 1)
-    }
+    result = attendance_score(counters)
+    if result.get("no_data"):
+        result.update({"start_date": start_date, "end_date": end_date})
+    return result
 
 
 async def calculate_task_score(employee_id: str = None, month: str = None, year: int = None, use_yearly: bool = False) -> dict:
@@ -122,24 +112,10 @@ async def calculate_task_score(employee_id: str = None, month: str = None, year:
     
     tasks = await db.tasks.find(query, {"_id": 0, "final_score": 1, "delay_info": 1, "closed_at": 1, "employee_id": 1}).to_list(5000)
     
-    if not tasks:
-        return {"score": 0, "total_tasks": 0, "completed_on_time": 0, "delayed": 0, "average_rating": 0}
-    
-    scores = [t.get('final_score', {}).get('final_score', 0) for t in tasks if t.get('final_score')]
-    on_time = len([t for t in tasks if not t.get('delay_info', {}).get('delayed', False)])
-    delayed = len(tasks) - on_time
-    
-    avg_score = sum(scores) / len(scores) if scores else 0
-    score = min(100, avg_score * 20)  # تحويل من 5 إلى 100
-    
-    return {
-        "score": round(score, 1),
-        "total_tasks": len(tasks),
-        "completed_on_time": on_time,
-        "delayed": delayed,
-        "average_rating": round(avg_score, 2),
-        "completion_rate": round((on_time / len(tasks)) * 100, 1) if tasks else 0
-    }
+    counters = new_counters()
+    for t in tasks:
+        add_task(counters, t)
+    return task_score(counters)
 
 
 async def calculate_financial_score(employee_id: str = None, month: str = None, year: int = None, use_yearly: bool = False) -> dict:
@@ -164,23 +140,11 @@ async def calculate_financial_score(employee_id: str = None, month: str = None,
     
     custodies = await db.admin_custodies.find(query, {"_id": 0, "audit_status": 1, "returned_count": 1, "spent": 1, "created_by": 1, "created_at": 1}).to_list(2000)
     
-    if not custodies:
-        return {"score": 0, "total_custodies": 0, "approved_first_time": 0, "returned": 0, "total_spent": 0, "no_data": True}
-    
     # العهد المعتمدة من أول مرة (لم يتم إرجاعها)
-    approved_first = len([c for c in custodies if c.get('audit_status') == 'approved' and not c.get('returned_count', 0)])
-    returned = len([c for c in custodies if c.get('returned_count', 0) > 0])
-    total_spent = sum(c.get('spent', 0) for c in custodies)
-    
-    score = (approved_first / len(custodies)) * 100 if custodies else 100
-    
-    return {
-        "score": round(score, 1),
-        "total_custodies": len(custodies),
-        "approved_first_time": approved_first,
-        "returned": returned,
-        "total_spent": round(total_spent, 2)
-    }
+    counters = new_counters()
+    for c in custodies:
+        add_custody(counters, c)
+    return financial_score(counters)
 
 
 async def calculate_request_score(employee_id: str = None, month: str = None, year: int = None, use_yearly: bool = False) -> dict:
@@ -205,130 +169,80 @@ async def calculate_request_score(employee_id: str = None, month: str = None, ye
     
     transactions = await db.transactions.find(query, {"_id": 0, "status": 1, "employee_id": 1, "created_at": 1}).to_list(5000)
     
-    if not transactions:
-        return {"score": 0, "total_requests": 0, "approved": 0, "rejected": 0, "pending": 0, "no_data": True}
-    
-    approved = len([t for t in transactions if t.get('status') in ['approved', 'stas', 'completed']])
-    rejected = len([t for t in transactions if t.get('status') in ['rejected', 'cancelled']])
-    pending = len([t for t in transactions if t.get('status') not in ['approved', 'stas', 'completed', 'rejected', 'cancelled']])
-    
-    total_decided = approved + rejected
-    score = (approved / total_decided) * 100 if total_decided > 0 else 100
-    
-    return {
-        "score": round(score, 1),
-        "total_requests": len(transactions),
-        "approved": approved,
-        "rejected": rejected,
-        "pending": pending,
-        "approval_rate": round(score, 1)
-    }
+    counters = new_counters()
+    for t in transactions:
+        add_request(counters, t)
+    return request_score(counters)
 
 
 async def calculate_company_health_score(month: str = None) -> dict:
     """
     حساب مؤشر صحة الشركة
     المتوسط المرجح للمؤشرات الأربعة
-    يعمل سنوياً من أول السنة إلى اليوم الحالي
+    يعمل سنوياً من أول السنة إلى اليوم الحالي - من جدول الحقائق
     """
-    now = datetime.now(timezone.utc)
-    use_yearly = True  # دائماً سنوي للوحة الحوكمة
-    year = now.year
-    
-    attendance = await calculate_attendance_score(year=year, use_yearly=use_yearly)
-    tasks = await calculate_task_score(year=year, use_yearly=use_yearly)
-    financial = await calculate_financial_score(year=year, use_yearly=use_yearly)
-    requests = await calculate_request_score(year=year, use_yearly=use_yearly)
-    
-    # الأوزان
-    weights = {
-        "attendance": 0.30,
-        "tasks": 0.35,
-        "financial": 0.20,
-        "requests": 0.15
-    }
-    
-    health_score = (
-        attendance['score'] * weights['attendance'] +
-        tasks['score'] * weights['tasks'] +
-        financial['score'] * weights['financial'] +
-        requests['score'] * weights['requests']
-    )
+    year = datetime.now(timezone.utc).year
+    totals = await month_totals(db, year_months(year))
+    health = health_score(sum_counters(totals.values()))
     
     # نطاق التقرير
     start_date, end_date = get_year_range(year)
-    
-    return {
-        "health_score": round(health_score, 1),
-        "attendance": attendance,
-        "tasks": tasks,
-        "financial": financial,
-        "requests": requests,
-        "weights": weights,
-        "period": {
-            "type": "yearly",
-            "year": year,
-            "start_date": start_date,
-            "end_date": end_date
-        }
+    health["period"] = {
+        "type": "yearly",
+        "year": year,
+        "start_date": start_date,
+        "end_date": end_date
     }
+    return health
 
 
-async def get_top_performers(limit: int = 5, month: str = None, year: int = None, use_yearly: bool = True) -> list:
-    """أفضل الموظفين أداءً - باستثناء الإداريين"""
+async def _rank_performers(month: str = None, year: int = None, use_yearly: bool = True) -> list:
+    """كل الموظفين (باستثناء الإداريين) مرتبين تنازلياً - من جدول الحقائق"""
     now = datetime.now(timezone.utc)
     if year is None:
         year = now.year
-        
+    months = year_months(year) if use_yearly else [month or now.strftime("%Y-%m")]
+    
     employees = await db.employees.find(
         {"status": "active", "exclude_from_evaluation": {"$ne": True}}, 
         {"_id": 0, "id": 1, "full_name": 1, "full_name_ar": 1, "department": 1}
     ).to_list(100)
+    totals = await employee_totals(db, months, [emp['id'] for emp in employees])
     
     results = []
     for emp in employees:
-        attendance = await calculate_attendance_score(employee_id=emp['id'], year=year, use_yearly=use_yearly)
-        tasks = await calculate_task_score(employee_id=emp['id'], year=year, use_yearly=use_yearly)
-        excuses = await calculate_excuse_score(employee_id=emp['id'], year=year, use_yearly=use_yearly)
-        
-        # حساب شامل مع الأعذار
-        overall = (attendance['score'] * 0.35) + (tasks['score'] * 0.40) + (excuses['score'] * 0.25)
-        
         results.append({
             "employee_id": emp['id'],
             "name": emp.get('full_name_ar', emp.get('full_name', 'N/A')),
             "department": emp.get('department', 'N/A'),
-            "score": round(overall, 1),
-            "attendance_score": attendance['score'],
-            "task_score": tasks['score'],
-            "excuse_score": excuses['score'],
-            "forget_checkin": excuses.get('forget_checkin', {}).get('count', 0),
-            "late_excuse": excuses.get('late_excuse', {}).get('count', 0)
+            **performer_score(totals.get(emp['id']) or new_counters(), yearly=use_yearly)
         })
     
-    return sorted(results, key=lambda x: x['score'], reverse=True)[:limit]
+    return sorted(results, key=lambda x: x['score'], reverse=True)
+
+
+async def get_top_performers(limit: int = 5, month: str = None, year: int = None, use_yearly: bool = True) -> list:
+    """أفضل الموظفين أداءً - باستثناء الإداريين"""
+    ranked = await _rank_performers(month=month, year=year, use_yearly=use_yearly)
+    return ranked[:limit]
 
 
 async def get_bottom_performers(limit: int = 5, month: str = None, year: int = None, use_yearly: bool = True) -> list:
     """الموظفون الذين يحتاجون متابعة"""
-    top = await get_top_performers(limit=100, year=year, use_yearly=use_yearly)
-    return sorted(top, key=lambda x: x['score'])[:limit]
+    ranked = await _rank_performers(month=month, year=year, use_yearly=use_yearly)
+    return sorted(ranked, key=lambda x: x['score'])[:limit]
 
 
 async def get_monthly_trend(months: int = 6) -> list:
-    """اتجاه الأداء الشهري"""
-    now = datetime.now(timezone.utc)
-    trends = []
+    """اتجاه الأداء الشهري - صحة الشركة لكل شهر من جدول الحقائق"""
+    totals = await month_totals(db, recent_months(months))
     
-    for i in range(months - 1, -1, -1):
-        target_date = now - timedelta(days=30 * i)
-        month_str = target_date.strftime("%Y-%m")
-        
-        health = await calculate_company_health_score(month=month_str)
-        
+    trends = []
+    for month_str, counters in totals.items():
+        health = health_score(counters)
         trends.append({
             "month": month_str,
-            "month_name": target_date.strftime("%b %Y"),
+            "month_name": datetime.strptime(month_str, "%Y-%m").strftime("%b %Y"),
             "health_score": health['health_score'],
             "attendance": health['attendance']['score'],
             "tasks": health['tasks']['score'],
@@ -394,12 +308,13 @@ async def get_executive_dashboard(
     # نطاق السنة
     start_date, end_date = get_year_range(year)
     
-    # حساب المؤشرات سنوياً
+    # حساب المؤشرات سنوياً (من جدول الحقائق)
     health_data = await calculate_company_health_score()
     
-    # أفضل وأسوأ الموظفين سنوياً
-    top_performers = await get_top_performers(limit=5, year=year, use_yearly=True)
-    bottom_performers = await get_bottom_performers(limit=5, year=year, use_yearly=True)
+    # أفضل وأسوأ الموظفين سنوياً - ترتيب واحد للقائمتين
+    ranked = await _rank_performers(year=year, use_yearly=True)
+    top_performers = ranked[:5]
+    bottom_performers = sorted(ranked, key=lambda x: x['score'])[:5]
     
     # الاتجاه الشهري (آخر 12 شهر)
     monthly_trend = await get_monthly_trend(months=12)
@@ -422,6 +337,7 @@ async def get_executive_dashboard(
             "days_elapsed": (now - datetime(year, 1, 1, tzinfo=timezone.utc)).days + 1
         },
         "generated_at": datetime.now(timezone.utc).isoformat(),
+        "facts_built_at": await last_built_at(db, year_months(year)),
         "health_score": health_data['health_score'],
         "metrics": {
             "attendance": health_data['attendance'],
@@ -575,95 +491,25 @@ async def calculate_excuse_score(employee_id: str, month: str = None, year: int
         if year is None:
             year = now.year
         start_date, end_date = get_year_range(year)
-        # تعديل الحدود للسنة
-        forget_limit = 36  # 3 × 12 شهر
-        late_limit = 60    # 5 × 12 شهر
     elif month:
         yr, mon = int(month.split('-')[0]), int(month.split('-')[1])
         start_date, end_date = get_month_range(yr, mon)
-        forget_limit = 3
-        late_limit = 5
     else:
         yr, mon = now.year, now.month
         start_date, end_date = get_month_range(yr, mon)
-        forget_limit = 3
-        late_limit = 5
     
-    # نسيان البصمة
-    forget_count = await db.transactions.count_documents({
+    # نسيان البصمة، تبرير التأخير، الخروج المبكر - استعلام واحد
+    excuses = await db.transactions.find({
         "employee_id": employee_id,
-        "type": "forget_checkin",
+        "type": {"$in": EXCUSE_TYPES},
         "status": {"$nin": ["rejected", "cancelled"]},
         "data.date": {"$gte": start_date, "$lte": end_date}
-    })
+    }, {"_id": 0, "type": 1, "data": 1}).to_list(None)
     
-    # تبرير التأخير
-    late_excuse_count = await db.transactions.count_documents({
-        "employee_id": employee_id,
-        "type": "late_excuse",
-        "status": {"$nin": ["rejected", "cancelled"]},
-        "data.date": {"$gte": start_date, "$lte": end_date}
-    })
-    
-    # الخروج المبكر (بالدقائق)
-    early_leaves = await db.transactions.find({
-        "employee_id": employee_id,
-        "type": {"$in": ["early_leave_request", "early_leave", "permission"]},
-        "status": {"$nin": ["rejected", "cancelled"]},
-        "data.date": {"$gte": start_date, "$lte": end_date}
-    }, {"_id": 0, "data": 1}).to_list(200)
-    
-    early_leave_minutes = 0
-    for el in early_leaves:
-        from_time = el.get('data', {}).get('from_time', '')
-        to_time = el.get('data', {}).get('to_time', '')
-        if from_time and to_time:
-            try:
-                f_parts = from_time.split(':')
-                t_parts = to_time.split(':')
-                f_mins = int(f_parts[0]) * 60 + int(f_parts[1])
-                t_mins = int(t_parts[0]) * 60 + int(t_parts[1])
-                early_leave_minutes += (t_mins - f_mins)
-            except Exception:
-                pass
-    
-    # حساب الدرجة
-    # نسيان بصمة: كل مرة تخصم نقاط حسب الحد
-    forget_penalty = min((forget_count / forget_limit) * 30, 30) if forget_limit > 0 else 0
-    # تبرير تأخير
-    late_penalty = min((late_excuse_count / late_limit) * 30, 30) if late_limit > 0 else 0
-    # خروج مبكر: كل 30 دقيقة تخصم 5 نقاط
-    early_penalty = min((early_leave_minutes // 30) * 5, 40)
-    
-    total_penalty = forget_penalty + late_penalty + early_penalty
-    
-    # إذا لا يوجد أي استخدام للأعذار، الدرجة 0 (لم يبدأ التقييم بعد)
-    if forget_count == 0 and late_excuse_count == 0 and early_leave_minutes == 0:
-        score = 0
-        no_data = True
-    else:
-        score = max(0, 100 - total_penalty)
-        no_data = False
-    
-    return {
-        "score": round(score, 1),
-        "no_data": no_data,
-        "forget_checkin": {
-            "count": forget_count,
-            "limit": forget_limit,
-            "penalty": round(forget_penalty, 1)
-        },
-        "late_excuse": {
-            "count": late_excuse_count,
-            "limit": late_limit,
-            "penalty": round(late_penalty, 1)
-        },
-        "early_leave": {
-            "minutes": early_leave_minutes,
-            "hours": round(early_leave_minutes / 60, 1),
-            "penalty": round(early_penalty, 1)
-        }
-    }
+    counters = new_counters()
+    for t in excuses:
+        add_excuse(counters, t)
+    return excuse_score(counters, yearly=use_yearly)
 
 
 async def calculate_ai_employee_score(employee_id: str, month: str = None, year: int = None, use_yearly: bool = True) -> dict:
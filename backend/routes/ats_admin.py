@@ -3,12 +3,17 @@ ATS Admin Routes - Protected routes for HR/Admin only
 Handles job management and application review
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime, timezone
 from database import db
 from utils.auth import get_current_user
+from services.ats_ingestion import PENDING_STATUSES, STATUS_COMPLETED
+from services.ats_rescoring import scoring_changed, start_rescore, get_rescore
+from services.ats_stats import calibration_accuracy, get_application_stats, invalidate_stats
+from services.ats_public_cache import invalidate_public_jobs
+import asyncio
 import uuid
 import os
 import shutil
@@ -19,6 +24,10 @@ router = APIRouter(prefix="/api/ats/admin", tags=["ATS Admin"])
 ATS_STORAGE_DIR = "/app/ats_storage"
 ATS_CV_DIR = "/app/ats_storage/cv_files"
 
+# Internal index fields (search / duplicate detection) are never returned
+APPLICATION_DETAIL_PROJECTION = {"_id": 0, "search_text": 0, "minhash": 0, "lsh_bands": 0}
+APPLICATION_LIST_PROJECTION = {**APPLICATION_DETAIL_PROJECTION, "extracted_text": 0}
+
 # ==================== MODELS ====================
 
 class JobCreate(BaseModel):
@@ -30,6 +39,7 @@ class JobCreate(BaseModel):
     experience_years: Optional[int] = 0
     required_languages: Optional[List[str]] = ["ar"]
     required_skills: Optional[str] = ""  # comma separated
+    weights: Optional[Dict[str, int]] = None  # overrides DEFAULT_WEIGHTS for this job
 
 class JobUpdate(BaseModel):
     title_ar: Optional[str] = None
@@ -40,6 +50,7 @@ class JobUpdate(BaseModel):
     experience_years: Optional[int] = None
     required_languages: Optional[List[str]] = None
     required_skills: Optional[str] = None
+    weights: Optional[Dict[str, int]] = None
     status: Optional[str] = None  # active, closed, archived
 
 class ApplicationStatusUpdate(BaseModel):
@@ -66,6 +77,21 @@ def require_admin_only(user: dict):
         raise HTTPException(status_code=403, detail="Admin access required for this action.")
     return True
 
+def validate_weights(weights: Optional[Dict[str, int]]):
+    """Only known weight keys, each between 0 and 100, score components adding up to 100"""
+    if weights is None:
+        return
+    from services.ats_scoring import DEFAULT_WEIGHTS
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown weights: {sorted(unknown)}")
+    if any(not 0 <= v <= 100 for v in weights.values()):
+        raise HTTPException(status_code=400, detail="Weights must be between 0 and 100")
+    merged = {**DEFAULT_WEIGHTS, **weights}
+    component_total = sum(v for k, v in merged.items() if not k.endswith("_max"))
+    if component_total != 100:
+        raise HTTPException(status_code=400, detail=f"Score weights must add up to 100 (got {component_total})")
+
 def generate_job_slug():
     """Generate unique job ID for public URL"""
     return str(uuid.uuid4())[:8]
@@ -91,6 +117,7 @@ async def list_jobs(user=Depends(get_current_user)):
 async def create_job(job: JobCreate, user=Depends(get_current_user)):
     """Create a new job posting"""
     require_ats_access(user)
+    validate_weights(job.weights)
     
     job_id = str(uuid.uuid4())
     slug = generate_job_slug()
@@ -107,6 +134,7 @@ async def create_job(job: JobCreate, user=Depends(get_current_user)):
         "experience_years": job.experience_years,
         "required_languages": job.required_languages,
         "required_skills": job.required_skills,
+        "weights": job.weights,
         "status": "active",
         "created_by": user.get("user_id"),
         "created_at": now,
@@ -115,6 +143,7 @@ async def create_job(job: JobCreate, user=Depends(get_current_user)):
     
     await db.ats_jobs.insert_one(job_doc)
     job_doc.pop("_id", None)
+    invalidate_public_jobs()
     
     return job_doc
 
@@ -137,22 +166,59 @@ async def get_job(job_id: str, user=Depends(get_current_user)):
 
 @router.put("/jobs/{job_id}")
 async def update_job(job_id: str, job: JobUpdate, user=Depends(get_current_user)):
-    """Update job details"""
+    """Update job details - re-scores existing applications when scoring inputs change"""
     require_ats_access(user)
+    validate_weights(job.weights)
     
     existing = await db.ats_jobs.find_one({"id": job_id})
     if not existing:
         raise HTTPException(status_code=404, detail="Job not found")
     
     update_data = {k: v for k, v in job.dict().items() if v is not None}
+    rescore_needed = scoring_changed(existing, update_data)
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.ats_jobs.update_one({"id": job_id}, {"$set": update_data})
+    invalidate_public_jobs()
     
     updated = await db.ats_jobs.find_one({"id": job_id}, {"_id": 0})
+    if rescore_needed:
+        updated["rescore"] = await start_rescore(job_id, user.get("user_id"), "job_updated")
     return updated
 
 
+@router.post("/jobs/{job_id}/rescore")
+async def rescore_job_applications(job_id: str, user=Depends(get_current_user)):
+    """Re-score all processed applications of a job against its current requirements/weights"""
+    require_ats_access(user)
+    
+    rescore = await start_rescore(job_id, user.get("user_id"), "manual")
+    if not rescore:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return rescore
+
+
+@router.get("/jobs/{job_id}/rescore")
+async def list_job_rescores(job_id: str, user=Depends(get_current_user)):
+    """Recent re-score runs for a job (latest first)"""
+    require_ats_access(user)
+    
+    return await db.ats_rescore_jobs.find(
+        {"job_id": job_id}, {"_id": 0}
+    ).sort("started_at", -1).to_list(20)
+
+
+@router.get("/rescore/{rescore_id}")
+async def get_rescore_progress(rescore_id: str, user=Depends(get_current_user)):
+    """Progress of a re-score run (processed / total, tier transitions)"""
+    require_ats_access(user)
+    
+    rescore = await get_rescore(rescore_id)
+    if not rescore:
+        raise HTTPException(status_code=404, detail="Rescore run not found")
+    return rescore
+
+
 @router.delete("/jobs/{job_id}")
 async def delete_job(job_id: str, user=Depends(get_current_user)):
     """Delete a job (admin only) - also deletes all applications"""
@@ -167,6 +233,8 @@ async def delete_job(job_id: str, user=Depends(get_current_user)):
     
     # Delete the job
     await db.ats_jobs.delete_one({"id": job_id})
+    invalidate_stats(job_id)
+    invalidate_public_jobs()
     
     return {"message": "Job and all applications deleted"}
 
@@ -182,6 +250,7 @@ async def archive_job(job_id: str, user=Depends(get_current_user)):
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Job not found")
+    invalidate_public_jobs()
     
     return {"message": "Job archived"}
 
@@ -197,6 +266,7 @@ async def close_job(job_id: str, user=Depends(get_current_user)):
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Job not found")
+    invalidate_public_jobs()
     
     return {"message": "Job closed"}
 
@@ -212,6 +282,7 @@ async def reopen_job(job_id: str, user=Depends(get_current_user)):
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Job not found")
+    invalidate_public_jobs()
     
     return {"message": "Job reopened"}
 
@@ -238,35 +309,82 @@ async def list_applications(
     if tier and tier in ['A', 'B', 'C']:
         query["tier"] = tier
     elif not show_tier_c:
-        # Default: hide Tier C
-        query["tier"] = {"$in": ["A", "B"]}
+        # Default: hide Tier C (applications still being processed have no tier yet)
+        query["$or"] = [
+            {"tier": {"$in": ["A", "B"]}},
+            {"processing_status": {"$in": PENDING_STATUSES}},
+        ]
     
     applications = await db.ats_applications.find(
         query, 
-        {"_id": 0, "extracted_text": 0}  # Exclude large text field
+        APPLICATION_LIST_PROJECTION  # Exclude large text / index fields
     ).sort([("score", -1), ("submitted_at", -1)]).to_list(1000)
     
-    # Count by tier
-    tier_counts = {
-        "A": await db.ats_applications.count_documents({"job_id": job_id, "tier": "A"}),
-        "B": await db.ats_applications.count_documents({"job_id": job_id, "tier": "B"}),
-        "C": await db.ats_applications.count_documents({"job_id": job_id, "tier": "C"}),
-    }
+    # Tier counts + score distribution (one cached $facet aggregation per job)
+    stats = await get_application_stats(db, job_id)
+    tier_counts = {t: stats["by_tier"].get(t, 0) for t in ("A", "B", "C")}
     
     return {
         "job": job, 
         "applications": applications,
         "tier_counts": tier_counts,
-        "total": sum(tier_counts.values())
+        "processing": stats["processing"],
+        "score_histogram": stats["score_histogram"],
+        "total": sum(tier_counts.values()) + stats["processing"]
     }
 
 
+@router.get("/applications/{app_id}/processing-status")
+async def get_processing_status(app_id: str, user=Depends(get_current_user)):
+    """Lightweight poll endpoint for CV extraction/scoring progress"""
+    require_ats_access(user)
+    
+    app = await db.ats_applications.find_one(
+        {"id": app_id},
+        {"_id": 0, "id": 1, "processing_status": 1, "processing_error": 1,
+         "processing_attempts": 1, "processed_at": 1, "score": 1, "tier": 1, "auto_class": 1}
+    )
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    # Applications submitted before background processing have no status field
+    app.setdefault("processing_status", STATUS_COMPLETED)
+    return app
+
+
+@router.get("/search")
+async def search_cvs(
+    q: str,
+    job_id: Optional[str] = None,
+    tier: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    status: Optional[str] = None,
+    match: str = "all",  # all: every term must appear, any: at least one
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    user=Depends(get_current_user)
+):
+    """Full-text search over extracted CV text across all jobs (ranked by relevance, then score)"""
+    require_ats_access(user)
+    
+    if tier and tier not in ['A', 'B', 'C']:
+        raise HTTPException(status_code=400, detail="Invalid tier")
+    
+    from services.ats_search import search_applications
+    return await search_applications(
+        db, q,
+        job_id=job_id, tier=tier, min_score=min_score, max_score=max_score, status=status,
+        match_all=match != "any", page=page, page_size=page_size,
+    )
+
+
 @router.get("/applications/{app_id}")
 async def get_application(app_id: str, user=Depends(get_current_user)):
     """Get application details with full scoring info"""
     require_ats_access(user)
     
-    app = await db.ats_applications.find_one({"id": app_id}, {"_id": 0})
+    app = await db.ats_applications.find_one({"id": app_id}, APPLICATION_DETAIL_PROJECTION)
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
     
@@ -277,6 +395,47 @@ async def get_application(app_id: str, user=Depends(get_current_user)):
     return app
 
 
+@router.get("/applications/{app_id}/duplicates")
+async def get_application_duplicates(app_id: str, user=Depends(get_current_user)):
+    """
+    Other applications from the same person: identical CV files (exact)
+    or near-identical CV text (MinHash similarity), across all jobs
+    """
+    require_ats_access(user)
+    
+    app = await db.ats_applications.find_one(
+        {"id": app_id},
+        {"_id": 0, "id": 1, "email": 1, "content_hash": 1, "minhash": 1, "lsh_bands": 1,
+         "duplicate_of": 1, "reused_from": 1, "processing_status": 1}
+    )
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    from services.ats_dedup import find_duplicates, find_exact_match
+    
+    # Fresh lookup: later applications are flagged on themselves, not on this one
+    exact = await find_exact_match(db, app_id, app.get("content_hash"))
+    duplicates = await find_duplicates(db, app_id, exact, app.get("minhash"), app.get("lsh_bands", []))
+    for d in duplicates:
+        d["same_email"] = d.get("email") == app.get("email")
+    
+    job_ids = list({d["job_id"] for d in duplicates if d.get("job_id")})
+    jobs = {
+        j["id"]: j for j in await db.ats_jobs.find(
+            {"id": {"$in": job_ids}}, {"_id": 0, "id": 1, "title_ar": 1, "title_en": 1, "slug": 1}
+        ).to_list(len(job_ids) or 1)
+    }
+    for d in duplicates:
+        d["job"] = jobs.get(d.get("job_id"))
+    
+    return {
+        "application_id": app_id,
+        "processing_status": app.get("processing_status"),
+        "reused_from": app.get("reused_from"),
+        "duplicates": duplicates,
+    }
+
+
 @router.put("/applications/{app_id}/status")
 async def update_application_status(app_id: str, data: ApplicationStatusUpdate, user=Depends(get_current_user)):
     """Update application status"""
@@ -286,16 +445,18 @@ async def update_application_status(app_id: str, data: ApplicationStatusUpdate,
     if data.status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
     
-    result = await db.ats_applications.update_one(
+    app = await db.ats_applications.find_one_and_update(
         {"id": app_id},
         {"$set": {
             "status": data.status,
             "status_updated_at": datetime.now(timezone.utc).isoformat(),
             "status_updated_by": user.get("user_id")
-        }}
+        }},
+        projection={"_id": 0, "job_id": 1}
     )
-    if result.matched_count == 0:
+    if not app:
         raise HTTPException(status_code=404, detail="Application not found")
+    invalidate_stats(app.get("job_id"))
     
     return {"message": f"Status updated to {data.status}"}
 
@@ -344,6 +505,7 @@ async def delete_application(app_id: str, user=Depends(get_current_user)):
     
     # Delete from database
     await db.ats_applications.delete_one({"id": app_id})
+    invalidate_stats(app.get("job_id"))
     
     return {"message": "Application and files permanently deleted"}
 
@@ -351,54 +513,28 @@ async def delete_application(app_id: str, user=Depends(get_current_user)):
 # ==================== STATISTICS ====================
 
 @router.get("/stats")
-async def get_ats_stats(user=Depends(get_current_user)):
-    """Get ATS statistics"""
+async def get_ats_stats(job_id: Optional[str] = None, user=Depends(get_current_user)):
+    """Get ATS statistics (all jobs, or one job with ?job_id=)"""
     require_ats_access(user)
     
-    total_jobs = await db.ats_jobs.count_documents({})
-    active_jobs = await db.ats_jobs.count_documents({"status": "active"})
-    total_applications = await db.ats_applications.count_documents({})
-    new_applications = await db.ats_applications.count_documents({"status": "new"})
-    
-    # Applications by status
-    pipeline = [
+    job_counts = await db.ats_jobs.aggregate([
         {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-    ]
-    status_counts = await db.ats_applications.aggregate(pipeline).to_list(20)
-    
-    # Applications by tier
-    tier_pipeline = [
-        {"$group": {"_id": "$tier", "count": {"$sum": 1}}}
-    ]
-    tier_counts = await db.ats_applications.aggregate(tier_pipeline).to_list(10)
-    
-    # Applications by class
-    class_pipeline = [
-        {"$group": {"_id": "$auto_class", "count": {"$sum": 1}}}
-    ]
-    class_counts = await db.ats_applications.aggregate(class_pipeline).to_list(10)
-    
-    # High potential count
-    high_potential = await db.ats_applications.count_documents({"scoring.high_potential": True})
-    
-    # Average score
-    avg_pipeline = [
-        {"$match": {"score": {"$ne": None}}},
-        {"$group": {"_id": None, "avg_score": {"$avg": "$score"}}}
-    ]
-    avg_result = await db.ats_applications.aggregate(avg_pipeline).to_list(1)
-    avg_score = avg_result[0]["avg_score"] if avg_result else 0
+    ]).to_list(20)
+    stats = await get_application_stats(db, job_id)
     
     return {
-        "total_jobs": total_jobs,
-        "active_jobs": active_jobs,
-        "total_applications": total_applications,
-        "new_applications": new_applications,
-        "by_status": {s["_id"]: s["count"] for s in status_counts if s["_id"]},
-        "by_tier": {t["_id"]: t["count"] for t in tier_counts if t["_id"]},
-        "by_class": {c["_id"]: c["count"] for c in class_counts if c["_id"]},
-        "high_potential": high_potential,
-        "avg_score": round(avg_score, 1)
+        "total_jobs": sum(j["count"] for j in job_counts),
+        "active_jobs": sum(j["count"] for j in job_counts if j["_id"] == "active"),
+        "total_applications": stats["total"],
+        "new_applications": stats["by_status"].get("new", 0),
+        "processing": stats["processing"],
+        "by_status": stats["by_status"],
+        "by_tier": stats["by_tier"],
+        "by_class": stats["by_class"],
+        "by_outcome": stats["by_outcome"],
+        "score_histogram": stats["score_histogram"],
+        "high_potential": stats["high_potential"],
+        "avg_score": stats["avg_score"]
     }
 
 
@@ -418,81 +554,43 @@ async def record_outcome(app_id: str, outcome: str, notes: str = "", user=Depend
     
     now = datetime.now(timezone.utc).isoformat()
     
-    result = await db.ats_applications.update_one(
+    app = await db.ats_applications.find_one_and_update(
         {"id": app_id},
         {"$set": {
             "final_outcome": outcome,
             "outcome_recorded_at": now,
             "outcome_recorded_by": user.get("user_id"),
             "outcome_notes": notes
-        }}
+        }},
+        projection={"_id": 0, "job_id": 1}
     )
     
-    if result.matched_count == 0:
+    if not app:
         raise HTTPException(status_code=404, detail="Application not found")
+    invalidate_stats(app.get("job_id"))
     
     return {"message": f"Outcome recorded: {outcome}"}
 
 
 @router.get("/calibration-report")
-async def get_calibration_report(user=Depends(get_current_user)):
+async def get_calibration_report(job_id: Optional[str] = None, user=Depends(get_current_user)):
     """
     Monthly calibration report: compare ATS predictions vs actual outcomes
     Used for weight adjustment suggestions
     """
     require_ats_access(user)
     
-    # Get applications with outcomes
-    apps_with_outcome = await db.ats_applications.find(
-        {"final_outcome": {"$exists": True, "$ne": None}},
-        {"_id": 0, "score": 1, "auto_class": 1, "tier": 1, "final_outcome": 1, "scoring": 1}
-    ).to_list(1000)
+    # Predicted tier/class vs actual outcome counts (cached $facet aggregation)
+    stats = await get_application_stats(db, job_id)
+    total_with_outcomes = sum(row["total"] for row in stats["calibration"])
     
-    if not apps_with_outcome:
+    if not total_with_outcomes:
         return {
             "message": "No outcome data yet for calibration",
             "total_with_outcomes": 0
         }
     
-    # Analyze accuracy
-    positive_outcomes = ["shortlisted", "interview", "offer", "hired"]
-    
-    # Group by tier
-    tier_accuracy = {"A": {"correct": 0, "total": 0}, "B": {"correct": 0, "total": 0}, "C": {"correct": 0, "total": 0}}
-    class_accuracy = {"Excellent": {"correct": 0, "total": 0}, "Strong": {"correct": 0, "total": 0}, 
-                      "Acceptable": {"correct": 0, "total": 0}, "Weak": {"correct": 0, "total": 0}}
-    
-    for app in apps_with_outcome:
-        tier = app.get("tier", "C")
-        auto_class = app.get("auto_class", "Weak")
-        outcome = app.get("final_outcome", "")
-        is_positive = outcome in positive_outcomes
-        
-        if tier in tier_accuracy:
-            tier_accuracy[tier]["total"] += 1
-            if (tier in ["A", "B"] and is_positive) or (tier == "C" and not is_positive):
-                tier_accuracy[tier]["correct"] += 1
-        
-        if auto_class in class_accuracy:
-            class_accuracy[auto_class]["total"] += 1
-            expected_positive = auto_class in ["Excellent", "Strong"]
-            if (expected_positive and is_positive) or (not expected_positive and not is_positive):
-                class_accuracy[auto_class]["correct"] += 1
-    
-    # Calculate accuracy percentages
-    for tier in tier_accuracy:
-        total = tier_accuracy[tier]["total"]
-        if total > 0:
-            tier_accuracy[tier]["accuracy"] = round(tier_accuracy[tier]["correct"] / total * 100, 1)
-        else:
-            tier_accuracy[tier]["accuracy"] = 0
-    
-    for cls in class_accuracy:
-        total = class_accuracy[cls]["total"]
-        if total > 0:
-            class_accuracy[cls]["accuracy"] = round(class_accuracy[cls]["correct"] / total * 100, 1)
-        else:
-            class_accuracy[cls]["accuracy"] = 0
+    tier_accuracy, class_accuracy = calibration_accuracy(stats["calibration"])
     
     # Weight adjustment suggestions
     suggestions = []
@@ -502,13 +600,50 @@ async def get_calibration_report(user=Depends(get_current_user)):
         suggestions.append("Consider reviewing fluff_penalty - too many Tier C candidates being hired")
     
     return {
-        "total_with_outcomes": len(apps_with_outcome),
+        "total_with_outcomes": total_with_outcomes,
         "tier_accuracy": tier_accuracy,
         "class_accuracy": class_accuracy,
         "suggestions": suggestions
     }
 
 
+@router.get("/calibration-search")
+async def search_calibration_weights(
+    objective: str = "f1",  # precision | recall | f1
+    min_other: float = Query(0.5, ge=0, le=1),  # minimum recall (or precision) the best configs must keep
+    step: int = 10,
+    max_weight: int = Query(60, ge=10, le=100),
+    top: int = Query(5, ge=1, le=20),
+    job_id: Optional[str] = None,
+    user=Depends(get_current_user)
+):
+    """
+    Grid search over scoring weights, penalty maxima and the Tier B threshold against recorded
+    outcomes. Returns the best configurations with confusion matrices next to the current defaults.
+    """
+    require_ats_access(user)
+    
+    if objective not in ("precision", "recall", "f1"):
+        raise HTTPException(status_code=400, detail="objective must be precision, recall or f1")
+    # step=5 is ~17M configurations - offline only (python -m services.ats_calibration)
+    if step not in (10, 20, 25):
+        raise HTTPException(status_code=400, detail="step must be 10, 20 or 25")
+    
+    from services.ats_calibration import grid_search, load_dataset
+    
+    dataset = await load_dataset(db, job_id)
+    if not dataset.size:
+        return {
+            "message": "No outcome data yet for calibration",
+            "samples": 0
+        }
+    
+    # NumPy search is CPU-bound - keep it off the event loop
+    return await asyncio.to_thread(
+        grid_search, dataset,
+        objective=objective, min_other=min_other, step=step, max_weight=max_weight, top=top,
+    )
+
 
 # ==================== NUCLEAR DELETE ====================
 
@@ -556,6 +691,7 @@ async def nuclear_delete_all_ats_data(user=Depends(get_current_user)):
     # Step 2: Delete all application records from database
     result = await db.ats_applications.delete_many({})
     deleted_records = result.deleted_count
+    invalidate_stats()
     
     # Log the action
     from datetime import datetime, timezone
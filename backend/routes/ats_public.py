@@ -4,12 +4,15 @@ NO authentication required - for job applicants only
 SECURITY: These routes have NO access to main HR system data
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime, timezone
 from database import db
+from services import ats_public_cache as public_cache
+from services.ats_public_cache import page_response
+from services.rate_limiter import client_ip, per_hour
 import uuid
 import os
 import re
@@ -28,6 +31,14 @@ MAX_FILES = 2
 ATS_UPLOAD_DIR = "/app/ats_storage/cv_files"
 os.makedirs(ATS_UPLOAD_DIR, exist_ok=True)
 
+# Apply rate limits (token bucket, in-process) - checked before any database access
+APPLY_LIMIT_PER_IP = per_hour(
+    int(os.environ.get("ATS_APPLY_PER_IP_HOUR", "20")), burst=int(os.environ.get("ATS_APPLY_IP_BURST", "5"))
+)
+APPLY_LIMIT_PER_EMAIL = per_hour(
+    int(os.environ.get("ATS_APPLY_PER_EMAIL_HOUR", "5")), burst=int(os.environ.get("ATS_APPLY_EMAIL_BURST", "3"))
+)
+
 # ==================== HELPER FUNCTIONS ====================
 
 def validate_email(email: str) -> bool:
@@ -46,6 +57,19 @@ def get_file_extension(filename: str) -> str:
     """Get lowercase file extension"""
     return os.path.splitext(filename)[1].lower()
 
+def check_rate_limit(limiter, key: str):
+    """429 with Retry-After when the key's bucket is empty"""
+    allowed, retry_after = limiter.acquire(key)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "ar": "عدد كبير من المحاولات. الرجاء المحاولة لاحقاً",
+                "en": "Too many attempts. Please try again later"
+            },
+            headers={"Retry-After": str(retry_after)}
+        )
+
 def sanitize_filename(filename: str) -> str:
     """Remove dangerous characters from filename"""
     # Keep only alphanumeric, dots, underscores, dashes
@@ -55,61 +79,24 @@ def sanitize_filename(filename: str) -> str:
 # ==================== PUBLIC ENDPOINTS ====================
 
 @router.get("/careers")
-async def get_careers_page():
+async def get_careers_page(request: Request):
     """
     Get all active jobs for public careers/jobs listing page
     Returns empty list with polite message if no jobs available
+    Served from the public cache with ETag (304 when unchanged)
     """
-    jobs = await db.ats_jobs.find(
-        {"status": "active"},
-        {
-            "_id": 0,
-            "id": 1,
-            "slug": 1,
-            "title_ar": 1,
-            "title_en": 1,
-            "description": 1,
-            "location": 1,
-            "contract_type": 1,
-            "experience_years": 1,
-            "created_at": 1
-        }
-    ).sort("created_at", -1).to_list(100)
-    
-    return {
-        "jobs": jobs,
-        "count": len(jobs),
-        "message": {
-            "ar": "شكراً لاهتمامك بالانضمام إلى فريقنا" if jobs else "نشكرك على اهتمامك، لا توجد شواغر متاحة حالياً. ندعوك لزيارة هذه الصفحة لاحقاً للاطلاع على الفرص الجديدة.",
-            "en": "Thank you for your interest in joining our team" if jobs else "Thank you for your interest. There are no vacancies available at this time. Please check back later for new opportunities."
-        }
-    }
+    return page_response(request, await public_cache.get_careers_page())
 
 
 @router.get("/jobs/{slug}")
-async def get_public_job(slug: str):
+async def get_public_job(slug: str, request: Request):
     """
     Get job details for public apply page
     SECURITY: Only returns minimal public info, no internal data
     """
-    job = await db.ats_jobs.find_one(
-        {"slug": slug, "status": "active"},
-        {
-            "_id": 0,
-            "id": 1,
-            "slug": 1,
-            "title_ar": 1,
-            "title_en": 1,
-            "description": 1,
-            "location": 1,
-            "contract_type": 1,
-            "experience_years": 1,
-            "required_languages": 1,
-            "required_skills": 1
-        }
-    )
+    page = await public_cache.get_active_job(slug)
     
-    if not job:
+    if page.data is None:
         raise HTTPException(
             status_code=404, 
             detail={
@@ -118,12 +105,13 @@ async def get_public_job(slug: str):
             }
         )
     
-    return job
+    return page_response(request, page)
 
 
 @router.post("/apply/{slug}")
 async def submit_application(
     slug: str,
+    request: Request,
     full_name: str = Form(...),
     email: str = Form(...),
     phone: str = Form(...),
@@ -134,12 +122,13 @@ async def submit_application(
     SECURITY: 
     - No authentication required
     - Strict file validation
-    - Rate limiting should be added in production
+    - Rate limited per IP and per email (in-process token buckets)
     - No access to main HR system
     """
+    check_rate_limit(APPLY_LIMIT_PER_IP, client_ip(request))
     
-    # Validate job exists and is active
-    job = await db.ats_jobs.find_one({"slug": slug, "status": "active"})
+    # Validate job exists and is active (public cache - shared job links don't hit the database)
+    job = (await public_cache.get_active_job(slug)).data
     if not job:
         raise HTTPException(
             status_code=404,
@@ -168,6 +157,8 @@ async def submit_application(
             }
         )
     
+    check_rate_limit(APPLY_LIMIT_PER_EMAIL, email.lower().strip())
+    
     if not validate_phone(phone):
         raise HTTPException(
             status_code=400,
@@ -196,12 +187,23 @@ async def submit_application(
             }
         )
     
-    # Process and validate files
-    saved_files = []
-    app_id = str(uuid.uuid4())
+    # Check for duplicate application (same email + same job) before saving anything
+    existing = await db.ats_applications.find_one({
+        "job_id": job["id"],
+        "email": email.lower().strip()
+    }, {"_id": 1})
+    
+    if existing:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "ar": "لقد قدمت على هذه الوظيفة مسبقاً",
+                "en": "You have already applied to this job"
+            }
+        )
     
-    for idx, file in enumerate(files):
-        # Check extension
+    # Validate all extensions before writing any file
+    for file in files:
         ext = get_file_extension(file.filename)
         if ext not in ALLOWED_EXTENSIONS:
             raise HTTPException(
@@ -211,119 +213,79 @@ async def submit_application(
                     "en": f"Unsupported file type: {ext}. Allowed: PDF, DOC, DOCX"
                 }
             )
-        
-        # Read file content
-        content = await file.read()
-        
-        # Check size
-        if len(content) > MAX_FILE_SIZE:
-            size_mb = len(content) / (1024 * 1024)
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "ar": f"حجم الملف كبير جداً ({size_mb:.1f}MB). الحد الأقصى 5MB",
-                    "en": f"File too large ({size_mb:.1f}MB). Maximum size is 5MB"
-                }
-            )
-        
-        # Save file
-        safe_name = sanitize_filename(file.filename)
-        file_id = str(uuid.uuid4())[:8]
-        filename = f"{app_id}_{file_id}_{safe_name}"
-        filepath = os.path.join(ATS_UPLOAD_DIR, filename)
-        
-        with open(filepath, 'wb') as f:
-            f.write(content)
-        
-        saved_files.append({
-            "id": file_id,
-            "original_name": file.filename,
-            "saved_name": filename,
-            "path": filepath,
-            "size": len(content),
-            "type": ext,
-            "label": "cv_ar" if idx == 0 else "cv_en"
-        })
     
-    # Check for duplicate application (same email + same job)
-    existing = await db.ats_applications.find_one({
-        "job_id": job["id"],
-        "email": email.lower().strip()
-    })
+    # Stream files to disk in chunks (size limit enforced while reading)
+    from services.media_service import save_upload_stream
     
-    if existing:
-        # Clean up uploaded files
+    saved_files = []
+    app_id = str(uuid.uuid4())
+    
+    try:
+        for idx, file in enumerate(files):
+            ext = get_file_extension(file.filename)
+            safe_name = sanitize_filename(file.filename)
+            file_id = str(uuid.uuid4())[:8]
+            filename = f"{app_id}_{file_id}_{safe_name}"
+            
+            saved = await save_upload_stream(
+                file, ATS_UPLOAD_DIR, MAX_FILE_SIZE,
+                filename=filename,
+                size_error={
+                    "ar": "حجم الملف كبير جداً. الحد الأقصى 5MB",
+                    "en": "File too large. Maximum size is 5MB"
+                }
+            )
+            
+            saved_files.append({
+                "id": file_id,
+                "original_name": file.filename,
+                "saved_name": filename,
+                "path": saved["path"],
+                "size": saved["size"],
+                "sha256": saved["sha256"],
+                "type": ext,
+                "label": "cv_ar" if idx == 0 else "cv_en"
+            })
+    except HTTPException:
+        # Clean up files saved before the failing one
         for f in saved_files:
             try:
                 os.remove(f["path"])
-            except:
+            except OSError:
                 pass
-        
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "ar": "لقد قدمت على هذه الوظيفة مسبقاً",
-                "en": "You have already applied to this job"
-            }
-        )
+        raise
     
     # ============ PHASE 2: Text Extraction & ATS Scoring ============
-    from services.ats_extraction import extract_text_from_file, detect_language
-    from services.ats_scoring import score_application
-    
-    # Extract text from all CV files
-    all_text = ""
-    ats_readable = True
-    extraction_errors = []
-    
-    for f in saved_files:
-        text, is_readable, error = await extract_text_from_file(f["path"])
-        f["extracted_text"] = text
-        f["is_readable"] = is_readable
-        f["extraction_error"] = error
-        f["language"] = detect_language(text)
-        
-        if text:
-            all_text += text + "\n\n"
-        
-        if not is_readable:
-            ats_readable = False
-            extraction_errors.append(f["original_name"])
-    
-    # If not ATS-readable, still accept but mark for manual review
-    # Don't reject applicants just because their CV is scanned
-    if not ats_readable or len(all_text.strip()) < 100:
-        ats_readable = False
-        all_text = "[Manual Review Required - CV not machine-readable]"
-    
-    # Score the application
-    job_requirements = {
-        "required_skills": job.get("required_skills", ""),
-        "experience_years": job.get("experience_years", 0),
-        "required_languages": job.get("required_languages", ["ar"]),
-    }
-    
-    scoring_result = await score_application(all_text, job_requirements, ats_readable)
+    # Extraction and scoring run in the background worker pool
+    # (services/ats_ingestion.py) - the applicant gets an immediate response
+    from services.ats_ingestion import enqueue_application, STATUS_QUEUED
+    from services.ats_dedup import content_hash
+    from services.ats_search import build_search_name
+    from services.ats_stats import invalidate_stats
     
-    # Create application record
     now = datetime.now(timezone.utc).isoformat()
     application = {
         "id": app_id,
         "job_id": job["id"],
         "job_slug": slug,
         "full_name": full_name.strip(),
+        "search_name": build_search_name(full_name),
         "email": email.lower().strip(),
         "phone": phone.strip(),
         "files": saved_files,
         "file_count": len(saved_files),
+        # Same files re-submitted (any job) reuse the earlier extraction
+        "content_hash": content_hash(saved_files),
         "status": "new",
-        # ATS Intelligence fields
-        "ats_readable": ats_readable,
-        "extracted_text": all_text[:10000],  # Limit stored text
-        "score": scoring_result.get("score", 0),
-        "auto_class": scoring_result.get("auto_class", "Weak"),
-        "tier": scoring_result.get("tier", "C"),
-        "scoring": scoring_result,
+        # ATS Intelligence fields - filled by the ingestion worker
+        "processing_status": STATUS_QUEUED,
+        "processing_attempts": 0,
+        "ats_readable": None,
+        "extracted_text": "",
+        "score": None,
+        "auto_class": None,
+        "tier": None,
+        "scoring": None,
         # Legacy fields
         "notes": [],
         "submitted_at": now,
@@ -331,9 +293,13 @@ async def submit_application(
     }
     
     await db.ats_applications.insert_one(application)
+    invalidate_stats(job["id"])
+    await enqueue_application(app_id)
     
     return {
         "success": True,
+        "application_id": app_id,
+        "processing_status": STATUS_QUEUED,
         "message": {
             "ar": "شكراً، تم استلام السيرة الذاتية بنجاح. سيتم التواصل عبر بيانات الاتصال.",
             "en": "Thank you, your CV has been received successfully. We will contact you via your contact details."
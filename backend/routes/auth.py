@@ -1,9 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
+from collections import OrderedDict
 from database import db
-from utils.auth import verify_password, create_access_token, get_current_user, hash_password
-from datetime import datetime, timezone
+from utils.auth import verify_password_async, create_access_token, get_current_user, hash_password_async, TOKEN_EXPIRE_HOURS, DEFAULT_TOKEN_EXPIRE
+from services.session_cache import revoke_tokens
+from services.rate_limiter import client_ip
+from services.buffered_writer import audit_log
+from services import fraud_engine
+from services.fingerprint_index import index_fields
+from datetime import datetime, timezone, timedelta
+import asyncio
 import uuid
 import logging
 import os
@@ -15,61 +22,76 @@ EMERGENCY_AUTH_KEY = os.environ.get('EMERGENCY_AUTH_KEY', '')
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-# Rate Limiting - تتبع محاولات تسجيل الدخول
-login_attempts = {}  # {ip: {"count": int, "last_attempt": datetime, "blocked_until": datetime}}
-MAX_LOGIN_ATTEMPTS = 5
+# Rate Limiting - تتبع محاولات تسجيل الدخول لكل IP ولكل اسم مستخدم
+# يُفحص قبل أي استعلام أو حساب bcrypt، فمحاولات التخمين تُرفض بتكلفة شبه معدومة
+login_attempts: "OrderedDict[str, dict]" = OrderedDict()  # {"ip:..."/"user:...": {"count", "last_attempt", "blocked_until"}}
+MAX_LOGIN_ATTEMPTS = 5  # لكل IP
+# أعلى من حد الـ IP: تخمين موزع على عناوين كثيرة يُوقف، ومهاجم واحد لا يقفل حساب غيره بسهولة
+MAX_USERNAME_ATTEMPTS = int(os.environ.get("LOGIN_MAX_USERNAME_ATTEMPTS", "10"))
 BLOCK_DURATION_MINUTES = 15
+ATTEMPT_WINDOW_SECONDS = 300  # إعادة العد بعد 5 دقائق بلا محاولات
+MAX_TRACKED_KEYS = 10000
 
 
-def check_rate_limit(request: Request) -> bool:
-    """التحقق من Rate Limiting"""
-    client_ip = request.client.host if request.client else "unknown"
+def _attempt_keys(request: Request, username: Optional[str] = None) -> List[Tuple[str, int]]:
+    keys = [(f"ip:{client_ip(request)}", MAX_LOGIN_ATTEMPTS)]
+    if username:
+        keys.append((f"user:{username.strip().lower()}", MAX_USERNAME_ATTEMPTS))
+    return keys
+
+
+def check_rate_limit(request: Request, username: Optional[str] = None) -> bool:
+    """التحقق من Rate Limiting (الـ IP واسم المستخدم)"""
     now = datetime.now(timezone.utc)
     
-    if client_ip in login_attempts:
-        data = login_attempts[client_ip]
+    for key, _ in _attempt_keys(request, username):
+        data = login_attempts.get(key)
+        if not data:
+            continue
         
         # التحقق من الحظر
         if data.get("blocked_until") and now < data["blocked_until"]:
-            remaining = (data["blocked_until"] - now).seconds // 60
+            remaining = max(1, int((data["blocked_until"] - now).total_seconds() // 60))
             raise HTTPException(
                 status_code=429,
                 detail={
                     "error": "TOO_MANY_ATTEMPTS",
                     "message_ar": f"تم حظرك مؤقتاً. حاول بعد {remaining} دقيقة",
                     "message_en": f"Too many attempts. Try again in {remaining} minutes"
-                }
+                },
+                headers={"Retry-After": str(int((data["blocked_until"] - now).total_seconds()) + 1)}
             )
         
         # إعادة تعيين إذا مر وقت كافٍ
-        if (now - data["last_attempt"]).seconds > 300:  # 5 دقائق
-            login_attempts[client_ip] = {"count": 0, "last_attempt": now}
+        if (now - data["last_attempt"]).total_seconds() > ATTEMPT_WINDOW_SECONDS:
+            login_attempts[key] = {"count": 0, "last_attempt": now}
     
     return True
 
 
-def record_failed_attempt(request: Request):
+def record_failed_attempt(request: Request, username: Optional[str] = None):
     """تسجيل محاولة فاشلة"""
-    client_ip = request.client.host if request.client else "unknown"
     now = datetime.now(timezone.utc)
     
-    if client_ip not in login_attempts:
-        login_attempts[client_ip] = {"count": 0, "last_attempt": now}
-    
-    login_attempts[client_ip]["count"] += 1
-    login_attempts[client_ip]["last_attempt"] = now
+    for key, limit in _attempt_keys(request, username):
+        data = login_attempts.setdefault(key, {"count": 0, "last_attempt": now})
+        data["count"] += 1
+        data["last_attempt"] = now
+        login_attempts.move_to_end(key)
+        
+        # حظر بعد المحاولات المسموحة
+        if data["count"] >= limit:
+            data["blocked_until"] = now + timedelta(minutes=BLOCK_DURATION_MINUTES)
     
-    # حظر بعد المحاولات المسموحة
-    if login_attempts[client_ip]["count"] >= MAX_LOGIN_ATTEMPTS:
-        from datetime import timedelta
-        login_attempts[client_ip]["blocked_until"] = now + timedelta(minutes=BLOCK_DURATION_MINUTES)
+    # عدد المفاتيح محدود - الأقدم يُحذف أولاً
+    while len(login_attempts) > MAX_TRACKED_KEYS:
+        login_attempts.popitem(last=False)
 
 
-def clear_failed_attempts(request: Request):
+def clear_failed_attempts(request: Request, username: Optional[str] = None):
     """مسح المحاولات الفاشلة بعد تسجيل دخول ناجح"""
-    client_ip = request.client.host if request.client else "unknown"
-    if client_ip in login_attempts:
-        del login_attempts[client_ip]
+    for key, _ in _attempt_keys(request, username):
+        login_attempts.pop(key, None)
 
 
 @router.post("/clear-all-blocks")
@@ -103,6 +125,46 @@ class ChangePasswordRequest(BaseModel):
     new_password: str
 
 
+async def _register_login_device(employee_id, device_id, os_name, browser, is_mobile, user_agent, ip_address, fingerprint_data=None):
+    """تسجيل الجهاز أو تحديث آخر دخول - عملية واحدة (upsert) + حقول فهرس التشابه"""
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        result = await db.employee_devices.update_one(
+            {"employee_id": employee_id, "device_id": device_id},
+            {
+                "$set": {"last_login": now, **(index_fields(fingerprint_data) if fingerprint_data else {})},
+                "$inc": {"login_count": 1},
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "device_name": f"{os_name} - {browser}",
+                    "device_type": "mobile" if is_mobile else "desktop",
+                    "os": os_name,
+                    "browser": browser,
+                    "is_mobile": is_mobile,
+                    "status": "approved",
+                    "first_login": now,
+                    "user_agent": user_agent,
+                    "ip_address": ip_address
+                }
+            },
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            logger.info(f"New device registered for {employee_id}: {device_id}")
+    except Exception as e:
+        logger.error(f"Failed to register device: {e}")
+
+
+async def _update_fraud_state(fraud_key, session_id, device_signature, hours, revoked_session_ids):
+    """
+    الجلسات الملغاة تخرج من حالة كشف التلاعب قبل إضافة الجديدة -
+    وإلا فتح كل تغيير جهاز مشروع تنبيه "جلسات متزامنة"
+    """
+    if revoked_session_ids:
+        await fraud_engine.on_logout(fraud_key, revoked_session_ids)
+    await fraud_engine.on_login(fraud_key, session_id, device_signature, hours)
+
+
 ROLE_ORDER = {"stas": 0, "mohammed": 1, "sultan": 2, "naif": 3, "salah": 4, "supervisor": 5, "employee": 6}
 
 # الأدوار المُعفاة من فحص الأجهزة
@@ -156,28 +218,24 @@ async def switch_user(user_id: str, request: Request, current_user=Depends(get_c
     browser = "Chrome" if "chrome" in user_agent.lower() else "Safari" if "safari" in user_agent.lower() else "Firefox" if "firefox" in user_agent.lower() else "Other"
     os_name = "iOS" if "iphone" in user_agent.lower() or "ipad" in user_agent.lower() else "Android" if "android" in user_agent.lower() else "Windows" if "windows" in user_agent.lower() else "Mac" if "mac" in user_agent.lower() else "Other"
     
-    try:
-        await db.login_sessions.insert_one({
-            "id": str(uuid.uuid4()),
-            "employee_id": employee_id,
-            "username": user['username'],
-            "role": user['role'],
-            "session_id": session_id,
-            "device_id": None,
-            "login_at": datetime.now(timezone.utc).isoformat(),
-            "logout_at": None,
-            "device_type": "mobile" if is_mobile else "desktop",
-            "device_name": os_name,
-            "browser": browser,
-            "os": os_name,
-            "is_mobile": is_mobile,
-            "status": "active",
-            "switched_by": current_user.get('user_id'),
-            "login_method": "switch"
-        })
-        logger.info(f"Switch login session created for {employee_id} by {current_user.get('user_id')}")
-    except Exception as e:
-        logger.error(f"Failed to create switch login session: {e}")
+    await db.login_sessions.insert_one({
+        "id": str(uuid.uuid4()),
+        "employee_id": employee_id,
+        "username": user['username'],
+        "role": user['role'],
+        "session_id": session_id,
+        "device_id": None,
+        "login_at": datetime.now(timezone.utc).isoformat(),
+        "logout_at": None,
+        "device_type": "mobile" if is_mobile else "desktop",
+        "device_name": os_name,
+        "browser": browser,
+        "os": os_name,
+        "is_mobile": is_mobile,
+        "status": "active",
+        "switched_by": current_user.get('user_id'),
+        "login_method": "switch"
+    })
 
     return {
         "token": token,
@@ -197,16 +255,16 @@ async def switch_user(user_id: str, request: Request, current_user=Depends(get_c
 async def login(req: LoginRequest, request: Request):
     """
     تسجيل الدخول مع:
-    - Rate Limiting (5 محاولات / 15 دقيقة حظر)
+    - Rate Limiting (5 محاولات لكل IP / 10 لكل اسم مستخدم / 15 دقيقة حظر)
     - فحص تغير الجهاز
     - جلسات محدودة المدة حسب الدور
     """
     # التحقق من Rate Limiting
-    check_rate_limit(request)
+    check_rate_limit(request, req.username)
     
     user = await db.users.find_one({"username": req.username}, {"_id": 0})
     if not user:
-        record_failed_attempt(request)
+        record_failed_attempt(request, req.username)
         raise HTTPException(
             status_code=401, 
             detail={
@@ -216,8 +274,8 @@ async def login(req: LoginRequest, request: Request):
             }
         )
     
-    if not verify_password(req.password, user['password_hash']):
-        record_failed_attempt(request)
+    if not await verify_password_async(req.password, user['password_hash']):
+        record_failed_attempt(request, req.username)
         raise HTTPException(
             status_code=401, 
             detail={
@@ -290,63 +348,51 @@ async def login(req: LoginRequest, request: Request):
     role = user.get('role', 'employee')
     user_id = user['id']
     
+    # بصمة الجهاز تُحسب مرة واحدة
+    device_signature = None
+    if req.fingerprint_data:
+        from services.device_service import generate_core_hardware_signature
+        device_signature = generate_core_hardware_signature(req.fingerprint_data)
+    
     # فحص تغير الجهاز (للموظفين فقط)
     device_changed = False
-    if req.fingerprint_data and role not in EXEMPT_ROLES:
-        from services.device_service import generate_core_hardware_signature
-        current_signature = generate_core_hardware_signature(req.fingerprint_data)
-        
+    if device_signature and role not in EXEMPT_ROLES:
         # الحصول على آخر جهاز مسجل
         last_session = await db.user_sessions.find_one(
             {"user_id": user_id, "is_active": True},
+            {"_id": 0, "device_signature": 1},
             sort=[("created_at", -1)]
         )
         
-        if last_session and last_session.get("device_signature") != current_signature:
+        if last_session and last_session.get("device_signature") != device_signature:
             device_changed = True
-            # إبطال الجلسات القديمة عند تغير الجهاز
-            await db.user_sessions.update_many(
-                {"user_id": user_id, "is_active": True},
-                {"$set": {"is_active": False, "revoked_reason": "device_changed", "revoked_at": datetime.now(timezone.utc)}}
-            )
             # تسجيل الحدث
-            await db.security_audit_log.insert_one({
+            audit_log({
                 "id": str(uuid.uuid4()),
                 "employee_id": employee_id or user_id,
                 "action": "device_changed_logout",
-                "old_signature": last_session.get("device_signature", "")[:16] + "...",
-                "new_signature": current_signature[:16] + "...",
-                "ip_address": request.client.host if request.client else "unknown",
+                "old_signature": (last_session.get("device_signature") or "")[:16] + "...",
+                "new_signature": device_signature[:16] + "...",
+                "ip_address": client_ip(request),
                 "timestamp": datetime.now(timezone.utc).isoformat()
             })
     
+    # الجلسات التي ستُبطل بسبب تغير الجهاز (لإخراجها من كشف التلاعب أيضاً)
+    revoked_session_ids = []
+    if device_changed:
+        revoked_session_ids = [
+            s["id"] for s in await db.user_sessions.find(
+                {"user_id": user_id, "is_active": True}, {"_id": 0, "id": 1}
+            ).to_list(None)
+        ]
+    
     # مسح محاولات الدخول الفاشلة
-    clear_failed_attempts(request)
+    clear_failed_attempts(request, req.username)
     
     # إنشاء معرف الجلسة
     session_id = str(uuid.uuid4())
     token_id = str(uuid.uuid4())
-    
-    # تسجيل الجلسة الجديدة
-    device_signature = None
-    if req.fingerprint_data:
-        from services.device_service import generate_core_hardware_signature
-        device_signature = generate_core_hardware_signature(req.fingerprint_data)
-    
-    await db.user_sessions.insert_one({
-        "id": session_id,
-        "token_id": token_id,
-        "user_id": user_id,
-        "employee_id": employee_id,
-        "role": role,
-        "device_signature": device_signature,
-        "fingerprint_data": req.fingerprint_data,
-        "ip_address": request.client.host if request.client else "unknown",
-        "user_agent": request.headers.get("user-agent", ""),
-        "is_active": True,
-        "created_at": datetime.now(timezone.utc),
-        "last_activity": datetime.now(timezone.utc)
-    })
+    now = datetime.now(timezone.utc)
     
     # استخراج معلومات الجهاز
     user_agent = request.headers.get("user-agent", "")
@@ -354,64 +400,36 @@ async def login(req: LoginRequest, request: Request):
     browser = "Chrome" if "chrome" in user_agent.lower() else "Safari" if "safari" in user_agent.lower() else "Firefox" if "firefox" in user_agent.lower() else "Other"
     os_name = "iOS" if "iphone" in user_agent.lower() or "ipad" in user_agent.lower() else "Android" if "android" in user_agent.lower() else "Windows" if "windows" in user_agent.lower() else "Mac" if "mac" in user_agent.lower() else "Other"
     device_id = device_signature[:16] if device_signature else str(uuid.uuid4())[:16]
+    ip_address = client_ip(request)
     
-    # تسجيل الجهاز في employee_devices لإدارة الأجهزة
-    try:
-        existing_device = await db.employee_devices.find_one({
+    # الكتابات المستقلة تعمل بالتوازي
+    writes = [
+        # تسجيل الجلسة الجديدة
+        db.user_sessions.insert_one({
+            "id": session_id,
+            "token_id": token_id,
+            "user_id": user_id,
             "employee_id": employee_id,
-            "device_id": device_id
-        })
-        
-        if not existing_device:
-            await db.employee_devices.insert_one({
-                "id": str(uuid.uuid4()),
-                "employee_id": employee_id,
-                "device_id": device_id,
-                "device_name": f"{os_name} - {browser}",
-                "device_type": "mobile" if is_mobile else "desktop",
-                "os": os_name,
-                "browser": browser,
-                "is_mobile": is_mobile,
-                "status": "approved",
-                "first_login": datetime.now(timezone.utc).isoformat(),
-                "last_login": datetime.now(timezone.utc).isoformat(),
-                "login_count": 1,
-                "user_agent": user_agent,
-                "ip_address": request.client.host if request.client else "unknown"
-            })
-            logger.info(f"New device registered for {employee_id}: {device_id}")
-        else:
-            await db.employee_devices.update_one(
-                {"id": existing_device["id"]},
-                {"$set": {"last_login": datetime.now(timezone.utc).isoformat()}, "$inc": {"login_count": 1}}
-            )
-    except Exception as e:
-        logger.error(f"Failed to register device: {e}")
-    
-    # تسجيل الدخول في سجل الأمان
-    await db.security_audit_log.insert_one({
-        "id": str(uuid.uuid4()),
-        "employee_id": employee_id or user_id,
-        "action": "login_success",
-        "session_id": session_id,
-        "device_signature": device_signature,
-        "device_changed": device_changed,
-        "ip_address": request.client.host if request.client else "unknown",
-        "details": {"username": req.username, "role": role},
-        "performed_by": user_id,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
-    
-    # تسجيل في login_sessions لصفحة سجل الدخول
-    try:
-        await db.login_sessions.insert_one({
+            "role": role,
+            "device_signature": device_signature,
+            "fingerprint_data": req.fingerprint_data,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "is_active": True,
+            "created_at": now,
+            "last_activity": now
+        }),
+        # تسجيل الجهاز في employee_devices لإدارة الأجهزة
+        _register_login_device(employee_id, device_id, os_name, browser, is_mobile, user_agent, ip_address, req.fingerprint_data),
+        # سجل الدخول (login_sessions) - حالة تُحدَّث عند الخروج، لذا تُكتب مباشرة لا عبر الطابور
+        db.login_sessions.insert_one({
             "id": str(uuid.uuid4()),
             "employee_id": employee_id or user_id,
             "username": req.username,
             "role": role,
             "session_id": session_id,
             "device_id": device_id,
-            "login_at": datetime.now(timezone.utc).isoformat(),
+            "login_at": now.isoformat(),
             "logout_at": None,
             "device_type": "mobile" if is_mobile else "desktop",
             "device_name": os_name,
@@ -420,11 +438,36 @@ async def login(req: LoginRequest, request: Request):
             "is_mobile": is_mobile,
             "status": "active",
             "fingerprint_data": req.fingerprint_data,  # إضافة بصمة الجهاز الكاملة
-            "core_signature": generate_core_hardware_signature(req.fingerprint_data) if req.fingerprint_data else None
-        })
-        logger.info(f"Login session created for {employee_id or user_id}")
-    except Exception as e:
-        logger.error(f"Failed to create login session: {e}")
+            "core_signature": device_signature
+        }),
+        # كشف التلاعب التزايدي (جهاز مشترك / جلسات متزامنة)
+        _update_fraud_state(
+            employee_id or user_id, session_id, device_signature,
+            TOKEN_EXPIRE_HOURS.get(role, DEFAULT_TOKEN_EXPIRE), revoked_session_ids,
+        ),
+    ]
+    if device_changed:
+        # إبطال الجلسات القديمة عند تغير الجهاز (عدا الجلسة الجديدة)
+        writes.append(db.user_sessions.update_many(
+            {"user_id": user_id, "is_active": True, "id": {"$ne": session_id}},
+            {"$set": {"is_active": False, "revoked_reason": "device_changed", "revoked_at": now}}
+        ))
+    await asyncio.gather(*writes)
+    
+    # تسجيل الدخول في سجل الأمان
+    audit_log({
+        "id": str(uuid.uuid4()),
+        "employee_id": employee_id or user_id,
+        "action": "login_success",
+        "session_id": session_id,
+        "device_signature": device_signature,
+        "device_changed": device_changed,
+        "ip_address": ip_address,
+        "details": {"username": req.username, "role": role},
+        "performed_by": user_id,
+        "timestamp": now.isoformat()
+    })
+    
 
     token = create_access_token({
         "user_id": user_id,
@@ -467,20 +510,20 @@ async def get_me(user=Depends(get_current_user)):
 async def change_password(req: ChangePasswordRequest, user=Depends(get_current_user)):
     """تغيير كلمة المرور - يتطلب إعادة المصادقة"""
     db_user = await db.users.find_one({"id": user['user_id']}, {"_id": 0})
-    if not verify_password(req.current_password, db_user['password_hash']):
+    if not await verify_password_async(req.current_password, db_user['password_hash']):
         raise HTTPException(status_code=400, detail="كلمة المرور الحالية غير صحيحة")
     
     await db.users.update_one(
         {"id": user['user_id']},
         {"$set": {
-            "password_hash": hash_password(req.new_password),
+            "password_hash": await hash_password_async(req.new_password),
             "plain_password": None,
             "password_changed_at": datetime.now(timezone.utc)
         }}
     )
     
     # تسجيل تغيير كلمة المرور
-    await db.security_audit_log.insert_one({
+    audit_log({
         "id": str(uuid.uuid4()),
         "employee_id": user.get('employee_id') or user['user_id'],
         "action": "password_changed",
@@ -512,24 +555,30 @@ async def logout(user=Depends(get_current_user)):
             {"$set": {"is_active": False, "revoked_reason": "logout", "revoked_at": datetime.now(timezone.utc)}}
         )
     
-    # تحديث login_sessions بوقت الخروج
-    await db.login_sessions.find_one_and_update(
-        {"employee_id": employee_id, "status": "active"},
-        {"$set": {"logout_at": datetime.now(timezone.utc).isoformat(), "status": "completed"}},
-        sort=[("login_at", -1)]
-    )
+    # تحديث login_sessions بوقت الخروج - سجل هذه الجلسة نفسها (لا "آخر جلسة نشطة")
+    if session_id:
+        await db.login_sessions.update_one(
+            {"session_id": session_id, "status": "active"},
+            {"$set": {"logout_at": datetime.now(timezone.utc).isoformat(), "status": "completed"}}
+        )
+    else:
+        # توكنات قديمة بلا session_id
+        await db.login_sessions.find_one_and_update(
+            {"employee_id": employee_id, "status": "active"},
+            {"$set": {"logout_at": datetime.now(timezone.utc).isoformat(), "status": "completed"}},
+            sort=[("login_at", -1)]
+        )
     
-    # إضافة التوكن للقائمة السوداء
+    if session_id:
+        await fraud_engine.on_logout(employee_id, [session_id])
+    
+    # إضافة التوكن للقائمة السوداء (القاعدة + ذاكرة التحقق فوراً)
     if token_id:
-        await db.revoked_tokens.insert_one({
-            "token_id": token_id,
-            "user_id": user['user_id'],
-            "revoked_at": datetime.now(timezone.utc),
-            "reason": "logout"
-        })
+        expires_at = datetime.fromtimestamp(user['exp'], tz=timezone.utc) if user.get('exp') else None
+        await revoke_tokens([token_id], user['user_id'], "logout", expires_at=expires_at)
     
     # تسجيل الخروج
-    await db.security_audit_log.insert_one({
+    audit_log({
         "id": str(uuid.uuid4()),
         "employee_id": employee_id,
         "action": "logout",
@@ -560,17 +609,11 @@ async def logout_all_sessions(user=Depends(get_current_user)):
     )
     
     # إضافة جميع التوكنات للقائمة السوداء
-    for session in active_sessions:
-        if session.get("token_id"):
-            await db.revoked_tokens.insert_one({
-                "token_id": session["token_id"],
-                "user_id": user_id,
-                "revoked_at": datetime.now(timezone.utc),
-                "reason": "logout_all"
-            })
+    await revoke_tokens([s.get("token_id") for s in active_sessions], user_id, "logout_all")
+    await fraud_engine.on_logout(user.get('employee_id') or user_id)
     
     # تسجيل الحدث
-    await db.security_audit_log.insert_one({
+    audit_log({
         "id": str(uuid.uuid4()),
         "employee_id": user.get('employee_id') or user_id,
         "action": "logout_all_sessions",
@@ -627,12 +670,6 @@ async def revoke_session(session_id: str, user=Depends(get_current_user)):
     )
     
     # إضافة التوكن للقائمة السوداء
-    if session.get("token_id"):
-        await db.revoked_tokens.insert_one({
-            "token_id": session["token_id"],
-            "user_id": user['user_id'],
-            "revoked_at": datetime.now(timezone.utc),
-            "reason": "manual_revoke"
-        })
+    await revoke_tokens([session.get("token_id")], user['user_id'], "manual_revoke")
     
     return {"message": "تم إنهاء الجلسة"}
@@ -9,17 +9,21 @@ Company Settings Routes - إعدادات الشركة
 ============================================================
 """
 
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request
 from pydantic import BaseModel
 from typing import Optional
 from database import db
 from utils.auth import get_current_user, require_roles
+from services.branding_assets import (
+    PUBLIC_ASSETS, PWA_ICON_SIZES, DEFAULT_ICON_SIZE,
+    store_asset, remove_asset, get_asset_meta, load_asset_bytes, asset_response,
+    render_pwa_icons, clear_pwa_icons, get_pwa_icons,
+)
 from datetime import datetime, timezone
-import uuid
-import base64
-import os
+import logging
 
 router = APIRouter(prefix="/api/company-settings", tags=["company-settings"])
+logger = logging.getLogger(__name__)
 
 
 # ============================================================
@@ -160,10 +164,8 @@ async def upload_logo(
     if len(content) > 2 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="حجم الملف أكبر من 2MB")
     
-    # Convert to base64 data URL
-    mime_type = file.content_type
-    base64_data = base64.b64encode(content).decode('utf-8')
-    data_url = f"data:{mime_type};base64,{base64_data}"
+    # Store as file - the settings document only keeps the URL
+    meta = await store_asset(db, "logo", content, file.content_type)
     
     now = datetime.now(timezone.utc).isoformat()
     
@@ -171,7 +173,7 @@ async def upload_logo(
         {"key": "login_page"},
         {
             "$set": {
-                "logo_url": data_url,
+                "logo_url": meta["url"],
                 "logo_filename": file.filename,
                 "logo_updated_at": now,
                 "updated_at": now,
@@ -181,7 +183,15 @@ async def upload_logo(
         upsert=True
     )
     
-    return {"message": "تم رفع الشعار بنجاح", "logo_url": data_url}
+    # الشعار هو أيقونة التطبيق الاحتياطية - تُولد المقاسات الآن بدلاً من كل طلب
+    icons = await get_pwa_icons(db)
+    if not icons or icons.get("source") != "upload":
+        try:
+            await render_pwa_icons(db, content, "logo")
+        except ValueError as e:
+            logger.warning(f"PWA icons not rendered from logo: {e}")
+    
+    return {"message": "تم رفع الشعار بنجاح", "logo_url": meta["url"]}
 
 
 # ============================================================
@@ -208,10 +218,8 @@ async def upload_side_image(
     if len(content) > 5 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="حجم الملف أكبر من 5MB")
     
-    # Convert to base64 data URL
-    mime_type = file.content_type
-    base64_data = base64.b64encode(content).decode('utf-8')
-    data_url = f"data:{mime_type};base64,{base64_data}"
+    # Store as file - the settings document only keeps the URL
+    meta = await store_asset(db, "side_image", content, file.content_type)
     
     now = datetime.now(timezone.utc).isoformat()
     
@@ -219,7 +227,7 @@ async def upload_side_image(
         {"key": "login_page"},
         {
             "$set": {
-                "side_image_url": data_url,
+                "side_image_url": meta["url"],
                 "side_image_filename": file.filename,
                 "side_image_updated_at": now,
                 "updated_at": now,
@@ -229,7 +237,7 @@ async def upload_side_image(
         upsert=True
     )
     
-    return {"message": "تم رفع الصورة الجانبية بنجاح", "side_image_url": data_url}
+    return {"message": "تم رفع الصورة الجانبية بنجاح", "side_image_url": meta["url"]}
 
 
 # ============================================================
@@ -253,6 +261,12 @@ async def delete_logo(user=Depends(require_roles('stas'))):
         }
     )
     
+    await remove_asset(db, "logo")
+    
+    icons = await get_pwa_icons(db)
+    if icons and icons.get("source") == "logo":
+        await clear_pwa_icons(db)
+    
     return {"message": "تم حذف الشعار"}
 
 
@@ -277,6 +291,8 @@ async def delete_side_image(user=Depends(require_roles('stas'))):
         }
     )
     
+    await remove_asset(db, "side_image")
+    
     return {"message": "تم حذف الصورة الجانبية"}
 
 
@@ -304,19 +320,21 @@ async def upload_pwa_icon(
     if len(content) > 2 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="حجم الملف أكبر من 2MB")
     
-    # Convert to base64 data URL
-    mime_type = file.content_type
-    base64_data = base64.b64encode(content).decode('utf-8')
-    data_url = f"data:{mime_type};base64,{base64_data}"
+    # Render every icon size once, at upload time
+    try:
+        await render_pwa_icons(db, content, "upload")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="تعذر قراءة الصورة")
+    
+    meta = await store_asset(db, "pwa_icon", content, file.content_type)
     
     now = datetime.now(timezone.utc).isoformat()
     
-    # Save to database
     await db.company_settings.update_one(
         {"key": "login_page"},
         {
             "$set": {
-                "pwa_icon_url": data_url,
+                "pwa_icon_url": meta["url"],
                 "pwa_icon_filename": file.filename,
                 "pwa_icon_updated_at": now,
                 "updated_at": now,
@@ -326,23 +344,9 @@ async def upload_pwa_icon(
         upsert=True
     )
     
-    # Also save the raw bytes to serve as actual icon files
-    await db.company_settings.update_one(
-        {"key": "pwa_icons"},
-        {
-            "$set": {
-                "icon_data": base64_data,
-                "mime_type": mime_type,
-                "updated_at": now,
-                "version": str(uuid.uuid4())[:8]
-            }
-        },
-        upsert=True
-    )
-    
     return {
         "message": "تم رفع أيقونة التطبيق بنجاح",
-        "pwa_icon_url": data_url
+        "pwa_icon_url": meta["url"]
     }
 
 
@@ -363,92 +367,57 @@ async def delete_pwa_icon(user=Depends(require_roles('stas'))):
         }
     )
     
-    await db.company_settings.delete_one({"key": "pwa_icons"})
+    await clear_pwa_icons(db)
+    await remove_asset(db, "pwa_icon")
+    
+    # العودة لأيقونات مشتقة من الشعار إن وجد
+    logo_meta = await get_asset_meta(db, "logo")
+    if logo_meta:
+        try:
+            await render_pwa_icons(db, await load_asset_bytes(logo_meta), "logo")
+        except (ValueError, FileNotFoundError) as e:
+            logger.warning(f"PWA icons not rendered from logo: {e}")
     
     return {"message": "تم حذف أيقونة التطبيق"}
 
 
 @router.get("/pwa-icon/{size}")
-async def get_pwa_icon(size: str):
+async def get_pwa_icon(size: str, request: Request, v: Optional[str] = None):
     """
     Get PWA icon in requested size. No auth required.
-    Sizes: 192, 512, 180 (apple-touch)
-    Returns the actual image file.
+    Sizes: 32, 180 (apple-touch), 192, 512
+    Icons are pre-rendered at upload time and served with a strong ETag;
+    versioned URLs (?v=) from the manifest are cached as immutable.
     """
-    from fastapi.responses import Response
-    from PIL import Image
-    from io import BytesIO
-    
-    # Get icon from database
-    icon_data = await db.company_settings.find_one({"key": "pwa_icons"})
-    
-    if not icon_data or not icon_data.get("icon_data"):
-        # Fall back to company logo
-        settings = await db.company_settings.find_one({"key": "login_page"})
-        if settings and settings.get("logo_url"):
-            # Extract base64 from data URL
-            logo_url = settings["logo_url"]
-            if logo_url.startswith("data:"):
-                parts = logo_url.split(",", 1)
-                if len(parts) == 2:
-                    base64_data = parts[1]
-                    mime_type = parts[0].split(":")[1].split(";")[0]
-                else:
-                    raise HTTPException(status_code=404, detail="Icon not found")
-            else:
-                raise HTTPException(status_code=404, detail="Icon not found")
-        else:
-            raise HTTPException(status_code=404, detail="Icon not found")
-    else:
-        base64_data = icon_data["icon_data"]
-        mime_type = icon_data.get("mime_type", "image/png")
-    
-    # Decode base64
-    try:
-        image_bytes = base64.b64decode(base64_data)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Invalid icon data")
-    
     # Parse requested size
     try:
         target_size = int(size)
-        if target_size not in [32, 180, 192, 512]:
-            target_size = 512
+        if target_size not in PWA_ICON_SIZES:
+            target_size = DEFAULT_ICON_SIZE
     except ValueError:
-        target_size = 512
+        target_size = DEFAULT_ICON_SIZE
     
-    # Resize image
-    try:
-        img = Image.open(BytesIO(image_bytes))
-        
-        # Convert to RGB if needed (for PNG with transparency, add white background)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize
-        img = img.resize((target_size, target_size), Image.LANCZOS)
-        
-        # Save to bytes
-        output = BytesIO()
-        img.save(output, format='PNG')
-        output.seek(0)
-        
-        return Response(
-            content=output.read(),
-            media_type="image/png",
-            headers={
-                "Cache-Control": "public, max-age=3600",
-                "Content-Disposition": f"inline; filename=icon-{target_size}.png"
-            }
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process icon: {str(e)}")
+    meta = await get_asset_meta(db, f"pwa_icon_{target_size}")
+    if not meta:
+        raise HTTPException(status_code=404, detail="Icon not found")
+    
+    return await asset_response(request, meta, filename=f"icon-{target_size}.png", immutable=bool(v))
+
+
+@router.get("/assets/{name}")
+async def get_branding_asset(name: str, request: Request, v: Optional[str] = None):
+    """
+    Serve a branding asset (logo, side image, PWA icon source). No auth required.
+    URLs stored in settings carry ?v=<etag> and are cached as immutable.
+    """
+    if name not in PUBLIC_ASSETS:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    
+    meta = await get_asset_meta(db, name)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    
+    return await asset_response(request, meta, immutable=bool(v))
 
 
 @router.get("/manifest.json")
@@ -458,7 +427,7 @@ async def get_dynamic_manifest():
     No auth required.
     """
     settings = await db.company_settings.find_one({"key": "login_page"}, {"_id": 0})
-    icon_data = await db.company_settings.find_one({"key": "pwa_icons"})
+    icon_data = await get_pwa_icons(db)
     
     company_name_ar = settings.get("company_name_ar", "شركة دار الكود") if settings else "شركة دار الكود"
     company_name_en = settings.get("company_name_en", "DAR AL CODE") if settings else "DAR AL CODE"
@@ -467,11 +436,8 @@ async def get_dynamic_manifest():
     # Use version for cache busting
     version = icon_data.get("version", "1") if icon_data else "1"
     
-    # Check if custom icon exists
-    has_custom_icon = icon_data and icon_data.get("icon_data")
-    has_logo = settings and settings.get("logo_url")
-    
-    if has_custom_icon or has_logo:
+    # Icons are pre-rendered from the uploaded icon or the logo
+    if icon_data and icon_data.get("sizes"):
         # Use dynamic icons from API
         icons = [
             {
@@ -14,6 +14,7 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
 from database import db
+from services.branding_assets import get_company_branding
 from utils.auth import get_current_user, require_roles
 from services.contract_service import (
     generate_contract_serial,
@@ -1377,7 +1378,7 @@ async def get_contract_pdf(
         raise HTTPException(status_code=404, detail="العقد غير موجود")
     
     # Get branding
-    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    branding = await get_company_branding(db)
     
     # Generate PDF
     pdf_bytes, pdf_hash, integrity_id = generate_contract_pdf(
@@ -1,8 +1,8 @@
 """
 Device Management Routes - إدارة الأجهزة
 """
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, timezone
 from database import db
@@ -22,6 +22,7 @@ from services.device_service import (
     reset_employee_devices,
     set_device_as_primary
 )
+from services.fingerprint_index import SIMILAR_THRESHOLD, find_similar_devices, normalize_features
 
 router = APIRouter(prefix="/api/devices", tags=["devices"])
 
@@ -522,3 +523,79 @@ async def compare_two_fingerprints(
     
     result = compare_fingerprints(fp1, fp2)
     return result
+
+
+# ==================== SIMILAR DEVICES - الأجهزة المشابهة ====================
+
+SIMILAR_DEVICE_FIELDS = {
+    "id": 1, "employee_id": 1, "device_name": 1, "device_type": 1, "os": 1, "browser": 1,
+    "status": 1, "registered_at": 1, "last_used_at": 1, "last_login": 1, "device_signature": 1,
+}
+
+
+class SimilarDevicesRequest(BaseModel):
+    fingerprint_data: dict
+    threshold: float = Field(SIMILAR_THRESHOLD, ge=0.3, le=1.0)
+
+
+async def _similar_devices_response(features: dict, threshold: float, exclude_id: Optional[str] = None) -> dict:
+    if not features:
+        raise HTTPException(400, "لا توجد بصمة كافية للمقارنة")
+    
+    query = {"id": {"$ne": exclude_id}} if exclude_id else None
+    devices = await find_similar_devices(db, features, query, threshold, projection=SIMILAR_DEVICE_FIELDS)
+    
+    # أسماء الموظفين باستعلام واحد
+    employee_ids = list({d.get('employee_id') for d in devices if d.get('employee_id')})
+    employees = await db.employees.find(
+        {"id": {"$in": employee_ids}},
+        {"_id": 0, "id": 1, "full_name_ar": 1, "employee_number": 1}
+    ).to_list(len(employee_ids) or 1)
+    by_id = {e['id']: e for e in employees}
+    
+    for device in devices:
+        matched = device.pop('fp_features', {}) or {}
+        device['matching_fields'] = [f for f, v in features.items() if matched.get(f) == v]
+        emp = by_id.get(device.get('employee_id'), {})
+        device['employee_name_ar'] = emp.get('full_name_ar', '')
+        device['employee_number'] = emp.get('employee_number', '')
+    
+    return {
+        "threshold": threshold,
+        "count": len(devices),
+        "employee_count": len(employee_ids),
+        "devices": devices
+    }
+
+
+@router.get("/similar/{device_id}")
+async def get_similar_devices(
+    device_id: str,
+    threshold: float = Query(SIMILAR_THRESHOLD, ge=0.3, le=1.0),
+    user=Depends(require_roles('stas', 'sultan', 'naif'))
+):
+    """
+    الأجهزة المشابهة لجهاز مسجل (لكل الموظفين) - من فهرس تشابه البصمات
+    """
+    device = await db.employee_devices.find_one(
+        {"id": device_id},
+        {"_id": 0, "fp_features": 1, "fingerprint_data": 1}
+    )
+    if not device:
+        raise HTTPException(404, "الجهاز غير موجود")
+    
+    features = device.get('fp_features') or normalize_features(device.get('fingerprint_data'))
+    result = await _similar_devices_response(features, threshold, exclude_id=device_id)
+    result["device_id"] = device_id
+    return result
+
+
+@router.post("/similar")
+async def search_similar_devices(
+    req: SimilarDevicesRequest,
+    user=Depends(require_roles('stas', 'sultan', 'naif'))
+):
+    """
+    البحث عن الأجهزة المشابهة لبصمة معينة (لكل الموظفين)
+    """
+    return await _similar_devices_response(normalize_features(req.fingerprint_data), req.threshold)
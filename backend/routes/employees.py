@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request
 from pydantic import BaseModel
 from typing import Optional
 from database import db
+from services.session_cache import refresh_users
 from utils.auth import get_current_user, require_roles
 from datetime import datetime, timezone
 import os
@@ -12,6 +13,9 @@ import base64
 from services.leave_service import get_employee_leave_summary
 from services.attendance_service import get_employee_attendance_summary, get_unsettled_absences
 from services.service_calculator import get_employee_service_info
+from services.media_service import (
+    save_upload_stream, generate_thumbnails, get_thumbnail, remove_with_thumbnails, file_response
+)
 from services.hr_policy import (
     calculate_pro_rata_entitlement,
     get_employee_annual_policy,
@@ -230,6 +234,7 @@ async def update_employee(employee_id: str, update: EmployeeUpdate, user=Depends
         )
     if 'is_active' in updates:
         await db.users.update_one({"employee_id": employee_id}, {"$set": {"is_active": updates['is_active']}})
+        await refresh_users({"employee_id": employee_id})
     updated = await db.employees.find_one({"id": employee_id}, {"_id": 0})
     return updated
 
@@ -1125,40 +1130,37 @@ async def upload_employee_photo(
             detail=f"نوع الملف غير مدعوم. الأنواع المدعومة: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # قراءة المحتوى والتحقق من الحجم
-    content = await photo.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="حجم الصورة يجب أن يكون أقل من 5 ميجابايت")
+    # حفظ الملف على دفعات - الاسم هو بصمة المحتوى فالصور المكررة تُحفظ مرة واحدة
+    saved = await save_upload_stream(
+        photo, UPLOAD_DIR, MAX_FILE_SIZE, ext=file_ext,
+        size_error="حجم الصورة يجب أن يكون أقل من 5 ميجابايت"
+    )
     
-    # إنشاء مجلد الرفع
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    # توليد الصور المصغرة (خارج حلقة الأحداث) - يتحقق أيضاً من أن الملف صورة فعلاً
+    try:
+        await generate_thumbnails(saved["path"])
+    except Exception:
+        if not saved["deduplicated"]:
+            remove_with_thumbnails(saved["path"])
+        raise HTTPException(status_code=400, detail="تعذر قراءة الصورة")
     
-    # حذف الصورة القديمة إن وجدت
+    # حذف الصورة القديمة إن لم تعد مستخدمة
     old_photo = emp.get('photo_filename')
-    if old_photo:
-        old_path = os.path.join(UPLOAD_DIR, old_photo)
-        if os.path.exists(old_path):
-            try:
-                os.remove(old_path)
-            except OSError:
-                pass
-    
-    # إنشاء اسم ملف فريد
-    filename = f"{employee_id}_{uuid.uuid4().hex[:8]}{file_ext}"
-    filepath = os.path.join(UPLOAD_DIR, filename)
+    if old_photo and old_photo != saved["filename"]:
+        await _release_photo_file(old_photo, employee_id)
     
-    # حفظ الملف
-    with open(filepath, 'wb') as f:
-        f.write(content)
-    
-    # تحديث بيانات الموظف مع URL الصورة
-    photo_url = f"/api/employees/{employee_id}/photo-file"
+    # تحديث بيانات الموظف مع URL الصورة (v= للتخزين المؤقت في المتصفح)
+    version = saved["sha256"][:12]
+    photo_url = f"/api/employees/{employee_id}/photo-file?v={version}"
+    photo_thumbnail_url = f"/api/employees/{employee_id}/photo-file?size=128&v={version}"
     
     await db.employees.update_one(
         {"id": employee_id},
         {"$set": {
-            "photo_filename": filename,
+            "photo_filename": saved["filename"],
+            "photo_sha256": saved["sha256"],
             "photo_url": photo_url,
+            "photo_thumbnail_url": photo_thumbnail_url,
             "photo_updated_at": datetime.now(timezone.utc).isoformat(),
             "photo_updated_by": user['user_id']
         }}
@@ -1166,18 +1168,31 @@ async def upload_employee_photo(
     
     return {
         "message": "تم رفع الصورة بنجاح",
-        "photo_url": photo_url
+        "photo_url": photo_url,
+        "photo_thumbnail_url": photo_thumbnail_url
     }
 
 
+async def _release_photo_file(filename: str, employee_id: str):
+    """حذف ملف الصورة ومصغراتها إذا لم يعد أي موظف آخر يستخدمها"""
+    in_use = await db.employees.count_documents({"photo_filename": filename, "id": {"$ne": employee_id}})
+    if not in_use:
+        remove_with_thumbnails(os.path.join(UPLOAD_DIR, filename))
+
+
 @router.get("/{employee_id}/photo-file")
-async def get_employee_photo_file(employee_id: str):
+async def get_employee_photo_file(
+    employee_id: str,
+    request: Request,
+    size: Optional[int] = None,
+    v: Optional[str] = None
+):
     """
     الحصول على ملف صورة الموظف
+    - size: صورة مصغرة WebP (64 / 128 / 256) للوحات الفريق
+    - يدعم ETag و Last-Modified و Range
     """
-    from fastapi.responses import FileResponse
-    
-    emp = await db.employees.find_one({"id": employee_id}, {"photo_filename": 1})
+    emp = await db.employees.find_one({"id": employee_id}, {"photo_filename": 1, "photo_sha256": 1})
     if not emp or not emp.get('photo_filename'):
         raise HTTPException(status_code=404, detail="الصورة غير موجودة")
     
@@ -1185,7 +1200,23 @@ async def get_employee_photo_file(employee_id: str):
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="ملف الصورة غير موجود")
     
-    return FileResponse(filepath)
+    # الروابط المرقمة (v=) لا تتغير أبداً
+    cache_control = "private, max-age=31536000, immutable" if v else "private, max-age=3600"
+    sha = emp.get('photo_sha256')
+    
+    if size:
+        thumb_path = await get_thumbnail(filepath, size)
+        if thumb_path:
+            return await file_response(
+                request, thumb_path, media_type="image/webp",
+                etag=f"{sha}-{os.path.basename(thumb_path)}" if sha else None,
+                content_disposition_type="inline", cache_control=cache_control
+            )
+    
+    return await file_response(
+        request, filepath, etag=sha,
+        content_disposition_type="inline", cache_control=cache_control
+    )
 
 
 @router.delete("/{employee_id}/photo")
@@ -1203,19 +1234,16 @@ async def delete_employee_photo(
     # حذف الملف
     old_photo = emp.get('photo_filename')
     if old_photo:
-        old_path = os.path.join(UPLOAD_DIR, old_photo)
-        if os.path.exists(old_path):
-            try:
-                os.remove(old_path)
-            except OSError:
-                pass
+        await _release_photo_file(old_photo, employee_id)
     
     # تحديث بيانات الموظف
     await db.employees.update_one(
         {"id": employee_id},
         {"$unset": {
             "photo_filename": "",
-            "photo_url": ""
+            "photo_sha256": "",
+            "photo_url": "",
+            "photo_thumbnail_url": ""
         },
         "$set": {
             "photo_deleted_at": datetime.now(timezone.utc).isoformat(),
@@ -9,16 +9,38 @@ STAS System Maintenance API
 - أي collection جديدة يجب إضافتها هنا
 """
 
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from database import db
 from utils.auth import require_roles
+from services.storage_insights import (
+    GROWTH_HISTORY_DAYS,
+    get_collection_stats,
+    get_database_stats,
+    get_growth,
+    get_index_usage,
+    invalidate_cache,
+)
+from services.request_metrics import summary as request_summary
+from services.data_transfer import NdjsonImporter, gzip_stream, ndjson_line as _ndjson_line
+from services.archive_engine import (
+    ArchiveReader,
+    ARCHIVE_FORMAT,
+    create_archive,
+    is_chunked,
+    iter_archive_json,
+    open_archive_chain,
+    remove_archive_files,
+    restore_chain,
+    restore_lock,
+    restore_progress,
+)
 from datetime import datetime, timezone
 import uuid
 import json
-import gzip
-import base64
+import zlib
 import zipfile
 import io
 import os
@@ -66,6 +88,11 @@ PROTECTED_COLLECTIONS = [
 # كل الـ Collections في النظام (للأرشفة)
 ALL_COLLECTIONS = TRANSACTION_COLLECTIONS + PROTECTED_COLLECTIONS
 
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# ما يُؤرشف ويُستعاد: system_archives سجلات لملفات الأرشيف على القرص - استعادتها تفقد الأرشيفات الحالية
+ARCHIVED_COLLECTIONS = [c for c in ALL_COLLECTIONS if c != "system_archives"]
+
 # Collections تحتاج إعادة تهيئة بعد الحذف
 RESET_AFTER_DELETE = {
     "counters": [{"id": "transaction_ref", "seq": 0}],
@@ -96,6 +123,7 @@ class RestoreRequest(BaseModel):
 async def get_storage_info(user=Depends(require_roles('stas'))):
     """
     الحصول على معلومات التخزين وحجم البيانات
+    الأحجام الفعلية من $collStats (services.storage_insights) - محفوظة لدقيقة
     متاح لـ STAS فقط
     """
     storage_info = {
@@ -109,6 +137,8 @@ async def get_storage_info(user=Depends(require_roles('stas'))):
             "total_size_kb": 0,
             "transaction_size_kb": 0,
             "protected_size_kb": 0,
+            "storage_size_kb": 0,
+            "index_size_kb": 0,
         },
         "categories": {
             "transactions": {"collections": [], "total_docs": 0, "total_size_kb": 0},
@@ -116,60 +146,85 @@ async def get_storage_info(user=Depends(require_roles('stas'))):
         }
     }
     
-    # جمع إحصائيات كل collection
+    stats = await get_collection_stats(db, ALL_COLLECTIONS)
+    
     for coll_name in ALL_COLLECTIONS:
-        try:
-            coll = db[coll_name]
-            count = await coll.count_documents({})
-            
-            # حساب حجم تقريبي (عدد المستندات * متوسط الحجم)
-            sample = await coll.find_one()
-            avg_size = len(json.dumps(sample, default=str)) if sample else 0
-            estimated_size = count * avg_size
-            estimated_size_kb = round(estimated_size / 1024, 2)
-            
-            coll_info = {
-                "name": coll_name,
-                "documents": count,
-                "estimated_size_bytes": estimated_size,
-                "estimated_size_kb": estimated_size_kb,
-                "is_protected": coll_name in PROTECTED_COLLECTIONS,
-                "is_transaction_data": coll_name in TRANSACTION_COLLECTIONS,
-            }
-            
-            storage_info["collections"][coll_name] = coll_info
-            storage_info["totals"]["total_documents"] += count
-            storage_info["totals"]["total_collections"] += 1
-            storage_info["totals"]["total_size_kb"] += estimated_size_kb
-            
-            if coll_name in TRANSACTION_COLLECTIONS:
-                storage_info["totals"]["transaction_documents"] += count
-                storage_info["totals"]["transaction_size_kb"] += estimated_size_kb
-                storage_info["categories"]["transactions"]["collections"].append(coll_name)
-                storage_info["categories"]["transactions"]["total_docs"] += count
-                storage_info["categories"]["transactions"]["total_size_kb"] += estimated_size_kb
-            else:
-                storage_info["totals"]["protected_documents"] += count
-                storage_info["totals"]["protected_size_kb"] += estimated_size_kb
-                storage_info["categories"]["protected"]["collections"].append(coll_name)
-                storage_info["categories"]["protected"]["total_docs"] += count
-                storage_info["categories"]["protected"]["total_size_kb"] += estimated_size_kb
-                
-        except Exception as e:
-            storage_info["collections"][coll_name] = {
-                "name": coll_name,
-                "error": str(e),
-                "documents": 0
-            }
+        coll_stats = stats[coll_name]
+        count = coll_stats["documents"]
+        size_kb = round(coll_stats["size_bytes"] / 1024, 2)
+        
+        storage_info["collections"][coll_name] = {
+            "name": coll_name,
+            "documents": count,
+            "estimated_size_bytes": coll_stats["size_bytes"],
+            "estimated_size_kb": size_kb,
+            "avg_document_bytes": coll_stats["avg_document_bytes"],
+            "storage_size_kb": round(coll_stats["storage_size_bytes"] / 1024, 2),
+            "index_size_kb": round(coll_stats["index_size_bytes"] / 1024, 2),
+            "is_protected": coll_name in PROTECTED_COLLECTIONS,
+            "is_transaction_data": coll_name in TRANSACTION_COLLECTIONS,
+        }
+        
+        totals = storage_info["totals"]
+        totals["total_documents"] += count
+        totals["total_collections"] += 1
+        totals["total_size_kb"] += size_kb
+        totals["storage_size_kb"] += storage_info["collections"][coll_name]["storage_size_kb"]
+        totals["index_size_kb"] += storage_info["collections"][coll_name]["index_size_kb"]
+        
+        category = "transactions" if coll_name in TRANSACTION_COLLECTIONS else "protected"
+        prefix = "transaction" if category == "transactions" else "protected"
+        totals[f"{prefix}_documents"] += count
+        totals[f"{prefix}_size_kb"] += size_kb
+        storage_info["categories"][category]["collections"].append(coll_name)
+        storage_info["categories"][category]["total_docs"] += count
+        storage_info["categories"][category]["total_size_kb"] += size_kb
     
     # تقريب الأحجام الكلية
-    storage_info["totals"]["total_size_kb"] = round(storage_info["totals"]["total_size_kb"], 2)
-    storage_info["totals"]["transaction_size_kb"] = round(storage_info["totals"]["transaction_size_kb"], 2)
-    storage_info["totals"]["protected_size_kb"] = round(storage_info["totals"]["protected_size_kb"], 2)
+    for key in ("total_size_kb", "transaction_size_kb", "protected_size_kb", "storage_size_kb", "index_size_kb"):
+        storage_info["totals"][key] = round(storage_info["totals"][key], 2)
+    for category in storage_info["categories"].values():
+        category["total_size_kb"] = round(category["total_size_kb"], 2)
     
     return storage_info
 
 
+@router.get("/storage-insights")
+async def get_storage_insights(
+    days: int = Query(30, ge=1, le=GROWTH_HISTORY_DAYS),
+    user=Depends(require_roles('stas'))
+):
+    """
+    تفاصيل التخزين لكل Collections قاعدة البيانات:
+    الأحجام الفعلية، أحجام واستخدام الفهارس (غير المستخدمة منذ تشغيل الخادم)، والنمو اليومي
+    """
+    names = sorted(n for n in await db.list_collection_names() if not n.startswith("system."))
+    stats = await get_collection_stats(db, names)
+    usage = await get_index_usage(db, names)
+    
+    collections = []
+    for name in names:
+        coll_stats = dict(stats[name])
+        index_sizes = coll_stats.pop("indexes")
+        coll_stats["indexes"] = [
+            {**index, "size_bytes": index_sizes.get(index["name"], 0), "unused": index["ops"] == 0 and index["name"] != "_id_"}
+            for index in usage.get(name, [])
+        ]
+        collections.append(coll_stats)
+    collections.sort(key=lambda c: c["storage_size_bytes"] + c["index_size_bytes"], reverse=True)
+    
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "database": await get_database_stats(db),
+        "collections": collections,
+        "unused_indexes": [
+            {"collection": c["name"], "index": i["name"], "size_bytes": i["size_bytes"]}
+            for c in collections for i in c["indexes"] if i["unused"]
+        ],
+        "growth": await get_growth(db, days),
+    }
+
+
 # ============================================================
 # حذف جميع المعاملات
 # ============================================================
@@ -279,6 +334,7 @@ async def purge_all_transactions(req: PurgeRequest, user=Depends(require_roles('
             "details": results
         })
         
+        invalidate_cache()
         return results
         
     except Exception as e:
@@ -295,64 +351,64 @@ async def purge_all_transactions(req: PurgeRequest, user=Depends(require_roles('
 async def create_full_archive(req: ArchiveRequest, user=Depends(require_roles('stas'))):
     """
     إنشاء أرشيف كامل للنظام
-    يحفظ جميع الـ Collections في سجل واحد
+    كل Collection تُصدّر بمؤشر على دفعات إلى ملفات NDJSON مضغوطة (services.archive_engine)
+    وسجل system_archives يحمل البيان فقط (الملفات + SHA-256)
+    """
+    return await _create_archive(req, user)
+
+
+@router.post("/archive-incremental")
+async def create_incremental_archive(req: ArchiveRequest, user=Depends(require_roles('stas'))):
     """
+    إنشاء أرشيف تزايدي: فقط ما تغيّر منذ آخر أرشيف (كامل أو تزايدي)
+    الاستعادة منه تطبّق الأرشيف الكامل + كل الأرشيفات التزايدية بعده حتى هذا الأرشيف
+    """
+    base = await db.system_archives.find_one(
+        {"format": ARCHIVE_FORMAT},
+        {"_id": 0},
+        sort=[("created_at", -1)]
+    )
+    if not base:
+        raise HTTPException(status_code=400, detail="لا يوجد أرشيف سابق - أنشئ أرشيفاً كاملاً أولاً")
+    
+    return await _create_archive(req, user, base=base)
+
+
+async def _create_archive(req: ArchiveRequest, user: dict, base: Optional[dict] = None):
     now = datetime.now(timezone.utc)
+    kind = "incremental" if base else "full"
     archive_id = f"ARCHIVE-{now.strftime('%Y%m%d-%H%M%S')}-{str(uuid.uuid4())[:8]}"
+    name = req.name or f"{kind.title()} Archive {now.strftime('%Y-%m-%d %H:%M')}"
     
-    archive_data = {
-        "id": archive_id,
-        "name": req.name or f"Full Archive {now.strftime('%Y-%m-%d %H:%M')}",
-        "description": req.description or "Full system archive",
-        "created_at": now.isoformat(),
-        "created_by": user['user_id'],
-        "created_by_name": user.get('full_name', 'STAS'),
-        "version": "1.0",
-        "collections": {},
-        "stats": {
-            "total_documents": 0,
-            "collections_archived": 0,
-        }
-    }
-    
-    # جمع بيانات كل collection
-    for coll_name in ALL_COLLECTIONS:
-        try:
-            coll = db[coll_name]
-            documents = await coll.find({}, {"_id": 0}).to_list(100000)
-            
-            archive_data["collections"][coll_name] = {
-                "count": len(documents),
-                "data": documents
-            }
-            archive_data["stats"]["total_documents"] += len(documents)
-            archive_data["stats"]["collections_archived"] += 1
-            
-        except Exception as e:
-            archive_data["collections"][coll_name] = {
-                "error": str(e),
-                "count": 0,
-                "data": []
-            }
+    # Changes are taken from the base archive's start time, so nothing written during it is missed
+    manifest = await create_archive(db, archive_id, ARCHIVED_COLLECTIONS, base=base)
     
-    # ضغط البيانات وتحويلها إلى base64
-    json_data = json.dumps(archive_data, default=str, ensure_ascii=False)
-    compressed = gzip.compress(json_data.encode('utf-8'))
-    compressed_b64 = base64.b64encode(compressed).decode('ascii')
+    stats = {
+        "total_documents": manifest["total_documents"],
+        "collections_archived": sum(1 for c in manifest["collections"].values() if not c.get("error")),
+    }
+    raw_bytes = manifest["raw_bytes"]
+    size_bytes = manifest["size_bytes"]
     
-    # حفظ الأرشيف في قاعدة البيانات
     archive_record = {
         "id": archive_id,
-        "name": archive_data["name"],
-        "description": archive_data["description"],
+        "name": name,
+        "description": req.description or ("Incremental system archive" if base else "Full system archive"),
         "created_at": now.isoformat(),
         "created_by": user['user_id'],
         "created_by_name": user.get('full_name', 'STAS'),
-        "stats": archive_data["stats"],
-        "compressed_data": compressed_b64,
-        "size_original_kb": round(len(json_data) / 1024, 2),
-        "size_compressed_kb": round(len(compressed) / 1024, 2),
-        "compression_ratio": round(len(compressed) / len(json_data) * 100, 1),
+        "version": "2.0",
+        "stats": stats,
+        "kind": kind,
+        "base_archive_id": base["id"] if base else None,
+        "since": base["created_at"] if base else None,
+        "format": manifest["format"],
+        "storage": manifest["storage"],
+        "directory": manifest["directory"],
+        "collections": manifest["collections"],
+        "size_original_kb": round(raw_bytes / 1024, 2),
+        "size_compressed_kb": round(size_bytes / 1024, 2),
+        "compression_ratio": round(size_bytes / raw_bytes * 100, 1) if raw_bytes else 0,
     }
     
     await db.system_archives.insert_one(archive_record)
@@ -361,14 +417,14 @@ async def create_full_archive(req: ArchiveRequest, user=Depends(require_roles('s
     await db.maintenance_log.insert_one({
         "id": str(uuid.uuid4()),
         "type": "archive",
-        "action": "create_full_archive",
+        "action": "create_incremental_archive" if base else "create_full_archive",
         "archive_id": archive_id,
         "performed_by": user['user_id'],
         "performed_by_name": user.get('full_name', 'STAS'),
         "timestamp": now.isoformat(),
         "details": {
-            "name": archive_data["name"],
-            "stats": archive_data["stats"],
+            "name": name,
+            "stats": stats,
             "size_kb": archive_record["size_compressed_kb"]
         }
     })
@@ -376,8 +432,10 @@ async def create_full_archive(req: ArchiveRequest, user=Depends(require_roles('s
     return {
         "message": "تم إنشاء الأرشيف بنجاح",
         "archive_id": archive_id,
-        "name": archive_data["name"],
-        "stats": archive_data["stats"],
+        "name": name,
+        "kind": kind,
+        "base_archive_id": archive_record["base_archive_id"],
+        "stats": stats,
         "size_original_kb": archive_record["size_original_kb"],
         "size_compressed_kb": archive_record["size_compressed_kb"],
         "compression_ratio": f"{archive_record['compression_ratio']}%"
@@ -391,7 +449,7 @@ async def list_archives(user=Depends(require_roles('stas'))):
     """
     archives = await db.system_archives.find(
         {}, 
-        {"_id": 0, "compressed_data": 0}  # لا نرسل البيانات المضغوطة
+        {"_id": 0, "compressed_data": 0, "collections": 0}  # لا نرسل البيانات المضغوطة ولا بيان الملفات
     ).sort("created_at", -1).to_list(100)
     
     return {
@@ -403,7 +461,7 @@ async def list_archives(user=Depends(require_roles('stas'))):
 @router.get("/archives/{archive_id}")
 async def get_archive_details(archive_id: str, user=Depends(require_roles('stas'))):
     """
-    عرض تفاصيل أرشيف محدد (بدون البيانات)
+    عرض تفاصيل أرشيف محدد (بدون البيانات - مع بيان الملفات للأرشيف المجزأ)
     """
     archive = await db.system_archives.find_one(
         {"id": archive_id},
@@ -416,85 +474,120 @@ async def get_archive_details(archive_id: str, user=Depends(require_roles('stas'
     return archive
 
 
-@router.get("/archives/{archive_id}/download")
-async def download_archive(archive_id: str, user=Depends(require_roles('stas'))):
-    """
-    تحميل بيانات الأرشيف كاملة (JSON مضغوط)
-    """
+async def _open_verified_archive(archive_id: str) -> ArchiveReader:
+    """فتح أرشيف للقراءة بعد التحقق من ملفاته"""
     archive = await db.system_archives.find_one({"id": archive_id}, {"_id": 0})
     
     if not archive:
         raise HTTPException(status_code=404, detail="الأرشيف غير موجود")
+    if not is_chunked(archive) and not archive.get("compressed_data"):
+        raise HTTPException(status_code=400, detail="هذا الأرشيف لا يحتوي على بيانات")
     
-    # فك الضغط وإرجاع البيانات
-    compressed = base64.b64decode(archive["compressed_data"])
-    decompressed = gzip.decompress(compressed)
-    data = json.loads(decompressed.decode('utf-8'))
+    reader = await ArchiveReader.open(archive)
+    problems = await reader.verify()
+    if problems:
+        raise HTTPException(status_code=409, detail=f"ملفات الأرشيف تالفة أو مفقودة: {', '.join(problems[:5])}")
+    return reader
+
+
+@router.get("/archives/{archive_id}/download")
+async def download_archive(archive_id: str, format: str = "json", user=Depends(require_roles('stas'))):
+    """
+    تحميل بيانات الأرشيف كاملة - تُولَّد تدريجياً من ملفات الأرشيف
+    format=json: ملف JSON واحد (الصيغة السابقة)
+    format=ndjson: NDJSON مضغوط (gzip) - قابل للرفع والاستعادة المتدفقة عبر /archives/upload
+    """
+    reader = await _open_verified_archive(archive_id)
+    archive = reader.archive
+    header = {
+        "id": archive["id"],
+        "name": archive.get("name"),
+        "description": archive.get("description"),
+        "created_at": archive.get("created_at"),
+        "created_by": archive.get("created_by"),
+        "created_by_name": archive.get("created_by_name"),
+        "version": archive.get("version", "1.0"),
+        "kind": archive.get("kind", "full"),
+        "base_archive_id": archive.get("base_archive_id"),
+        "stats": archive.get("stats", {}),
+    }
+    
+    if format == "ndjson":
+        async def lines():
+            yield _ndjson_line({"meta": header})
+            for collection in reader.collections():
+                async for batch in reader.batches(collection):
+                    yield b"".join(_ndjson_line({"collection": collection, "doc": doc}) for doc in batch)
+        
+        return StreamingResponse(
+            gzip_stream(lines()),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{archive_id}.ndjson.gz"'}
+        )
     
-    return data
+    return StreamingResponse(
+        iter_archive_json(reader, header),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="{archive_id}.json"'}
+    )
 
 
 @router.post("/archives/{archive_id}/restore")
 async def restore_archive(archive_id: str, req: RestoreRequest, user=Depends(require_roles('stas'))):
     """
-    استعادة النظام من أرشيف محدد
+    استعادة النظام من أرشيف محدد (الأرشيف التزايدي: + سلسلة الأرشيفات قبله حتى الكامل)
     ⚠️ تحذير: هذا يحذف جميع البيانات الحالية ويستبدلها بالأرشيف
+    المتابعة أثناء التنفيذ: GET /api/maintenance/restore-progress
     """
     if not req.confirm:
         raise HTTPException(
             status_code=400, 
             detail="يجب تأكيد الاستعادة (confirm=true). تحذير: سيتم حذف جميع البيانات الحالية!"
         )
-    
+    # القفل يؤخذ قبل أول await - طلبان متزامنان لا يمران معاً من الفحص
+    if restore_lock.locked():
+        raise HTTPException(status_code=409, detail="توجد عملية استعادة قيد التنفيذ")
+    async with restore_lock:
+        return await _restore_archive(archive_id, user)
+
+
+async def _restore_archive(archive_id: str, user: dict):
+    """التحقق من سلسلة الأرشيف ثم الاستعادة - يُستدعى والقفل مأخوذ"""
     archive = await db.system_archives.find_one({"id": archive_id}, {"_id": 0})
-    
     if not archive:
         raise HTTPException(status_code=404, detail="الأرشيف غير موجود")
+    if not is_chunked(archive) and not archive.get("compressed_data"):
+        raise HTTPException(status_code=400, detail="هذا الأرشيف لا يحتوي على بيانات")
+    
+    # التحقق من ملفات السلسلة كاملة قبل حذف أي شيء
+    try:
+        chain = await open_archive_chain(db, archive)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=f"سلسلة الأرشيف غير مكتملة: {e}")
+    for reader in chain:
+        problems = await reader.verify()
+        if problems:
+            raise HTTPException(status_code=409, detail=f"ملفات الأرشيف تالفة أو مفقودة: {', '.join(problems[:5])}")
     
     now = datetime.now(timezone.utc).isoformat()
     
     try:
-        # فك ضغط البيانات
-        compressed = base64.b64decode(archive["compressed_data"])
-        decompressed = gzip.decompress(compressed)
-        archive_data = json.loads(decompressed.decode('utf-8'))
+        collections_restored = await restore_chain(db, chain, ARCHIVED_COLLECTIONS)
+        invalidate_cache()
         
         results = {
             "timestamp": now,
             "archive_id": archive_id,
             "archive_name": archive["name"],
             "restored_by": user['user_id'],
-            "collections_restored": {},
-            "total_documents_restored": 0,
+            "chain": [reader.archive_id for reader in chain],
+            "collections_restored": collections_restored,
+            "total_documents_restored": sum(c.get("restored", 0) for c in collections_restored.values()),
+            "verified": all(c.get("verified") for c in collections_restored.values()),
             "status": "success"
         }
-        
-        # حذف واستعادة كل collection
-        for coll_name in ALL_COLLECTIONS:
-            if coll_name in archive_data.get("collections", {}):
-                coll_data = archive_data["collections"][coll_name]
-                documents = coll_data.get("data", [])
-                
-                try:
-                    coll = db[coll_name]
-                    
-                    # حذف البيانات الحالية
-                    delete_result = await coll.delete_many({})
-                    
-                    # استعادة البيانات من الأرشيف
-                    if documents:
-                        await coll.insert_many(documents)
-                    
-                    results["collections_restored"][coll_name] = {
-                        "deleted": delete_result.deleted_count,
-                        "restored": len(documents)
-                    }
-                    results["total_documents_restored"] += len(documents)
-                    
-                except Exception as e:
-                    results["collections_restored"][coll_name] = {
-                        "error": str(e)
-                    }
+        if not results["verified"]:
+            results["status"] = "partial"
         
         # تسجيل في سجل الصيانة
         await db.maintenance_log.insert_one({
@@ -514,17 +607,33 @@ async def restore_archive(archive_id: str, req: RestoreRequest, user=Depends(req
         raise HTTPException(status_code=500, detail=f"خطأ في الاستعادة: {str(e)}")
 
 
+@router.get("/restore-progress")
+async def get_restore_progress(user=Depends(require_roles('stas'))):
+    """
+    تقدم آخر عملية استعادة (لكل Collection: المتوقع / المُستعاد / الحالة)
+    """
+    return restore_progress or {"status": "idle"}
+
+
 @router.delete("/archives/{archive_id}")
 async def delete_archive(archive_id: str, user=Depends(require_roles('stas'))):
     """
-    حذف أرشيف محدد
+    حذف أرشيف محدد (السجل + ملفاته)
     """
-    archive = await db.system_archives.find_one({"id": archive_id})
+    archive = await db.system_archives.find_one({"id": archive_id}, {"_id": 0, "compressed_data": 0})
     
     if not archive:
         raise HTTPException(status_code=404, detail="الأرشيف غير موجود")
     
+    dependent = await db.system_archives.find_one({"base_archive_id": archive_id}, {"_id": 0, "id": 1})
+    if dependent:
+        raise HTTPException(
+            status_code=409,
+            detail=f"لا يمكن حذف الأرشيف - الأرشيف التزايدي {dependent['id']} يعتمد عليه"
+        )
+    
     await db.system_archives.delete_one({"id": archive_id})
+    await remove_archive_files(archive)
     
     # تسجيل في سجل الصيانة
     await db.maintenance_log.insert_one({
@@ -561,6 +670,54 @@ async def get_maintenance_logs(limit: int = 50, user=Depends(require_roles('stas
     }
 
 
+# ============================================================
+# سياسات الاحتفاظ (الجلسات وسجل الأمان)
+# ============================================================
+
+@router.get("/retention")
+async def get_retention_policies(user=Depends(require_roles('stas'))):
+    """
+    عرض سياسات الاحتفاظ وآخر تنفيذ لها
+    """
+    from services.retention import list_policies
+    
+    last_runs = await db.job_logs.find(
+        {"job_type": "retention"},
+        {"_id": 0}
+    ).sort("executed_at", -1).to_list(10)
+    
+    return {
+        "policies": list_policies(),
+        "last_runs": last_runs
+    }
+
+
+@router.post("/retention/run")
+async def run_retention_now(user=Depends(require_roles('stas'))):
+    """
+    تطبيق سياسات الاحتفاظ فوراً (أرشفة ← تجميع ← حذف)
+    """
+    from services.retention import run_retention
+    
+    now = datetime.now(timezone.utc)
+    results = await run_retention(db)
+    
+    await db.maintenance_log.insert_one({
+        "id": str(uuid.uuid4()),
+        "type": "retention",
+        "action": "run_retention",
+        "performed_by": user['user_id'],
+        "performed_by_name": user.get('full_name', 'STAS'),
+        "timestamp": now.isoformat(),
+        "details": {"results": results}
+    })
+    
+    return {
+        "message": "تم تطبيق سياسات الاحتفاظ",
+        "results": results
+    }
+
+
 # ============================================================
 # معلومات Collections (للتوثيق)
 # ============================================================
@@ -569,20 +726,31 @@ async def get_maintenance_logs(limit: int = 50, user=Depends(require_roles('stas
 async def get_collections_info(user=Depends(require_roles('stas'))):
     """
     عرض معلومات عن تصنيف الـ Collections
-    مفيد لفهم ما سيُحذف وما سيبقى
+    مفيد لفهم ما سيُحذف وما سيبقى (مع العدد والحجم الفعلي لكل تصنيف)
     """
+    stats = await get_collection_stats(db, ALL_COLLECTIONS)
+    
+    def _totals(collections: List[str]) -> dict:
+        return {
+            "documents": sum(stats[c]["documents"] for c in collections),
+            "size_kb": round(sum(stats[c]["size_bytes"] for c in collections) / 1024, 2),
+            "storage_size_kb": round(sum(stats[c]["storage_size_bytes"] + stats[c]["index_size_bytes"] for c in collections) / 1024, 2),
+        }
+    
     return {
         "transaction_collections": {
             "description": "هذه الـ Collections تُحذف عند حذف المعاملات",
             "description_ar": "سجلات المعاملات والعمليات اليومية",
             "collections": TRANSACTION_COLLECTIONS,
-            "count": len(TRANSACTION_COLLECTIONS)
+            "count": len(TRANSACTION_COLLECTIONS),
+            **_totals(TRANSACTION_COLLECTIONS)
         },
         "protected_collections": {
             "description": "هذه الـ Collections لا تُحذف (بيانات أساسية)",
             "description_ar": "بيانات المستخدمين والموظفين والإعدادات",
             "collections": PROTECTED_COLLECTIONS,
-            "count": len(PROTECTED_COLLECTIONS)
+            "count": len(PROTECTED_COLLECTIONS),
+            **_totals(PROTECTED_COLLECTIONS)
         },
         "all_collections": {
             "description": "جميع الـ Collections في النظام",
@@ -597,22 +765,38 @@ async def get_collections_info(user=Depends(require_roles('stas'))):
 # رفع واستعادة أرشيف من ملف
 # ============================================================
 
+NDJSON_SUFFIXES = ('.ndjson', '.ndjson.gz', '.jsonl', '.jsonl.gz')
+
+
 @router.post("/archives/upload")
 async def upload_and_restore_archive(
     file: UploadFile = File(...),
     user=Depends(require_roles('stas'))
 ):
     """
-    رفع ملف أرشيف JSON واستعادة النظام منه
+    رفع ملف أرشيف واستعادة النظام منه
+    - NDJSON (.ndjson / .ndjson.gz) بصيغة التحميل ?format=ndjson: يُقرأ ويُكتب على دفعات
+    - JSON (.json) بصيغة التحميل الافتراضية: يُقرأ كاملاً
     ⚠️ تحذير: هذا يحذف جميع البيانات الحالية ويستبدلها بالأرشيف المرفوع
     """
+    # نفس قفل الاستعادة من أرشيف مخزن - استعادة واحدة في كل مرة
+    if restore_lock.locked():
+        raise HTTPException(status_code=409, detail="توجد عملية استعادة قيد التنفيذ")
+    async with restore_lock:
+        return await _restore_from_upload(file, user)
+
+
+async def _restore_from_upload(file: UploadFile, user: dict) -> dict:
+    """JSON يُقرأ كاملاً، NDJSON متدفق - يُستدعى والقفل مأخوذ"""
     now = datetime.now(timezone.utc).isoformat()
     
     # التحقق من نوع الملف
+    if file.filename.endswith(NDJSON_SUFFIXES):
+        return await _restore_from_ndjson_upload(file, user, now)
     if not file.filename.endswith('.json'):
         raise HTTPException(
             status_code=400, 
-            detail="نوع الملف غير مدعوم. يجب أن يكون ملف JSON"
+            detail="نوع الملف غير مدعوم. يجب أن يكون ملف JSON أو NDJSON"
         )
     
     try:
@@ -639,7 +823,7 @@ async def upload_and_restore_archive(
         }
         
         # حذف واستعادة كل collection
-        for coll_name in ALL_COLLECTIONS:
+        for coll_name in ARCHIVED_COLLECTIONS:
             if coll_name in archive_data.get("collections", {}):
                 coll_data = archive_data["collections"][coll_name]
                 documents = coll_data.get("data", [])
@@ -665,43 +849,7 @@ async def upload_and_restore_archive(
                         "error": str(e)
                     }
         
-        # حفظ سجل للأرشيف المرفوع
-        uploaded_archive_id = f"UPLOADED-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{str(uuid.uuid4())[:8]}"
-        
-        await db.system_archives.insert_one({
-            "id": uploaded_archive_id,
-            "name": f"Restored: {archive_data.get('name', file.filename)}",
-            "description": f"استعادة من ملف مرفوع: {file.filename}",
-            "created_at": now,
-            "created_by": user['user_id'],
-            "created_by_name": user.get('full_name', 'STAS'),
-            "stats": {
-                "total_documents": results["total_documents_restored"],
-                "collections_archived": len(results["collections_restored"])
-            },
-            "compressed_data": "",  # لا نحفظ البيانات مرة أخرى
-            "size_original_kb": round(len(content) / 1024, 2),
-            "size_compressed_kb": 0,
-            "source": "uploaded",
-            "original_archive_id": archive_data.get("id")
-        })
-        
-        # تسجيل في سجل الصيانة
-        await db.maintenance_log.insert_one({
-            "id": str(uuid.uuid4()),
-            "type": "restore",
-            "action": "restore_from_uploaded_file",
-            "archive_id": uploaded_archive_id,
-            "performed_by": user['user_id'],
-            "performed_by_name": user.get('full_name', 'STAS'),
-            "timestamp": now,
-            "details": {
-                "file_name": file.filename,
-                "original_archive_name": archive_data.get("name"),
-                "total_restored": results["total_documents_restored"]
-            }
-        })
-        
+        await _record_uploaded_restore(file.filename, len(content), archive_data.get("name"), archive_data.get("id"), results, user, now)
         return results
         
     except json.JSONDecodeError:
@@ -709,6 +857,8 @@ async def upload_and_restore_archive(
             status_code=400, 
             detail="ملف JSON غير صالح"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -716,6 +866,86 @@ async def upload_and_restore_archive(
         )
 
 
+async def _restore_from_ndjson_upload(file: UploadFile, user: dict, now: str) -> dict:
+    """استعادة متدفقة: الملف يُقرأ على أجزاء وكل Collection تُفرغ عند أول سطر لها ثم تُكتب بدفعات"""
+    importer = NdjsonImporter(db, collections=ARCHIVED_COLLECTIONS, replace=True)
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            await importer.feed(chunk)
+        imported = await importer.finish()
+    except (ValueError, zlib.error) as e:
+        raise HTTPException(status_code=400, detail=f"ملف NDJSON غير صالح: {e}")
+    
+    if not imported["collections"] and imported["error_count"]:
+        raise HTTPException(status_code=400, detail=f"ملف NDJSON غير صالح: {imported['errors'][0]['error']}")
+    
+    meta = importer.meta or {}
+    results = {
+        "timestamp": now,
+        "archive_name": meta.get("name", file.filename),
+        "archive_id": meta.get("id", "UPLOADED"),
+        "restored_by": user['user_id'],
+        "file_name": file.filename,
+        "collections_restored": {
+            name: {"deleted": r.get("deleted", 0), "restored": r["written"], "errors": r["errors"]}
+            for name, r in imported["collections"].items()
+        },
+        "total_documents_restored": imported["total_written"],
+        "lines": imported["lines"],
+        "error_count": imported["error_count"],
+        "errors": imported["errors"],
+        "status": "success" if imported["error_count"] == 0 else "partial"
+    }
+    
+    await _record_uploaded_restore(file.filename, size, meta.get("name"), meta.get("id"), results, user, now)
+    return results
+
+
+async def _record_uploaded_restore(file_name: str, size: int, original_name, original_id, results: dict, user: dict, now: str):
+    """سجل الأرشيف المرفوع + سجل الصيانة"""
+    invalidate_cache()
+    uploaded_archive_id = f"UPLOADED-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{str(uuid.uuid4())[:8]}"
+    
+    await db.system_archives.insert_one({
+        "id": uploaded_archive_id,
+        "name": f"Restored: {original_name or file_name}",
+        "description": f"استعادة من ملف مرفوع: {file_name}",
+        "created_at": now,
+        "created_by": user['user_id'],
+        "created_by_name": user.get('full_name', 'STAS'),
+        "stats": {
+            "total_documents": results["total_documents_restored"],
+            "collections_archived": len(results["collections_restored"])
+        },
+        "compressed_data": "",  # لا نحفظ البيانات مرة أخرى
+        "size_original_kb": round(size / 1024, 2),
+        "size_compressed_kb": 0,
+        "source": "uploaded",
+        "original_archive_id": original_id
+    })
+    
+    # تسجيل في سجل الصيانة
+    await db.maintenance_log.insert_one({
+        "id": str(uuid.uuid4()),
+        "type": "restore",
+        "action": "restore_from_uploaded_file",
+        "archive_id": uploaded_archive_id,
+        "performed_by": user['user_id'],
+        "performed_by_name": user.get('full_name', 'STAS'),
+        "timestamp": now,
+        "details": {
+            "file_name": file_name,
+            "original_archive_name": original_name,
+            "total_restored": results["total_documents_restored"]
+        }
+    })
+
+
 
 # ============================================================
 # معلومات تشغيل السيرفر (System Metrics)
@@ -1045,6 +1275,8 @@ async def get_system_metrics(user=Depends(require_roles('stas'))):
             "file_storage": file_storage,
             "uptime": uptime_info,
             "process": process_info,
+            # زمن الطلبات لكل مسار (التفاصيل الكاملة بصيغة Prometheus في /api/system/metrics)
+            "requests": request_summary(),
             "status": "healthy"
         }
         
@@ -11,6 +11,8 @@ from pydantic import BaseModel
 from typing import Optional, List
 from database import db
 from utils.auth import get_current_user
+from services.session_cache import refresh_users, revoke_all_sessions, revoke_user_sessions
+from services import fraud_engine
 from datetime import datetime, timezone, timedelta
 import uuid
 import logging
@@ -20,6 +22,11 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/security", tags=["security"])
 
 
+def user_query(employee_id: str) -> dict:
+    """مستخدم الموظف - حسابات الإدارة بدون موظف تستخدم معرف المستخدم"""
+    return {"$or": [{"employee_id": employee_id}, {"id": employee_id}]}
+
+
 def require_stas(user=Depends(get_current_user)):
     """التحقق من صلاحية STAS فقط"""
     if user.get('role') != 'stas':
@@ -98,6 +105,10 @@ async def suspend_accounts(req: SuspendRequest, request: Request, user=Depends(r
                 }
             )
             
+            # إبطال التوكنات الحالية فوراً (ذاكرة التحقق من الجلسات)
+            await revoke_user_sessions(user_query(emp_id))
+            await fraud_engine.on_logout(emp_id)
+            
             # تسجيل في سجل الأمان
             await db.security_log.insert_one({
                 "id": str(uuid.uuid4()),
@@ -155,6 +166,8 @@ async def unblock_accounts(req: UnblockRequest, request: Request, user=Depends(r
             )
             
             if result.modified_count > 0:
+                await refresh_users(user_query(emp_id))
+                
                 # جلب اسم الموظف
                 employee = await db.employees.find_one({"id": emp_id})
                 emp_name = employee.get('full_name_ar', '') if employee else ''
@@ -206,6 +219,10 @@ async def force_logout(employee_id: str, request: Request, user=Depends(require_
         }
     )
     
+    # إبطال كل التوكنات الصادرة للموظف حتى الآن
+    await revoke_user_sessions(user_query(employee_id))
+    await fraud_engine.on_logout(employee_id)
+    
     # تسجيل في سجل الأمان
     employee = await db.employees.find_one({"id": employee_id})
     await db.security_log.insert_one({
@@ -244,6 +261,10 @@ async def force_logout_all(request: Request, user=Depends(require_stas)):
         }
     )
     
+    # إبطال كل التوكنات (عدا توكن STAS المنفذ)
+    await revoke_all_sessions(user.get('user_id'))
+    await fraud_engine.on_logout_all()
+    
     await db.security_log.insert_one({
         "id": str(uuid.uuid4()),
         "action": "emergency_logout_all",
@@ -422,83 +443,9 @@ async def get_security_stats(user=Depends(require_stas)):
 async def get_fraud_alerts(user=Depends(require_stas)):
     """
     جلب تنبيهات التلاعب المكتشفة
+    التنبيهات تُنشأ عند الدخول والخروج (fraud_engine) - هنا قراءة فقط
     """
-    from services.advanced_device_analysis import detect_fraud_indicators
-    
-    alerts = []
-    
-    # 1. كشف الأجهزة المشتركة بين موظفين
-    pipeline = [
-        {"$match": {"status": "active"}},
-        {"$group": {
-            "_id": "$core_signature",
-            "employees": {"$addToSet": "$employee_id"},
-            "count": {"$sum": 1}
-        }},
-        {"$match": {"count": {"$gt": 1}}}
-    ]
-    
-    shared_devices = await db.login_sessions.aggregate(pipeline).to_list(50)
-    
-    for device in shared_devices:
-        if len(device['employees']) > 1:
-            # جلب أسماء الموظفين
-            emp_names = []
-            for emp_id in device['employees']:
-                emp = await db.employees.find_one({"id": emp_id}, {"full_name_ar": 1})
-                if emp:
-                    emp_names.append(emp.get('full_name_ar', emp_id))
-            
-            alerts.append({
-                "id": str(uuid.uuid4()),
-                "type": "shared_device",
-                "severity": "critical",
-                "title_ar": "جهاز مشترك بين موظفين",
-                "message_ar": f"نفس الجهاز يستخدمه: {', '.join(emp_names)}",
-                "employees": device['employees'],
-                "employee_names": emp_names,
-                "device_signature": device['_id'],
-                "detected_at": datetime.now(timezone.utc).isoformat()
-            })
-    
-    # 2. كشف الجلسات المتزامنة
-    active_sessions = await db.login_sessions.find(
-        {"status": "active"},
-        {"_id": 0}
-    ).to_list(500)
-    
-    # تجميع حسب الموظف
-    emp_sessions = {}
-    for session in active_sessions:
-        emp_id = session.get('employee_id')
-        if emp_id not in emp_sessions:
-            emp_sessions[emp_id] = []
-        emp_sessions[emp_id].append(session)
-    
-    # كشف موظف له أكثر من جلسة نشطة من أجهزة مختلفة
-    for emp_id, sessions in emp_sessions.items():
-        if len(sessions) > 1:
-            signatures = set(s.get('core_signature') for s in sessions if s.get('core_signature'))
-            if len(signatures) > 1:
-                emp = await db.employees.find_one({"id": emp_id}, {"full_name_ar": 1})
-                alerts.append({
-                    "id": str(uuid.uuid4()),
-                    "type": "concurrent_sessions",
-                    "severity": "high",
-                    "title_ar": "جلسات متزامنة من أجهزة مختلفة",
-                    "message_ar": f"{emp.get('full_name_ar', emp_id)} نشط على {len(signatures)} أجهزة مختلفة",
-                    "employee_id": emp_id,
-                    "employee_name": emp.get('full_name_ar', '') if emp else '',
-                    "session_count": len(sessions),
-                    "device_count": len(signatures),
-                    "detected_at": datetime.now(timezone.utc).isoformat()
-                })
-    
-    # ترتيب حسب الخطورة
-    severity_order = {"critical": 0, "high": 1, "medium": 2, "low": 3}
-    alerts.sort(key=lambda x: severity_order.get(x.get('severity', 'low'), 99))
-    
-    return alerts
+    return await fraud_engine.get_open_alerts(db)
 
 
 @router.get("/device-usage/{employee_id}")
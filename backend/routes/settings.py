@@ -7,8 +7,8 @@ from pydantic import BaseModel
 from typing import Optional
 from database import db
 from utils.auth import get_current_user
+from services.branding_assets import store_asset, remove_asset, get_company_branding as load_company_branding
 from datetime import datetime, timezone
-import base64
 import uuid
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -24,7 +24,7 @@ class CompanyBrandingUpdate(BaseModel):
 @router.get("/branding")
 async def get_company_branding(user=Depends(get_current_user)):
     """Get company branding settings - accessible to all authenticated users"""
-    settings = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    settings = await load_company_branding(db)
     if not settings:
         # Return default settings
         return {
@@ -101,10 +101,9 @@ async def upload_company_logo(file: UploadFile = File(...), user=Depends(get_cur
     # Read file content
     content = await file.read()
     
-    # Convert to base64 for storage
+    # Store as file - PDF generators get logo_data via get_company_branding
     content_type = file.content_type or 'image/png'
-    base64_data = base64.b64encode(content).decode('utf-8')
-    logo_data = f"data:{content_type};base64,{base64_data}"
+    meta = await store_asset(db, "company_logo", content, content_type)
     
     now = datetime.now(timezone.utc).isoformat()
     
@@ -115,11 +114,11 @@ async def upload_company_logo(file: UploadFile = File(...), user=Depends(get_cur
         await db.settings.update_one(
             {"type": "company_branding"},
             {"$set": {
-                "logo_data": logo_data,
+                "logo_url": meta["url"],
                 "logo_updated_at": now,
                 "updated_at": now,
                 "updated_by": user.get('user_id')
-            }}
+            }, "$unset": {"logo_data": ""}}
         )
     else:
         await db.settings.insert_one({
@@ -128,7 +127,7 @@ async def upload_company_logo(file: UploadFile = File(...), user=Depends(get_cur
             "company_name_ar": "شركة دار الكود للاستشارات الهندسية",
             "slogan_en": "Engineering Excellence",
             "slogan_ar": "التميز الهندسي",
-            "logo_data": logo_data,
+            "logo_url": meta["url"],
             "logo_updated_at": now,
             "updated_at": now,
             "updated_by": user.get('user_id')
@@ -154,6 +153,7 @@ async def delete_company_logo(user=Depends(get_current_user)):
             "updated_by": user.get('user_id')
         }}
     )
+    await remove_asset(db, "company_logo")
     
     return {"message": "Logo deleted successfully"}
 
@@ -20,6 +20,8 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from database import db
+from services.session_cache import refresh_users
+from services.branding_assets import get_company_branding, asset_data_url
 from utils.auth import get_current_user, require_roles
 from services.settlement_service import (
     validate_settlement_request,
@@ -702,6 +704,7 @@ async def execute_settlement_endpoint(
             }
         }
     )
+    await refresh_users({"employee_id": employee_id})
     
     await db.employees.update_one(
         {"id": employee_id},
@@ -825,14 +828,14 @@ async def get_settlement_pdf(
                 settlement["snapshot"]["contract"] = contract_in_snapshot
     
     # جلب بيانات الشركة - من عدة مصادر
-    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    branding = await get_company_branding(db)
     if not branding:
         branding = await db.settings.find_one({"type": "branding"}, {"_id": 0})
     if not branding:
         # محاولة من company_settings (مصدر آخر للشعار)
-        company_settings = await db.company_settings.find_one({"key": "login_page"}, {"_id": 0})
-        if company_settings and company_settings.get("logo_url"):
-            branding = {"logo_data": company_settings.get("logo_url")}
+        logo_data = await asset_data_url(db, "logo")
+        if logo_data:
+            branding = {"logo_data": logo_data}
     
     # توليد PDF
     pdf_bytes = generate_settlement_pdf(settlement, branding)
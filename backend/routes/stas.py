@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
 from database import db
+from services.session_cache import refresh_users
+from services.branding_assets import get_company_branding
 from utils.auth import get_current_user, require_roles
 from utils.professional_pdf import generate_professional_transaction_pdf
 from datetime import datetime, timezone
@@ -387,7 +389,7 @@ async def execute_transaction(transaction_id: str, user=Depends(require_roles('s
             )
 
     # Fetch company branding for PDF
-    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    branding = await get_company_branding(db)
     if not branding:
         branding = {
             "company_name_en": "DAR AL CODE ENGINEERING CONSULTANCY",
@@ -769,6 +771,7 @@ async def archive_user(user_id: str, user=Depends(require_roles('stas'))):
         {"id": user_id},
         {"$set": {"is_active": False, "is_archived": True, "archived_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await refresh_users({"id": user_id})
     return {"message": f"User {target['username']} archived"}
 
 
@@ -783,6 +786,7 @@ async def restore_user(user_id: str, user=Depends(require_roles('stas'))):
         {"id": user_id},
         {"$set": {"is_active": True, "is_archived": False}, "$unset": {"archived_at": ""}}
     )
+    await refresh_users({"id": user_id})
     return {"message": f"User {target['username']} restored"}
 
 
@@ -971,7 +975,7 @@ async def download_transaction_pdf(transaction_id: str, user=Depends(get_current
     emp = await db.employees.find_one({"id": emp_id}, {"_id": 0}) if emp_id else None
     
     # جلب بيانات العلامة التجارية
-    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    branding = await get_company_branding(db)
     if not branding:
         branding = {
             "company_name_en": "DAR AL CODE ENGINEERING CONSULTANCY",
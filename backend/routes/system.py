@@ -2,11 +2,20 @@
 نقاط نهاية إدارة النظام
 System Management Endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from datetime import datetime, timezone
+from typing import Optional
 from database import db
 from routes.auth import get_current_user
+from services.storage_insights import invalidate_cache
 from pydantic import BaseModel
+import hmac
+import os
+
+# توكن ثابت لجامع المقاييس (Prometheus) - بدونه يلزم توكن مستخدم STAS
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
 
 router = APIRouter(prefix="/api/system", tags=["System"])
 
@@ -38,6 +47,7 @@ async def nuclear_delete_all_transactions(current_user: dict = Depends(get_curre
     # المجموعات التي سيتم حذفها
     collections_to_delete = [
         "login_sessions",
+        "login_sessions_daily",
         "attendance",
         "transactions",
         "financial_custody",
@@ -87,6 +97,7 @@ async def nuclear_delete_all_transactions(current_user: dict = Depends(get_curre
             collection = db[collection_name]
             result = await collection.delete_many({})
             deleted_counts[collection_name] = result.deleted_count
+        invalidate_cache()
         
         # تسجيل نجاح العملية
         await db.security_logs.insert_one({
@@ -133,6 +144,7 @@ async def get_collections_stats(current_user: dict = Depends(get_current_user)):
     # المجموعات المعاملاتية
     transactional_collections = [
         "login_sessions",
+        "login_sessions_daily",
         "attendance",
         "transactions",
         "financial_custody",
@@ -149,19 +161,35 @@ async def get_collections_stats(current_user: dict = Depends(get_current_user)):
         "job_applications",
     ]
     
-    stats = {}
-    total_count = 0
-    
-    for collection_name in transactional_collections:
-        try:
-            count = await db[collection_name].count_documents({})
-            stats[collection_name] = count
-            total_count += count
-        except:
-            stats[collection_name] = 0
+    # العدد من $collStats (بيانات المحرك الوصفية - بدون مسح المجموعات)
+    from services.storage_insights import get_collection_stats
+    collection_stats = await get_collection_stats(db, transactional_collections)
+    stats = {name: collection_stats[name]["documents"] for name in transactional_collections}
+    total_count = sum(stats.values())
     
     return {
         "collections": stats,
         "total_documents": total_count,
         "preserved": ["contracts", "users", "employees", "settings", "work_locations"]
     }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """
+    مقاييس الخادم بصيغة Prometheus النصية
+    Request latency histograms per route, in-flight requests, status codes, scheduler jobs
+    
+    Authorization: Bearer <METRICS_TOKEN> أو توكن STAS
+    """
+    from services.request_metrics import render_prometheus
+    
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    if not token:
+        raise HTTPException(status_code=401, detail="غير مصرح | Unauthorized")
+    if not (METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())):
+        current_user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        if current_user.get("role") != "stas":
+            raise HTTPException(status_code=403, detail="غير مصرح | Unauthorized")
+    
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -22,6 +22,7 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timezone, timedelta
 from database import db
+from services.branding_assets import get_company_branding
 from utils.auth import get_current_user, require_roles
 import uuid
 import io
@@ -1595,7 +1596,7 @@ async def print_attendance_report(
         period_title_ar = f"تقرير الحضور السنوي - {target_year}"
     
     # جلب بيانات الشركة للترويسة
-    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    branding = await get_company_branding(db)
     if not branding:
         branding = {
             "company_name_en": "DAR AL CODE ENGINEERING CONSULTANCY",
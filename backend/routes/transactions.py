@@ -3,6 +3,7 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from database import db
+from services.branding_assets import get_company_branding
 from utils.auth import get_current_user
 from utils.professional_pdf import generate_professional_transaction_pdf
 from utils.workflow import (
@@ -437,7 +438,7 @@ async def get_transaction_pdf(transaction_id: str, lang: str = 'ar', user=Depend
     tx['approval_chain'] = enriched_chain
     
     # Fetch company branding for PDF
-    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    branding = await get_company_branding(db)
     if not branding:
         branding = {
             "company_name_en": "DAR AL CODE ENGINEERING CONSULTANCY",
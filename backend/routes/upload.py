@@ -1,8 +1,9 @@
 """
 File Upload Routes - for medical files and other documents
 """
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request
 from utils.auth import get_current_user
+from services.media_service import save_upload_stream, file_response
 from datetime import datetime, timezone
 import uuid
 import os
@@ -25,38 +26,33 @@ async def upload_medical_file(file: UploadFile = File(...), user=Depends(get_cur
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="يجب أن يكون الملف بصيغة PDF")
     
-    # Validate file size (max 5MB)
-    contents = await file.read()
-    if len(contents) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="حجم الملف يجب أن لا يتجاوز 5 ميجابايت")
-    
     # Generate unique filename
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
     unique_id = str(uuid.uuid4())[:8]
     filename = f"medical_{user['user_id'][:8]}_{timestamp}_{unique_id}.pdf"
     
-    # Save file
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    # Save file in chunks (max 5MB)
+    saved = await save_upload_stream(
+        file, UPLOAD_DIR, 5 * 1024 * 1024, filename=filename,
+        size_error="حجم الملف يجب أن لا يتجاوز 5 ميجابايت"
+    )
     
     # Return relative URL
     return {
         "url": f"/api/upload/files/{filename}",
         "filename": filename,
-        "size": len(contents)
+        "size": saved["size"],
+        "sha256": saved["sha256"]
     }
 
 
 @router.get("/files/{filename}")
-async def get_uploaded_file(filename: str):
+async def get_uploaded_file(filename: str, request: Request):
     """
-    Retrieve an uploaded file.
+    Retrieve an uploaded file (supports ETag / Range for PDF viewers).
     ملاحظة: هذا الـ endpoint عام لأن الملفات تُفتح في نافذة جديدة
     الأمان يأتي من اسم الملف العشوائي (UUID)
     """
-    from fastapi.responses import FileResponse
-    
     # تأمين: منع path traversal attacks
     if ".." in filename or "/" in filename or "\\" in filename:
         raise HTTPException(status_code=400, detail="اسم ملف غير صالح")
@@ -65,7 +61,7 @@ async def get_uploaded_file(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="الملف غير موجود")
     
-    return FileResponse(file_path, media_type="application/pdf", filename=filename)
+    return await file_response(request, file_path, media_type="application/pdf", filename=filename)
 
 
 # ATS CV files directory - ISOLATED from main app
@@ -74,13 +70,11 @@ os.makedirs(ATS_UPLOAD_DIR, exist_ok=True)
 
 
 @router.get("/ats_cv/{filename}")
-async def get_ats_cv_file(filename: str, user=Depends(get_current_user)):
+async def get_ats_cv_file(filename: str, request: Request, user=Depends(get_current_user)):
     """
     Retrieve an uploaded ATS CV file.
     Protected - requires authentication (HR/Admin only)
     """
-    from fastapi.responses import FileResponse
-    
     # Check if user has ATS access
     role = user.get('role', '')
     username = user.get('username', '')
@@ -108,4 +102,4 @@ async def get_ats_cv_file(filename: str, user=Depends(get_current_user)):
     }
     content_type = content_types.get(ext, 'application/octet-stream')
     
-    return FileResponse(file_path, media_type=content_type, filename=filename)
+    return await file_response(request, file_path, media_type=content_type, filename=filename)
@@ -6,7 +6,8 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
 from database import db
-from utils.auth import get_current_user, require_roles, hash_password
+from services.session_cache import refresh_users
+from utils.auth import get_current_user, require_roles, hash_password_async
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/users", tags=["users"])
@@ -77,7 +78,7 @@ async def update_user_credentials(
     if update.password:
         if len(update.password) < 6:
             raise HTTPException(status_code=400, detail="كلمة المرور يجب أن تكون 6 أحرف على الأقل")
-        updates["password_hash"] = hash_password(update.password)
+        updates["password_hash"] = await hash_password_async(update.password)
         # إزالة كلمة المرور النصية إن وجدت (للأمان)
         updates["plain_password"] = None
     
@@ -119,7 +120,7 @@ async def create_user_for_employee(
     new_user = {
         "id": str(uuid.uuid4()),
         "username": data.username,
-        "password_hash": hash_password(data.password),
+        "password_hash": await hash_password_async(data.password),
         "full_name": employee.get("full_name", ""),
         "full_name_ar": employee.get("full_name_ar", ""),
         "role": "employee",
@@ -155,5 +156,6 @@ async def delete_user(employee_id: str, user=Depends(require_roles('stas'))):
         {"employee_id": employee_id},
         {"$set": {"is_active": False, "updated_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await refresh_users({"employee_id": employee_id})
     
     return {"message": "تم تعطيل المستخدم بنجاح"}
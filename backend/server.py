@@ -77,6 +77,7 @@ from routes.security import router as security_router
 from routes.system import router as system_router
 from seed import seed_database
 from services.auto_sync import auto_sync_database
+from services.request_metrics import RequestMetricsMiddleware
 
 # App Version
 APP_VERSION = "22.0"
@@ -133,6 +134,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# قياس زمن الطلبات لكل مسار (ASGI خالص - الأخير = الأبعد، يشمل كل الطبقات)
+app.add_middleware(RequestMetricsMiddleware)
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -150,11 +154,59 @@ async def startup():
     else:
         logger.info("Auto-Sync: Database is in sync")
     
-    # 3. تشغيل جدولة المهام
+    # ذاكرة التحقق من الجلسات (توكنات مُبطلة + حسابات محظورة) - بعد التزامن
+    # revoked_tokens تُحذف تلقائياً عند انتهاء التوكن (فهرس TTL) + فهارس الجلسات وسجل الأمان
+    from services.session_cache import load_session_state
+    from services.retention import ensure_retention_indexes
+    await db.revoked_tokens.create_index("token_id")
+    await ensure_retention_indexes(db)
+    await db.session_state.create_index("key", unique=True)
+    await load_session_state()
+    
+    # كشف التلاعب التزايدي (جهاز مشترك / جلسات متزامنة) - بناء الحالة من الجلسات النشطة عند أول تشغيل
+    from services.fraud_engine import ensure_fraud_indexes, rebuild_fraud_state
+    await ensure_fraud_indexes(db)
+    await rebuild_fraud_state(db)
+    
+    # فهرس تشابه بصمات الأجهزة (LSH) - فهرسة الأجهزة المسجلة قبل وجوده
+    from services.fingerprint_index import ensure_fingerprint_index
+    indexed = await ensure_fingerprint_index(db)
+    if indexed:
+        logger.info(f"Device fingerprints: {indexed} devices indexed")
+    # قائمة الأجهزة: ربط أسماء الموظفين ($lookup) والترتيب بالفهرس
+    await db.employees.create_index("id")
+    await db.employee_devices.create_index([("status", 1), ("registered_at", -1)])
+    # جدول حقائق التحليلات (لوحة الحوكمة) - يُبنى ليلياً، والأشهر الناقصة عند أول قراءة
+    from services.analytics_facts import ensure_fact_indexes
+    await ensure_fact_indexes(db)
+    
+    # 3. نقل صور الهوية المخزنة كـ base64 إلى ملفات وتوليد أيقونات PWA
+    from services.branding_assets import migrate_legacy_branding
+    migrated = await migrate_legacy_branding(db)
+    if migrated:
+        logger.info(f"Branding: {migrated} legacy assets moved to files")
+
+    # 4. تشغيل جدولة المهام
     from services.scheduler import init_scheduler
     init_scheduler()
     logger.info("✅ Scheduler initialized")
 
+    # 5. فهرس البحث في السير الذاتية + فهارس كشف التكرار + عمال المعالجة (استخراج + تقييم في الخلفية)
+    from services.ats_search import ensure_search_index
+    indexed = await ensure_search_index(db)
+    if indexed:
+        logger.info(f"ATS search: {indexed} applications indexed")
+
+    from services.ats_dedup import ensure_dedup_indexes
+    await ensure_dedup_indexes(db)
+
+    from services.ats_ingestion import start_ingestion_workers
+    await start_ingestion_workers()
+    logger.info("✅ ATS ingestion workers started")
+
+    from services.ats_rescoring import resume_interrupted_rescores
+    await resume_interrupted_rescores()
+
 
 @app.on_event("shutdown")
 async def shutdown():
@@ -162,6 +214,13 @@ async def shutdown():
     shutdown_scheduler()
     logger.info("🛑 Scheduler stopped")
 
+    from services.ats_ingestion import stop_ingestion_workers
+    await stop_ingestion_workers()
+
+    # كتابة ما تبقى من سجلات الأمان والدخول المجمّعة
+    from services.buffered_writer import flush_all_writers
+    await flush_all_writers()
+
 
 # Health endpoint for Kubernetes liveness/readiness probes (without /api prefix)
 @app.get("/health")
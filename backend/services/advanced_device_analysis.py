@@ -4,9 +4,53 @@ Advanced Device Analysis Service - خدمة تحليل الجهاز المتقد
 تحليل تفصيلي لبصمة الجهاز مع كشف التلاعب
 """
 import hashlib
-from datetime import datetime, timezone
+import os
+import re
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 from typing import Optional, Dict, List
 
+from utils.auth import MAX_TOKEN_HOURS  # جلسة بلا خروج تُعتبر منتهية بعدها
+
+# عدد نصوص User-Agent المحفوظة بعد التحليل (الأجهزة تتكرر: نفس النص لكل دخول)
+# مشترك مع ذاكرة التحليل في device_service
+UA_CACHE_SIZE = int(os.environ.get("UA_PARSE_CACHE_SIZE", "4096"))
+
+
+# ==================== USER-AGENT PATTERNS (مُجمّعة مرة واحدة) ====================
+
+_IOS_VERSION_RE = re.compile(r'iPhone OS (\d+)_(\d+)')
+_ANDROID_VERSION_RE = re.compile(r'Android\s*(\d+\.?\d*)', re.I)
+_BUILD_MODEL_RE = re.compile(r';\s*([^;)]+)\s*Build', re.I)
+_WINDOWS_NT_RE = re.compile(r'Windows NT (\d+\.?\d*)')
+
+_SAMSUNG_S_RE = re.compile(r'SM-S(\d{3})', re.I)
+_SAMSUNG_A_RE = re.compile(r'SM-A(\d{3})', re.I)
+_SAMSUNG_FAMILIES = [
+    (re.compile(r'SM-F9', re.I), 'Galaxy Z Fold'),
+    (re.compile(r'SM-F7', re.I), 'Galaxy Z Flip'),
+    (re.compile(r'SM-N', re.I), 'Galaxy Note'),
+    (re.compile(r'SM-T', re.I), 'Galaxy Tab'),
+    (re.compile(r'SM-X', re.I), 'Galaxy Tab S'),
+]
+
+_HUAWEI_RE = re.compile(r'(Mate|P\d+|Nova|Honor)\s*(\d+)?\s*(Pro|Plus|Lite|Ultra)?', re.I)
+
+_XIAOMI_RE = re.compile(r'Xiaomi\s*(\d+)\s*(Ultra|Pro|T)?', re.I)
+_REDMI_NOTE_RE = re.compile(r'Redmi\s*Note\s*(\d+)\s*(Pro|S|Plus)?', re.I)
+_REDMI_RE = re.compile(r'Redmi\s*(\d+[A-Z]?)\s*(Pro)?', re.I)
+_POCO_RE = re.compile(r'POCO\s*(\w+)', re.I)
+
+_BROWSER_PATTERNS = [
+    ('Edge', re.compile(r'Edg(?:e|A|iOS)?\/(\d+[\.\d]*)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)\/(\d+[\.\d]*)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser\/(\d+[\.\d]*)')),
+    ('UC Browser', re.compile(r'UCBrowser\/(\d+[\.\d]*)')),
+    ('Firefox', re.compile(r'Firefox\/(\d+[\.\d]*)')),
+    ('Chrome', re.compile(r'Chrome\/(\d+[\.\d]*)')),
+    ('Safari', re.compile(r'Version\/(\d+[\.\d]*).*Safari')),
+]
+
 
 def analyze_device_fingerprint(fingerprint_data: dict) -> dict:
     """
@@ -138,7 +182,13 @@ def _generate_hardware_signature(fp: dict) -> str:
 
 
 def _parse_user_agent_detailed(ua: str) -> dict:
-    """تحليل User Agent بالتفصيل"""
+    """تحليل User Agent بالتفصيل (من الذاكرة إذا سبق تحليل نفس النص)"""
+    return dict(_parse_user_agent_cached(ua or ""))
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def _parse_user_agent_cached(ua: str) -> dict:
+    # Shared between callers: _parse_user_agent_detailed returns a copy
     result = {
         "device_type": "desktop",
         "device_brand": "",
@@ -163,8 +213,7 @@ def _parse_user_agent_detailed(ua: str) -> dict:
         result["os_name"] = "iOS"
         
         # استخراج إصدار iOS
-        import re
-        ios_match = re.search(r'iPhone OS (\d+)_(\d+)', ua)
+        ios_match = _IOS_VERSION_RE.search(ua)
         if ios_match:
             result["os_version"] = f"{ios_match.group(1)}.{ios_match.group(2)}"
         
@@ -191,8 +240,7 @@ def _parse_user_agent_detailed(ua: str) -> dict:
     elif 'android' in ua_lower:
         result["os_name"] = "Android"
         
-        import re
-        android_ver = re.search(r'Android\s*(\d+\.?\d*)', ua, re.I)
+        android_ver = _ANDROID_VERSION_RE.search(ua)
         if android_ver:
             result["os_version"] = android_ver.group(1)
         
@@ -223,8 +271,7 @@ def _parse_user_agent_detailed(ua: str) -> dict:
         
         # كشف ماركات أخرى
         else:
-            import re
-            model_match = re.search(r';\s*([^;)]+)\s*Build', ua, re.I)
+            model_match = _BUILD_MODEL_RE.search(ua)
             if model_match:
                 model = model_match.group(1).strip()
                 result["device_model"] = model
@@ -247,8 +294,7 @@ def _parse_user_agent_detailed(ua: str) -> dict:
         result["device_type"] = "desktop"
         result["os_name"] = "Windows"
         
-        import re
-        win_match = re.search(r'Windows NT (\d+\.?\d*)', ua)
+        win_match = _WINDOWS_NT_RE.search(ua)
         if win_match:
             nt_ver = float(win_match.group(1))
             if nt_ver >= 10:
@@ -271,10 +317,8 @@ def _parse_user_agent_detailed(ua: str) -> dict:
 
 def _extract_samsung_model(ua: str) -> str:
     """استخراج موديل سامسونج"""
-    import re
-    
     # Galaxy S series
-    s_match = re.search(r'SM-S(\d{3})', ua, re.I)
+    s_match = _SAMSUNG_S_RE.search(ua)
     if s_match:
         code = int(s_match.group(1))
         if code >= 928: return 'Galaxy S24 Ultra'
@@ -288,7 +332,7 @@ def _extract_samsung_model(ua: str) -> str:
         if code >= 901: return 'Galaxy S22'
     
     # Galaxy A series
-    a_match = re.search(r'SM-A(\d{3})', ua, re.I)
+    a_match = _SAMSUNG_A_RE.search(ua)
     if a_match:
         code = int(a_match.group(1))
         if code >= 556: return 'Galaxy A55'
@@ -298,24 +342,17 @@ def _extract_samsung_model(ua: str) -> str:
         if code >= 256: return 'Galaxy A25'
         if code >= 156: return 'Galaxy A15'
     
-    # Z Fold/Flip
-    if re.search(r'SM-F9', ua, re.I): return 'Galaxy Z Fold'
-    if re.search(r'SM-F7', ua, re.I): return 'Galaxy Z Flip'
-    
-    # Note
-    if re.search(r'SM-N', ua, re.I): return 'Galaxy Note'
-    
-    # Tab
-    if re.search(r'SM-T', ua, re.I): return 'Galaxy Tab'
-    if re.search(r'SM-X', ua, re.I): return 'Galaxy Tab S'
+    # Z Fold/Flip, Note, Tab
+    for pattern, family in _SAMSUNG_FAMILIES:
+        if pattern.search(ua):
+            return family
     
     return 'Galaxy'
 
 
 def _extract_huawei_model(ua: str) -> str:
     """استخراج موديل هواوي"""
-    import re
-    match = re.search(r'(Mate|P\d+|Nova|Honor)\s*(\d+)?\s*(Pro|Plus|Lite|Ultra)?', ua, re.I)
+    match = _HUAWEI_RE.search(ua)
     if match:
         return f"{match.group(1)} {match.group(2) or ''} {match.group(3) or ''}".strip()
     return 'Huawei'
@@ -323,25 +360,23 @@ def _extract_huawei_model(ua: str) -> str:
 
 def _extract_xiaomi_model(ua: str) -> str:
     """استخراج موديل شاومي"""
-    import re
-    
     # Xiaomi 14/13/12
-    xiaomi_match = re.search(r'Xiaomi\s*(\d+)\s*(Ultra|Pro|T)?', ua, re.I)
+    xiaomi_match = _XIAOMI_RE.search(ua)
     if xiaomi_match:
         return f"Xiaomi {xiaomi_match.group(1)} {xiaomi_match.group(2) or ''}".strip()
     
     # Redmi Note
-    redmi_note = re.search(r'Redmi\s*Note\s*(\d+)\s*(Pro|S|Plus)?', ua, re.I)
+    redmi_note = _REDMI_NOTE_RE.search(ua)
     if redmi_note:
         return f"Redmi Note {redmi_note.group(1)} {redmi_note.group(2) or ''}".strip()
     
     # Redmi
-    redmi = re.search(r'Redmi\s*(\d+[A-Z]?)\s*(Pro)?', ua, re.I)
+    redmi = _REDMI_RE.search(ua)
     if redmi:
         return f"Redmi {redmi.group(1)} {redmi.group(2) or ''}".strip()
     
     # Poco
-    poco = re.search(r'POCO\s*(\w+)', ua, re.I)
+    poco = _POCO_RE.search(ua)
     if poco:
         return f"Poco {poco.group(1)}"
     
@@ -350,20 +385,8 @@ def _extract_xiaomi_model(ua: str) -> str:
 
 def _detect_browser(ua: str) -> dict:
     """كشف المتصفح"""
-    import re
-    
-    browsers = [
-        ('Edge', r'Edg(?:e|A|iOS)?\/(\d+[\.\d]*)'),
-        ('Opera', r'(?:OPR|Opera)\/(\d+[\.\d]*)'),
-        ('Samsung Internet', r'SamsungBrowser\/(\d+[\.\d]*)'),
-        ('UC Browser', r'UCBrowser\/(\d+[\.\d]*)'),
-        ('Firefox', r'Firefox\/(\d+[\.\d]*)'),
-        ('Chrome', r'Chrome\/(\d+[\.\d]*)'),
-        ('Safari', r'Version\/(\d+[\.\d]*).*Safari'),
-    ]
-    
-    for name, pattern in browsers:
-        match = re.search(pattern, ua)
+    for name, pattern in _BROWSER_PATTERNS:
+        match = pattern.search(ua)
         if match:
             return {"browser_name": name, "browser_version": match.group(1)}
     
@@ -609,6 +632,16 @@ def compare_fingerprints(fp1: dict, fp2: dict) -> dict:
     }
 
 
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
 def detect_fraud_indicators(sessions: List[dict]) -> List[dict]:
     """
     كشف مؤشرات التلاعب من سجل الجلسات
@@ -644,24 +677,33 @@ def detect_fraud_indicators(sessions: List[dict]) -> List[dict]:
                 })
     
     # === 2. كشف الجلسات المتزامنة (نفس الوقت من أجهزة مختلفة) ===
-    for i, s1 in enumerate(sorted_sessions):
-        for s2 in sorted_sessions[i+1:]:
-            # إذا كانت الجلستان متداخلتان زمنياً
-            s1_login = s1.get('login_at', '')
-            s1_logout = s1.get('logout_at', '')
-            s2_login = s2.get('login_at', '')
-            
-            if s1_login and s2_login and (not s1_logout or s1_logout > s2_login):
-                # تحقق إذا كانت من أجهزة مختلفة
-                if s1.get('core_signature') != s2.get('core_signature'):
-                    alerts.append({
-                        "type": "concurrent_sessions",
-                        "severity": "high",
-                        "title_ar": "جلسات متزامنة من أجهزة مختلفة",
-                        "message_ar": "تم تسجيل الدخول من جهازين مختلفين في نفس الوقت",
-                        "sessions": [s1.get('id'), s2.get('id')],
-                        "timestamp": s2_login
-                    })
+    # كل جلسة فترة [الدخول، الخروج أو انتهاء التوكن]. المرور بترتيب الدخول مع إبقاء
+    # الفترات المفتوحة فقط (أحدثها لكل جهاز) - بدلاً من مقارنة كل زوج من الجلسات
+    open_by_device = {}  # core_signature -> (ends_at, session)
+    for session in sorted_sessions:
+        start = _parse_time(session.get('login_at'))
+        if not start:
+            continue
+        for signature, (ends_at, _) in list(open_by_device.items()):
+            if ends_at <= start:
+                del open_by_device[signature]
+        
+        signature = session.get('core_signature')
+        for other_signature, (_, other) in open_by_device.items():
+            if other_signature != signature:
+                alerts.append({
+                    "type": "concurrent_sessions",
+                    "severity": "high",
+                    "title_ar": "جلسات متزامنة من أجهزة مختلفة",
+                    "message_ar": "تم تسجيل الدخول من جهازين مختلفين في نفس الوقت",
+                    "sessions": [other.get('id'), session.get('id')],
+                    "timestamp": session.get('login_at')
+                })
+        
+        ends_at = _parse_time(session.get('logout_at')) or start + timedelta(hours=MAX_TOKEN_HOURS)
+        current = open_by_device.get(signature)
+        if not current or ends_at > current[0]:
+            open_by_device[signature] = (ends_at, session)
     
     # === 3. كشف أوقات الدخول الغريبة (بين 12 ليلاً و 5 صباحاً) ===
     for session in sorted_sessions:
@@ -0,0 +1,466 @@
+"""
+Analytics Facts - جدول حقائق شهري لكل موظف للوحة الحوكمة
+============================================================
+لوحة المدير التنفيذي كانت تحسب كل شيء عند الفتح: لكل موظف استعلامات الحضور والمهام
+والأعذار (N+1)، ثم تعيدها كلها لأسوأ الموظفين، ثم صحة الشركة 12 مرة للاتجاه الشهري.
+
+الآن analytics_facts: مستند لكل (employee_id, month) بعدادات قابلة للجمع:
+- الحضور (daily_status حسب date): أيام العمل، الحضور، الغياب، دقائق التأخير
+- المهام (tasks المغلقة حسب closed_at): العدد، في الوقت، المقيّمة ومجموع التقييم
+- العهد (admin_custodies حسب created_at، الموظف = created_by): العدد، المعتمدة من أول مرة،
+  المرتجعة، المصروف
+- الطلبات (transactions حسب created_at): العدد، المقبولة، المرفوضة
+- الأعذار (transactions حسب data.date): نسيان البصمة، تبرير التأخير، دقائق الخروج المبكر
+
+المؤشرات (السنوية أو الشهرية) = جمع العدادات ثم نفس الصيغ - الدوال *_score هنا
+هي نفسها المستخدمة في الحساب المباشر (routes/analytics.py).
+
+البناء: build_facts يعيد بناء أشهر كاملة بقراءة واحدة متدفقة لكل مصدر:
+- ليلياً: الشهر الحالي والسابق + أي شهر ناقص في آخر FACT_HISTORY_MONTHS شهر
+- ترقيع: الشهر الحالي كل ANALYTICS_PATCH_MINUTES دقيقة (services/scheduler.py)
+- عند القراءة: الشهر غير المبني يُبنى مرة واحدة (أول تشغيل)
+analytics_fact_builds: وقت بناء كل شهر.
+البناءات داخل العملية متتالية (قفل)، والحذف يشمل فقط مفاتيح (employee_id, month) الغائبة
+عن ناتج البناء نفسه - بناء متزامن من عملية أخرى لا يمسح حقائق غيره.
+============================================================
+"""
+import asyncio
+import calendar
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+FACT_HISTORY_MONTHS = int(os.environ.get("FACT_HISTORY_MONTHS", "24"))
+PATCH_MINUTES = int(os.environ.get("ANALYTICS_PATCH_MINUTES", "15"))
+WRITE_BATCH = 500
+
+# Nightly build, periodic patch and first-read builds never overlap in this process
+_build_lock = asyncio.Lock()
+
+PRESENT_STATUSES = ["PRESENT", "LATE", "LATE_EXCUSED", "EARLY_LEAVE", "EARLY_EXCUSED", "PERMISSION", "ON_MISSION"]
+WORK_STATUSES = PRESENT_STATUSES + ["ABSENT"]
+APPROVED_REQUEST_STATUSES = ["approved", "stas", "completed"]
+REJECTED_REQUEST_STATUSES = ["rejected", "cancelled"]
+CUSTODY_STATUSES = ["approved", "executed", "closed"]
+EARLY_LEAVE_TYPES = ["early_leave_request", "early_leave", "permission"]
+EXCUSE_TYPES = ["forget_checkin", "late_excuse"] + EARLY_LEAVE_TYPES
+
+COUNTERS = [
+    "work_days", "present_days", "absent_days", "late_minutes",
+    "tasks_total", "tasks_on_time", "tasks_rated", "task_rating_sum",
+    "custody_total", "custody_approved_first", "custody_returned", "custody_spent",
+    "requests_total", "requests_approved", "requests_rejected",
+    "forget_checkin", "late_excuse", "early_leave_minutes",
+]
+
+# Health score weights (company and per employee)
+HEALTH_WEIGHTS = {"attendance": 0.30, "tasks": 0.35, "financial": 0.20, "requests": 0.15}
+
+
+def new_counters() -> Dict:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def sum_counters(facts: Iterable[dict]) -> Dict:
+    total = new_counters()
+    for fact in facts:
+        for field in COUNTERS:
+            total[field] += fact.get(field, 0) or 0
+    return total
+
+
+# ==================== ACCUMULATORS ====================
+
+def add_attendance(c: dict, record: dict):
+    status = record.get("final_status")
+    if status in WORK_STATUSES:
+        c["work_days"] += 1
+    if status in PRESENT_STATUSES:
+        c["present_days"] += 1
+    if status == "ABSENT":
+        c["absent_days"] += 1
+    c["late_minutes"] += record.get("late_minutes", 0) or 0
+
+
+def add_task(c: dict, task: dict):
+    c["tasks_total"] += 1
+    if not (task.get("delay_info") or {}).get("delayed", False):
+        c["tasks_on_time"] += 1
+    if task.get("final_score"):
+        c["tasks_rated"] += 1
+        c["task_rating_sum"] += task["final_score"].get("final_score", 0) or 0
+
+
+def add_custody(c: dict, custody: dict):
+    c["custody_total"] += 1
+    if custody.get("audit_status") == "approved" and not custody.get("returned_count", 0):
+        c["custody_approved_first"] += 1
+    if (custody.get("returned_count", 0) or 0) > 0:
+        c["custody_returned"] += 1
+    c["custody_spent"] += custody.get("spent", 0) or 0
+
+
+def add_request(c: dict, transaction: dict):
+    c["requests_total"] += 1
+    if transaction.get("status") in APPROVED_REQUEST_STATUSES:
+        c["requests_approved"] += 1
+    elif transaction.get("status") in REJECTED_REQUEST_STATUSES:
+        c["requests_rejected"] += 1
+
+
+def _minutes_between(from_time: str, to_time: str) -> int:
+    try:
+        f_parts = from_time.split(':')
+        t_parts = to_time.split(':')
+        return (int(t_parts[0]) * 60 + int(t_parts[1])) - (int(f_parts[0]) * 60 + int(f_parts[1]))
+    except Exception:
+        return 0
+
+
+def add_excuse(c: dict, transaction: dict):
+    """معاملة عذر غير مرفوضة (نسيان بصمة، تبرير تأخير، خروج مبكر)"""
+    kind = transaction.get("type")
+    if kind == "forget_checkin":
+        c["forget_checkin"] += 1
+    elif kind == "late_excuse":
+        c["late_excuse"] += 1
+    elif kind in EARLY_LEAVE_TYPES:
+        data = transaction.get("data") or {}
+        if data.get("from_time") and data.get("to_time"):
+            c["early_leave_minutes"] += _minutes_between(data["from_time"], data["to_time"])
+
+
+# ==================== SCORES ====================
+
+def attendance_score(c: dict) -> dict:
+    """(أيام الحضور / أيام العمل) × 100 - (دقائق التأخير × 0.05، حد أقصى 20)"""
+    if c["work_days"] == 0:
+        return {"score": 0, "present_days": 0, "work_days": 0, "late_minutes": 0, "absent_days": 0, "no_data": True}
+    presence_rate = (c["present_days"] / c["work_days"]) * 100
+    late_penalty = min(c["late_minutes"] * 0.05, 20)
+    score = max(0, min(100, presence_rate - late_penalty))
+    return {
+        "score": round(score, 1),
+        "present_days": c["present_days"],
+        "work_days": c["work_days"],
+        "late_minutes": c["late_minutes"],
+        "absent_days": c["absent_days"],
+        "presence_rate": round(presence_rate, 1)
+    }
+
+
+def task_score(c: dict) -> dict:
+    """متوسط التقييم × 20 (من 5 إلى 100)"""
+    total = c["tasks_total"]
+    if not total:
+        return {"score": 0, "total_tasks": 0, "completed_on_time": 0, "delayed": 0, "average_rating": 0}
+    avg_score = c["task_rating_sum"] / c["tasks_rated"] if c["tasks_rated"] else 0
+    return {
+        "score": round(min(100, avg_score * 20), 1),
+        "total_tasks": total,
+        "completed_on_time": c["tasks_on_time"],
+        "delayed": total - c["tasks_on_time"],
+        "average_rating": round(avg_score, 2),
+        "completion_rate": round((c["tasks_on_time"] / total) * 100, 1)
+    }
+
+
+def financial_score(c: dict) -> dict:
+    """(العهد المعتمدة من أول مرة / الإجمالي) × 100"""
+    total = c["custody_total"]
+    if not total:
+        return {"score": 0, "total_custodies": 0, "approved_first_time": 0, "returned": 0, "total_spent": 0, "no_data": True}
+    return {
+        "score": round((c["custody_approved_first"] / total) * 100, 1),
+        "total_custodies": total,
+        "approved_first_time": c["custody_approved_first"],
+        "returned": c["custody_returned"],
+        "total_spent": round(c["custody_spent"], 2)
+    }
+
+
+def request_score(c: dict) -> dict:
+    """(المقبولة / المقبولة + المرفوضة) × 100"""
+    total = c["requests_total"]
+    if not total:
+        return {"score": 0, "total_requests": 0, "approved": 0, "rejected": 0, "pending": 0, "no_data": True}
+    decided = c["requests_approved"] + c["requests_rejected"]
+    score = (c["requests_approved"] / decided) * 100 if decided > 0 else 100
+    return {
+        "score": round(score, 1),
+        "total_requests": total,
+        "approved": c["requests_approved"],
+        "rejected": c["requests_rejected"],
+        "pending": total - decided,
+        "approval_rate": round(score, 1)
+    }
+
+
+def excuse_score(c: dict, yearly: bool = False) -> dict:
+    """
+    نسيان بصمة: الحد 3 مرات/شهر (36 سنوياً) - تبرير تأخير: 5/شهر (60 سنوياً)
+    خروج مبكر: كل 30 دقيقة تخصم 5 نقاط
+    """
+    forget_limit, late_limit = (36, 60) if yearly else (3, 5)
+    forget_count, late_count, early_minutes = c["forget_checkin"], c["late_excuse"], c["early_leave_minutes"]
+
+    forget_penalty = min((forget_count / forget_limit) * 30, 30)
+    late_penalty = min((late_count / late_limit) * 30, 30)
+    early_penalty = min((early_minutes // 30) * 5, 40)
+
+    # لا استخدام للأعذار: الدرجة 0 (لم يبدأ التقييم بعد)
+    no_data = forget_count == 0 and late_count == 0 and early_minutes == 0
+    score = 0 if no_data else max(0, 100 - (forget_penalty + late_penalty + early_penalty))
+    return {
+        "score": round(score, 1),
+        "no_data": no_data,
+        "forget_checkin": {"count": forget_count, "limit": forget_limit, "penalty": round(forget_penalty, 1)},
+        "late_excuse": {"count": late_count, "limit": late_limit, "penalty": round(late_penalty, 1)},
+        "early_leave": {
+            "minutes": early_minutes,
+            "hours": round(early_minutes / 60, 1),
+            "penalty": round(early_penalty, 1)
+        }
+    }
+
+
+def health_score(c: dict) -> dict:
+    """المتوسط المرجح للمؤشرات الأربعة"""
+    metrics = {
+        "attendance": attendance_score(c),
+        "tasks": task_score(c),
+        "financial": financial_score(c),
+        "requests": request_score(c),
+    }
+    score = sum(metrics[name]["score"] * weight for name, weight in HEALTH_WEIGHTS.items())
+    return {"health_score": round(score, 1), **metrics, "weights": HEALTH_WEIGHTS}
+
+
+def performer_score(c: dict, yearly: bool = True) -> dict:
+    """درجة الموظف في قوائم الأفضل/الأسوأ: حضور 35% + مهام 40% + أعذار 25%"""
+    attendance, tasks, excuses = attendance_score(c), task_score(c), excuse_score(c, yearly)
+    return {
+        "score": round(attendance["score"] * 0.35 + tasks["score"] * 0.40 + excuses["score"] * 0.25, 1),
+        "attendance_score": attendance["score"],
+        "task_score": tasks["score"],
+        "excuse_score": excuses["score"],
+        "forget_checkin": excuses["forget_checkin"]["count"],
+        "late_excuse": excuses["late_excuse"]["count"],
+    }
+
+
+# ==================== MONTHS ====================
+
+def month_key(now: Optional[datetime] = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m")
+
+
+def shift_month(month: str, delta: int) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def recent_months(count: int, now: Optional[datetime] = None) -> List[str]:
+    """آخر count شهر (الأقدم أولاً) حتى الشهر الحالي"""
+    current = month_key(now)
+    return [shift_month(current, -i) for i in range(count - 1, -1, -1)]
+
+
+def year_months(year: int, now: Optional[datetime] = None) -> List[str]:
+    """أشهر السنة حتى الشهر الحالي (السنة الحالية) أو كاملة (سنة سابقة)"""
+    now = now or datetime.now(timezone.utc)
+    last = now.month if year == now.year else 12
+    return [f"{year}-{m:02d}" for m in range(1, last + 1)] if year <= now.year else []
+
+
+# ==================== BUILD ====================
+
+async def ensure_fact_indexes(db):
+    await db.analytics_facts.create_index([("employee_id", 1), ("month", 1)], unique=True)
+    await db.analytics_facts.create_index("month")
+    await db.analytics_fact_builds.create_index("month", unique=True)
+    # Month-range reads of the sources (build_facts)
+    await db.daily_status.create_index("date", name="daily_status_date")
+    await db.tasks.create_index([("status", 1), ("closed_at", 1)], name="tasks_status_closed_at")
+    await db.admin_custodies.create_index("created_at", name="admin_custodies_created_at")
+    await db.transactions.create_index("created_at", name="transactions_created_at")
+    await db.transactions.create_index([("type", 1), ("data.date", 1)], name="transactions_type_data_date")
+
+
+async def build_facts(db, months: Iterable[str]) -> Dict:
+    """
+    إعادة بناء حقائق أشهر كاملة (كل الموظفين): قراءة متدفقة واحدة لكل مصدر على
+    نطاق الأشهر، ثم upsert بالدفعات وحذف حقائق لم تعد موجودة في المصدر.
+    """
+    async with _build_lock:
+        return await _build_facts(db, months)
+
+
+async def _build_facts(db, months: Iterable[str]) -> Dict:
+    months = sorted(set(months))
+    if not months:
+        return {"months": [], "facts": 0}
+    wanted = set(months)
+    first, last = months[0], months[-1]
+    last_day = calendar.monthrange(int(last[:4]), int(last[5:7]))[1]
+    start_date, end_date = f"{first}-01", f"{last}-{last_day:02d}"
+    start_ts, end_ts = f"{start_date}T00:00:00", f"{end_date}T23:59:59"
+
+    facts: Dict[tuple, dict] = {}
+
+    def counters(employee_id, month) -> Optional[dict]:
+        if month not in wanted:
+            return None
+        key = (employee_id or "", month)
+        if key not in facts:
+            facts[key] = new_counters()
+        return facts[key]
+
+    async for record in db.daily_status.find(
+        {"date": {"$gte": start_date, "$lte": end_date}},
+        {"_id": 0, "employee_id": 1, "date": 1, "final_status": 1, "late_minutes": 1},
+    ):
+        c = counters(record.get("employee_id"), str(record.get("date", ""))[:7])
+        if c is not None:
+            add_attendance(c, record)
+
+    async for task in db.tasks.find(
+        {"status": "closed", "closed_at": {"$gte": start_ts, "$lte": end_ts}},
+        {"_id": 0, "employee_id": 1, "closed_at": 1, "final_score": 1, "delay_info": 1},
+    ):
+        c = counters(task.get("employee_id"), str(task.get("closed_at", ""))[:7])
+        if c is not None:
+            add_task(c, task)
+
+    async for custody in db.admin_custodies.find(
+        {"status": {"$in": CUSTODY_STATUSES}, "created_at": {"$gte": start_ts, "$lte": end_ts}},
+        {"_id": 0, "created_by": 1, "created_at": 1, "audit_status": 1, "returned_count": 1, "spent": 1},
+    ):
+        c = counters(custody.get("created_by"), str(custody.get("created_at", ""))[:7])
+        if c is not None:
+            add_custody(c, custody)
+
+    async for transaction in db.transactions.find(
+        {"created_at": {"$gte": start_ts, "$lte": end_ts}},
+        {"_id": 0, "employee_id": 1, "created_at": 1, "status": 1},
+    ):
+        c = counters(transaction.get("employee_id"), str(transaction.get("created_at", ""))[:7])
+        if c is not None:
+            add_request(c, transaction)
+
+    async for transaction in db.transactions.find(
+        {
+            "type": {"$in": EXCUSE_TYPES},
+            "status": {"$nin": REJECTED_REQUEST_STATUSES},
+            "data.date": {"$gte": start_date, "$lte": end_date},
+        },
+        {"_id": 0, "employee_id": 1, "type": 1, "data.date": 1, "data.from_time": 1, "data.to_time": 1},
+    ):
+        c = counters(transaction.get("employee_id"), str((transaction.get("data") or {}).get("date", ""))[:7])
+        if c is not None:
+            add_excuse(c, transaction)
+
+    built_at = datetime.now(timezone.utc).isoformat()
+    ops = []
+    for (employee_id, month), c in facts.items():
+        ops.append(ReplaceOne(
+            {"employee_id": employee_id, "month": month},
+            {"employee_id": employee_id, "month": month, **c, "built_at": built_at},
+            upsert=True,
+        ))
+        if len(ops) >= WRITE_BATCH:
+            await db.analytics_facts.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.analytics_facts.bulk_write(ops, ordered=False)
+
+    # Employees with no source data left in these months - only keys this build did not produce
+    for month in months:
+        await db.analytics_facts.delete_many({
+            "month": month,
+            "employee_id": {"$nin": [key[0] for key in facts if key[1] == month]},
+        })
+    for month in months:
+        await db.analytics_fact_builds.update_one(
+            {"month": month},
+            {"$set": {"month": month, "built_at": built_at,
+                      "facts": sum(1 for key in facts if key[1] == month)}},
+            upsert=True,
+        )
+    return {"months": months, "facts": len(facts), "built_at": built_at}
+
+
+async def ensure_facts(db, months: Iterable[str]) -> List[str]:
+    """بناء الأشهر التي لم تُبنَ بعد - Returns: الأشهر المبنية الآن"""
+    months = sorted(set(months))
+    missing = await _unbuilt(db, months)
+    if not missing:
+        return []
+    async with _build_lock:
+        # Concurrent first reads: whoever got the lock first already built them
+        missing = await _unbuilt(db, missing)
+        if missing:
+            await _build_facts(db, missing)
+    return missing
+
+
+async def _unbuilt(db, months: List[str]) -> List[str]:
+    built = await db.analytics_fact_builds.find(
+        {"month": {"$in": months}}, {"_id": 0, "month": 1}
+    ).to_list(len(months))
+    return sorted(set(months) - {b["month"] for b in built})
+
+
+async def run_nightly_build(db) -> Dict:
+    """الشهر الحالي والسابق (تصحيحات متأخرة) + الأشهر الناقصة في آخر FACT_HISTORY_MONTHS"""
+    current = month_key()
+    rebuilt = await build_facts(db, [shift_month(current, -1), current])
+    backfilled = await ensure_facts(db, recent_months(FACT_HISTORY_MONTHS))
+    return {"rebuilt": rebuilt["months"], "backfilled": backfilled, "facts": rebuilt["facts"]}
+
+
+async def patch_current_month(db) -> Dict:
+    """ترقيع دوري: الشهر الحالي فقط (نطاق صغير بالفهارس)"""
+    return await build_facts(db, [month_key()])
+
+
+# ==================== READ ====================
+
+async def get_facts(db, months: Iterable[str], employee_ids: Optional[List[str]] = None) -> List[dict]:
+    months = sorted(set(months))
+    await ensure_facts(db, months)
+    query: Dict = {"month": {"$in": months}}
+    if employee_ids is not None:
+        query["employee_id"] = {"$in": employee_ids}
+    return await db.analytics_facts.find(query, {"_id": 0}).to_list(None)
+
+
+async def employee_totals(db, months: Iterable[str], employee_ids: Optional[List[str]] = None) -> Dict[str, dict]:
+    """عدادات كل موظف مجموعة على الأشهر"""
+    by_employee: Dict[str, List[dict]] = {}
+    for fact in await get_facts(db, months, employee_ids):
+        by_employee.setdefault(fact["employee_id"], []).append(fact)
+    return {employee_id: sum_counters(facts) for employee_id, facts in by_employee.items()}
+
+
+async def month_totals(db, months: Iterable[str]) -> Dict[str, dict]:
+    """عدادات الشركة لكل شهر"""
+    months = sorted(set(months))
+    by_month: Dict[str, List[dict]] = {month: [] for month in months}
+    for fact in await get_facts(db, months):
+        by_month[fact["month"]].append(fact)
+    return {month: sum_counters(facts) for month, facts in by_month.items()}
+
+
+async def last_built_at(db, months: Iterable[str]) -> Optional[str]:
+    """أقدم وقت بناء بين الأشهر (مدى حداثة الأرقام)"""
+    builds = await db.analytics_fact_builds.find(
+        {"month": {"$in": list(months)}}, {"_id": 0, "built_at": 1}
+    ).to_list(None)
+    return min((b["built_at"] for b in builds), default=None)
@@ -0,0 +1,479 @@
+"""
+Archive Engine - أرشفة النظام المتدفقة (ملفات مجزأة بدلاً من مستند واحد)
+============================================================
+الأرشيف السابق: كل المجموعات في قاموس واحد ← JSON ← gzip ← base64 في مستند
+system_archives واحد (حد MongoDB 16MB + عدة نسخ من البيانات في الذاكرة).
+
+الآن:
+- لكل مجموعة مؤشر (cursor) يُقرأ على دفعات، وكل CHUNK_DOCS مستند في ملف
+  NDJSON مضغوط (gzip) مستقل داخل SYSTEM_ARCHIVE_DIR/<archive_id>/
+- مستند system_archives يحمل البيان (manifest) فقط: الملفات وعدد المستندات
+  والحجم و SHA-256 لكل ملف - ونسخة منه manifest.json بجانب الملفات
+- الذاكرة ثابتة: دفعة واحدة (BATCH_DOCS) في أي لحظة مهما كبرت قاعدة البيانات
+- التحويل لـ JSON والضغط في خيط منفصل - حلقة الأحداث لا تُحجب
+- القراءة (تحميل/استعادة) تتحقق من SHA-256 قبل أي تعديل على البيانات
+
+أرشيف تزايدي (incremental): فقط المستندات التي تغيّرت (updated_at / created_at) منذ
+الأرشيف السابق أو الجديدة (id غير موجود فيه)، مع قائمة معرفات (id) كل المجموعة لمعرفة
+المحذوف. مجموعة فيها مستندات بلا id تُؤرشف كاملة داخل الأرشيف التزايدي.
+ملاحظة: تعديل لا يحدّث updated_at لا يظهر في الأرشيف التزايدي - الأرشيف الكامل الدوري يغطيه.
+
+الاستعادة لنقطة زمنية: الأرشيف + سلسلة أرشيفاته السابقة حتى الكامل (الأحدث أولاً)،
+كل مستند يُكتب مرة واحدة بأحدث نسخة له بـ insert_many(ordered=False) على دفعات،
+والمجموعات بالتوازي (RESTORE_CONCURRENCY) مع تقدم مباشر وتحقق من العدد بعد الانتهاء.
+
+الأرشيفات السابقة (compressed_data) تبقى قابلة للتحميل والاستعادة.
+============================================================
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.environ.get(
+    "SYSTEM_ARCHIVE_DIR", str(Path(__file__).parent.parent / "uploads" / "archives")
+))
+CHUNK_DOCS = int(os.environ.get("ARCHIVE_CHUNK_DOCS", "20000"))
+BATCH_DOCS = 1000
+RESTORE_CONCURRENCY = int(os.environ.get("ARCHIVE_RESTORE_CONCURRENCY", "4"))
+
+# Fields that mark a document as changed since the previous archive
+CHANGE_FIELDS = ("updated_at", "created_at")
+
+ARCHIVE_FORMAT = "ndjson-chunks"
+MANIFEST_FILE = "manifest.json"
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def archive_dir(archive_id: str) -> Path:
+    return ARCHIVE_DIR / archive_id
+
+
+def is_chunked(archive: dict) -> bool:
+    return archive.get("format") == ARCHIVE_FORMAT
+
+
+# ==================== WRITE ====================
+
+class _ChunkWriter:
+    """ملفات مجموعة واحدة: ملف جديد كل CHUNK_DOCS مستند (يُستدعى من خيط منفصل)"""
+
+    def __init__(self, directory: Path, collection: str):
+        self.directory = directory
+        self.collection = collection
+        self.chunks: List[dict] = []
+        self._fh = None
+        self._path: Optional[Path] = None
+        self._docs = 0
+        self._raw_bytes = 0
+
+    def write(self, docs: List[dict]):
+        for doc in docs:
+            if self._fh is None:
+                self._path = self.directory / f"{self.collection}-{len(self.chunks) + 1:05d}.ndjson.gz"
+                self._fh = gzip.open(self._path, "wt", encoding="utf-8")
+                self._docs = 0
+                self._raw_bytes = 0
+            line = json.dumps(doc, default=_json_default, ensure_ascii=False) + "\n"
+            self._fh.write(line)
+            self._docs += 1
+            self._raw_bytes += len(line.encode("utf-8"))
+            if self._docs >= CHUNK_DOCS:
+                self.close()
+
+    def close(self):
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._fh = None
+        self.chunks.append({
+            "file": self._path.name,
+            "documents": self._docs,
+            "raw_bytes": self._raw_bytes,
+            "size_bytes": self._path.stat().st_size,
+            "sha256": _sha256(self._path),
+        })
+
+
+async def archive_collection(db, directory: Path, collection: str, query: Optional[dict] = None) -> Dict:
+    """تصدير مجموعة واحدة إلى ملفات مجزأة - يعيد بيانها"""
+    writer = _ChunkWriter(directory, collection)
+    count = 0
+    batch = []
+    try:
+        async for doc in db[collection].find(query or {}, {"_id": 0}).batch_size(BATCH_DOCS):
+            batch.append(doc)
+            if len(batch) >= BATCH_DOCS:
+                await asyncio.to_thread(writer.write, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(writer.write, batch)
+            count += len(batch)
+    finally:
+        await asyncio.to_thread(writer.close)
+
+    return {
+        "count": count,
+        "chunks": writer.chunks,
+        "raw_bytes": sum(c["raw_bytes"] for c in writer.chunks),
+        "size_bytes": sum(c["size_bytes"] for c in writer.chunks),
+    }
+
+
+def _write_manifest(directory: Path, manifest: dict):
+    with open(directory / MANIFEST_FILE, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1, default=_json_default)
+
+
+def changed_since_query(since: str) -> List[dict]:
+    """شروط: أُنشئ أو عُدّل منذ since (نص ISO أو datetime في المستندات الأقدم)"""
+    since_dt = datetime.fromisoformat(since)
+    return [{field: {"$gte": value}} for value in (since, since_dt) for field in CHANGE_FIELDS]
+
+
+async def _archive_ids(db, directory: Path, collection: str) -> tuple:
+    """قائمة معرفات المجموعة (ملف مستقل) - يعيد (البيان، المعرفات)"""
+    writer = _ChunkWriter(directory, f"{collection}.ids")
+    ids = set()
+    batch = []
+    try:
+        async for doc in db[collection].find({}, {"_id": 0, "id": 1}).batch_size(BATCH_DOCS * 10):
+            ids.add(doc["id"])
+            batch.append(doc)
+            if len(batch) >= BATCH_DOCS * 10:
+                await asyncio.to_thread(writer.write, batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(writer.write, batch)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return {"count": len(ids), "chunks": writer.chunks, "size_bytes": sum(c["size_bytes"] for c in writer.chunks)}, ids
+
+
+async def _archive_delta(db, directory: Path, collection: str, base: "ArchiveReader", since: str) -> Dict:
+    """المتغير منذ الأرشيف السابق: معدّل بالوقت أو معرف جديد غير موجود فيه"""
+    ids_info, current_ids = await _archive_ids(db, directory, collection)
+    new_ids = current_ids - await base.ids(collection)
+    conditions = changed_since_query(since)
+    if new_ids:
+        conditions.append({"id": {"$in": list(new_ids)}})
+    info = await archive_collection(db, directory, collection, {"$or": conditions})
+    info["ids"] = ids_info
+    return info
+
+
+async def create_archive(db, archive_id: str, collections: List[str], base: Optional[dict] = None) -> Dict:
+    """
+    أرشفة المجموعات إلى SYSTEM_ARCHIVE_DIR/<archive_id>/
+    base: سجل الأرشيف السابق - أرشيف تزايدي (المتغير منذ base + معرفات المجموعة كاملة)
+    Returns: البيان {format, kind, directory, collections: {name: {mode, count, chunks, ...}}, total_documents, raw_bytes, size_bytes}
+    """
+    directory = archive_dir(archive_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    base_reader = ArchiveReader(base) if base else None
+
+    manifest = {
+        "format": ARCHIVE_FORMAT,
+        "kind": "incremental" if base else "full",
+        "storage": "disk",
+        "directory": archive_id,
+        "collections": {},
+        "total_documents": 0,
+        "raw_bytes": 0,
+        "size_bytes": 0,
+    }
+    for collection in collections:
+        try:
+            # Deltas need a stable key to merge versions and detect deletions
+            delta = (
+                base_reader is not None
+                and collection in base_reader.collections()
+                and not await db[collection].find_one({"id": {"$exists": False}}, {"_id": 1})
+            )
+            if delta:
+                info = await _archive_delta(db, directory, collection, base_reader, base["created_at"])
+            else:
+                info = await archive_collection(db, directory, collection)
+            info["mode"] = "delta" if delta else "full"
+        except Exception as e:
+            logger.error(f"Archive {archive_id}: {collection} failed: {e}")
+            manifest["collections"][collection] = {"error": str(e), "count": 0, "chunks": []}
+            continue
+        manifest["collections"][collection] = info
+        manifest["total_documents"] += info["count"]
+        manifest["raw_bytes"] += info["raw_bytes"]
+        manifest["size_bytes"] += info["size_bytes"] + info.get("ids", {}).get("size_bytes", 0)
+
+    await asyncio.to_thread(_write_manifest, directory, manifest)
+    return manifest
+
+
+async def remove_archive_files(archive: dict):
+    if is_chunked(archive):
+        await asyncio.to_thread(shutil.rmtree, archive_dir(archive["directory"]), True)
+
+
+# ==================== READ ====================
+
+class ArchiveReader:
+    """
+    قراءة أرشيف (مجزأ أو سابق) على دفعات.
+    الأرشيف السابق يُفك ضغطه مرة واحدة عند الفتح (كان محدوداً بحجم المستند أصلاً).
+    """
+
+    def __init__(self, archive: dict, legacy_data: Optional[dict] = None):
+        self.archive = archive
+        self._legacy = legacy_data
+
+    @classmethod
+    async def open(cls, archive: dict) -> "ArchiveReader":
+        if is_chunked(archive):
+            return cls(archive)
+
+        import base64
+
+        def _decode():
+            return json.loads(gzip.decompress(base64.b64decode(archive.get("compressed_data") or "")).decode("utf-8"))
+
+        return cls(archive, await asyncio.to_thread(_decode))
+
+    @property
+    def archive_id(self) -> str:
+        return self.archive["id"]
+
+    def collections(self) -> Dict[str, int]:
+        """المجموعات في الأرشيف ← عدد مستنداتها"""
+        if self._legacy is not None:
+            return {name: len(c.get("data", [])) for name, c in self._legacy.get("collections", {}).items()}
+        return {name: c.get("count", 0) for name, c in self.archive["collections"].items() if not c.get("error")}
+
+    def mode(self, collection: str) -> str:
+        """full: المجموعة كاملة / delta: المتغير فقط + المعرفات"""
+        if self._legacy is not None:
+            return "full"
+        return self.archive["collections"].get(collection, {}).get("mode", "full")
+
+    async def verify(self) -> List[str]:
+        """التحقق من وجود كل الملفات وتطابق SHA-256 - يعيد قائمة المشاكل"""
+        if self._legacy is not None:
+            return []
+        directory = archive_dir(self.archive["directory"])
+
+        def _check(chunk: dict) -> Optional[str]:
+            path = directory / chunk["file"]
+            if not path.exists():
+                return f"{chunk['file']}: missing"
+            if _sha256(path) != chunk["sha256"]:
+                return f"{chunk['file']}: checksum mismatch"
+            return None
+
+        problems = []
+        for info in self.archive["collections"].values():
+            for chunk in info.get("chunks", []) + info.get("ids", {}).get("chunks", []):
+                problem = await asyncio.to_thread(_check, chunk)
+                if problem:
+                    problems.append(problem)
+        return problems
+
+    async def batches(self, collection: str, size: int = BATCH_DOCS) -> AsyncIterator[List[dict]]:
+        """مستندات مجموعة على دفعات بحجم size"""
+        if self._legacy is not None:
+            documents = self._legacy.get("collections", {}).get(collection, {}).get("data", [])
+            for start in range(0, len(documents), size):
+                yield documents[start:start + size]
+            return
+
+        async for batch in self._chunk_batches(self.archive["collections"].get(collection, {}).get("chunks", []), size):
+            yield batch
+
+    async def ids(self, collection: str) -> set:
+        """معرفات المجموعة وقت الأرشيف (قائمة المعرفات للتزايدي، أو من المستندات للكامل)"""
+        ids = set()
+        if self.mode(collection) == "delta":
+            batches = self._chunk_batches(self.archive["collections"][collection]["ids"]["chunks"], BATCH_DOCS * 10)
+        else:
+            batches = self.batches(collection, BATCH_DOCS * 10)
+        async for batch in batches:
+            ids.update(doc["id"] for doc in batch if "id" in doc)
+        return ids
+
+    async def _chunk_batches(self, chunks: List[dict], size: int) -> AsyncIterator[List[dict]]:
+        directory = archive_dir(self.archive["directory"])
+        for chunk in chunks:
+            fh = await asyncio.to_thread(gzip.open, directory / chunk["file"], "rt", encoding="utf-8")
+            try:
+                while True:
+                    lines = await asyncio.to_thread(_read_lines, fh, size)
+                    if not lines:
+                        break
+                    yield [json.loads(line) for line in lines]
+            finally:
+                await asyncio.to_thread(fh.close)
+
+
+def _read_lines(fh, count: int) -> List[str]:
+    lines = []
+    for line in fh:
+        if line.strip():
+            lines.append(line)
+            if len(lines) >= count:
+                break
+    return lines
+
+
+async def iter_archive_json(reader: ArchiveReader, header: dict) -> AsyncIterator[bytes]:
+    """
+    الأرشيف كملف JSON واحد (نفس بنية التحميل السابقة: {..., collections: {name: {count, data}}})
+    يُولَّد تدريجياً - للتحميل عبر StreamingResponse
+    """
+    head = json.dumps(header, default=_json_default, ensure_ascii=False)
+    yield (head[:-1] + (", " if header else "") + '"collections": {').encode("utf-8")
+
+    for index, (collection, count) in enumerate(reader.collections().items()):
+        prefix = ", " if index else ""
+        yield f'{prefix}{json.dumps(collection)}: {{"count": {count}, "data": ['.encode("utf-8")
+        first = True
+        async for batch in reader.batches(collection):
+            body = ", ".join(json.dumps(doc, default=_json_default, ensure_ascii=False) for doc in batch)
+            yield (("" if first else ", ") + body).encode("utf-8")
+            first = False
+        yield b"]}"
+
+    yield b"}}"
+
+
+# ==================== RESTORE ====================
+
+async def open_archive_chain(db, archive: dict) -> List[ArchiveReader]:
+    """الأرشيف وأرشيفاته السابقة حتى أقرب أرشيف كامل - الأحدث أولاً"""
+    chain = [await ArchiveReader.open(archive)]
+    while archive.get("kind") == "incremental":
+        base_id = archive.get("base_archive_id")
+        archive = await db.system_archives.find_one({"id": base_id}, {"_id": 0})
+        if not archive:
+            raise ValueError(f"base archive {base_id} not found")
+        chain.append(await ArchiveReader.open(archive))
+    return chain
+
+
+# آخر عملية استعادة (للمتابعة أثناء التنفيذ)
+restore_progress: Dict = {}
+# عملية استعادة واحدة في كل مرة
+restore_lock = asyncio.Lock()
+
+
+async def _restore_collection(db, chain: List[ArchiveReader], collection: str, progress: dict) -> Dict:
+    """
+    استعادة مجموعة واحدة: كل مستند بأحدث نسخة في السلسلة، مرة واحدة.
+    الأحدث أولاً: ما كُتب لا يُكتب من أرشيف أقدم، والمعرفات المحذوفة (غير موجودة
+    في قائمة أحدث أرشيف تزايدي) تُتجاهل.
+    """
+    sources = []
+    for reader in chain:
+        if collection in reader.collections():
+            sources.append(reader)
+            if reader.mode(collection) == "full":
+                break
+    else:
+        return {"error": "full copy not found in archive chain"}
+
+    newest = sources[0]
+    live = await newest.ids(collection) if newest.mode(collection) == "delta" else None
+    expected = len(live) if live is not None else newest.collections()[collection]
+    progress.update({"expected": expected, "restored": 0, "status": "running"})
+
+    coll = db[collection]
+    deleted = await coll.delete_many({})
+    seen = set()
+    restored = 0
+    failed = 0
+    for reader in sources:
+        async for batch in reader.batches(collection):
+            documents = []
+            for doc in batch:
+                key = doc.get("id")
+                if key is None:
+                    if live is None:
+                        documents.append(doc)
+                elif key not in seen and (live is None or key in live):
+                    seen.add(key)
+                    documents.append(doc)
+            if not documents:
+                continue
+            try:
+                await coll.insert_many(documents, ordered=False)
+                restored += len(documents)
+            except BulkWriteError as e:
+                inserted = e.details.get("nInserted", 0)
+                restored += inserted
+                failed += len(documents) - inserted
+            progress["restored"] = restored
+
+    actual = await coll.count_documents({})
+    progress["status"] = "done"
+    return {
+        "deleted": deleted.deleted_count,
+        "restored": restored,
+        "failed": failed,
+        "expected": expected,
+        "actual": actual,
+        "verified": actual == expected,
+        "sources": [reader.archive_id for reader in sources],
+    }
+
+
+async def restore_chain(db, chain: List[ArchiveReader], collections: List[str]) -> Dict:
+    """
+    استعادة المجموعات من سلسلة أرشيفات (الأحدث أولاً) بالتوازي.
+    التقدم في restore_progress أثناء التنفيذ.
+    """
+    present = set()
+    for reader in chain:
+        present.update(reader.collections())
+    targets = [c for c in collections if c in present]
+
+    restore_progress.clear()
+    restore_progress.update({
+        "archive_id": chain[0].archive_id,
+        "chain": [reader.archive_id for reader in chain],
+        "status": "running",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "collections": {c: {"status": "pending"} for c in targets},
+    })
+    semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+    async def _one(collection: str):
+        async with semaphore:
+            try:
+                return collection, await _restore_collection(db, chain, collection, restore_progress["collections"][collection])
+            except Exception as e:
+                logger.error(f"Restore {chain[0].archive_id}: {collection} failed: {e}")
+                restore_progress["collections"][collection]["status"] = "error"
+                return collection, {"error": str(e)}
+
+    results = dict(await asyncio.gather(*(_one(c) for c in targets)))
+    restore_progress["status"] = "done"
+    restore_progress["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return results
@@ -0,0 +1,258 @@
+"""
+ATS Calibration Engine - معايرة أوزان التقييم من النتائج الفعلية
+============================================================
+- تُحمّل الدرجات الفرعية المخزنة (scoring) والنتيجة النهائية (final_outcome)
+  لكل طلب في مصفوفات NumPy - بدون إعادة قراءة السير الذاتية
+- بحث شبكي متجه: كل توزيعات الأوزان (مجموعها 100) × حدود العقوبات × حد القبول
+  - الدرجات لكل الأوزان = ضرب مصفوفات واحد (طلبات × أوزان)
+  - مصفوفة الالتباس لكل الحدود = عدد الحدود التي تتجاوزها كل درجة + bincount
+    لكل عمود ثم مجموع تراكمي عكسي (بدون مصفوفة ثلاثية الأبعاد)
+- الهدف: أعلى precision أو recall أو f1 للنتائج الإيجابية، مع حد أدنى للمقياس الآخر
+- التوقع الإيجابي = المستوى A/B (الدرجة ≥ الحد، أو high_potential)
+============================================================
+"""
+import itertools
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.ats_scoring import CLASSIFICATION_THRESHOLDS, DEFAULT_WEIGHTS
+from services.ats_stats import POSITIVE_OUTCOMES
+
+COMPONENTS = ["skill_match", "experience", "education", "language", "stability", "evidence"]
+PENALTIES = ["fluff_penalty_max", "ego_penalty_max", "stuffing_penalty_max"]
+
+DEFAULT_PENALTY_OPTIONS = {
+    "fluff_penalty_max": (0, 10, 15, 20),
+    "ego_penalty_max": (0, 10, 15),
+    "stuffing_penalty_max": (0, 10, 15),
+}
+DEFAULT_THRESHOLDS = tuple(range(40, 90, 5))
+OBJECTIVES = ("precision", "recall", "f1")
+
+WEIGHT_CHUNK = 4096  # weight vectors scored at once (bounds memory: samples × chunk)
+
+
+# ==================== DATASET ====================
+
+class CalibrationDataset:
+    """الدرجات الفرعية ومؤشرات المخاطر والنتائج كمصفوفات"""
+
+    def __init__(self, rows: List[dict]):
+        # Positive outcomes first: per-class counts then work on contiguous slices (no copies)
+        rows = sorted(rows, key=lambda r: r.get("final_outcome") not in POSITIVE_OUTCOMES)
+        self.size = len(rows)
+        self.components = np.array(
+            [[r.get(f"{c}_score") or 0 for c in COMPONENTS] for r in rows], dtype=np.float64
+        ).reshape(-1, len(COMPONENTS))
+        self.fluff_ratio = np.array([r.get("fluff_ratio") or 0 for r in rows], dtype=np.float64)
+        # Ego penalty only applies to extreme cases (see _calc_ego_index) - the stored penalty marks them
+        self.ego_excess = np.array(
+            [(r.get("ego_index") or 0) - 0.7 if r.get("ego_penalty") else 0 for r in rows], dtype=np.float64
+        )
+        self.stuffing_risk = np.array([r.get("stuffing_risk") or 0 for r in rows], dtype=np.float64)
+        self.high_potential = np.array([bool(r.get("high_potential")) for r in rows], dtype=bool)
+        self.positive = np.array([r.get("final_outcome") in POSITIVE_OUTCOMES for r in rows], dtype=bool)
+        self.positive_count = int(self.positive.sum())
+
+    def penalties(self, penalty_max: np.ndarray) -> np.ndarray:
+        """العقوبة الكلية لكل طلب لحدود عقوبات معينة (نفس التقريب int() في المحرك)"""
+        fluff, ego, stuffing = penalty_max
+        return (
+            np.trunc(self.fluff_ratio * fluff)
+            + np.trunc(self.ego_excess * ego)
+            + np.trunc(self.stuffing_risk * stuffing)
+        )
+
+
+async def load_dataset(db, job_id: Optional[str] = None) -> CalibrationDataset:
+    """الطلبات التي لها تقييم ونتيجة نهائية (مؤشر واحد، الحقول اللازمة فقط)"""
+    query = {"final_outcome": {"$exists": True, "$ne": None}, "scoring": {"$ne": None}}
+    if job_id:
+        query["job_id"] = job_id
+
+    cursor = db.ats_applications.find(query, {"_id": 0, "scoring": 1, "final_outcome": 1}).batch_size(1000)
+    rows = [{**app["scoring"], "final_outcome": app["final_outcome"]} async for app in cursor if app.get("scoring")]
+    return CalibrationDataset(rows)
+
+
+# ==================== GRIDS ====================
+
+def weight_grid(step: int = 10, min_weight: int = 0, max_weight: int = 60) -> np.ndarray:
+    """كل توزيعات أوزان المكونات الستة بخطوة step ومجموع 100 (stars and bars)"""
+    if step <= 0 or 100 % step:
+        raise ValueError("step must divide 100")
+    units = 100 // step
+    slots = len(COMPONENTS) - 1
+    grid = []
+    for bars in itertools.combinations(range(units + slots), slots):
+        edges = (-1,) + bars + (units + slots,)
+        grid.append([(edges[i + 1] - edges[i] - 1) * step for i in range(len(COMPONENTS))])
+    grid = np.array(grid, dtype=np.float64)
+    keep = ((grid >= min_weight) & (grid <= max_weight)).all(axis=1)
+    return grid[keep]
+
+
+def penalty_grid(options: Optional[Dict[str, tuple]] = None) -> np.ndarray:
+    options = options or DEFAULT_PENALTY_OPTIONS
+    return np.array(list(itertools.product(*(options[p] for p in PENALTIES))), dtype=np.float64)
+
+
+# ==================== METRICS ====================
+
+def _metrics(tp, fp, fn, tn):
+    """precision / recall / f1 / accuracy لمصفوفات أعداد (0 عند القسمة على صفر)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    accuracy = (tp + tn) / np.maximum(tp + fp + fn + tn, 1)
+    return {"precision": precision, "recall": recall, "f1": f1, "accuracy": accuracy}
+
+
+def _configuration(weights, penalty_max, threshold, counts) -> dict:
+    tp, fp, fn, tn = (int(c) for c in counts)
+    metrics = _metrics(np.float64(tp), np.float64(fp), np.float64(fn), np.float64(tn))
+    return {
+        "weights": {
+            **{c: int(w) for c, w in zip(COMPONENTS, weights)},
+            **{p: int(v) for p, v in zip(PENALTIES, penalty_max)},
+        },
+        "threshold": int(threshold),
+        "confusion_matrix": {"tp": tp, "fp": fp, "fn": fn, "tn": tn},
+        **{name: round(float(value), 4) for name, value in metrics.items()},
+    }
+
+
+def evaluate(dataset: CalibrationDataset, weights: np.ndarray, penalty_max: np.ndarray,
+             thresholds: np.ndarray) -> np.ndarray:
+    """
+    مصفوفة الالتباس لكل (أوزان، حد):
+    Returns: (len(weights), len(thresholds), 4) → tp, fp, fn, tn
+    """
+    base = dataset.components @ (weights.T / 100)                        # samples × weights
+    scores = base - dataset.penalties(penalty_max)[:, None]
+    n_weights, n_thresholds = len(weights), len(thresholds)
+
+    # Number of thresholds each score passes: int(x) >= t  ⇔  x >= t for integer t
+    passed = np.zeros(scores.shape, dtype=np.uint8)
+    for threshold in thresholds:
+        passed += scores >= threshold
+    passed[dataset.high_potential] = n_thresholds                        # high potential is bumped to Tier B
+
+    # Per-column histogram of "passed" for positives/negatives (one bincount each),
+    # then reverse cumulative sum → predicted-positive counts for every threshold
+    offsets = np.arange(n_weights) * (n_thresholds + 1)
+    size = n_weights * (n_thresholds + 1)
+    counts = []
+    for rows in (passed[:dataset.positive_count], passed[dataset.positive_count:]):
+        histogram = np.bincount((rows + offsets).ravel(), minlength=size).reshape(n_weights, -1)
+        counts.append(histogram[:, ::-1].cumsum(axis=1)[:, ::-1][:, 1:])
+    tp, fp = counts
+    total_neg = dataset.size - dataset.positive_count
+    return np.stack([tp, fp, dataset.positive_count - tp, total_neg - fp], axis=-1)
+
+
+# ==================== SEARCH ====================
+
+def grid_search(
+    dataset: CalibrationDataset,
+    objective: str = "f1",
+    min_other: float = 0.5,
+    step: int = 10,
+    max_weight: int = 60,
+    penalty_options: Optional[Dict[str, tuple]] = None,
+    thresholds: tuple = DEFAULT_THRESHOLDS,
+    top: int = 5,
+) -> dict:
+    """
+    البحث عن أفضل الأوزان والحد.
+    objective: precision (بشرط recall ≥ min_other)، recall (بشرط precision ≥ min_other)، أو f1
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}")
+    start = time.perf_counter()
+
+    weights = weight_grid(step, max_weight=max_weight)
+    penalties = penalty_grid(penalty_options)
+    threshold_values = np.sort(np.asarray(thresholds, dtype=np.float64))  # passed count → threshold index
+    constraint = {"precision": "recall", "recall": "precision"}.get(objective)
+
+    candidates = []  # (objective, f1, weights_index, penalty_index, threshold_index, counts)
+    if dataset.size:
+        for p_index, penalty_max in enumerate(penalties):
+            for offset in range(0, len(weights), WEIGHT_CHUNK):
+                counts = evaluate(dataset, weights[offset:offset + WEIGHT_CHUNK], penalty_max, threshold_values)
+                metrics = _metrics(*(counts[..., i].astype(np.float64) for i in range(4)))
+                value = metrics[objective].copy()
+                if constraint:
+                    value[metrics[constraint] < min_other] = -1
+                # Tie-break on f1 so precision/recall searches prefer balanced configurations
+                ranking = value + metrics["f1"] * 1e-6
+                flat = ranking.ravel()
+                best = np.argpartition(-flat, min(top, flat.size) - 1)[:top]
+                for index in best:
+                    w_index, t_index = np.unravel_index(index, ranking.shape)
+                    if value[w_index, t_index] < 0:
+                        continue
+                    candidates.append((
+                        float(flat[index]), offset + w_index, p_index, t_index, counts[w_index, t_index]
+                    ))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    best_configurations = [
+        _configuration(weights[w], penalties[p], threshold_values[t], counts)
+        for _, w, p, t, counts in candidates[:top]
+    ]
+
+    baseline_weights = np.array([[DEFAULT_WEIGHTS[c] for c in COMPONENTS]], dtype=np.float64)
+    baseline_penalties = np.array([DEFAULT_WEIGHTS[p] for p in PENALTIES], dtype=np.float64)
+    baseline_threshold = np.array([CLASSIFICATION_THRESHOLDS["acceptable"]], dtype=np.float64)
+    baseline = _configuration(
+        baseline_weights[0], baseline_penalties, baseline_threshold[0],
+        evaluate(dataset, baseline_weights, baseline_penalties, baseline_threshold)[0, 0]
+        if dataset.size else (0, 0, 0, 0),
+    )
+
+    return {
+        "samples": dataset.size,
+        "positives": dataset.positive_count,
+        "objective": objective,
+        "constraint": {f"min_{constraint}": min_other} if constraint else None,
+        "evaluated": len(weights) * len(penalties) * len(threshold_values),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "baseline": baseline,
+        "best": best_configurations,
+    }
+
+
+# ==================== BENCHMARK ====================
+
+def synthetic_dataset(size: int = 2000, seed: int = 1) -> CalibrationDataset:
+    """طلبات عشوائية نتيجتها مرتبطة بالمهارات والأدلة - لقياس سرعة البحث"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(size):
+        sub = {f"{c}_score": int(rng.integers(20, 101)) for c in COMPONENTS}
+        signal = 0.5 * sub["skill_match_score"] + 0.3 * sub["evidence_score"] + 0.2 * sub["experience_score"]
+        rows.append({
+            **sub,
+            "fluff_ratio": float(rng.random() * 0.5),
+            "ego_index": float(rng.random()),
+            "ego_penalty": int(rng.random() < 0.05),
+            "stuffing_risk": float(rng.random() * 0.3),
+            "high_potential": bool(rng.random() < 0.03),
+            "final_outcome": "hired" if signal + rng.normal(0, 10) > 70 else "rejected",
+        })
+    return CalibrationDataset(rows)
+
+
+# Benchmark - run from backend/: python -m services.ats_calibration
+if __name__ == "__main__":
+    report = grid_search(synthetic_dataset(), objective="f1")
+    for key in ("samples", "positives", "evaluated", "elapsed_ms"):
+        print(f"{key}: {report[key]}")
+    print(f"baseline: f1={report['baseline']['f1']} {report['baseline']['confusion_matrix']}")
+    for config in report["best"]:
+        print(f"best: f1={config['f1']} threshold={config['threshold']} {config['weights']} {config['confusion_matrix']}")
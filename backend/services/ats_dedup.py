@@ -0,0 +1,150 @@
+"""
+ATS Duplicate Detection - كشف المتقدمين المكررين
+============================================================
+1. تطابق تام: content_hash = بصمة ملفات السيرة (SHA-256 لكل ملف)
+   → يُعاد استخدام الاستخراج (والتقييم إن كانت متطلبات الوظيفة نفسها)
+2. تشابه تقريبي: MinHash على مقاطع من 3 كلمات من النص المطبّع
+   + LSH (16 نطاق × 8 صفوف) مخزنة في lsh_bands مع فهرس
+   → المرشحون فقط من يشاركون نطاقاً واحداً على الأقل، بدون مقارنة كل السير
+
+حد التشابه التقريبي لـ LSH بهذه الإعدادات ≈ (1/16)^(1/8) ≈ 0.71
+============================================================
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+DUPLICATE_THRESHOLD = 0.8
+MAX_CANDIDATES = 50
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fixed seed: signatures must stay comparable across processes and restarts
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+# ==================== HASHES ====================
+
+def content_hash(files: List[dict]) -> Optional[str]:
+    """بصمة مجموعة الملفات (لا تعتمد على ترتيب الرفع)"""
+    hashes = sorted(f["sha256"] for f in files if f.get("sha256"))
+    if not hashes or len(hashes) != len(files):
+        return None
+    return hashlib.sha256("|".join(hashes).encode()).hexdigest()
+
+
+def scoring_key(job_requirements: Dict, weights: Optional[Dict]) -> str:
+    """مفتاح مدخلات التقييم - تقييم سابق يُعاد استخدامه فقط إذا تطابق المفتاح"""
+    payload = json.dumps({"requirements": job_requirements, "weights": weights}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+# ==================== MINHASH / LSH ====================
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def minhash_signature(normalized_text: str) -> Optional[List[int]]:
+    """توقيع MinHash (NUM_PERM قيمة) - None إذا كان النص قصيراً جداً"""
+    hashes = _shingle_hashes(normalized_text)
+    if hashes.size == 0:
+        return None
+    # (shingles × permutations) universal hashing, then column-wise minimum
+    values = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return values.min(axis=0).astype(np.uint32).tolist()
+
+
+def lsh_bands(signature: List[int]) -> List[str]:
+    """مفاتيح النطاقات: 'رقم النطاق:بصمة الصفوف'"""
+    return [
+        f"{band}:{hashlib.blake2b(np.asarray(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS], dtype=np.uint32).tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """تقدير تشابه Jaccard من توقيعين"""
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    return float(np.mean(np.asarray(sig_a, dtype=np.uint32) == np.asarray(sig_b, dtype=np.uint32)))
+
+
+def fingerprint(normalized_text: str) -> Dict:
+    """الحقول المخزنة على الطلب: minhash + lsh_bands (تُحسب داخل عملية المعالجة)"""
+    signature = minhash_signature(normalized_text)
+    if signature is None:
+        return {"minhash": None, "lsh_bands": []}
+    return {"minhash": signature, "lsh_bands": lsh_bands(signature)}
+
+
+# ==================== LOOKUPS ====================
+
+async def ensure_dedup_indexes(db):
+    await db.ats_applications.create_index("content_hash", name="ats_content_hash")
+    await db.ats_applications.create_index("lsh_bands", name="ats_lsh_bands")
+
+
+async def find_exact_match(db, app_id: str, hash_value: Optional[str]) -> Optional[dict]:
+    """آخر طلب مكتمل بنفس الملفات تماماً"""
+    if not hash_value:
+        return None
+    matches = await db.ats_applications.find(
+        {"content_hash": hash_value, "processing_status": "completed", "id": {"$ne": app_id}},
+        {"_id": 0}
+    ).sort("processed_at", -1).limit(1).to_list(1)
+    return matches[0] if matches else None
+
+
+async def find_near_duplicates(db, app_id: str, signature: Optional[List[int]], bands: List[str]) -> List[dict]:
+    """
+    المرشحون من فهرس lsh_bands فقط، ثم تقدير التشابه من التوقيع.
+    Returns: [{id, job_id, full_name, email, similarity}] مرتبة تنازلياً
+    """
+    if not signature or not bands:
+        return []
+    candidates = await db.ats_applications.find(
+        {"lsh_bands": {"$in": bands}, "id": {"$ne": app_id}},
+        {"_id": 0, "id": 1, "job_id": 1, "full_name": 1, "email": 1, "minhash": 1, "submitted_at": 1}
+    ).limit(MAX_CANDIDATES).to_list(MAX_CANDIDATES)
+
+    duplicates = []
+    for candidate in candidates:
+        similarity = estimate_similarity(signature, candidate.pop("minhash", None))
+        if similarity >= DUPLICATE_THRESHOLD:
+            candidate["similarity"] = round(similarity, 3)
+            duplicates.append(candidate)
+    duplicates.sort(key=lambda d: d["similarity"], reverse=True)
+    return duplicates
+
+
+async def find_duplicates(db, app_id: str, exact: Optional[dict], signature: Optional[List[int]],
+                          bands: List[str]) -> List[dict]:
+    """التكرارات التقريبية + التطابق التام (similarity=1.0) في قائمة واحدة، مع exact لكل عنصر"""
+    duplicates = await find_near_duplicates(db, app_id, signature, bands)
+    if exact and not any(d["id"] == exact["id"] for d in duplicates):
+        duplicates.insert(0, {
+            **{k: exact.get(k) for k in ("id", "job_id", "full_name", "email", "submitted_at")},
+            "similarity": 1.0,
+        })
+    for d in duplicates:
+        d["exact"] = bool(exact) and d["id"] == exact["id"]
+    return duplicates
@@ -3,6 +3,7 @@ ATS CV Text Extraction Service
 Extracts text from PDF, DOC, DOCX files for ATS processing
 """
 
+import asyncio
 import os
 import re
 from typing import Optional, Tuple
@@ -11,9 +12,12 @@ from typing import Optional, Tuple
 MIN_TEXT_LENGTH = 200
 
 
-async def extract_text_from_file(file_path: str) -> Tuple[str, bool, str]:
+def extract_text(file_path: str, max_pages: Optional[int] = None) -> Tuple[str, bool, str]:
     """
-    Extract text from CV file.
+    Extract text from CV file (blocking - run in a worker thread/process).
+    
+    Args:
+        max_pages: stop after this many PDF pages (None = all pages)
     
     Returns:
         Tuple of (extracted_text, is_readable, error_message)
@@ -25,9 +29,9 @@ async def extract_text_from_file(file_path: str) -> Tuple[str, bool, str]:
     
     try:
         if ext == '.pdf':
-            text = await extract_from_pdf(file_path)
+            text = extract_from_pdf(file_path, max_pages)
         elif ext in ['.doc', '.docx']:
-            text = await extract_from_docx(file_path)
+            text = extract_from_docx(file_path)
         else:
             return "", False, f"Unsupported file type: {ext}"
         
@@ -44,7 +48,12 @@ async def extract_text_from_file(file_path: str) -> Tuple[str, bool, str]:
         return "", False, str(e)
 
 
-async def extract_from_pdf(file_path: str) -> str:
+async def extract_text_from_file(file_path: str, max_pages: Optional[int] = None) -> Tuple[str, bool, str]:
+    """Async wrapper - runs extraction in a thread so the event loop is not blocked"""
+    return await asyncio.to_thread(extract_text, file_path, max_pages)
+
+
+def extract_from_pdf(file_path: str, max_pages: Optional[int] = None) -> str:
     """Extract text from PDF using multiple methods"""
     text = ""
     
@@ -52,7 +61,7 @@ async def extract_from_pdf(file_path: str) -> str:
     try:
         import pdfplumber
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
+            for page in pdf.pages[:max_pages]:
                 page_text = page.extract_text()
                 if page_text:
                     text += page_text + "\n"
@@ -65,7 +74,7 @@ async def extract_from_pdf(file_path: str) -> str:
     try:
         from PyPDF2 import PdfReader
         reader = PdfReader(file_path)
-        for page in reader.pages:
+        for page in reader.pages[:max_pages]:
             page_text = page.extract_text()
             if page_text:
                 text += page_text + "\n"
@@ -75,7 +84,7 @@ async def extract_from_pdf(file_path: str) -> str:
     return text
 
 
-async def extract_from_docx(file_path: str) -> str:
+def extract_from_docx(file_path: str) -> str:
     """Extract text from DOCX/DOC files"""
     text = ""
     
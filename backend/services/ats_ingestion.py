@@ -0,0 +1,466 @@
+"""
+ATS Ingestion Service - معالجة السير الذاتية في الخلفية
+============================================================
+التقديم العام يحفظ الملفات ويُرجع الرد فوراً، ثم:
+1. يُضاف الطلب إلى طابور داخلي (asyncio.Queue)
+2. عمال الطابور يرسلون الاستخراج والتقييم إلى ProcessPoolExecutor
+   مع حد للصفحات ومهلة زمنية لكل طلب
+3. النتيجة تُكتب في ats_applications مع حقل processing_status
+
+processing_status: queued → processing → completed | failed
+- يُحجز الطلب ذرياً من queued فقط (processing = قيد المعالجة لدى عامل آخر)
+- processing_started_at هو عقد الحجز: طلب processing أقدم من PROCESSING_LEASE_SECONDS
+  توقف عامله (إعادة تشغيل/انهيار) فيعود إلى queued - عند بدء التشغيل ودورياً (scheduler)
+============================================================
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# ==================== CONFIGURATION ====================
+
+WORKER_PROCESSES = int(os.environ.get("ATS_EXTRACTION_WORKERS", "2"))
+QUEUE_CONSUMERS = WORKER_PROCESSES
+MAX_PDF_PAGES = int(os.environ.get("ATS_MAX_PDF_PAGES", "10"))
+PROCESSING_TIMEOUT_SECONDS = int(os.environ.get("ATS_PROCESSING_TIMEOUT", "60"))
+MAX_ATTEMPTS = 2
+# A task killed by another task's pool reset is retried without charging an attempt - this many times
+MAX_POOL_RESETS = 3
+# Longer than any single run (pool timeout + DB work): older "processing" rows lost their worker
+PROCESSING_LEASE_SECONDS = int(os.environ.get("ATS_PROCESSING_LEASE", str(PROCESSING_TIMEOUT_SECONDS * 5)))
+
+MIN_READABLE_TEXT = 100
+MANUAL_REVIEW_TEXT = "[Manual Review Required - CV not machine-readable]"
+
+STATUS_QUEUED = "queued"
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+PENDING_STATUSES = [STATUS_QUEUED, STATUS_PROCESSING]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_queue: Optional[asyncio.Queue] = None
+_consumers: List[asyncio.Task] = []
+
+
+class PoolReset(Exception):
+    """المهمة توقفت لأن مجموعة العمليات أُعيد تشغيلها بسبب مهمة أخرى (مهلة/انهيار) - ليس خطأها"""
+
+
+# ==================== WORKER PROCESS ====================
+
+def job_requirements_for(job: dict) -> Dict:
+    """متطلبات الوظيفة التي يستخدمها محرك التقييم"""
+    return {
+        "required_skills": job.get("required_skills", ""),
+        "experience_years": job.get("experience_years", 0),
+        "required_languages": job.get("required_languages", ["ar"]),
+    }
+
+
+def scoring_weights_for(job: dict) -> Optional[Dict]:
+    """أوزان التقييم الخاصة بالوظيفة (إن وُجدت) مدموجة مع الافتراضية"""
+    if not job.get("weights"):
+        return None
+    from services.ats_scoring import DEFAULT_WEIGHTS
+    return {**DEFAULT_WEIGHTS, **job["weights"]}
+
+
+EXTRACTION_FIELDS = ("extracted_text", "is_readable", "extraction_error", "language")
+
+
+def combine_extracted(files: List[Dict]) -> Tuple[str, bool]:
+    """نص الملفات المستخرج كاملاً (غير مقتطع) + هل كل الملفات قابلة للقراءة"""
+    all_text = ""
+    ats_readable = True
+    for f in files:
+        if f.get("extracted_text"):
+            all_text += f["extracted_text"] + "\n\n"
+        if not f.get("is_readable"):
+            ats_readable = False
+    return all_text, ats_readable
+
+
+def scoring_input(all_text: str, ats_readable: bool) -> Tuple[str, bool]:
+    """النص الذي يُقيَّم فعلاً - نفسه في المعالجة الأولى وإعادة التقييم"""
+    # If not ATS-readable, still accept but mark for manual review
+    # Don't reject applicants just because their CV is scanned
+    if not ats_readable or len(all_text.strip()) < MIN_READABLE_TEXT:
+        return MANUAL_REVIEW_TEXT, False
+    return all_text, ats_readable
+
+
+def score_extracted(files: List[Dict], job_requirements: Dict, weights: Optional[Dict] = None) -> Dict:
+    """
+    يعمل داخل عملية منفصلة: تجميع نص الملفات المستخرجة + التقييم + بصمة التكرار.
+    يُستخدم بعد الاستخراج، أو مباشرة عند إعادة استخدام استخراج سابق لنفس الملفات.
+    """
+    from services.ats_scoring import ATSScoringEngine
+    from services.ats_search import build_search_text
+    from services.ats_dedup import fingerprint
+
+    all_text, ats_readable = combine_extracted(files)
+
+    # Index whatever text was extracted, even for CVs sent to manual review
+    search_text = build_search_text(all_text)
+
+    all_text, ats_readable = scoring_input(all_text, ats_readable)
+    scoring = ATSScoringEngine(job_requirements, weights).score(all_text, ats_readable).to_dict()
+
+    return {
+        "files": files,
+        "all_text": all_text,
+        "ats_readable": ats_readable,
+        "scoring": scoring,
+        "search_text": search_text,
+        **fingerprint(search_text),
+    }
+
+
+def extract_and_score(file_paths: List[str], job_requirements: Dict, max_pages: int,
+                      weights: Optional[Dict] = None) -> Dict:
+    """
+    يعمل داخل عملية منفصلة: استخراج النص من كل ملف ثم التقييم.
+    يجب أن يبقى دالة على مستوى الوحدة حتى يمكن تمريرها إلى ProcessPoolExecutor.
+    """
+    from services.ats_extraction import extract_text, detect_language
+
+    files = []
+    for path in file_paths:
+        text, is_readable, error = extract_text(path, max_pages)
+        files.append({
+            "extracted_text": text,
+            "is_readable": is_readable,
+            "extraction_error": error,
+            "language": detect_language(text),
+        })
+
+    return score_extracted(files, job_requirements, weights)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: لا ننسخ حلقة الأحداث ولا اتصالات Mongo إلى العمليات الفرعية
+        _pool = ProcessPoolExecutor(
+            max_workers=WORKER_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor):
+    """
+    إيقاف مجموعة العمليات بعد انتهاء المهلة أو انهيار عملية.
+    ProcessPoolExecutor لا يلغي مهمة قيد التشغيل، لذلك تُنهى العمليات مباشرة
+    وتُنشأ مجموعة جديدة عند الطلب التالي.
+    pool: المجموعة التي أُرسلت إليها المهمة الفاشلة - إذا استُبدلت بالفعل (فشل مهمة
+    أخرى عليها) لا تُمس المجموعة الحالية.
+    """
+    global _pool
+    if pool is not _pool:
+        return
+    _pool = None
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+async def run_in_pool(fn, *args, timeout: int = PROCESSING_TIMEOUT_SECONDS):
+    """
+    تشغيل دالة في مجموعة العمليات مع مهلة - يرفع asyncio.TimeoutError.
+    يرفع PoolReset إذا أُنهيت المجموعة بسبب مهمة أخرى أثناء انتظار هذه المهمة.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    future = loop.run_in_executor(pool, fn, *args)
+    try:
+        return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.TimeoutError:
+        # عملية عالقة (مثلاً ملف PDF تالف) - مجموعة جديدة للطلب التالي
+        _reset_pool(pool)
+        raise
+    except BrokenProcessPool as e:
+        if pool is not _pool:
+            # Already replaced: another task's timeout/crash terminated the processes
+            raise PoolReset(str(e) or "process pool was reset") from e
+        _reset_pool(pool)
+        raise
+    except asyncio.CancelledError:
+        # shutdown(cancel_futures=True) cancels tasks still waiting for a process
+        if pool is not _pool and not asyncio.current_task().cancelling():
+            raise PoolReset("process pool was reset")
+        raise
+
+
+# ==================== APPLICATION PROCESSING ====================
+
+SCORE_HISTORY_LIMIT = 20
+
+
+def build_score_fields(result: Dict) -> Dict:
+    """حقول التقييم التي تُكتب على مستند الطلب"""
+    scoring = result["scoring"]
+    return {
+        "ats_readable": result["ats_readable"],
+        "extracted_text": result["all_text"][:10000],  # Limit stored text
+        "score": scoring.get("score", 0),
+        "auto_class": scoring.get("auto_class", "Weak"),
+        "tier": scoring.get("tier", "C"),
+        "scoring": scoring,
+        "search_text": result.get("search_text", ""),
+        "minhash": result.get("minhash"),
+        "lsh_bands": result.get("lsh_bands", []),
+    }
+
+
+def reused_result(prior: Dict, files: List[Dict]) -> Dict:
+    """نتيجة طلب سابق بنفس الملفات تماماً (نفس متطلبات التقييم)"""
+    by_hash = {f.get("sha256"): f for f in prior.get("files", [])}
+    return {
+        "files": [{k: by_hash.get(f.get("sha256"), {}).get(k) for k in EXTRACTION_FIELDS} for f in files],
+        "all_text": prior.get("extracted_text", ""),
+        "ats_readable": prior.get("ats_readable", False),
+        "scoring": prior.get("scoring") or {},
+        "search_text": prior.get("search_text", ""),
+        "minhash": prior.get("minhash"),
+        "lsh_bands": prior.get("lsh_bands", []),
+    }
+
+
+def score_history_push(entry: Dict) -> Dict:
+    """$push لسجل التقييمات (آخر SCORE_HISTORY_LIMIT فقط) - لتدقيق تغير الفئات"""
+    return {"score_history": {"$each": [entry], "$slice": -SCORE_HISTORY_LIMIT}}
+
+
+async def process_application(app_id: str) -> Optional[str]:
+    """
+    استخراج وتقييم طلب واحد وحفظ النتيجة.
+    Returns: الحالة النهائية أو None إذا كان الطلب غير موجود/ليس في الطابور (قيد المعالجة في مكان آخر)
+    """
+    from database import db
+
+    app = await db.ats_applications.find_one_and_update(
+        {"id": app_id, "processing_status": STATUS_QUEUED},
+        {
+            "$set": {
+                "processing_status": STATUS_PROCESSING,
+                "processing_started_at": datetime.now(timezone.utc).isoformat(),
+            },
+            "$inc": {"processing_attempts": 1},
+        },
+        projection={
+            "_id": 0, "id": 1, "job_id": 1, "files": 1, "content_hash": 1, "processing_attempts": 1, "pool_resets": 1,
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if not app:
+        return None
+
+    from services.ats_dedup import find_duplicates, find_exact_match, scoring_key
+    from services.ats_stats import invalidate_stats
+
+    job = await db.ats_jobs.find_one({"id": app["job_id"]}, {"_id": 0}) or {}
+    files = app.get("files", [])
+    requirements = job_requirements_for(job)
+    weights = scoring_weights_for(job)
+    key = scoring_key(requirements, weights)
+
+    # Same files already processed: reuse extraction, and scoring too if the inputs match
+    prior = await find_exact_match(db, app_id, app.get("content_hash"))
+
+    try:
+        if prior and prior.get("scoring_key") == key and prior.get("scoring"):
+            result = reused_result(prior, files)
+        elif prior:
+            result = await run_in_pool(
+                score_extracted, reused_result(prior, files)["files"], requirements, weights,
+            )
+        else:
+            result = await run_in_pool(
+                extract_and_score,
+                [f["path"] for f in files],
+                requirements,
+                MAX_PDF_PAGES,
+                weights,
+            )
+    except PoolReset as e:
+        if app.get("pool_resets", 0) >= MAX_POOL_RESETS:
+            return await _mark_failed(app, str(e))
+        # Collateral of another application's timeout: retry without charging an attempt
+        logger.info(f"ATS processing of {app_id} interrupted by a pool reset - re-queued")
+        await db.ats_applications.update_one(
+            {"id": app_id},
+            {"$set": {"processing_status": STATUS_QUEUED}, "$inc": {"processing_attempts": -1, "pool_resets": 1}}
+        )
+        await enqueue_application(app_id)
+        return STATUS_QUEUED
+    except Exception as e:
+        error = "Processing timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+        logger.warning(f"ATS processing failed for {app_id} (attempt {app.get('processing_attempts')}): {error}")
+
+        if app.get("processing_attempts", 1) < MAX_ATTEMPTS and not isinstance(e, asyncio.TimeoutError):
+            await db.ats_applications.update_one(
+                {"id": app_id}, {"$set": {"processing_status": STATUS_QUEUED, "processing_error": error}}
+            )
+            await enqueue_application(app_id)
+            return STATUS_QUEUED
+
+        return await _mark_failed(app, error)
+
+    for f, extracted in zip(files, result["files"]):
+        f.update(extracted)
+
+    duplicates = await find_duplicates(db, app_id, prior, result.get("minhash"), result.get("lsh_bands", []))
+
+    fields = build_score_fields(result)
+    now = datetime.now(timezone.utc).isoformat()
+    await db.ats_applications.update_one(
+        {"id": app_id},
+        {
+            "$set": {
+                **fields,
+                "files": files,
+                "processing_status": STATUS_COMPLETED,
+                "processing_error": None,
+                "processed_at": now,
+                "scoring_key": key,
+                "reused_from": prior["id"] if prior else None,
+                "is_duplicate": bool(duplicates),
+                "duplicate_of": duplicates[:10],
+            },
+            "$push": score_history_push({
+                "score": fields["score"],
+                "tier": fields["tier"],
+                "auto_class": fields["auto_class"],
+                "reason": "initial",
+                "scored_at": now,
+            }),
+        }
+    )
+    invalidate_stats(app["job_id"])
+    return STATUS_COMPLETED
+
+
+async def _mark_failed(app: dict, error: str) -> str:
+    """لا نرفض المتقدم - يُحال للمراجعة اليدوية"""
+    from database import db
+    from services.ats_stats import invalidate_stats
+
+    await db.ats_applications.update_one(
+        {"id": app["id"]},
+        {"$set": {
+            "processing_status": STATUS_FAILED,
+            "processing_error": error,
+            "processed_at": datetime.now(timezone.utc).isoformat(),
+            "ats_readable": False,
+            "extracted_text": MANUAL_REVIEW_TEXT,
+            "search_text": "",
+            "score": 0,
+            "auto_class": "Manual Review",
+            "tier": "C",
+        }}
+    )
+    invalidate_stats(app["job_id"])
+    return STATUS_FAILED
+
+
+# ==================== QUEUE ====================
+
+async def enqueue_application(app_id: str):
+    """إضافة طلب للطابور. إذا لم يكن الطابور يعمل يبقى queued ويُلتقط عند التشغيل"""
+    if _queue is None:
+        logger.warning(f"ATS ingestion queue not running - {app_id} stays queued")
+        return
+    await _queue.put(app_id)
+
+
+async def _consume():
+    while True:
+        app_id = await _queue.get()
+        try:
+            await process_application(app_id)
+        except Exception as e:
+            logger.error(f"ATS ingestion worker error for {app_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def start_ingestion_workers():
+    """بدء عمال الطابور وإعادة الطلبات العالقة"""
+    global _queue, _consumers
+    from database import db
+
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue()
+    _consumers = [asyncio.create_task(_consume()) for _ in range(QUEUE_CONSUMERS)]
+
+    await requeue_stale_applications()
+    queued = await db.ats_applications.find(
+        {"processing_status": STATUS_QUEUED},
+        {"_id": 0, "id": 1}
+    ).sort("submitted_at", 1).to_list(None)
+    for app in queued:
+        _queue.put_nowait(app["id"])
+    if queued:
+        logger.info(f"ATS ingestion: {len(queued)} queued applications picked up")
+
+
+async def requeue_stale_applications() -> int:
+    """
+    طلبات processing انتهى عقد حجزها (عاملها توقف) تعود إلى queued.
+    طلبات processing حديثة لدى عامل حي (عملية أخرى) لا تُمس.
+    Returns: عدد الطلبات المعادة
+    """
+    from database import db
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=PROCESSING_LEASE_SECONDS)).isoformat()
+    stale_query = {
+        "processing_status": STATUS_PROCESSING,
+        "$or": [
+            {"processing_started_at": {"$lt": cutoff}},
+            {"processing_started_at": {"$exists": False}},
+        ],
+    }
+    stale = await db.ats_applications.find(stale_query, {"_id": 0, "id": 1}).to_list(None)
+    requeued = 0
+    for app in stale:
+        # Conditional on the stale lease: a worker that just finished or re-claimed it wins
+        result = await db.ats_applications.update_one(
+            {"id": app["id"], **stale_query},
+            {"$set": {"processing_status": STATUS_QUEUED}}
+        )
+        if result.modified_count:
+            requeued += 1
+            await enqueue_application(app["id"])
+    if requeued:
+        logger.info(f"ATS ingestion: {requeued} stale processing applications re-queued")
+    return requeued
+
+
+async def stop_ingestion_workers():
+    global _queue, _consumers, _pool
+    for task in _consumers:
+        task.cancel()
+    _consumers = []
+    _queue = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        # A restart creates a fresh pool instead of submitting to a shut-down one
+        _pool = None
+
+
+def queue_size() -> int:
+    return _queue.qsize() if _queue is not None else 0
@@ -0,0 +1,145 @@
+"""
+ATS Public Cache - ذاكرة مؤقتة لصفحات التوظيف العامة
+============================================================
+- صفحة الوظائف (/careers) وصفحة كل وظيفة (/jobs/{slug}) تُبنى مرة واحدة
+  وتُحفظ كـ JSON جاهز مع ETag (بصمة المحتوى)
+- If-None-Match مطابق → 304 بدون جسم
+- تُلغى عند إنشاء/تعديل/إغلاق/أرشفة/إعادة فتح/حذف وظيفة (ats_admin)
+- الروابط غير الموجودة تُحفظ أيضاً لمدة قصيرة حتى لا تصل للقاعدة
+- قفل لكل مفتاح: عند انتهاء الصلاحية تحت ضغط، استعلام واحد فقط يصل للقاعدة
+- مدة صلاحية احتياطية (ATS_PUBLIC_CACHE_TTL) في حال تعدد العمليات
+============================================================
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+CACHE_TTL_SECONDS = int(os.environ.get("ATS_PUBLIC_CACHE_TTL", "300"))
+MISSING_TTL_SECONDS = 30
+MAX_CACHED_JOBS = 500
+
+# Browsers revalidate every time (cheap 304); shared caches may keep it briefly
+PUBLIC_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+CAREERS_KEY = "careers"
+
+PUBLIC_JOB_FIELDS = {
+    "_id": 0, "id": 1, "slug": 1, "title_ar": 1, "title_en": 1, "description": 1,
+    "location": 1, "contract_type": 1, "experience_years": 1,
+    "required_languages": 1, "required_skills": 1,
+}
+
+
+class CachedPage:
+    __slots__ = ("data", "body", "etag", "expires_at")
+
+    def __init__(self, data, ttl: int):
+        self.data = data
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode() if data is not None else b""
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()}"'
+        self.expires_at = time.monotonic() + ttl
+
+
+_pages: "OrderedDict[str, CachedPage]" = OrderedDict()
+_locks: Dict[str, asyncio.Lock] = {}
+_generation = 0  # bumped on invalidation - a rebuild started before it is not stored
+
+
+def invalidate_public_jobs():
+    """إلغاء كل الصفحات العامة (الوظائف قليلة والتعديلات نادرة)"""
+    global _generation
+    _generation += 1
+    _pages.clear()
+
+
+async def _get_page(key: str, build: Callable[[], Awaitable[Optional[object]]]) -> CachedPage:
+    page = _pages.get(key)
+    if page and page.expires_at > time.monotonic():
+        _pages.move_to_end(key)
+        return page
+
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        page = _pages.get(key)
+        if page and page.expires_at > time.monotonic():
+            return page
+
+        generation = _generation
+        data = await build()
+        page = CachedPage(data, CACHE_TTL_SECONDS if data is not None else MISSING_TTL_SECONDS)
+        if generation == _generation:
+            _pages[key] = page
+            _pages.move_to_end(key)
+            while len(_pages) > MAX_CACHED_JOBS + 1:
+                evicted, _ = _pages.popitem(last=False)
+                _locks.pop(evicted, None)
+    return page
+
+
+# ==================== PAGES ====================
+
+async def _build_careers():
+    from database import db
+
+    jobs = await db.ats_jobs.find(
+        {"status": "active"},
+        {
+            "_id": 0,
+            "id": 1,
+            "slug": 1,
+            "title_ar": 1,
+            "title_en": 1,
+            "description": 1,
+            "location": 1,
+            "contract_type": 1,
+            "experience_years": 1,
+            "created_at": 1
+        }
+    ).sort("created_at", -1).to_list(100)
+
+    return {
+        "jobs": jobs,
+        "count": len(jobs),
+        "message": {
+            "ar": "شكراً لاهتمامك بالانضمام إلى فريقنا" if jobs else "نشكرك على اهتمامك، لا توجد شواغر متاحة حالياً. ندعوك لزيارة هذه الصفحة لاحقاً للاطلاع على الفرص الجديدة.",
+            "en": "Thank you for your interest in joining our team" if jobs else "Thank you for your interest. There are no vacancies available at this time. Please check back later for new opportunities."
+        }
+    }
+
+
+async def get_careers_page() -> CachedPage:
+    return await _get_page(CAREERS_KEY, _build_careers)
+
+
+async def get_active_job(slug: str) -> CachedPage:
+    """صفحة وظيفة نشطة - data = None إذا لم تكن موجودة أو مغلقة"""
+    from database import db
+
+    async def build():
+        return await db.ats_jobs.find_one({"slug": slug, "status": "active"}, PUBLIC_JOB_FIELDS)
+
+    return await _get_page(f"job:{slug}", build)
+
+
+# ==================== RESPONSES ====================
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    return header.strip() == "*" or any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def page_response(request: Request, page: CachedPage) -> Response:
+    """JSON جاهز مع ETag - أو 304 إذا كانت نسخة المتصفح مطابقة"""
+    headers = {"ETag": page.etag, "Cache-Control": PUBLIC_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
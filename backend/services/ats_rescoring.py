@@ -0,0 +1,266 @@
+"""
+ATS Rescoring Service - إعادة تقييم الطلبات عند تغيير متطلبات الوظيفة
+============================================================
+عند تعديل المهارات/الخبرة/اللغات/الأوزان لوظيفة:
+1. تُقرأ طلبات الوظيفة بمؤشر (cursor) على دفعات - بدون تحميلها كلها
+2. نص الملفات المستخرج كاملاً (files[].extracted_text - نفس مدخل المعالجة الأولى،
+   لا extracted_text المقتطع للعرض) يُعاد تقييمه في مجموعة العمليات
+   (نفس مجموعة معالجة السير الذاتية) - عدة دفعات بالتوازي
+3. النتائج تُكتب بـ bulk_write مع إضافة سجل في score_history
+4. التقدم يُحفظ في ats_rescore_jobs (processed / total / tier_transitions)
+============================================================
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from services.ats_ingestion import (
+    PENDING_STATUSES,
+    PROCESSING_TIMEOUT_SECONDS,
+    PoolReset,
+    WORKER_PROCESSES,
+    combine_extracted,
+    job_requirements_for,
+    run_in_pool,
+    score_history_push,
+    scoring_input,
+    scoring_weights_for,
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+PARALLEL_BATCHES = max(WORKER_PROCESSES, 1)
+
+# Job fields that change scores
+SCORING_FIELDS = ("required_skills", "experience_years", "required_languages", "weights")
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_SUPERSEDED = "superseded"
+
+_running: Dict[str, Tuple[str, asyncio.Task]] = {}  # job_id -> (rescore_id, task)
+
+
+# ==================== WORKER PROCESS ====================
+
+def score_batch(items: List[Tuple[str, bool]], job_requirements: Dict, weights: Optional[Dict]) -> List[Dict]:
+    """يعمل داخل عملية منفصلة: تقييم دفعة (النص، قابل للقراءة) بمحرك واحد"""
+    from services.ats_scoring import ATSScoringEngine
+
+    engine = ATSScoringEngine(job_requirements, weights)
+    return [engine.score(text or "", readable).to_dict() for text, readable in items]
+
+
+def rescore_input(app: dict) -> Tuple[str, bool]:
+    """(النص، قابل للقراءة) للتقييم - من نص الملفات الكامل كما في المعالجة الأولى"""
+    files = app.get("files") or []
+    if any(f.get("extracted_text") for f in files):
+        return scoring_input(*combine_extracted(files))
+    # Failed processing / legacy applications: only the stored text exists
+    return app.get("extracted_text") or "", app.get("ats_readable") is not False
+
+
+# ==================== RESCORE JOB ====================
+
+def scoring_changed(before: dict, update: dict) -> bool:
+    """هل يغير التعديل نتيجة التقييم؟"""
+    return any(field in update and update[field] != before.get(field) for field in SCORING_FIELDS)
+
+
+async def start_rescore(job_id: str, triggered_by: Optional[str] = None, reason: str = "job_updated") -> Optional[dict]:
+    """
+    بدء إعادة تقييم لوظيفة في الخلفية.
+    إذا كانت هناك إعادة تقييم جارية لنفس الوظيفة تُلغى (النتيجة الجديدة تغطي كل الطلبات).
+    Returns: مستند التقدم أو None إذا لم تكن الوظيفة موجودة
+    """
+    from database import db
+
+    job = await db.ats_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        return None
+
+    previous = _running.pop(job_id, None)
+    if previous:
+        previous_id, task = previous
+        task.cancel()
+        await db.ats_rescore_jobs.update_one(
+            {"id": previous_id, "status": STATUS_RUNNING},
+            {"$set": {"status": STATUS_SUPERSEDED, "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+
+    query = {"job_id": job_id, "processing_status": {"$nin": PENDING_STATUSES}}
+    rescore = {
+        "id": str(uuid.uuid4()),
+        "job_id": job_id,
+        "status": STATUS_RUNNING,
+        "reason": reason,
+        "requirements": job_requirements_for(job),
+        "weights": job.get("weights"),
+        "total": await db.ats_applications.count_documents(query),
+        "processed": 0,
+        "tier_changes": 0,
+        "tier_transitions": {},
+        "error": None,
+        "triggered_by": triggered_by,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+    }
+    await db.ats_rescore_jobs.insert_one(rescore)
+    rescore.pop("_id", None)
+
+    task = asyncio.create_task(_run_rescore(rescore["id"], job, query, reason))
+    _running[job_id] = (rescore["id"], task)
+    return rescore
+
+
+async def _run_rescore(rescore_id: str, job: dict, query: dict, reason: str):
+    from database import db
+
+    job_id = job["id"]
+    requirements = job_requirements_for(job)
+    weights = scoring_weights_for(job)
+    in_flight = set()
+
+    try:
+        cursor = db.ats_applications.find(
+            query,
+            {
+                "_id": 0, "id": 1, "extracted_text": 1, "ats_readable": 1, "score": 1, "tier": 1, "auto_class": 1,
+                "files.extracted_text": 1, "files.is_readable": 1,
+            }
+        ).batch_size(BATCH_SIZE)
+
+        batch = []
+        async for app in cursor:
+            batch.append(app)
+            if len(batch) < BATCH_SIZE:
+                continue
+            in_flight.add(asyncio.create_task(_rescore_batch(rescore_id, job_id, batch, requirements, weights, reason)))
+            batch = []
+            if len(in_flight) >= PARALLEL_BATCHES:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        if batch:
+            in_flight.add(asyncio.create_task(_rescore_batch(rescore_id, job_id, batch, requirements, weights, reason)))
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        in_flight = set()
+
+        await db.ats_rescore_jobs.update_one(
+            {"id": rescore_id},
+            {"$set": {"status": STATUS_COMPLETED, "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        await db.ats_jobs.update_one(
+            {"id": job_id}, {"$set": {"last_rescored_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        logger.info(f"ATS rescore {rescore_id} for job {job_id} completed")
+    except asyncio.CancelledError:
+        for task in in_flight:
+            task.cancel()
+        raise
+    except Exception as e:
+        for task in in_flight:
+            task.cancel()
+        logger.error(f"ATS rescore {rescore_id} for job {job_id} failed: {e}")
+        await db.ats_rescore_jobs.update_one(
+            {"id": rescore_id},
+            {"$set": {
+                "status": STATUS_FAILED,
+                "error": str(e) or type(e).__name__,
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }}
+        )
+    finally:
+        current = _running.get(job_id)
+        if current and current[0] == rescore_id:
+            _running.pop(job_id, None)
+
+
+async def _rescore_batch(rescore_id: str, job_id: str, apps: List[dict], requirements: Dict,
+                         weights: Optional[Dict], reason: str):
+    """تقييم دفعة في مجموعة العمليات ثم كتابتها بعملية bulk_write واحدة"""
+    from database import db
+
+    from services.ats_dedup import scoring_key
+    from services.ats_stats import invalidate_stats
+
+    items = [rescore_input(app) for app in apps]
+    try:
+        results = await run_in_pool(score_batch, items, requirements, weights, timeout=PROCESSING_TIMEOUT_SECONDS)
+    except PoolReset:
+        # Interrupted by another task's timeout (e.g. a hung CV upload) - not this batch's fault
+        results = await run_in_pool(score_batch, items, requirements, weights, timeout=PROCESSING_TIMEOUT_SECONDS)
+    key = scoring_key(requirements, weights)
+
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    transitions: Dict[str, int] = {}
+    for app, scoring in zip(apps, results):
+        old_tier = app.get("tier")
+        new_tier = scoring.get("tier", "C")
+        if old_tier != new_tier:
+            transition = f"{old_tier or 'none'}_to_{new_tier}"
+            transitions[transition] = transitions.get(transition, 0) + 1
+
+        operations.append(UpdateOne(
+            {"id": app["id"]},
+            {
+                "$set": {
+                    "score": scoring.get("score", 0),
+                    "auto_class": scoring.get("auto_class", "Weak"),
+                    "tier": new_tier,
+                    "scoring": scoring,
+                    "scoring_key": key,
+                    "rescored_at": now,
+                },
+                "$push": score_history_push({
+                    "score": scoring.get("score", 0),
+                    "tier": new_tier,
+                    "auto_class": scoring.get("auto_class", "Weak"),
+                    "previous_score": app.get("score"),
+                    "previous_tier": old_tier,
+                    "reason": reason,
+                    "rescore_id": rescore_id,
+                    "scored_at": now,
+                }),
+            }
+        ))
+
+    if operations:
+        await db.ats_applications.bulk_write(operations, ordered=False)
+        invalidate_stats(job_id)
+
+    progress = {"processed": len(apps), "tier_changes": sum(transitions.values())}
+    progress.update({f"tier_transitions.{key}": count for key, count in transitions.items()})
+    await db.ats_rescore_jobs.update_one({"id": rescore_id}, {"$inc": progress})
+
+
+async def get_rescore(rescore_id: str) -> Optional[dict]:
+    from database import db
+    return await db.ats_rescore_jobs.find_one({"id": rescore_id}, {"_id": 0})
+
+
+async def resume_interrupted_rescores():
+    """إعادة تشغيل عمليات إعادة التقييم التي انقطعت بإعادة تشغيل الخادم"""
+    from database import db
+
+    interrupted = await db.ats_rescore_jobs.find(
+        {"status": STATUS_RUNNING}, {"_id": 0, "id": 1, "job_id": 1, "triggered_by": 1, "reason": 1}
+    ).to_list(None)
+    for rescore in interrupted:
+        await db.ats_rescore_jobs.update_one(
+            {"id": rescore["id"]},
+            {"$set": {"status": STATUS_SUPERSEDED, "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    for job_id in {r["job_id"] for r in interrupted}:
+        latest = next(r for r in reversed(interrupted) if r["job_id"] == job_id)
+        await start_rescore(job_id, latest.get("triggered_by"), latest.get("reason", "job_updated"))
+    if interrupted:
+        logger.info(f"ATS rescoring: {len(interrupted)} interrupted runs restarted")
@@ -4,6 +4,8 @@ C-A Style: Strict on fluff, fair to young talent with evidence
 """
 
 import re
+import string
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -50,7 +52,7 @@ FLUFF_PHRASES_AR = [
     "مهارات التعامل", "مهارات تنظيمية", "مهارات تحليلية", "العمل تحت الضغط",
 ]
 
-# Evidence indicators
+# Evidence indicators (the compiled form used for scoring is _EVIDENCE_RES)
 EVIDENCE_PATTERNS = [
     r'\d+%',  # Percentages
     r'\$[\d,]+', r'[\d,]+\s*(ريال|SAR|USD|دولار)',  # Money
@@ -87,6 +89,158 @@ SKILL_SYNONYMS = {
     "برمجة": ["برمجة", "مطور", "تطوير", "بايثون", "جافا"],
 }
 
+EDUCATION_KEYWORDS = {
+    'phd': 100, 'doctorate': 100, 'دكتوراه': 100,
+    'master': 90, 'mba': 90, 'ماجستير': 90,
+    'bachelor': 80, 'bsc': 80, 'ba': 80, 'بكالوريوس': 80,
+    'diploma': 60, 'دبلوم': 60,
+    'certificate': 50, 'شهادة': 50,
+    'high school': 40, 'ثانوي': 40,
+}
+
+LANGUAGE_KEYWORDS = ['fluent', 'native', 'proficient', 'bilingual', 'طلاقة', 'إجادة', 'ثنائي اللغة', 'جيد جداً', 'ممتاز']
+
+EXPERIENCE_PATTERNS = [
+    r'(\d+)\+?\s*(?:years?|سنة|سنوات)\s*(?:of\s*)?(?:experience|خبرة)',
+    r'(?:experience|خبرة)[:\s]*(\d+)\+?\s*(?:years?|سنة|سنوات)',
+    r'(\d{4})\s*[-–]\s*(?:present|current|حالي|الآن)',
+]
+
+
+# ==================== COMPILED MATCHER ====================
+# Everything the engine looks for is prepared once per job (required skills
+# are part of the lexicon) instead of on every score() call:
+# - lexicon: every phrase list + skills + synonyms, lowercased and deduplicated,
+#   each counted once per CV and shared by all features
+# - evidence: EVIDENCE_PATTERNS merged into three regexes whose matches cannot
+#   overlap within a regex, so one scan each gives the same counts as
+#   re.findall per pattern
+# - CVs are lowercased once, so nothing needs IGNORECASE
+# One trie-shaped regex over the whole lexicon measured slower than C-level
+# str.count for a lexicon this size (see benchmark_scoring).
+
+SYNONYM_GROUPS = {key.lower(): [s.lower() for s in synonyms] for key, synonyms in SKILL_SYNONYMS.items()}
+
+# Reverse index: synonym -> groups that contain it
+SYNONYM_INDEX: Dict[str, List[str]] = {}
+for _key, _synonyms in SYNONYM_GROUPS.items():
+    for _syn in _synonyms:
+        SYNONYM_INDEX.setdefault(_syn, []).append(_key)
+
+FLUFF_TERMS = [p.lower() for p in FLUFF_PHRASES_EN + FLUFF_PHRASES_AR]
+EGO_TERMS = EGO_PRONOUNS_EN + EGO_PRONOUNS_AR
+TEAM_TERMS = TEAM_WORDS_EN + TEAM_WORDS_AR
+
+# Letter counts on the UTF-8 bytes: every U+0600-U+06FF character starts with
+# exactly one of the lead bytes D8-DB, and ASCII letters are single bytes
+_ARABIC_LEAD_BYTES = bytes(range(0xD8, 0xDC))
+_ENGLISH_BYTES = string.ascii_letters.encode()
+
+_EXPERIENCE_RES = [re.compile(p) for p in EXPERIENCE_PATTERNS]
+_YEAR_RE = re.compile(r'20\d{2}')
+
+# EVIDENCE_PATTERNS grouped by how a match starts: "$", a digit, or a verb
+_EVIDENCE_RES = [
+    re.compile(r'\$[\d,]+'),
+    re.compile(
+        r'[\d,]+\s*(?:ريال|sar|usd|دولار)'
+        r'|\d+(?:%|\s*(?:project|مشروع|client|عميل|year|سنة|month|شهر|week|أسبوع))'
+    ),
+    re.compile(
+        r'(?:increased|decreased|improved|reduced|saved|achieved|led|managed|supervised'
+        r'|زيادة|تقليل|تحسين|توفير|إنجاز|قاد|أدار|أشرف على)\s+\d+'
+    ),
+]
+
+
+@dataclass
+class CVFeatures:
+    """Everything the scoring engine reads from the CV text"""
+    term_counts: Dict[str, int]
+    evidence_count: int
+    experience_years: int
+    career_years: List[int]
+    arabic_chars: int
+    english_chars: int
+    total_words: int
+
+    def has(self, term: str) -> bool:
+        return self.term_counts.get(term, 0) > 0
+
+    def count(self, terms) -> int:
+        return sum(self.term_counts.get(t, 0) for t in terms)
+
+
+class CompiledMatcher:
+    """
+    Lexicon, reverse synonym lookups and evidence matchers for one set of
+    required skills. Build through get_matcher() so each job compiles once.
+    """
+
+    def __init__(self, required_skills: str = ""):
+        self.skills = [s.strip().lower() for s in required_skills.split(',') if s.strip()]
+
+        # Synonyms to look for when a skill is not found directly
+        self.skill_synonyms: Dict[str, List[str]] = {}
+        for skill in self.skills:
+            groups = [key for key in SYNONYM_GROUPS if skill in key]
+            groups += [key for key in SYNONYM_INDEX.get(skill, []) if key not in groups]
+            candidates = []
+            for key in SYNONYM_GROUPS:
+                if key in groups:
+                    candidates += [syn for syn in SYNONYM_GROUPS[key] if syn not in candidates]
+            self.skill_synonyms[skill] = candidates
+
+        terms = set(FLUFF_TERMS + EGO_TERMS + TEAM_TERMS + LANGUAGE_KEYWORDS)
+        terms.update(EDUCATION_KEYWORDS)
+        terms.update(self.skills)
+        for candidates in self.skill_synonyms.values():
+            terms.update(candidates)
+        terms.discard('')
+        self.terms = sorted(terms)
+
+    def scan(self, cv_text: str) -> CVFeatures:
+        cv_lower = cv_text.lower()
+
+        counts = {}
+        for term in self.terms:
+            count = cv_lower.count(term)
+            if count:
+                counts[term] = count
+
+        max_years = 0
+        for pattern in _EXPERIENCE_RES:
+            for match in pattern.findall(cv_lower):
+                try:
+                    if len(match) == 4:  # Year like 2020
+                        years = datetime.now().year - int(match)
+                    else:
+                        years = int(match)
+                    max_years = max(max_years, years)
+                except ValueError:
+                    pass
+
+        encoded = cv_text.encode('utf-8', 'surrogatepass')
+
+        this_year = datetime.now().year
+        career_years = sorted({int(y) for y in _YEAR_RE.findall(cv_text) if 2000 <= int(y) <= this_year})
+
+        return CVFeatures(
+            term_counts=counts,
+            evidence_count=sum(len(pattern.findall(cv_lower)) for pattern in _EVIDENCE_RES),
+            experience_years=max_years,
+            career_years=career_years,
+            arabic_chars=len(encoded) - len(encoded.translate(None, _ARABIC_LEAD_BYTES)),
+            english_chars=len(encoded) - len(encoded.translate(None, _ENGLISH_BYTES)),
+            total_words=len(cv_lower.split()),
+        )
+
+
+@lru_cache(maxsize=256)
+def get_matcher(required_skills: str = "") -> CompiledMatcher:
+    """Compiled matcher per distinct required_skills string"""
+    return CompiledMatcher(required_skills or "")
+
 
 @dataclass
 class ScoringResult:
@@ -158,6 +312,7 @@ class ATSScoringEngine:
     def __init__(self, job_requirements: Dict = None, weights: Dict = None):
         self.job = job_requirements or {}
         self.weights = weights or DEFAULT_WEIGHTS.copy()
+        self.matcher = get_matcher(self.job.get('required_skills') or '')
         self.result = ScoringResult()
     
     def score(self, cv_text: str, is_readable: bool = True) -> ScoringResult:
@@ -176,20 +331,20 @@ class ATSScoringEngine:
             self.result.top_reasons.append("File uploaded but needs HR review")
             return self.result
         
-        cv_lower = cv_text.lower()
+        features = self.matcher.scan(cv_text)
         
         # Calculate individual scores
-        self._calc_skill_match(cv_lower)
-        self._calc_experience(cv_text)
-        self._calc_education(cv_lower)
-        self._calc_language(cv_text)
-        self._calc_stability(cv_text)
-        self._calc_evidence(cv_text)
+        self._calc_skill_match(features)
+        self._calc_experience(features)
+        self._calc_education(features)
+        self._calc_language(features)
+        self._calc_stability(features)
+        self._calc_evidence(features)
         
         # Calculate risk indicators
-        self._calc_fluff_ratio(cv_lower)
-        self._calc_ego_index(cv_lower)
-        self._calc_stuffing_risk(cv_lower)
+        self._calc_fluff_ratio(features)
+        self._calc_ego_index(features)
+        self._calc_stuffing_risk(features)
         
         # Calculate final score
         self._calc_final_score()
@@ -205,40 +360,21 @@ class ATSScoringEngine:
         
         return self.result
     
-    def _calc_skill_match(self, cv_lower: str):
+    def _calc_skill_match(self, features: CVFeatures):
         """Calculate skill match percentage"""
-        required_skills = self.job.get('required_skills', '')
-        if not required_skills:
-            self.result.skill_match_score = 70  # Neutral if no requirements
-            return
-        
-        skills_list = [s.strip().lower() for s in required_skills.split(',') if s.strip()]
+        skills_list = self.matcher.skills
         if not skills_list:
-            self.result.skill_match_score = 70
+            self.result.skill_match_score = 70  # Neutral if no requirements
             return
         
         matched = []
         missing = []
         
         for skill in skills_list:
-            # Check direct match
-            if skill in cv_lower:
+            # Direct match, then synonyms
+            if features.has(skill) or any(features.has(syn) for syn in self.matcher.skill_synonyms[skill]):
                 matched.append(skill)
-                continue
-            
-            # Check synonyms
-            found = False
-            for key, synonyms in SKILL_SYNONYMS.items():
-                if skill in key.lower() or skill in [s.lower() for s in synonyms]:
-                    for syn in synonyms:
-                        if syn.lower() in cv_lower:
-                            matched.append(skill)
-                            found = True
-                            break
-                if found:
-                    break
-            
-            if not found:
+            else:
                 missing.append(skill)
         
         self.result.matched_skills = matched
@@ -247,29 +383,10 @@ class ATSScoringEngine:
         if skills_list:
             self.result.skill_match_score = int((len(matched) / len(skills_list)) * 100)
     
-    def _calc_experience(self, cv_text: str):
+    def _calc_experience(self, features: CVFeatures):
         """Estimate years of experience"""
         required_years = self.job.get('experience_years', 0)
-        
-        # Look for experience patterns
-        patterns = [
-            r'(\d+)\+?\s*(?:years?|سنة|سنوات)\s*(?:of\s*)?(?:experience|خبرة)',
-            r'(?:experience|خبرة)[:\s]*(\d+)\+?\s*(?:years?|سنة|سنوات)',
-            r'(\d{4})\s*[-–]\s*(?:present|current|حالي|الآن)',
-        ]
-        
-        max_years = 0
-        for pattern in patterns:
-            matches = re.findall(pattern, cv_text.lower(), re.IGNORECASE)
-            for match in matches:
-                try:
-                    if len(match) == 4:  # Year like 2020
-                        years = datetime.now().year - int(match)
-                    else:
-                        years = int(match)
-                    max_years = max(max_years, years)
-                except:
-                    pass
+        max_years = features.experience_years
         
         if required_years > 0:
             ratio = min(max_years / required_years, 1.5)  # Cap at 150%
@@ -277,25 +394,16 @@ class ATSScoringEngine:
         else:
             self.result.experience_score = 70 if max_years > 0 else 50
     
-    def _calc_education(self, cv_lower: str):
+    def _calc_education(self, features: CVFeatures):
         """Score education level"""
-        education_keywords = {
-            'phd': 100, 'doctorate': 100, 'دكتوراه': 100,
-            'master': 90, 'mba': 90, 'ماجستير': 90,
-            'bachelor': 80, 'bsc': 80, 'ba': 80, 'بكالوريوس': 80,
-            'diploma': 60, 'دبلوم': 60,
-            'certificate': 50, 'شهادة': 50,
-            'high school': 40, 'ثانوي': 40,
-        }
-        
         max_score = 0
-        for keyword, score in education_keywords.items():
-            if keyword in cv_lower:
+        for keyword, score in EDUCATION_KEYWORDS.items():
+            if features.has(keyword):
                 max_score = max(max_score, score)
         
         self.result.education_score = max_score if max_score > 0 else 50
     
-    def _calc_language(self, cv_text: str):
+    def _calc_language(self, features: CVFeatures):
         """Score language proficiency"""
         required_langs = self.job.get('required_languages', ['ar'])
         if isinstance(required_langs, str):
@@ -304,8 +412,8 @@ class ATSScoringEngine:
         score = 0
         
         # Check Arabic content (at least 50 characters)
-        has_arabic = len(re.findall(r'[\u0600-\u06FF]', cv_text)) >= 50
-        has_english = len(re.findall(r'[a-zA-Z]', cv_text)) >= 50
+        has_arabic = features.arabic_chars >= 50
+        has_english = features.english_chars >= 50
         
         # Score based on required languages
         if 'ar' in required_langs and has_arabic:
@@ -318,11 +426,8 @@ class ATSScoringEngine:
             score = min(score + 20, 100)
         
         # Check for language proficiency mentions
-        lang_keywords = ['fluent', 'native', 'proficient', 'bilingual', 'طلاقة', 'إجادة', 'ثنائي اللغة', 'جيد جداً', 'ممتاز']
-        for kw in lang_keywords:
-            if kw in cv_text.lower():
-                score = min(score + 10, 100)
-                break
+        if any(features.has(kw) for kw in LANGUAGE_KEYWORDS):
+            score = min(score + 10, 100)
         
         # If no required languages specified, give neutral score if any language found
         if not required_langs and (has_arabic or has_english):
@@ -330,11 +435,9 @@ class ATSScoringEngine:
         
         self.result.language_score = score
     
-    def _calc_stability(self, cv_text: str):
+    def _calc_stability(self, features: CVFeatures):
         """Calculate job stability (penalize frequent changes)"""
-        # Find year patterns
-        years = re.findall(r'20\d{2}', cv_text)
-        years = sorted(set([int(y) for y in years if 2000 <= int(y) <= datetime.now().year]))
+        years = features.career_years
         
         if len(years) < 2:
             self.result.stability_score = 70
@@ -364,13 +467,9 @@ class ATSScoringEngine:
             self.result.stability_score = 70
             self.result.stability_risk = 0.3
     
-    def _calc_evidence(self, cv_text: str):
+    def _calc_evidence(self, features: CVFeatures):
         """Score evidence of achievements"""
-        evidence_count = 0
-        
-        for pattern in EVIDENCE_PATTERNS:
-            matches = re.findall(pattern, cv_text, re.IGNORECASE)
-            evidence_count += len(matches)
+        evidence_count = features.evidence_count
         
         # Score based on evidence count
         if evidence_count >= 10:
@@ -384,14 +483,10 @@ class ATSScoringEngine:
         else:
             self.result.evidence_score = 30
     
-    def _calc_fluff_ratio(self, cv_lower: str):
+    def _calc_fluff_ratio(self, features: CVFeatures):
         """Calculate fluff phrase ratio"""
-        fluff_count = 0
-        total_words = len(cv_lower.split())
-        
-        for phrase in FLUFF_PHRASES_EN + FLUFF_PHRASES_AR:
-            count = cv_lower.count(phrase.lower())
-            fluff_count += count
+        fluff_count = features.count(FLUFF_TERMS)
+        total_words = features.total_words
         
         if total_words > 0:
             self.result.fluff_ratio = min((fluff_count * 10) / total_words, 1.0)
@@ -399,10 +494,10 @@ class ATSScoringEngine:
         # Calculate penalty
         self.result.fluff_penalty = int(self.result.fluff_ratio * self.weights['fluff_penalty_max'])
     
-    def _calc_ego_index(self, cv_lower: str):
+    def _calc_ego_index(self, features: CVFeatures):
         """Calculate ego vs team language ratio"""
-        ego_count = sum(cv_lower.count(p) for p in EGO_PRONOUNS_EN + EGO_PRONOUNS_AR)
-        team_count = sum(cv_lower.count(p) for p in TEAM_WORDS_EN + TEAM_WORDS_AR)
+        ego_count = features.count(EGO_TERMS)
+        team_count = features.count(TEAM_TERMS)
         
         # Add 1 to avoid division by zero and reduce sensitivity
         total = ego_count + team_count + 1
@@ -415,18 +510,15 @@ class ATSScoringEngine:
         else:
             self.result.ego_penalty = 0
     
-    def _calc_stuffing_risk(self, cv_lower: str):
+    def _calc_stuffing_risk(self, features: CVFeatures):
         """Detect keyword stuffing"""
-        required_skills = self.job.get('required_skills', '')
-        if not required_skills:
+        if not self.job.get('required_skills', ''):
             self.result.stuffing_risk = 0.0
             return
         
-        skills_list = [s.strip().lower() for s in required_skills.split(',') if s.strip()]
-        
         stuffing_score = 0
-        for skill in skills_list:
-            count = cv_lower.count(skill)
+        for skill in self.matcher.skills:
+            count = features.term_counts.get(skill, 0)
             if count > 5:  # Suspicious repetition
                 stuffing_score += (count - 5) * 0.1
         
@@ -543,3 +635,130 @@ async def score_application(cv_text: str, job_requirements: Dict, is_readable: b
     engine = ATSScoringEngine(job_requirements)
     result = engine.score(cv_text, is_readable)
     return result.to_dict()
+
+
+# ==================== BENCHMARK ====================
+
+def _reference_scan(cv_text: str, matcher: CompiledMatcher) -> CVFeatures:
+    """
+    Baseline for the benchmark: what score() did before the compiled matcher -
+    each feature lowercases its own phrase list and scans the text again,
+    regexes are looked up per call and matched with IGNORECASE.
+    """
+    cv_lower = cv_text.lower()
+    counts = {}
+
+    def _count(term):
+        count = cv_lower.count(term)
+        if count:
+            counts[term] = count
+
+    for skill in matcher.skills:
+        _count(skill)
+        for key, synonyms in SKILL_SYNONYMS.items():
+            if skill in key.lower() or skill in [s.lower() for s in synonyms]:
+                for syn in synonyms:
+                    _count(syn.lower())
+    for keyword in list(EDUCATION_KEYWORDS) + LANGUAGE_KEYWORDS:
+        _count(keyword)
+    for phrase in FLUFF_PHRASES_EN + FLUFF_PHRASES_AR + EGO_PRONOUNS_EN + EGO_PRONOUNS_AR + TEAM_WORDS_EN + TEAM_WORDS_AR:
+        _count(phrase.lower())
+
+    max_years = 0
+    for pattern in EXPERIENCE_PATTERNS:
+        for match in re.findall(pattern, cv_lower, re.IGNORECASE):
+            years = datetime.now().year - int(match) if len(match) == 4 else int(match)
+            max_years = max(max_years, years)
+
+    years = sorted({int(y) for y in re.findall(r'20\d{2}', cv_text) if 2000 <= int(y) <= datetime.now().year})
+
+    return CVFeatures(
+        term_counts=counts,
+        evidence_count=sum(len(re.findall(p, cv_text, re.IGNORECASE)) for p in EVIDENCE_PATTERNS),
+        experience_years=max_years,
+        career_years=years,
+        arabic_chars=len(re.findall(r'[\u0600-\u06FF]', cv_text)),
+        english_chars=len(re.findall(r'[a-zA-Z]', cv_text)),
+        total_words=len(cv_lower.split()),
+    )
+
+
+def synthetic_cv_corpus(count: int = 200, seed: int = 1) -> List[str]:
+    """Bilingual CV-like texts built from the phrase lists, numbers and dates"""
+    import random
+
+    rnd = random.Random(seed)
+    vocabulary = (
+        FLUFF_PHRASES_EN + FLUFF_PHRASES_AR + TEAM_WORDS_EN + TEAM_WORDS_AR
+        + [syn for synonyms in SKILL_SYNONYMS.values() for syn in synonyms]
+        + list(EDUCATION_KEYWORDS) + LANGUAGE_KEYWORDS
+        + ["responsible for", "company", "الشركة", "مسؤول عن", "reports", "customers", "systems", "المشاريع"]
+    )
+    templates = [
+        "increased sales {n}%", "led {n} engineers", "managed {n} accounts", "{n} projects delivered",
+        "{y} - present", "{n} years of experience", "خبرة {n} سنوات", "قاد {n} موظفين", "${n},000 budget",
+        "{n},000 SAR", "{y} - {y2}", "I am responsible for {n} clients", "my role",
+    ]
+    corpus = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rnd.randint(150, 450)):
+            if rnd.random() < 0.2:
+                year = rnd.randint(2005, 2024)
+                parts.append(rnd.choice(templates).format(n=rnd.randint(2, 60), y=year, y2=year + rnd.randint(1, 4)))
+            else:
+                parts.append(rnd.choice(vocabulary))
+        corpus.append(" ".join(parts)[:10000])  # Same limit as stored extracted_text
+    return corpus
+
+
+def benchmark_scoring(cv_texts: List[str] = None, required_skills: str = "python, excel, management, محاسبة, sql",
+                      iterations: int = 5) -> dict:
+    """
+    Compare the compiled single-pass matcher against per-phrase scanning over a CV corpus.
+    Returns average milliseconds per CV and checks both produce identical features.
+    """
+    import time
+
+    cv_texts = cv_texts or synthetic_cv_corpus()
+    matcher = get_matcher(required_skills)
+
+    for text in cv_texts:
+        if matcher.scan(text) != _reference_scan(text, matcher):
+            raise AssertionError("Compiled matcher disagrees with reference scan")
+
+    def _avg_ms(fn):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for text in cv_texts:
+                fn(text)
+        return round((time.perf_counter() - start) * 1000 / (iterations * len(cv_texts)), 3)
+
+    build_start = time.perf_counter()
+    CompiledMatcher(required_skills)
+    build_ms = round((time.perf_counter() - build_start) * 1000, 2)
+
+    engine = ATSScoringEngine({"required_skills": required_skills, "experience_years": 3, "required_languages": ["ar", "en"]})
+    results = {
+        'cvs': len(cv_texts),
+        'iterations': iterations,
+        'matcher_build_ms': build_ms,
+        'reference_scan_ms': _avg_ms(lambda t: _reference_scan(t, matcher)),
+        'compiled_scan_ms': _avg_ms(matcher.scan),
+        'full_score_ms': _avg_ms(engine.score),
+    }
+    results['speedup'] = round(results['reference_scan_ms'] / results['compiled_scan_ms'], 2) if results['compiled_scan_ms'] else None
+    return results
+
+
+# Benchmark - run from backend/: python -m services.ats_scoring [cv files...]
+if __name__ == "__main__":
+    import sys
+
+    texts = None
+    if len(sys.argv) > 1:
+        from services.ats_extraction import extract_text
+        texts = [extract_text(path)[0][:10000] for path in sys.argv[1:]]
+
+    for key, value in benchmark_scoring(texts).items():
+        print(f"{key}: {value}")
@@ -0,0 +1,212 @@
+"""
+ATS Search Service - البحث النصي في السير الذاتية
+============================================================
+- search_text: نص السيرة بعد التطبيع (حروف صغيرة، توحيد الألف/الياء/التاء
+  المربوطة، حذف التشكيل والتطويل، أرقام عربية → لاتينية)
+- search_name: اسم المتقدم بنفس التطبيع (full_name يبقى كما كتبه للعرض)
+- فهرس نصي في Mongo على search_text + search_name بلغة "none" (لا يوجد stemming عربي في Mongo،
+  فالتطبيع يتم هنا ويُطبق نفسه على الاستعلام)
+- يُكتب search_name عند التقديم و search_text عند تقييم الطلب (ats_ingestion)
+  → الفهرسة تزايدية
+- الطلبات القديمة تُفهرس عند بدء التشغيل على دفعات
+============================================================
+"""
+import logging
+import re
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+TEXT_INDEX_NAME = "ats_cv_text"
+SEARCH_TEXT_LIMIT = 30000
+SNIPPET_RADIUS = 80
+BACKFILL_BATCH_SIZE = 200
+
+_ARABIC_NORMALIZATION = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    "ـ": None,  # tatweel
+    **{chr(c): None for c in range(0x064B, 0x0653)},  # tashkeel
+    "ٰ": None,
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic-Indic digits
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # Persian digits
+})
+
+_TERM_RE = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def normalize_text(text: str) -> str:
+    """تطبيع النص للفهرسة والبحث - نفس الدالة للسيرة والاستعلام"""
+    return (text or "").lower().translate(_ARABIC_NORMALIZATION)
+
+
+def build_search_text(text: str) -> str:
+    return normalize_text(text[:SEARCH_TEXT_LIMIT])
+
+
+def build_search_name(full_name: str) -> str:
+    return normalize_text(full_name).strip()
+
+
+def parse_query(query: str) -> List[str]:
+    """'sap "supply chain" الرياض' → ['sap', 'supply chain', 'الرياض'] (مطبّعة)"""
+    terms = []
+    for phrase, word in _TERM_RE.findall(query or ""):
+        term = normalize_text(phrase or word).strip().replace('"', "")
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def text_search_string(terms: List[str], match_all: bool = True) -> str:
+    """
+    كل المصطلحات (AND): كل مصطلح بين علامتي تنصيص - هكذا يطبق Mongo شرط "و".
+    أي مصطلح (OR): كلمات بدون تنصيص، والعبارات تبقى بين تنصيص.
+    """
+    if match_all:
+        return " ".join(f'"{t}"' for t in terms)
+    return " ".join(f'"{t}"' if " " in t else t for t in terms)
+
+
+def make_snippet(text: str, terms: List[str]) -> str:
+    """مقطع حول أول تطابق - من النص الأصلي، أو المطبّع إذا كان التطابق بعد التطبيع فقط"""
+    if not text:
+        return ""
+    source = text
+    positions = [p for p in (text.lower().find(t) for t in terms) if p >= 0]
+    if not positions:
+        source = normalize_text(text)
+        positions = [p for p in (source.find(t) for t in terms) if p >= 0] or [0]
+
+    pos = min(positions)
+    start = max(pos - SNIPPET_RADIUS, 0)
+    end = min(pos + SNIPPET_RADIUS * 2, len(source))
+    snippet = " ".join(source[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(source) else "")
+
+
+# ==================== INDEXES ====================
+
+async def ensure_search_index(db):
+    """الفهرس النصي + فهرسة الطلبات التي ليس لها search_text/search_name"""
+    weights = {"search_text": 1, "search_name": 5}
+
+    # A collection has one text index: an older definition (raw full_name) is replaced
+    existing = (await db.ats_applications.index_information()).get(TEXT_INDEX_NAME)
+    if existing and existing.get("weights") != weights:
+        await db.ats_applications.drop_index(TEXT_INDEX_NAME)
+        logger.info(f"ATS search: rebuilding text index {TEXT_INDEX_NAME}")
+
+    await db.ats_applications.create_index(
+        [("search_text", "text"), ("search_name", "text")],
+        name=TEXT_INDEX_NAME,
+        default_language="none",
+        # files[].language يحمل "ar" وهي لغة غير مدعومة في فهارس Mongo النصية
+        language_override="search_language",
+        weights=weights,
+    )
+    return await backfill_search_text(db)
+
+
+async def backfill_search_text(db) -> int:
+    """فهرسة الطلبات القديمة على دفعات (bulk_write)"""
+    total = await _backfill(
+        db,
+        {"search_text": {"$exists": False}, "extracted_text": {"$exists": True}},
+        "extracted_text", "search_text", build_search_text,
+    )
+    total += await _backfill(
+        db,
+        {"search_name": {"$exists": False}, "full_name": {"$exists": True}},
+        "full_name", "search_name", build_search_name,
+    )
+    return total
+
+
+async def _backfill(db, query: Dict, source: str, target: str, build) -> int:
+    cursor = db.ats_applications.find(
+        query, {"_id": 0, "id": 1, source: 1}
+    ).batch_size(BACKFILL_BATCH_SIZE)
+
+    total = 0
+    operations = []
+    async for app in cursor:
+        operations.append(UpdateOne(
+            {"id": app["id"]},
+            {"$set": {target: build(app.get(source) or "")}}
+        ))
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            await db.ats_applications.bulk_write(operations, ordered=False)
+            total += len(operations)
+            operations = []
+    if operations:
+        await db.ats_applications.bulk_write(operations, ordered=False)
+        total += len(operations)
+    return total
+
+
+# ==================== SEARCH ====================
+
+async def search_applications(
+    db,
+    query: str,
+    job_id: Optional[str] = None,
+    tier: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    status: Optional[str] = None,
+    match_all: bool = True,
+    page: int = 1,
+    page_size: int = 20,
+) -> Dict:
+    """بحث مرتب حسب الصلة ثم الدرجة، مع فلاتر وترقيم صفحات"""
+    terms = parse_query(query)
+    if not terms:
+        return {"query": query, "terms": [], "total": 0, "page": page, "page_size": page_size, "results": []}
+
+    mongo_query: Dict = {"$text": {"$search": text_search_string(terms, match_all)}}
+    if job_id:
+        mongo_query["job_id"] = job_id
+    if tier:
+        mongo_query["tier"] = tier
+    if status:
+        mongo_query["status"] = status
+    if min_score is not None or max_score is not None:
+        mongo_query["score"] = {}
+        if min_score is not None:
+            mongo_query["score"]["$gte"] = min_score
+        if max_score is not None:
+            mongo_query["score"]["$lte"] = max_score
+
+    total = await db.ats_applications.count_documents(mongo_query)
+    results = await db.ats_applications.find(
+        mongo_query,
+        {
+            "_id": 0, "id": 1, "job_id": 1, "full_name": 1, "email": 1, "phone": 1,
+            "tier": 1, "score": 1, "auto_class": 1, "status": 1, "submitted_at": 1,
+            "extracted_text": 1, "relevance": {"$meta": "textScore"},
+        }
+    ).sort([("relevance", {"$meta": "textScore"}), ("score", -1)]).skip((page - 1) * page_size).limit(page_size).to_list(page_size)
+
+    job_ids = list({r["job_id"] for r in results if r.get("job_id")})
+    jobs = {
+        j["id"]: j for j in await db.ats_jobs.find(
+            {"id": {"$in": job_ids}}, {"_id": 0, "id": 1, "title_ar": 1, "title_en": 1, "slug": 1}
+        ).to_list(len(job_ids) or 1)
+    }
+
+    for r in results:
+        r["snippet"] = make_snippet(r.pop("extracted_text", ""), terms)
+        r["relevance"] = round(r.get("relevance", 0), 3)
+        r["job"] = jobs.get(r.get("job_id"))
+
+    return {
+        "query": query,
+        "terms": terms,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "results": results,
+    }
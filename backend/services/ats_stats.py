@@ -0,0 +1,158 @@
+"""
+ATS Stats Service - إحصائيات الطلبات بتجميع واحد
+============================================================
+- تجميع واحد ($facet) يحسب: المستويات، التصنيفات، الحالات، النتائج النهائية،
+  توزيع الدرجات (histogram)، الطلبات قيد المعالجة، وبيانات المعايرة
+- ذاكرة مؤقتة لكل وظيفة (+ نطاق عام لكل الوظائف) داخل العملية
+- تُلغى عند: إنشاء طلب، انتهاء معالجته، إعادة تقييمه، تغيير حالته أو نتيجته، حذفه
+- مدة صلاحية احتياطية قصيرة (ATS_STATS_CACHE_TTL، 60 ثانية) لتغييرات العمليات
+  الأخرى (عدة workers) والكتابات التي لا تمر بهذه العملية
+============================================================
+"""
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from services.ats_ingestion import PENDING_STATUSES
+
+CACHE_TTL_SECONDS = int(os.environ.get("ATS_STATS_CACHE_TTL", "60"))
+
+POSITIVE_OUTCOMES = ["shortlisted", "interview", "offer", "hired"]
+SCORE_BUCKETS = list(range(0, 101, 10)) + [101]  # 0-9, 10-19, ..., 90-100
+
+ALL_JOBS = "__all__"
+
+_cache: Dict[str, Tuple[float, dict]] = {}  # scope -> (expires_at, stats)
+
+
+# ==================== CACHE ====================
+
+def invalidate_stats(job_id: Optional[str] = None):
+    """إلغاء إحصائيات وظيفة (والنطاق العام). بدون job_id: إلغاء الكل"""
+    if job_id is None:
+        _cache.clear()
+        return
+    _cache.pop(job_id, None)
+    _cache.pop(ALL_JOBS, None)
+
+
+# ==================== AGGREGATION ====================
+
+def _count_by(field: str) -> list:
+    return [{"$group": {"_id": field, "count": {"$sum": 1}}}]
+
+
+def stats_pipeline(job_id: Optional[str] = None) -> list:
+    """تجميع واحد بكل الإحصائيات - رحلة واحدة لقاعدة البيانات"""
+    return [
+        {"$match": {"job_id": job_id} if job_id else {}},
+        {"$facet": {
+            "summary": [{"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "avg_score": {"$avg": "$score"},  # $avg ignores null scores
+                "high_potential": {"$sum": {"$cond": [{"$eq": ["$scoring.high_potential", True]}, 1, 0]}},
+                "processing": {"$sum": {"$cond": [{"$in": ["$processing_status", PENDING_STATUSES]}, 1, 0]}},
+            }}],
+            "by_tier": _count_by("$tier"),
+            "by_class": _count_by("$auto_class"),
+            "by_status": _count_by("$status"),
+            "by_outcome": _count_by("$final_outcome"),
+            "score_histogram": [
+                {"$match": {"score": {"$type": "number"}}},
+                {"$bucket": {
+                    "groupBy": "$score",
+                    "boundaries": SCORE_BUCKETS,
+                    "default": "other",
+                    "output": {"count": {"$sum": 1}},
+                }},
+            ],
+            # Predicted (tier, class) vs actual outcome - for the calibration report
+            "calibration": [
+                {"$match": {"final_outcome": {"$exists": True, "$ne": None}}},
+                {"$group": {
+                    "_id": {
+                        "tier": {"$ifNull": ["$tier", "C"]},
+                        "auto_class": {"$ifNull": ["$auto_class", "Weak"]},
+                    },
+                    "total": {"$sum": 1},
+                    "positive": {"$sum": {"$cond": [{"$in": ["$final_outcome", POSITIVE_OUTCOMES]}, 1, 0]}},
+                }},
+            ],
+        }},
+    ]
+
+
+def _counts(rows: list) -> Dict[str, int]:
+    return {r["_id"]: r["count"] for r in rows if r["_id"]}
+
+
+def _histogram(rows: list) -> list:
+    counts = {r["_id"]: r["count"] for r in rows}
+    return [
+        {"min": low, "max": min(high - 1, 100), "count": counts.get(low, 0)}
+        for low, high in zip(SCORE_BUCKETS, SCORE_BUCKETS[1:])
+    ]
+
+
+def shape_stats(facets: dict) -> dict:
+    """تحويل ناتج $facet إلى شكل الاستجابة"""
+    summary = (facets.get("summary") or [{}])[0]
+    return {
+        "total": summary.get("total", 0),
+        "processing": summary.get("processing", 0),
+        "high_potential": summary.get("high_potential", 0),
+        "avg_score": round(summary.get("avg_score") or 0, 1),
+        "by_tier": _counts(facets.get("by_tier", [])),
+        "by_class": _counts(facets.get("by_class", [])),
+        "by_status": _counts(facets.get("by_status", [])),
+        "by_outcome": _counts(facets.get("by_outcome", [])),
+        "score_histogram": _histogram(facets.get("score_histogram", [])),
+        "calibration": [
+            {**row["_id"], "total": row["total"], "positive": row["positive"]}
+            for row in facets.get("calibration", [])
+        ],
+    }
+
+
+async def get_application_stats(db, job_id: Optional[str] = None) -> dict:
+    """إحصائيات طلبات وظيفة (أو كل الوظائف) - من الذاكرة المؤقتة إن وُجدت"""
+    scope = job_id or ALL_JOBS
+    cached = _cache.get(scope)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    result = await db.ats_applications.aggregate(stats_pipeline(job_id)).to_list(1)
+    stats = shape_stats(result[0] if result else {})
+    _cache[scope] = (time.monotonic() + CACHE_TTL_SECONDS, stats)
+    return stats
+
+
+# ==================== CALIBRATION ====================
+
+def calibration_accuracy(calibration: list) -> Tuple[Dict, Dict]:
+    """
+    دقة التوقع لكل مستوى وتصنيف:
+    A/B و Excellent/Strong صحيحة إذا كانت النتيجة إيجابية، والباقي إذا كانت سلبية
+    """
+    tier_accuracy = {t: {"correct": 0, "total": 0} for t in ("A", "B", "C")}
+    class_accuracy = {c: {"correct": 0, "total": 0} for c in ("Excellent", "Strong", "Acceptable", "Weak")}
+
+    for row in calibration:
+        total, positive = row["total"], row["positive"]
+
+        tier = tier_accuracy.get(row["tier"])
+        if tier is not None:
+            tier["total"] += total
+            tier["correct"] += positive if row["tier"] in ("A", "B") else total - positive
+
+        cls = class_accuracy.get(row["auto_class"])
+        if cls is not None:
+            cls["total"] += total
+            cls["correct"] += positive if row["auto_class"] in ("Excellent", "Strong") else total - positive
+
+    for group in (tier_accuracy, class_accuracy):
+        for entry in group.values():
+            entry["accuracy"] = round(entry["correct"] / entry["total"] * 100, 1) if entry["total"] else 0
+
+    return tier_accuracy, class_accuracy
@@ -158,6 +158,8 @@ async def auto_sync_database(db):
                     {"username": user_data["username"]},
                     {"$set": {"is_active": True, "updated_at": now}}
                 )
+                from services.session_cache import refresh_users
+                await refresh_users({"username": user_data["username"]})
                 sync_results["actions"].append(f"✅ تم تفعيل مستخدم: {user_data['username']}")
     
     # 3. التأكد من وجود موظفين للمستخدمين الأساسيين
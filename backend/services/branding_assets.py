@@ -0,0 +1,324 @@
+"""
+Branding Assets Service - أصول الهوية البصرية
+============================================================
+- حفظ الشعار والصورة الجانبية وأيقونة التطبيق كملفات على القرص
+  بدلاً من data URLs داخل مستندات الإعدادات
+- توليد أيقونات PWA بكل المقاسات مرة واحدة عند الرفع
+- تقديم الملفات مع ETag قوي و Cache-Control طويل
+============================================================
+
+البيانات الوصفية في company_settings:
+- {"key": "branding_assets", "assets": {name: {file, mime_type, etag, size, url}}}
+- {"key": "pwa_icons", "source": "upload" | "logo", "version", "sizes", "updated_at"}
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+BRANDING_DIR = Path(__file__).parent.parent / "uploads" / "branding"
+
+PWA_ICON_SIZES = (32, 180, 192, 512)
+DEFAULT_ICON_SIZE = 512
+
+# الأصول المتاحة بدون تسجيل دخول (صفحة الدخول و PWA)
+PUBLIC_ASSETS = {"logo", "side_image", "pwa_icon", "company_logo"}
+
+# الروابط تحمل ?v=<etag> لذلك يمكن تخزينها في المتصفح لمدة طويلة
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=86400"
+
+MIME_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/webp": ".webp",
+    "image/svg+xml": ".svg",
+}
+
+# كاش البيانات الوصفية - مستند صغير يُقرأ مع كل طلب أيقونة
+META_TTL_SECONDS = 30
+_meta_cache = {"doc": None, "expires": 0.0}
+
+# كاش محتوى الملفات - أسماء الملفات مبنية على المحتوى فلا تتقادم
+MAX_CACHED_FILES = 16
+_bytes_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+
+def invalidate_branding_cache():
+    """مسح كاش البيانات الوصفية بعد أي رفع أو حذف"""
+    _meta_cache["doc"] = None
+    _meta_cache["expires"] = 0.0
+
+
+def asset_url(name: str, meta: dict) -> str:
+    return f"/api/company-settings/assets/{name}?v={meta['etag'][:12]}"
+
+
+def decode_data_url(data_url: str) -> Optional[tuple]:
+    """data:<mime>;base64,<data> → (bytes, mime_type)"""
+    if not data_url or not data_url.startswith("data:"):
+        return None
+    header, _, data = data_url.partition(",")
+    if not data:
+        return None
+    mime_type = header[5:].split(";")[0] or "image/png"
+    try:
+        return base64.b64decode(data), mime_type
+    except Exception:
+        return None
+
+
+# ============================================================
+# FILE STORAGE
+# ============================================================
+
+def _write_file(name: str, content: bytes, ext: str) -> dict:
+    BRANDING_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256(content).hexdigest()
+    filename = f"{name}-{digest[:16]}{ext}"
+    path = BRANDING_DIR / filename
+    if not path.exists():
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(content)
+        tmp.replace(path)
+    # حذف النسخ القديمة من نفس الأصل
+    for old in BRANDING_DIR.glob(f"{name}-*"):
+        if old.name != filename:
+            old.unlink(missing_ok=True)
+    return {"file": filename, "etag": digest, "size": len(content)}
+
+
+def _delete_files(name: str):
+    if BRANDING_DIR.exists():
+        for old in BRANDING_DIR.glob(f"{name}-*"):
+            old.unlink(missing_ok=True)
+
+
+async def store_asset(db, name: str, content: bytes, mime_type: str) -> dict:
+    """حفظ أصل كملف وتسجيل بياناته الوصفية - يُرجع meta مع url"""
+    ext = MIME_EXTENSIONS.get(mime_type, "")
+    meta = await asyncio.to_thread(_write_file, name, content, ext)
+    meta["mime_type"] = mime_type
+    meta["url"] = asset_url(name, meta)
+    meta["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+    await db.company_settings.update_one(
+        {"key": "branding_assets"},
+        {"$set": {f"assets.{name}": meta}},
+        upsert=True
+    )
+    invalidate_branding_cache()
+    return meta
+
+
+async def remove_asset(db, name: str):
+    await db.company_settings.update_one(
+        {"key": "branding_assets"},
+        {"$unset": {f"assets.{name}": ""}}
+    )
+    await asyncio.to_thread(_delete_files, name)
+    invalidate_branding_cache()
+
+
+async def get_assets(db) -> dict:
+    """البيانات الوصفية لكل الأصول (مع كاش قصير)"""
+    now = time.monotonic()
+    if _meta_cache["doc"] is None or now >= _meta_cache["expires"]:
+        doc = await db.company_settings.find_one({"key": "branding_assets"}, {"_id": 0, "assets": 1})
+        _meta_cache["doc"] = (doc or {}).get("assets") or {}
+        _meta_cache["expires"] = now + META_TTL_SECONDS
+    return _meta_cache["doc"]
+
+
+async def get_asset_meta(db, name: str) -> Optional[dict]:
+    return (await get_assets(db)).get(name)
+
+
+async def load_asset_bytes(meta: dict) -> bytes:
+    filename = meta["file"]
+    content = _bytes_cache.get(filename)
+    if content is None:
+        content = await asyncio.to_thread((BRANDING_DIR / filename).read_bytes)
+        _bytes_cache[filename] = content
+        while len(_bytes_cache) > MAX_CACHED_FILES:
+            _bytes_cache.popitem(last=False)
+    else:
+        _bytes_cache.move_to_end(filename)
+    return content
+
+
+async def asset_response(request: Request, meta: dict, filename: str = None, immutable: bool = False) -> Response:
+    """تقديم أصل مع ETag قوي - يُرجع 304 إذا كانت نسخة المتصفح مطابقة"""
+    etag = f'"{meta["etag"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        content = await load_asset_bytes(meta)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    if filename:
+        headers["Content-Disposition"] = f"inline; filename={filename}"
+    return Response(content=content, media_type=meta["mime_type"], headers=headers)
+
+
+# ============================================================
+# PWA ICONS
+# ============================================================
+
+def _render_icons(image_bytes: bytes) -> dict:
+    """توليد PNG لكل مقاس - عملية CPU تعمل خارج حلقة الأحداث"""
+    from PIL import Image
+
+    img = Image.open(BytesIO(image_bytes))
+
+    # Convert to RGB if needed (for PNG with transparency, add white background)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    rendered = {}
+    for size in PWA_ICON_SIZES:
+        output = BytesIO()
+        img.resize((size, size), Image.LANCZOS).save(output, format='PNG', optimize=True)
+        rendered[size] = output.getvalue()
+    return rendered
+
+
+async def render_pwa_icons(db, image_bytes: bytes, source: str) -> dict:
+    """
+    توليد أيقونات PWA مرة واحدة وحفظها كملفات.
+    source: "upload" (أيقونة مرفوعة) أو "logo" (مشتقة من الشعار)
+    يرفع ValueError إذا تعذر فتح الصورة.
+    """
+    try:
+        rendered = await asyncio.to_thread(_render_icons, image_bytes)
+    except Exception as e:
+        raise ValueError(f"Failed to process icon: {e}")
+
+    sizes = {}
+    for size, content in rendered.items():
+        meta = await store_asset(db, f"pwa_icon_{size}", content, "image/png")
+        sizes[str(size)] = meta["etag"][:12]
+
+    doc = {
+        "source": source,
+        "version": hashlib.sha256(image_bytes).hexdigest()[:8],
+        "sizes": sizes,
+        "mime_type": "image/png",
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await db.company_settings.update_one(
+        {"key": "pwa_icons"},
+        {"$set": doc, "$unset": {"icon_data": ""}},
+        upsert=True
+    )
+    return doc
+
+
+async def clear_pwa_icons(db):
+    await db.company_settings.delete_one({"key": "pwa_icons"})
+    for size in PWA_ICON_SIZES:
+        await remove_asset(db, f"pwa_icon_{size}")
+
+
+async def get_pwa_icons(db) -> Optional[dict]:
+    return await db.company_settings.find_one({"key": "pwa_icons"}, {"_id": 0, "icon_data": 0})
+
+
+# ============================================================
+# BRANDING FOR PDF GENERATORS
+# ============================================================
+
+async def asset_data_url(db, name: str) -> Optional[str]:
+    """أصل كـ data URL - لمولدات PDF التي تتوقع base64"""
+    meta = await get_asset_meta(db, name)
+    if not meta:
+        return None
+    try:
+        content = await load_asset_bytes(meta)
+    except FileNotFoundError:
+        logger.warning(f"Branding asset file missing: {meta.get('file')}")
+        return None
+    return f"data:{meta['mime_type']};base64,{base64.b64encode(content).decode('utf-8')}"
+
+
+async def get_company_branding(db) -> Optional[dict]:
+    """
+    إعدادات company_branding مع logo_data كـ data URL.
+    الشعار يُقرأ من الملف (مع كاش) بدلاً من تخزينه في مستند الإعدادات.
+    """
+    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0})
+    if branding and not branding.get("logo_data"):
+        branding["logo_data"] = await asset_data_url(db, "company_logo")
+    return branding
+
+
+# ============================================================
+# MIGRATION - نقل data URLs القديمة إلى ملفات
+# ============================================================
+
+async def migrate_legacy_branding(db) -> int:
+    """تحويل الصور المخزنة كـ base64 داخل الإعدادات إلى ملفات - آمن للتكرار"""
+    migrated = 0
+
+    login = await db.company_settings.find_one({"key": "login_page"}, {"_id": 0})
+    if login:
+        for field, name in (("logo_url", "logo"), ("side_image_url", "side_image"), ("pwa_icon_url", "pwa_icon")):
+            decoded = decode_data_url(login.get(field) or "")
+            if decoded:
+                meta = await store_asset(db, name, *decoded)
+                await db.company_settings.update_one({"key": "login_page"}, {"$set": {field: meta["url"]}})
+                migrated += 1
+
+    icons = await db.company_settings.find_one({"key": "pwa_icons"}, {"_id": 0})
+    if icons and icons.get("icon_data"):
+        try:
+            await render_pwa_icons(db, base64.b64decode(icons["icon_data"]), "upload")
+            migrated += 1
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Legacy PWA icon could not be rendered: {e}")
+    elif not icons and login and login.get("logo_url"):
+        meta = await get_asset_meta(db, "logo")
+        if meta:
+            try:
+                await render_pwa_icons(db, await load_asset_bytes(meta), "logo")
+                migrated += 1
+            except (ValueError, FileNotFoundError) as e:
+                logger.warning(f"PWA icons could not be rendered from logo: {e}")
+
+    branding = await db.settings.find_one({"type": "company_branding"}, {"_id": 0, "logo_data": 1})
+    decoded = decode_data_url((branding or {}).get("logo_data") or "")
+    if decoded:
+        meta = await store_asset(db, "company_logo", *decoded)
+        await db.settings.update_one(
+            {"type": "company_branding"},
+            {"$set": {"logo_url": meta["url"]}, "$unset": {"logo_data": ""}}
+        )
+        migrated += 1
+
+    return migrated
@@ -0,0 +1,110 @@
+"""
+Buffered Writer - كتابة مجمّعة لسجلات الأحداث
+============================================================
+سجل الأمان (security_audit_log) يُكتب فيه مع كل تسجيل دخول/خروج وكل حدث جهاز.
+بدلاً من insert_one لكل حدث ينتظره الطلب:
+- add() يضيف الحدث للذاكرة ويعود فوراً (لا انتظار لقاعدة البيانات)
+- الكتابة بـ insert_many كل FLUSH_EVENTS حدث أو كل FLUSH_MS ميلي ثانية (أيهما أسبق)
+- فشل الاتصال: الأحداث تعود للطابور وتُعاد المحاولة (بحد أقصى MAX_PENDING)
+- عند الإيقاف: flush_all_writers() يكتب المتبقي
+
+ملاحظة: الحدث يظهر في القراءات بعد FLUSH_MS كحد أقصى - لذلك للسجلات المُلحقة فقط.
+login_sessions ليس منها: الخروج/الخروج الإجباري يحدّث سجل الجلسة، فيُكتب مباشرة.
+============================================================
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+FLUSH_EVENTS = int(os.environ.get("AUDIT_FLUSH_EVENTS", "100"))
+FLUSH_MS = int(os.environ.get("AUDIT_FLUSH_MS", "250"))
+MAX_PENDING = 10000
+
+
+class BufferedWriter:
+    def __init__(self, collection: str, flush_events: int = FLUSH_EVENTS, flush_ms: int = FLUSH_MS):
+        self.collection = collection
+        self.flush_events = flush_events
+        self.flush_ms = flush_ms
+        self._buffer: List[dict] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    def add(self, doc: dict):
+        """إضافة حدث - بدون انتظار"""
+        self._buffer.append(doc)
+        if len(self._buffer) > MAX_PENDING:
+            dropped = len(self._buffer) - MAX_PENDING
+            del self._buffer[:dropped]
+            logger.error(f"{self.collection}: buffer full, dropped {dropped} oldest events")
+
+        if len(self._buffer) >= self.flush_events:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_ms / 1000, self._start_flush)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """كتابة كل ما في الطابور بـ insert_many"""
+        from database import db
+
+        async with self._lock:
+            while self._buffer:
+                batch = self._buffer[:self.flush_events]
+                del self._buffer[:len(batch)]
+                try:
+                    await db[self.collection].insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    # Per-document errors (e.g. duplicates): the rest were written
+                    logger.error(f"{self.collection}: {len(e.details.get('writeErrors', []))} events not written")
+                except Exception as e:
+                    logger.error(f"{self.collection}: flush failed, retrying later: {e}")
+                    self._buffer[:0] = batch
+                    if self._timer is None:
+                        self._timer = asyncio.get_running_loop().call_later(self.flush_ms / 1000, self._start_flush)
+                    return
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+
+
+_writers: Dict[str, BufferedWriter] = {}
+
+
+def get_writer(collection: str) -> BufferedWriter:
+    writer = _writers.get(collection)
+    if writer is None:
+        writer = _writers[collection] = BufferedWriter(collection)
+    return writer
+
+
+def audit_log(event: dict):
+    """حدث في security_audit_log"""
+    get_writer("security_audit_log").add(event)
+
+
+async def flush_all_writers():
+    """عند إيقاف الخادم"""
+    for writer in _writers.values():
+        try:
+            await writer.close()
+        except Exception as e:
+            logger.error(f"{writer.collection}: final flush failed: {e}")
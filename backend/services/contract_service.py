@@ -10,6 +10,7 @@ Handles all contract-related operations including:
 """
 
 from database import db
+from services.session_cache import refresh_users
 from datetime import datetime, timezone
 from typing import Optional, Dict, List, Tuple
 import uuid
@@ -205,7 +206,7 @@ async def activate_contract(
     
     # 2. If no user exists, create one
     if not existing_user:
-        from utils.auth import hash_password
+        from utils.auth import hash_password_async
         
         # Generate username from employee code
         username = employee_code.lower().replace("-", "")
@@ -219,7 +220,7 @@ async def activate_contract(
         new_user = {
             "id": new_user_id,
             "username": username,
-            "password_hash": hash_password("DarAlCode2026!"),  # Default password
+            "password_hash": await hash_password_async("DarAlCode2026!"),  # Default password
             "full_name": contract.get("employee_name", ""),
             "full_name_ar": contract.get("employee_name_ar", ""),
             "role": "employee",  # Default role
@@ -242,6 +243,7 @@ async def activate_contract(
             {"employee_id": employee_id},
             {"$set": {"is_active": True, "updated_at": now}}
         )
+        await refresh_users({"employee_id": employee_id})
     
     # 3. Update employee to active
     await db.employees.update_one(
@@ -483,6 +485,7 @@ async def close_contract(
         {"employee_id": employee_id},
         {"$set": {"is_active": False, "updated_at": now}}
     )
+    await refresh_users({"employee_id": employee_id})
     
     await db.employees.update_one(
         {"id": employee_id},
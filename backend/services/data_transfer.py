@@ -0,0 +1,227 @@
+"""
+Data Transfer - تصدير واستيراد البيانات بصيغة NDJSON متدفقة (gzip)
+============================================================
+بدلاً من تحميل كل البيانات في الذاكرة (to_list ثم JSON واحد) في التصدير، وقراءة الملف
+أو الطلب كاملاً في الاستيراد:
+
+الصيغة: سطر لكل مستند  {"collection": "<اسم المجموعة>", "doc": {...}}
+        والسطر الأول اختياري  {"meta": {...}}  (وقت التصدير، المصدر، المجموعات)
+
+- التصدير: مؤشر لكل مجموعة على دفعات ← أسطر ← ضغط gzip تدريجي (StreamingResponse)
+- الاستيراد: قراءة الطلب/الملف على أجزاء ← فك الضغط تدريجياً (gzip أو نص عادي) ← سطر
+  سطر ← bulk_write على دفعات (IMPORT_BATCH):
+  - upsert بمفتاح المجموعة (ReplaceOne على id، أو UPSERT_KEYS مثل type للإعدادات)
+    - مستند بلا مفتاح: upsert بمحتواه كاملاً - لا يتكرر عند إعادة الاستيراد
+  - أو replace: المجموعة تُفرغ عند أول سطر لها ثم تُكتب (استعادة أرشيف)
+- أخطاء التحقق لكل سطر (رقم السطر + السبب) - السطر الخاطئ لا يوقف الباقي
+
+الذاكرة ثابتة: جزء القراءة + دفعة الكتابة لكل مجموعة، مهما كان حجم الملف.
+============================================================
+"""
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH = 1000
+IMPORT_BATCH = 500
+MAX_LINE_BYTES = 16 * 1024 * 1024  # MongoDB document limit
+MAX_REPORTED_ERRORS = 200
+
+# Collections whose documents are identified by another field than "id"
+UPSERT_KEYS = {
+    "settings": "type",  # ramadan_mode, app_version, company_branding...
+}
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def ndjson_line(obj: dict) -> bytes:
+    return (json.dumps(obj, default=_json_default, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+# ==================== EXPORT ====================
+
+async def gzip_stream(lines: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """ضغط gzip تدريجي لأسطر متدفقة"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for line in lines:
+        chunk = compressor.compress(line)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+async def export_lines(db, collections: Iterable[str], meta: Optional[dict] = None) -> AsyncIterator[bytes]:
+    """أسطر NDJSON لكل مستندات المجموعات - مؤشر لكل مجموعة على دفعات"""
+    collections = list(collections)
+    if meta is not None:
+        yield ndjson_line({"meta": {**meta, "collections": collections}})
+    for name in collections:
+        batch = []
+        async for doc in db[name].find({}, {"_id": 0}).batch_size(EXPORT_BATCH):
+            batch.append(ndjson_line({"collection": name, "doc": doc}))
+            if len(batch) >= EXPORT_BATCH:
+                yield b"".join(batch)
+                batch = []
+        if batch:
+            yield b"".join(batch)
+
+
+# ==================== IMPORT ====================
+
+class _LineDecoder:
+    """أجزاء خام (gzip أو نص) ← أسطر كاملة"""
+
+    def __init__(self):
+        self._inflate = None
+        self._started = False
+        self._buffer = b""
+
+    def _decompress(self, chunk: bytes) -> bytes:
+        if not self._started:
+            self._started = True
+            if chunk[:2] == b"\x1f\x8b":
+                self._inflate = zlib.decompressobj(31)
+        if self._inflate is None:
+            return chunk
+        out = self._inflate.decompress(chunk)
+        # Concatenated gzip members
+        while self._inflate.eof and self._inflate.unused_data:
+            rest = self._inflate.unused_data
+            self._inflate = zlib.decompressobj(31)
+            out += self._inflate.decompress(rest)
+        return out
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        self._buffer += self._decompress(chunk)
+        lines = self._buffer.split(b"\n")
+        self._buffer = lines.pop()
+        if len(self._buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"line longer than {MAX_LINE_BYTES} bytes")
+        return lines
+
+    def close(self) -> List[bytes]:
+        rest, self._buffer = self._buffer, b""
+        return [rest] if rest.strip() else []
+
+
+def _valid_collection(name) -> bool:
+    return isinstance(name, str) and 0 < len(name) <= 120 and "$" not in name and not name.startswith("system.")
+
+
+class NdjsonImporter:
+    """
+    استيراد أسطر {"collection", "doc"} بالدفعات.
+    collections: المجموعات المسموحة (None = أي اسم صالح)
+    replace: تفريغ كل مجموعة عند أول سطر لها (استعادة) بدلاً من upsert بالمعرف
+    stamp: حقول تُضاف لكل مستند (مثل imported_at)
+    """
+
+    def __init__(self, db, collections: Optional[Iterable[str]] = None, replace: bool = False, stamp: Optional[dict] = None):
+        self.db = db
+        self.allowed: Optional[Set[str]] = set(collections) if collections is not None else None
+        self.replace = replace
+        self.stamp = stamp or {}
+        self.meta: Optional[dict] = None
+        self.lines = 0
+        self.results: Dict[str, Dict] = {}
+        self.errors: List[Dict] = []
+        self.error_count = 0
+        self._decoder = _LineDecoder()
+        self._pending: Dict[str, List[tuple]] = {}
+
+    def _error(self, line: int, message: str, collection: Optional[str] = None):
+        self.error_count += 1
+        if collection:
+            self.results[collection]["errors"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "collection": collection, "error": message})
+
+    async def feed(self, chunk: bytes):
+        for raw in self._decoder.feed(chunk):
+            await self._line(raw)
+
+    async def finish(self) -> Dict:
+        for raw in self._decoder.close():
+            await self._line(raw)
+        for name in list(self._pending):
+            await self._flush(name)
+        return {
+            "lines": self.lines,
+            "collections": self.results,
+            "total_written": sum(r["written"] for r in self.results.values()),
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "errors_truncated": self.error_count > len(self.errors),
+        }
+
+    async def _line(self, raw: bytes):
+        self.lines += 1
+        number = self.lines
+        if not raw.strip():
+            return
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            self._error(number, f"invalid JSON: {e}")
+            return
+        if not isinstance(record, dict):
+            self._error(number, "line is not a JSON object")
+            return
+        if "meta" in record and "doc" not in record:
+            self.meta = record["meta"]
+            return
+
+        name, doc = record.get("collection"), record.get("doc")
+        if not _valid_collection(name):
+            self._error(number, "missing or invalid collection")
+            return
+        if self.allowed is not None and name not in self.allowed:
+            self._error(number, f"collection '{name}' is not allowed")
+            return
+        if name not in self.results:
+            self.results[name] = {"written": 0, "errors": 0}
+            if self.replace:
+                deleted = await self.db[name].delete_many({})
+                self.results[name]["deleted"] = deleted.deleted_count
+        if not isinstance(doc, dict):
+            self._error(number, "doc must be a JSON object", name)
+            return
+        doc.pop("_id", None)
+        doc.update(self.stamp)
+
+        key = UPSERT_KEYS.get(name, "id")
+        if self.replace:
+            op = InsertOne(doc)
+        elif isinstance(doc.get(key), str) and doc[key]:
+            op = ReplaceOne({key: doc[key]}, doc, upsert=True)
+        else:
+            # No key: the same content is matched again on the next import
+            op = ReplaceOne({k: v for k, v in doc.items() if k not in self.stamp}, doc, upsert=True)
+
+        pending = self._pending.setdefault(name, [])
+        pending.append((number, op))
+        if len(pending) >= IMPORT_BATCH:
+            await self._flush(name)
+
+    async def _flush(self, name: str):
+        pending = self._pending.pop(name, [])
+        if not pending:
+            return
+        try:
+            await self.db[name].bulk_write([op for _, op in pending], ordered=False)
+            self.results[name]["written"] += len(pending)
+        except BulkWriteError as e:
+            failed = e.details.get("writeErrors", [])
+            self.results[name]["written"] += len(pending) - len(failed)
+            for error in failed:
+                self._error(pending[error["index"]][0], error.get("errmsg", "write failed"), name)
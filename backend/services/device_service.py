@@ -7,8 +7,16 @@ Device Fingerprint Service - خدمة بصمة الجهاز
 import hashlib
 import uuid
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Optional, Dict, List
 from database import db
+from services.session_cache import refresh_users
+from services.buffered_writer import audit_log
+from services.fingerprint_index import index_fields, is_same_device, lsh_bands, normalize_features, similarity
+from services.advanced_device_analysis import UA_CACHE_SIZE
+
+# معلومات العرض المحفوظة مع الجهاز عند التسجيل (ua_info) - قائمة الأجهزة لا تعيد التحليل
+UA_DISPLAY_FIELDS = ("friendly_name", "device_brand", "device_model", "os_display", "is_mobile", "is_tablet", "is_pc")
 
 
 def generate_core_hardware_signature(fingerprint_data: dict) -> str:
@@ -140,7 +148,8 @@ async def register_login_session(
                 "browser_version": browser_info['browser_version'],
                 "last_browser_change": now,
                 "last_used_at": now,
-                "fingerprint_data": fingerprint_data
+                "fingerprint_data": fingerprint_data,
+                **index_fields(fingerprint_data)
             }}
         )
         device_status = "same_device_browser_changed" if existing_device.get('browser') != browser_info['browser'] else "existing"
@@ -165,9 +174,11 @@ async def register_login_session(
             "platform": fingerprint_data.get('platform', ''),
             "screen_resolution": fingerprint_data.get('screenResolution', ''),
             "fingerprint_data": fingerprint_data,
+            "ua_info": {field: device_info.get(field) for field in UA_DISPLAY_FIELDS},
             "status": "trusted",  # موثوق تلقائياً
             "registered_at": now,
-            "last_used_at": now
+            "last_used_at": now,
+            **index_fields(fingerprint_data)
         }
         await db.employee_devices.insert_one(new_device)
         device_status = "new_device"
@@ -274,7 +285,9 @@ async def register_device(
         "last_used_at": now,
         "usage_count": 1,
         "approved_by": "system" if is_first_device else None,
-        "approved_at": now if is_first_device else None
+        "approved_at": now if is_first_device else None,
+        "ua_info": ua_display_info(user_agent),
+        **index_fields(fingerprint_data)
     }
     
     await db.employee_devices.insert_one(device)
@@ -302,6 +315,55 @@ async def register_device(
     }
 
 
+async def _find_employee_device(employee_id: str, signature: str, fingerprint_data: dict) -> Optional[dict]:
+    """
+    جهاز الموظف المطابق في استعلام واحد:
+    البصمة الكاملة (أو بصمة بديلة سبق قبولها)، وإلا أقرب جهاز من فهرس LSH بنفس العتاد تماماً
+    واختلاف في الخصائص المرنة فقط (تحديث المتصفح مثلاً).
+    بصمة الجهاز المعتمدة لا تُستبدل: البصمة الجديدة تُضاف إلى known_signatures وتُسجل في سجل الأمان.
+    """
+    features = normalize_features(fingerprint_data)
+    bands = lsh_bands(features)
+    conditions = [{"device_signature": signature}, {"known_signatures": signature}]
+    if bands:
+        conditions.append({"fp_bands": {"$in": bands}})
+    
+    candidates = await db.employee_devices.find(
+        {"employee_id": employee_id, "$or": conditions},
+        {"_id": 0}
+    ).to_list(50)
+    
+    for device in candidates:
+        if device.get('device_signature') == signature or signature in (device.get('known_signatures') or []):
+            return device
+    
+    scored = [
+        (similarity(features, d.get('fp_features') or {}), d) for d in candidates
+        if is_same_device(features, d.get('fp_features') or {})
+    ]
+    score, device = max(scored, key=lambda pair: pair[0], default=(0.0, None))
+    if device is None:
+        return None
+    
+    await db.employee_devices.update_one(
+        {"id": device['id']},
+        {"$addToSet": {"known_signatures": signature}}
+    )
+    await log_security_event(
+        employee_id=employee_id,
+        action="device_fingerprint_variant",
+        device_signature=signature,
+        fingerprint_data=fingerprint_data,
+        performed_by="system",
+        details={
+            "device_id": device['id'],
+            "similarity": round(score, 3),
+            "approved_signature": device.get('device_signature')
+        }
+    )
+    return device
+
+
 async def check_device_for_login(
     employee_id: str,
     device_signature: str,
@@ -318,22 +380,14 @@ async def check_device_for_login(
             "message_en": str
         }
     """
-    # التحقق من وجود أجهزة مسجلة
-    devices_count = await db.employee_devices.count_documents({
-        "employee_id": employee_id
-    })
+    # البحث عن الجهاز (مطابق أو مشابه)
+    device = await _find_employee_device(employee_id, device_signature, fingerprint_data)
     
-    if devices_count == 0:
+    if not device and await db.employee_devices.count_documents({"employee_id": employee_id}) == 0:
         # أول جهاز - تسجيله تلقائياً
         await register_device(employee_id, fingerprint_data, is_first_device=True)
         return {"allowed": True}
     
-    # البحث عن الجهاز
-    device = await db.employee_devices.find_one({
-        "employee_id": employee_id,
-        "device_signature": device_signature
-    })
-    
     if not device:
         # جهاز جديد غير مسجل - تسجيله بحالة pending
         await register_device(employee_id, fingerprint_data, is_first_device=False)
@@ -395,12 +449,10 @@ async def validate_device(employee_id: str, fingerprint_data: dict) -> dict:
     """
     signature = await generate_device_signature(fingerprint_data)
     
-    # التحقق من وجود أجهزة مسجلة
-    devices_count = await db.employee_devices.count_documents({
-        "employee_id": employee_id
-    })
+    # البحث عن الجهاز (مطابق أو مشابه)
+    device = await _find_employee_device(employee_id, signature, fingerprint_data)
     
-    if devices_count == 0:
+    if not device and await db.employee_devices.count_documents({"employee_id": employee_id}) == 0:
         # أول جهاز - تسجيله تلقائياً
         result = await register_device(employee_id, fingerprint_data, is_first_device=True)
         return {
@@ -410,12 +462,6 @@ async def validate_device(employee_id: str, fingerprint_data: dict) -> dict:
             "is_first_device": True
         }
     
-    # البحث عن الجهاز
-    device = await db.employee_devices.find_one({
-        "employee_id": employee_id,
-        "device_signature": signature
-    })
-    
     if not device:
         # جهاز جديد غير مسجل - تسجيله بحالة pending
         result = await register_device(employee_id, fingerprint_data, is_first_device=False)
@@ -662,6 +708,7 @@ async def block_account(employee_id: str, blocked_by: str, reason: str = "") ->
             "block_reason": reason
         }}
     )
+    await refresh_users({"employee_id": employee_id})
     
     await log_security_event(
         employee_id=employee_id,
@@ -707,6 +754,7 @@ async def unblock_account(employee_id: str, unblocked_by: str) -> dict:
             "block_reason": ""
         }}
     )
+    await refresh_users({"employee_id": employee_id})
     
     await log_security_event(
         employee_id=employee_id,
@@ -743,7 +791,7 @@ async def log_security_event(
     performed_by: str = "system",
     details: dict = None
 ):
-    """تسجيل حدث أمني في security_audit_log"""
+    """تسجيل حدث أمني في security_audit_log (كتابة مجمّعة - لا ينتظر قاعدة البيانات)"""
     event = {
         "id": str(uuid.uuid4()),
         "employee_id": employee_id,
@@ -755,7 +803,7 @@ async def log_security_event(
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.security_audit_log.insert_one(event)
+    audit_log(event)
 
 
 async def get_employee_devices(employee_id: str) -> List[dict]:
@@ -769,37 +817,39 @@ async def get_employee_devices(employee_id: str) -> List[dict]:
 
 
 async def get_all_devices(status_filter: str = None) -> List[dict]:
-    """جلب جميع الأجهزة (للـ STAS) مع معلومات محسّنة"""
+    """جلب جميع الأجهزة (للـ STAS) مع معلومات محسّنة - استعلام واحد مع أسماء الموظفين"""
     query = {}
     if status_filter:
         query["status"] = status_filter
     
-    devices = await db.employee_devices.find(
-        query,
-        {"_id": 0}
-    ).sort("registered_at", -1).to_list(500)
-    
-    # إضافة بيانات الموظف ومعلومات الجهاز المحسّنة
+    devices = await db.employee_devices.aggregate([
+        {"$match": query},
+        {"$sort": {"registered_at": -1}},
+        {"$limit": 500},
+        {"$lookup": {
+            "from": "employees",
+            "localField": "employee_id",
+            "foreignField": "id",
+            "as": "employee"
+        }},
+        {"$addFields": {
+            "employee_name_ar": {"$ifNull": [{"$arrayElemAt": ["$employee.full_name_ar", 0]}, ""]},
+            "employee_number": {"$ifNull": [{"$arrayElemAt": ["$employee.employee_number", 0]}, ""]}
+        }},
+        {"$project": {"_id": 0, "employee": 0}}
+    ]).to_list(500)
+    
+    # معلومات الجهاز المحسّنة: المحفوظة عند التسجيل، وإلا تحليل User-Agent (من الذاكرة)
     for device in devices:
-        emp = await db.employees.find_one(
-            {"id": device['employee_id']},
-            {"_id": 0, "full_name_ar": 1, "employee_number": 1}
-        )
-        device['employee_name_ar'] = emp.get('full_name_ar', '') if emp else ''
-        device['employee_number'] = emp.get('employee_number', '') if emp else ''
+        ua_info = device.pop('ua_info', None)
+        if not ua_info:
+            ua_string = (device.get('fingerprint_data') or {}).get('userAgent', '')
+            ua_info = ua_display_info(ua_string) if ua_string else None
         
-        # تحليل User-Agent للحصول على معلومات سهلة
-        fingerprint = device.get('fingerprint_data', {})
-        ua_string = fingerprint.get('userAgent', '')
-        if ua_string:
-            parsed = _parse_user_agent(ua_string)
-            device['friendly_name'] = parsed.get('friendly_name', 'جهاز غير معروف')
-            device['device_brand'] = parsed.get('device_brand', '')
-            device['device_model'] = parsed.get('device_model', '')
-            device['os_display'] = parsed.get('os_display', device.get('os', ''))
-            device['is_mobile'] = parsed.get('is_mobile', False)
-            device['is_tablet'] = parsed.get('is_tablet', False)
-            device['is_pc'] = parsed.get('is_pc', True)
+        if ua_info:
+            device.update(ua_info)
+            device['friendly_name'] = device.get('friendly_name') or 'جهاز غير معروف'
+            device['os_display'] = device.get('os_display') or device.get('os', '')
         else:
             device['friendly_name'] = device.get('device_type', 'جهاز')
             device['os_display'] = device.get('os', '')
@@ -824,8 +874,20 @@ async def get_security_logs(employee_id: str = None, limit: int = 100) -> List[d
     return logs
 
 
+def ua_display_info(user_agent: str) -> dict:
+    """معلومات العرض من User Agent (تُحفظ مع الجهاز في ua_info)"""
+    parsed = _parse_user_agent(user_agent)
+    return {field: parsed.get(field) for field in UA_DISPLAY_FIELDS}
+
+
 def _parse_user_agent(user_agent: str) -> dict:
-    """استخراج معلومات الجهاز من User Agent بشكل سهل للمستخدم"""
+    """استخراج معلومات الجهاز من User Agent بشكل سهل للمستخدم (من الذاكرة إذا سبق تحليله)"""
+    return dict(_parse_user_agent_cached(user_agent or ""))
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def _parse_user_agent_cached(user_agent: str) -> dict:
+    # Shared between callers: _parse_user_agent returns a copy
     from user_agents import parse
     
     try:
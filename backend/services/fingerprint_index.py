@@ -0,0 +1,188 @@
+"""
+Fingerprint Index - فهرس تشابه بصمات الأجهزة
+============================================================
+المطابقة كانت بالبصمة الكاملة فقط (SHA-256): تحديث المتصفح أو تغير بسيط = جهاز جديد.
+الآن لكل جهاز في employee_devices:
+- fp_features: خصائص البصمة بعد التطبيع (حروف صغيرة، بدون أرقام إصدارات في User-Agent)
+- fp_bands: نطاقات LSH من توقيع MinHash على الخصائص الموزونة (مع فهرس)
+
+الوزن = أهمية الخاصية (نفس أوزان compare_fingerprints): كرت الشاشة والمعالج والرسوميات
+أثقل من اللغة والمنطقة الزمنية. التشابه = مجموع أوزان الخصائص المتطابقة ÷ أوزان الخصائص الموجودة.
+
+"نفس الجهاز" (is_same_device) يتطلب تطابق خصائص العتاد (HARDWARE_FIELDS) كلها حرفياً،
+والتشابه التقريبي يُقبل فقط في الخصائص المرنة (إصدار المتصفح، اللغة، المنطقة الزمنية...):
+هاتف آخر من نفس الطراز يختلف في canvasFingerprint وحده ليس الجهاز المعتمد.
+
+البحث: المرشحون فقط من يشاركون نطاقاً (استعلام بالفهرس)، ثم حساب التشابه الدقيق لهم.
+حد LSH بهذه الإعدادات ≈ (1/8)^(1/4) ≈ 0.59 - أقل من حد المطابقة حتى لا يُفقد مرشح.
+============================================================
+"""
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NUM_PERM = 32
+LSH_BANDS = 8
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+# Same device after a browser update / minor change
+MATCH_THRESHOLD = 0.85
+# Admin search: "devices similar to this one"
+SIMILAR_THRESHOLD = 0.6
+MAX_CANDIDATES = 200
+
+# Must be identical for two fingerprints to be the same device
+HARDWARE_FIELDS = (
+    "webglVendor", "webglRenderer", "canvasFingerprint",
+    "hardwareConcurrency", "deviceMemory", "platform", "screenResolution",
+)
+
+# field -> weight (units of 5, as in compare_fingerprints)
+FEATURE_WEIGHTS = {
+    "webglRenderer": 6,
+    "webglVendor": 5,
+    "canvasFingerprint": 4,
+    "hardwareConcurrency": 4,
+    "deviceMemory": 3,
+    "screenResolution": 3,
+    "platform": 3,
+    "maxTouchPoints": 2,
+    "userAgentFamily": 2,
+    "touchSupport": 1,
+    "timezone": 1,
+    "language": 1,
+}
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fixed seed: signatures must stay comparable across processes and restarts
+_rng = np.random.RandomState(7)
+_PERM_A = _rng.randint(1, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+
+_VERSION_RE = re.compile(r"[\d._]+")
+
+
+# ==================== FEATURES ====================
+
+def normalize_features(fingerprint_data: Optional[dict]) -> Dict[str, str]:
+    """الخصائص المستخدمة في التشابه - القيم الفارغة تُهمل"""
+    if not fingerprint_data:
+        return {}
+    values = dict(fingerprint_data)
+    # Browser/OS updates only change version numbers
+    values["userAgentFamily"] = _VERSION_RE.sub("", str(fingerprint_data.get("userAgent", "")))
+    features = {}
+    for field in FEATURE_WEIGHTS:
+        value = " ".join(str(values.get(field) or "").lower().split())
+        if value and value not in ("none", "null", "undefined", "unknown"):
+            features[field] = value
+    return features
+
+
+def similarity(features_a: Dict[str, str], features_b: Dict[str, str]) -> float:
+    """تشابه موزون: أوزان الخصائص المتطابقة ÷ أوزان كل الخصائص الموجودة في أي منهما"""
+    fields = features_a.keys() | features_b.keys()
+    total = sum(FEATURE_WEIGHTS[f] for f in fields)
+    if not total:
+        return 0.0
+    matched = sum(FEATURE_WEIGHTS[f] for f in fields if features_a.get(f) == features_b.get(f))
+    return matched / total
+
+
+def same_hardware(features_a: Dict[str, str], features_b: Dict[str, str]) -> bool:
+    """خصائص العتاد متطابقة (خاصية موجودة في واحدة فقط = اختلاف)"""
+    return all(features_a.get(f) == features_b.get(f) for f in HARDWARE_FIELDS)
+
+
+def is_same_device(features_a: Dict[str, str], features_b: Dict[str, str], threshold: float = MATCH_THRESHOLD) -> bool:
+    """نفس العتاد تماماً + تشابه كافٍ في الخصائص المرنة"""
+    return bool(features_a) and same_hardware(features_a, features_b) and similarity(features_a, features_b) >= threshold
+
+
+def _tokens(features: Dict[str, str]) -> np.ndarray:
+    # A feature of weight w contributes w tokens - weighted Jaccard through plain MinHash
+    tokens = [f"{field}={value}#{i}" for field, value in features.items() for i in range(FEATURE_WEIGHTS[field])]
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(t.encode(), digest_size=4).digest(), "little") for t in tokens),
+        dtype=np.uint64,
+        count=len(tokens),
+    )
+
+
+def lsh_bands(features: Dict[str, str]) -> List[str]:
+    """مفاتيح النطاقات 'رقم النطاق:بصمة الصفوف' - قائمة فارغة بدون خصائص"""
+    hashes = _tokens(features)
+    if hashes.size == 0:
+        return []
+    signature = ((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH).min(axis=0).astype(np.uint32)
+    return [
+        f"{band}:{hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+def index_fields(fingerprint_data: Optional[dict]) -> Dict:
+    """الحقول المخزنة على الجهاز في employee_devices"""
+    features = normalize_features(fingerprint_data)
+    return {"fp_features": features, "fp_bands": lsh_bands(features)}
+
+
+# ==================== LOOKUPS ====================
+
+async def ensure_fingerprint_index(db):
+    """فهرس النطاقات + فهرسة الأجهزة المسجلة قبل وجوده"""
+    from pymongo import UpdateOne
+
+    await db.employee_devices.create_index("fp_bands", name="employee_devices_fp_bands")
+    await db.employee_devices.create_index([("employee_id", 1), ("device_signature", 1)])
+
+    ops = []
+    indexed = 0
+    async for device in db.employee_devices.find(
+        {"fp_bands": {"$exists": False}, "fingerprint_data": {"$type": "object"}},
+        {"_id": 1, "fingerprint_data": 1},
+    ):
+        ops.append(UpdateOne({"_id": device["_id"]}, {"$set": index_fields(device["fingerprint_data"])}))
+        if len(ops) >= 500:
+            await db.employee_devices.bulk_write(ops, ordered=False)
+            indexed += len(ops)
+            ops = []
+    if ops:
+        await db.employee_devices.bulk_write(ops, ordered=False)
+        indexed += len(ops)
+    return indexed
+
+
+async def find_similar_devices(
+    db,
+    features: Dict[str, str],
+    query: Optional[dict] = None,
+    threshold: float = SIMILAR_THRESHOLD,
+    projection: Optional[dict] = None,
+    limit: int = MAX_CANDIDATES,
+) -> List[dict]:
+    """
+    الأجهزة المشابهة: مرشحو LSH (بالفهرس) ثم التشابه الدقيق.
+    query: شرط إضافي (مثل أجهزة موظف معين)
+    Returns: الأجهزة مع similarity مرتبة تنازلياً
+    """
+    bands = lsh_bands(features)
+    if not bands:
+        return []
+    fields = {"_id": 0, "fp_features": 1, **(projection or {})} if projection else {"_id": 0, "fp_bands": 0}
+    candidates = await db.employee_devices.find(
+        {"fp_bands": {"$in": bands}, **(query or {})}, fields
+    ).limit(limit).to_list(limit)
+
+    matches = []
+    for device in candidates:
+        score = similarity(features, device.get("fp_features") or {})
+        if score >= threshold:
+            device["similarity"] = round(score, 3)
+            matches.append(device)
+    matches.sort(key=lambda d: d["similarity"], reverse=True)
+    return matches
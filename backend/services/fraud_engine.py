@@ -0,0 +1,293 @@
+"""
+Fraud Engine - كشف التلاعب التزايدي عند الدخول والخروج
+============================================================
+بدلاً من إعادة حساب كل شيء عند فتح صفحة التنبيهات، تُحدَّث حالة صغيرة مع كل حدث:
+- fraud_signature_state: لكل بصمة جهاز ← الجلسات النشطة عليها (الجلسة ← الموظف)
+- fraud_employee_state:  لكل موظف ← جلساته النشطة (الجلسة ← بصمة الجهاز)
+كل جلسة فترة زمنية [الدخول، الخروج أو انتهاء التوكن] - الفترات المنتهية تُحذف تلقائياً.
+
+عند كل دخول:
+- بصمة عليها جلسات نشطة لأكثر من موظف ← تنبيه shared_device (critical)
+- موظف له جلسات نشطة من أكثر من بصمة ← تنبيه concurrent_sessions (high)
+عند الخروج: تنبيه لم يعد شرطه قائماً يُغلق (resolved)
+دورياً (sweep_expired في scheduler): التنبيهات المفتوحة التي انتهت جلساتها بلا خروج تُغلق
+
+التنبيهات في fraud_alerts (تنبيه مفتوح واحد لكل بصمة/موظف) - /api/security/fraud-alerts
+يقرأها مباشرة بفهرس.
+============================================================
+"""
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+from utils.auth import MAX_TOKEN_HOURS
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+SHARED_DEVICE = "shared_device"
+CONCURRENT_SESSIONS = "concurrent_sessions"
+
+
+# ==================== INDEXES ====================
+
+async def ensure_fraud_indexes(db):
+    await db.fraud_signature_state.create_index("signature", unique=True)
+    await db.fraud_employee_state.create_index("employee_id", unique=True)
+    await db.fraud_alerts.create_index(
+        "key", unique=True, partialFilterExpression={"status": "open"}, name="fraud_alerts_open_key"
+    )
+    await db.fraud_alerts.create_index([("status", 1), ("severity_rank", 1), ("detected_at", -1)])
+
+
+# ==================== STATE ====================
+
+def _live(sessions: Optional[dict], now: datetime) -> Dict[str, dict]:
+    """الجلسات التي لم تنتهِ فترتها بعد"""
+    cutoff = now.isoformat()
+    return {sid: s for sid, s in (sessions or {}).items() if s.get("ends_at", "") > cutoff}
+
+
+async def _add_session(db, collection: str, key_field: str, key: str, session_id: str, entry: dict, now: datetime) -> dict:
+    doc = await db[collection].find_one_and_update(
+        {key_field: key},
+        {"$set": {f"sessions.{session_id}": entry, "updated_at": now.isoformat()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0},
+    )
+    return await _prune(db, collection, key_field, key, doc, now)
+
+
+async def _remove_sessions(db, collection: str, key_field: str, key: str, session_ids: Iterable[str], now: datetime) -> dict:
+    unset = {f"sessions.{sid}": "" for sid in session_ids}
+    if not unset:
+        return {}
+    doc = await db[collection].find_one_and_update(
+        {key_field: key},
+        {"$unset": unset, "$set": {"updated_at": now.isoformat()}},
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0},
+    )
+    return await _prune(db, collection, key_field, key, doc, now)
+
+
+async def _prune(db, collection: str, key_field: str, key: str, doc: Optional[dict], now: datetime) -> dict:
+    """حذف الفترات المنتهية (جلسات لم يُسجل خروجها وانتهى توكنها)"""
+    sessions = (doc or {}).get("sessions") or {}
+    live = _live(sessions, now)
+    expired = [sid for sid in sessions if sid not in live]
+    if expired:
+        await db[collection].update_one({key_field: key}, {"$unset": {f"sessions.{sid}": "" for sid in expired}})
+    return live
+
+
+# ==================== ALERTS ====================
+
+async def _employee_names(db, employee_ids: List[str]) -> Dict[str, str]:
+    employees = await db.employees.find(
+        {"id": {"$in": employee_ids}}, {"_id": 0, "id": 1, "full_name_ar": 1}
+    ).to_list(len(employee_ids))
+    return {e["id"]: e.get("full_name_ar", e["id"]) for e in employees}
+
+
+async def _open_alert(db, alert_type: str, key: str, severity: str, fields: dict, now: datetime):
+    """تنبيه مفتوح واحد لكل مفتاح - يُحدَّث إذا كان موجوداً"""
+    await db.fraud_alerts.update_one(
+        {"key": key, "status": "open"},
+        {
+            "$set": {**fields, "updated_at": now.isoformat()},
+            "$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "type": alert_type,
+                "severity": severity,
+                "severity_rank": SEVERITY_RANK[severity],
+                "detected_at": now.isoformat(),
+            },
+        },
+        upsert=True,
+    )
+
+
+async def _resolve_alert(db, key: str, now: datetime):
+    await db.fraud_alerts.update_one(
+        {"key": key, "status": "open"},
+        {"$set": {"status": "resolved", "resolved_at": now.isoformat()}},
+    )
+
+
+async def _evaluate_signature(db, signature: str, sessions: Dict[str, dict], now: datetime):
+    key = f"{SHARED_DEVICE}:{signature}"
+    employees = sorted({s["employee_id"] for s in sessions.values()})
+    if len(employees) < 2:
+        await _resolve_alert(db, key, now)
+        return
+
+    names = await _employee_names(db, employees)
+    employee_names = [names[e] for e in employees if e in names]
+    await _open_alert(db, SHARED_DEVICE, key, "critical", {
+        "title_ar": "جهاز مشترك بين موظفين",
+        "message_ar": f"نفس الجهاز يستخدمه: {', '.join(employee_names)}",
+        "employees": employees,
+        "employee_names": employee_names,
+        "device_signature": signature,
+    }, now)
+
+
+async def _evaluate_employee(db, employee_id: str, sessions: Dict[str, dict], now: datetime):
+    key = f"{CONCURRENT_SESSIONS}:{employee_id}"
+    signatures = {s["signature"] for s in sessions.values()}
+    if len(signatures) < 2:
+        await _resolve_alert(db, key, now)
+        return
+
+    names = await _employee_names(db, [employee_id])
+    await _open_alert(db, CONCURRENT_SESSIONS, key, "high", {
+        "title_ar": "جلسات متزامنة من أجهزة مختلفة",
+        "message_ar": f"{names.get(employee_id, employee_id)} نشط على {len(signatures)} أجهزة مختلفة",
+        "employee_id": employee_id,
+        "employee_name": names.get(employee_id, ""),
+        "session_count": len(sessions),
+        "device_count": len(signatures),
+    }, now)
+
+
+# ==================== EVENTS ====================
+
+async def on_login(employee_id: str, session_id: str, signature: Optional[str], hours: float = MAX_TOKEN_HOURS):
+    """جلسة جديدة (تسجيل دخول / تبديل مستخدم)"""
+    if not signature or not employee_id:
+        return
+    from database import db
+
+    now = datetime.now(timezone.utc)
+    ends_at = (now + timedelta(hours=hours)).isoformat()
+    try:
+        by_signature = await _add_session(
+            db, "fraud_signature_state", "signature", signature, session_id,
+            {"employee_id": employee_id, "ends_at": ends_at}, now,
+        )
+        by_employee = await _add_session(
+            db, "fraud_employee_state", "employee_id", employee_id, session_id,
+            {"signature": signature, "ends_at": ends_at}, now,
+        )
+        await _evaluate_signature(db, signature, by_signature, now)
+        await _evaluate_employee(db, employee_id, by_employee, now)
+    except Exception as e:
+        logger.error(f"Fraud engine login update failed for {employee_id}: {e}")
+
+
+async def on_logout(employee_id: str, session_ids: Optional[List[str]] = None):
+    """
+    إنهاء جلسات موظف: جلسات محددة، أو كلها (خروج إجباري، تعطيل، خروج من كل الأجهزة)
+    """
+    if not employee_id:
+        return
+    from database import db
+
+    now = datetime.now(timezone.utc)
+    try:
+        state = await db.fraud_employee_state.find_one({"employee_id": employee_id}, {"_id": 0}) or {}
+        sessions = state.get("sessions") or {}
+        ended = [sid for sid in (session_ids if session_ids is not None else sessions) if sid in sessions]
+        if not ended:
+            return
+
+        remaining = await _remove_sessions(db, "fraud_employee_state", "employee_id", employee_id, ended, now)
+        await _evaluate_employee(db, employee_id, remaining, now)
+
+        by_signature: Dict[str, List[str]] = {}
+        for sid in ended:
+            by_signature.setdefault(sessions[sid]["signature"], []).append(sid)
+        for signature, sids in by_signature.items():
+            live = await _remove_sessions(db, "fraud_signature_state", "signature", signature, sids, now)
+            await _evaluate_signature(db, signature, live, now)
+    except Exception as e:
+        logger.error(f"Fraud engine logout update failed for {employee_id}: {e}")
+
+
+async def on_logout_all():
+    """خروج طوارئ لكل المستخدمين: لا جلسات نشطة ولا تنبيهات قائمة"""
+    from database import db
+
+    now = datetime.now(timezone.utc).isoformat()
+    await db.fraud_signature_state.update_many({}, {"$set": {"sessions": {}, "updated_at": now}})
+    await db.fraud_employee_state.update_many({}, {"$set": {"sessions": {}, "updated_at": now}})
+    await db.fraud_alerts.update_many(
+        {"status": "open", "type": {"$in": [SHARED_DEVICE, CONCURRENT_SESSIONS]}},
+        {"$set": {"status": "resolved", "resolved_at": now}},
+    )
+
+
+async def sweep_expired() -> int:
+    """
+    التنبيهات تُقيَّم فقط عند دخول/خروج على نفس المفتاح - تنبيه انتهت جلساته (توكن منتهٍ
+    بلا خروج) يبقى مفتوحاً. هنا: حذف الجلسات المنتهية لمفاتيح التنبيهات المفتوحة وإعادة تقييمها.
+    Returns: عدد التنبيهات المغلقة
+    """
+    from database import db
+
+    now = datetime.now(timezone.utc)
+    alerts = await db.fraud_alerts.find(
+        {"status": "open", "type": {"$in": [SHARED_DEVICE, CONCURRENT_SESSIONS]}},
+        {"_id": 0, "type": 1, "key": 1},
+    ).to_list(None)
+
+    resolved = 0
+    for alert in alerts:
+        subject = alert["key"].split(":", 1)[1]
+        try:
+            if alert["type"] == SHARED_DEVICE:
+                state = await db.fraud_signature_state.find_one({"signature": subject}, {"_id": 0})
+                live = await _prune(db, "fraud_signature_state", "signature", subject, state, now)
+                still_open = len({s["employee_id"] for s in live.values()}) >= 2
+                await _evaluate_signature(db, subject, live, now)
+            else:
+                state = await db.fraud_employee_state.find_one({"employee_id": subject}, {"_id": 0})
+                live = await _prune(db, "fraud_employee_state", "employee_id", subject, state, now)
+                still_open = len({s["signature"] for s in live.values()}) >= 2
+                await _evaluate_employee(db, subject, live, now)
+            resolved += not still_open
+        except Exception as e:
+            logger.error(f"Fraud engine sweep failed for {alert['key']}: {e}")
+    return resolved
+
+
+# ==================== READ ====================
+
+async def get_open_alerts(db, limit: int = 200) -> List[dict]:
+    """التنبيهات المفتوحة مرتبة حسب الخطورة ثم الأحدث - قراءة بالفهرس"""
+    return await db.fraud_alerts.find(
+        {"status": "open"}, {"_id": 0, "key": 0, "severity_rank": 0}
+    ).sort([("severity_rank", 1), ("detected_at", -1)]).to_list(limit)
+
+
+# ==================== REBUILD ====================
+
+async def rebuild_fraud_state(db):
+    """
+    بناء الحالة من الجلسات النشطة في login_sessions (أول تشغيل أو بعد فقدان الحالة).
+    يشمل فقط جلسات آخر MAX_TOKEN_HOURS ساعة - الأقدم انتهى توكنها.
+    """
+    if await db.fraud_employee_state.find_one({}, {"_id": 1}):
+        return 0
+
+    now = datetime.now(timezone.utc)
+    since = (now - timedelta(hours=MAX_TOKEN_HOURS)).isoformat()
+    count = 0
+    async for session in db.login_sessions.find(
+        {"status": "active", "login_at": {"$gte": since}, "core_signature": {"$ne": None}},
+        {"_id": 0, "employee_id": 1, "session_id": 1, "id": 1, "core_signature": 1, "login_at": 1},
+    ):
+        login_at = datetime.fromisoformat(session["login_at"].replace("Z", "+00:00"))
+        hours_left = MAX_TOKEN_HOURS - (now - login_at).total_seconds() / 3600
+        await on_login(
+            session.get("employee_id"), session.get("session_id") or session.get("id"),
+            session.get("core_signature"), hours=hours_left,
+        )
+        count += 1
+    return count
@@ -0,0 +1,77 @@
+"""
+Login Benchmark - قياس تزامن تسجيل الدخول قبل/بعد نقل bcrypt لمجموعة الخيوط
+============================================================
+يحاكي موجة تسجيل دخول (بداية الوردية): N طلب متزامن، كل طلب يتحقق من كلمة مرور
+بنفس تكلفة bcrypt الحقيقية، مع طلبات API خفيفة تعمل بالتوازي.
+
+- inline: verify_password داخل الـ coroutine (السلوك السابق) - حلقة الأحداث محجوبة
+- pool:   verify_password_async (مجموعة خيوط محدودة) - الحلقة تبقى متاحة
+
+يقيس: الزمن الكلي، زمن استجابة الطلبات الخفيفة، وأطول توقف لحلقة الأحداث.
+
+التشغيل:  cd backend && python -m services.login_benchmark [concurrency]
+============================================================
+"""
+import asyncio
+import statistics
+import sys
+import time
+from typing import Dict
+
+from utils.auth import PASSWORD_HASH_WORKERS, hash_password, verify_password, verify_password_async
+
+PROBE_INTERVAL = 0.01  # طلب خفيف (مثل GET /api/auth/me) كل 10ms
+
+
+async def _probe(stop: asyncio.Event, latencies: list):
+    """طلب خفيف متكرر - يُقاس تأخر تنفيذه عن موعده (= توقف الحلقة)"""
+    while not stop.is_set():
+        scheduled = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        latencies.append(time.perf_counter() - scheduled - PROBE_INTERVAL)
+
+
+async def _run(mode: str, concurrency: int, password_hash: str) -> Dict:
+    async def login_inline():
+        await asyncio.sleep(0)  # find_one على users
+        return verify_password("benchmark-password", password_hash)
+
+    async def login_pool():
+        await asyncio.sleep(0)
+        return await verify_password_async("benchmark-password", password_hash)
+
+    login = login_inline if mode == "inline" else login_pool
+    stop = asyncio.Event()
+    latencies: list = []
+    probe = asyncio.create_task(_probe(stop, latencies))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    assert all(results)
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "total_seconds": round(elapsed, 2),
+        "logins_per_second": round(concurrency / elapsed, 1),
+        "probe_requests": len(latencies),
+        "probe_p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "max_loop_stall_ms": round(max(latencies) * 1000, 1) if latencies else None,
+    }
+
+
+async def benchmark(concurrency: int = 20) -> list:
+    password_hash = hash_password("benchmark-password")
+    return [await _run(mode, concurrency, password_hash) for mode in ("inline", "pool")]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f"password hash workers: {PASSWORD_HASH_WORKERS}")
+    for row in asyncio.run(benchmark(n)):
+        print(row)
@@ -0,0 +1,275 @@
+"""
+Media Service - الملفات المرفوعة والصور
+============================================================
+- حفظ الرفع على القرص على دفعات مع حساب SHA-256 أثناء القراءة
+- إزالة التكرار: الملفات المتطابقة تُحفظ مرة واحدة (الاسم = البصمة)
+- صور مصغرة WebP بمقاسات ثابتة تُولد خارج حلقة الأحداث
+- تقديم الملفات مع ETag و Last-Modified ودعم Range (206)
+============================================================
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Union
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+THUMBNAIL_SIZES = (64, 128, 256)
+THUMBNAIL_DIR_NAME = "thumbs"
+
+DEFAULT_CACHE_CONTROL = "private, max-age=3600"
+
+
+# ============================================================
+# STREAMING UPLOAD
+# ============================================================
+
+async def save_upload_stream(
+    upload: UploadFile,
+    dest_dir: str,
+    max_size: int,
+    ext: str = "",
+    filename: Optional[str] = None,
+    size_error: Union[str, dict] = "حجم الملف أكبر من المسموح",
+) -> dict:
+    """
+    حفظ ملف مرفوع على دفعات مع حساب البصمة.
+
+    - filename=None: اسم الملف = SHA-256 + الامتداد، وإذا كان موجوداً مسبقاً
+      لا يُكتب مرة أخرى (deduplicated=True)
+    - يرفع HTTPException(400) إذا تجاوز الحجم max_size
+
+    Returns: {filename, path, sha256, size, deduplicated}
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = os.path.join(dest_dir, f".upload-{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=400, detail=size_error)
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    final_name = filename or f"{sha256}{ext}"
+    final_path = os.path.join(dest_dir, final_name)
+
+    deduplicated = filename is None and os.path.exists(final_path)
+    if deduplicated:
+        _remove_quietly(tmp_path)
+    else:
+        os.replace(tmp_path, final_path)
+
+    return {
+        "filename": final_name,
+        "path": final_path,
+        "sha256": sha256,
+        "size": size,
+        "deduplicated": deduplicated,
+    }
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# ============================================================
+# THUMBNAILS
+# ============================================================
+
+def thumbnail_path(source_path: str, size: int) -> str:
+    directory, name = os.path.split(source_path)
+    stem = os.path.splitext(name)[0]
+    return os.path.join(directory, THUMBNAIL_DIR_NAME, f"{stem}_{size}.webp")
+
+
+def _render_thumbnails(source_path: str, sizes: tuple) -> dict:
+    from PIL import Image, ImageOps
+
+    paths = {}
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+        for size in sizes:
+            path = thumbnail_path(source_path, size)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                thumb = ImageOps.fit(img, (size, size), Image.LANCZOS)
+                tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+                thumb.save(tmp, format="WEBP", quality=82, method=4)
+                os.replace(tmp, path)
+            paths[size] = path
+    return paths
+
+
+async def generate_thumbnails(source_path: str, sizes: tuple = THUMBNAIL_SIZES) -> dict:
+    """توليد الصور المصغرة في thread منفصل - يتجاوز المقاسات الموجودة"""
+    return await asyncio.to_thread(_render_thumbnails, source_path, sizes)
+
+
+async def get_thumbnail(source_path: str, size: int) -> Optional[str]:
+    """مسار الصورة المصغرة (تُولد عند الطلب للصور القديمة). None إذا تعذر التوليد"""
+    if size not in THUMBNAIL_SIZES:
+        size = min(THUMBNAIL_SIZES, key=lambda s: abs(s - size))
+    path = thumbnail_path(source_path, size)
+    if os.path.exists(path):
+        return path
+    try:
+        return (await generate_thumbnails(source_path, (size,)))[size]
+    except Exception as e:
+        logger.warning(f"Thumbnail generation failed for {source_path}: {e}")
+        return None
+
+
+def remove_with_thumbnails(source_path: str):
+    _remove_quietly(source_path)
+    for size in THUMBNAIL_SIZES:
+        _remove_quietly(thumbnail_path(source_path, size))
+
+
+# ============================================================
+# FILE SERVING - ETag / Last-Modified / Range
+# ============================================================
+
+def _parse_range(range_header: str, file_size: int) -> Optional[tuple]:
+    """
+    يدعم نطاقاً واحداً: bytes=start-end | bytes=start- | bytes=-suffix
+    Returns (start, end) شامل، أو None إذا كان الترويسة غير صالحة.
+    يرفع ValueError إذا كان النطاق خارج حجم الملف.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        start = int(start_s) if start_s else None
+        end = int(end_s) if end_s else None
+    except ValueError:
+        return None
+
+    if start is None:
+        # bytes=-N → آخر N بايت
+        if not end:
+            raise ValueError("range not satisfiable")
+        return max(file_size - end, 0), file_size - 1
+    if end is None:
+        end = file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, min(end, file_size - 1)
+
+
+async def _iter_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+async def file_response(
+    request: Request,
+    path: str,
+    media_type: Optional[str] = None,
+    etag: Optional[str] = None,
+    filename: Optional[str] = None,
+    content_disposition_type: str = "attachment",
+    cache_control: str = DEFAULT_CACHE_CONTROL,
+) -> Response:
+    """
+    تقديم ملف من القرص مع:
+    - ETag (البصمة إن وُجدت وإلا الحجم + وقت التعديل) و Last-Modified
+    - 304 عند If-None-Match / If-Modified-Since
+    - 206 Partial Content عند Range (نطاق واحد)، 416 إذا كان خارج الحجم
+    """
+    try:
+        stat = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+
+    etag = f'"{etag}"' if etag else f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+    }
+
+    # Conditional GET
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                    return Response(status_code=304, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+    # Range request (ignored if If-Range no longer matches)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers=headers,
+        filename=filename,
+        stat_result=stat,
+        content_disposition_type=content_disposition_type,
+    )
@@ -0,0 +1,158 @@
+"""
+Query Monitor - مراقبة أوامر MongoDB لكل طلب وكشف N+1
+============================================================
+معظم مشاكل الأداء حلقات N+1: استعلام find_one لكل موظف/إشعار/جهاز داخل حلقة.
+QueryMonitor (pymongo CommandListener) مسجل على عميل Motor في database.py:
+- كل أمر يُنسب للطلب الحالي عبر current_queries (ContextVar) - Motor ينسخ السياق
+  إلى خيط التنفيذ، فالمستمع يرى إحصائيات الطلب نفسه
+- لكل طلب: عدد الأوامر، زمنها الإجمالي، وعدد مرات كل "شكل" استعلام
+  (الأمر + المجموعة + مفاتيح الفلتر بدون القيم: find employees {"id": "?"})
+- شكل تكرر N_PLUS_ONE_THRESHOLD مرة أو أكثر في طلب واحد ← N+1 (سجل + مقاييس)
+
+الطلبات: RequestMetricsMiddleware (services/request_metrics.py)
+المهام المجدولة: _timed في services/scheduler.py
+============================================================
+"""
+import json
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "10"))
+
+# Handshake/auth/session housekeeping - not application queries
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "authenticate", "getnonce", "killCursors",
+}
+
+# Where the filter of each command lives
+_FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+
+
+class QueryStats:
+    """أوامر طلب واحد - تُحدَّث من خيوط Motor"""
+
+    __slots__ = ("commands", "seconds", "shapes", "_lock")
+
+    def __init__(self):
+        self.commands = 0
+        self.seconds = 0.0
+        # (command, collection, filter) -> [count, seconds]
+        self.shapes: Dict[Tuple[str, str, str], List] = {}
+        self._lock = threading.Lock()
+
+    def add(self, shape: Optional[Tuple[str, str, str]], seconds: float):
+        with self._lock:
+            self.commands += 1
+            self.seconds += seconds
+            if shape is not None:
+                entry = self.shapes.setdefault(shape, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Dict]:
+        """الأشكال المتكررة threshold مرة أو أكثر (الأكثر تكراراً أولاً)"""
+        with self._lock:
+            flagged = [
+                {"command": s[0], "collection": s[1], "filter": s[2], "count": c, "seconds": t}
+                for s, (c, t) in self.shapes.items() if c >= threshold
+            ]
+        return sorted(flagged, key=lambda f: f["count"], reverse=True)
+
+
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+
+# ==================== SHAPES ====================
+
+def _normalize(value, depth: int = 0):
+    # Keep keys and operators, drop values ($in lists collapse too)
+    if isinstance(value, dict):
+        if depth > 3:
+            return "{...}"
+        return {k: _normalize(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return [_normalize(value[0], depth + 1)]
+    return "?"
+
+
+def _pipeline_shape(pipeline: list) -> list:
+    shape = []
+    for stage in pipeline:
+        name = next(iter(stage), "?")
+        shape.append({name: _normalize(stage[name])} if name == "$match" else name)
+    return shape
+
+
+def command_shape(command_name: str, command: dict) -> Optional[Tuple[str, str, str]]:
+    """شكل الأمر: (الأمر، المجموعة، الفلتر بدون قيم) - None لأوامر لا تُعد"""
+    if command_name == "getMore":
+        # Continuation of a cursor already counted
+        return None
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        collection = ""
+
+    if command_name in _FILTER_FIELDS:
+        body = _normalize(command.get(_FILTER_FIELDS[command_name]) or {})
+    elif command_name == "aggregate":
+        body = _pipeline_shape(command.get("pipeline") or [])
+    elif command_name in ("update", "delete"):
+        statements = command.get(command_name + "s") or [{}]
+        body = _normalize(statements[0].get("q") or {})
+    else:
+        body = {}
+    return command_name, collection, json.dumps(body, sort_keys=True, ensure_ascii=False)[:300]
+
+
+# ==================== LISTENER ====================
+
+class QueryMonitor(monitoring.CommandListener):
+    def __init__(self):
+        # (connection, request id) -> (stats, shape) between started and succeeded/failed
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        stats = current_queries.get()
+        if stats is None or event.command_name in IGNORED_COMMANDS:
+            return
+        try:
+            shape = command_shape(event.command_name, event.command)
+        except Exception:
+            shape = (event.command_name, "", "?")
+        self._pending[(event.connection_id, event.request_id)] = (stats, shape)
+
+    def _finished(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is not None:
+            stats, shape = pending
+            stats.add(shape, event.duration_micros / 1_000_000)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+def report(stats: QueryStats, where: str, role: Optional[str] = None) -> List[Dict]:
+    """تسجيل أنماط N+1 في السجل - Returns: الأشكال المتكررة"""
+    flagged = stats.repeated()
+    for f in flagged:
+        logger.warning(
+            f"N+1 queries in {where} role={role or '-'}: {f['count']}x {f['command']} {f['collection']} "
+            f"{f['filter']} ({f['seconds'] * 1000:.1f} ms of {stats.commands} commands / {stats.seconds * 1000:.1f} ms)"
+        )
+    return flagged
@@ -0,0 +1,80 @@
+"""
+Rate Limiter - محدد معدل داخل العملية (Token Bucket)
+============================================================
+- لكل مفتاح (IP، بريد، اسم مستخدم...) دلو بسعة burst يمتلئ بمعدل ثابت
+- كل طلب يستهلك رمزاً، وعند فراغ الدلو يُرفض مع مدة الانتظار (Retry-After)
+- لا وصول لقاعدة البيانات - الرفض يحدث قبل أي استعلام
+- عدد المفاتيح محدود (LRU) حتى لا تستهلك الذاكرة عند هجوم بعناوين كثيرة
+
+ملاحظة: الحدود لكل عملية - مع عدة عمليات يتضاعف الحد الفعلي بعددها
+============================================================
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+# عدد الـ proxies الموثوقة أمام التطبيق (ingress) - كل واحد يضيف عنواناً إلى X-Forwarded-For
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+
+
+class TokenBucketLimiter:
+    """
+    capacity: أقصى عدد طلبات متتالية (burst)
+    refill_per_second: معدل امتلاء الدلو
+    """
+
+    def __init__(self, capacity: int, refill_per_second: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated_at)
+
+    def _refill(self, key: str, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+
+    def acquire(self, key: str, cost: float = 1) -> Tuple[bool, int]:
+        """
+        استهلاك رمز للمفتاح.
+        Returns: (allowed, retry_after_seconds)
+        """
+        now = time.monotonic()
+        tokens = self._refill(key, now)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        if allowed:
+            return True, 0
+        return False, max(1, math.ceil((cost - tokens) / self.refill_per_second))
+
+    def reset(self, key: str):
+        self._buckets.pop(key, None)
+
+
+def per_hour(limit: int, burst: Optional[int] = None, max_keys: int = 10000) -> TokenBucketLimiter:
+    """limit طلب في الساعة، بدفعة أولى burst (افتراضياً = limit)"""
+    return TokenBucketLimiter(burst or limit, limit / 3600, max_keys)
+
+
+def client_ip(request: Request) -> str:
+    """
+    عنوان العميل كما رآه الـ proxy الموثوق.
+    العميل يستطيع كتابة أي شيء في X-Forwarded-For، وكل proxy يضيف عنوان من اتصل به
+    في النهاية - فالعنوان الموثوق هو رقم TRUSTED_PROXY_HOPS من اليمين، لا الأول.
+    بدون proxy موثوق (0) أو بترويسة أقصر من المتوقع: عنوان الاتصال.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
@@ -0,0 +1,324 @@
+"""
+Request Metrics - قياس زمن الطلبات لكل مسار + مدة المهام المجدولة
+============================================================
+system-metrics يعرض موارد الخادم فقط (psutil) - لا يُعرف أي مسار بطيء.
+RequestMetricsMiddleware (ASGI خالص، بدون BaseHTTPMiddleware) يسجل لكل طلب:
+- المسار بقالبه (/api/employees/{employee_id}) وليس الرابط الفعلي - عدد التسميات ثابت
+- مدرج الزمن (histogram) + عدد الطلبات الجارية + رموز الحالة
+- تفصيل الزمن: حتى أول بايت (المعالجة) + إرسال الجسم (stream)
+
+الطلب البطيء (أبطأ من SLOW_REQUEST_MS، 0 = تعطيل) يُسجل في السجل مع المسار
+ودور المستخدم والتفصيل.
+المهام المجدولة (services/scheduler.py) تُسجل مدتها عبر observe_job.
+أوامر MongoDB لكل طلب (services/query_monitor.py): العدد والزمن وأنماط N+1 لكل مسار،
+و Server-Timing في الاستجابة إذا SERVER_TIMING=1 (للتطوير).
+
+render_prometheus() ← /api/system/metrics بصيغة Prometheus النصية.
+============================================================
+"""
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from services.query_monitor import QueryStats, current_queries, report
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", "1000"))
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+UNMATCHED_ROUTE = "<unmatched>"
+ROUTING = "<routing>"
+
+# Per-request info shared with the request's handlers (role, timings...).
+# A mutable dict: BaseHTTPMiddleware runs the app in a child task with a copied
+# context, so values set there would not be visible here - mutations are.
+current_request: ContextVar[Optional[dict]] = ContextVar("current_request", default=None)
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """الحد الأعلى للفئة التي تقع فيها النسبة q (تقريبي)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+# (method, route) -> histogram
+_latency: Dict[Tuple[str, str], _Histogram] = {}
+# (method, route, status) -> count
+_responses: Dict[Tuple[str, str, int], int] = {}
+# id(scope) -> scope, for requests still running
+_active: Dict[int, dict] = {}
+# (method, route) -> [commands, seconds]
+_db: Dict[Tuple[str, str], List] = {}
+# (method, route, command, collection) -> requests flagged
+_n_plus_one: Dict[Tuple[str, str, str, str], int] = {}
+
+_job_duration: Dict[str, _Histogram] = {}
+_job_runs: Dict[Tuple[str, str], int] = {}
+_job_last: Dict[str, dict] = {}
+
+
+def _route_of(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+def note_user(payload: dict):
+    """من get_current_user: دور المستخدم للطلب الحالي (سجل الطلبات البطيئة)"""
+    info = current_request.get()
+    if info is not None:
+        info["role"] = payload.get("role")
+        info["user_id"] = payload.get("user_id")
+
+
+# ==================== MIDDLEWARE ====================
+
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        info = {"status": 500, "first_byte": None}
+        queries = QueryStats()
+        token = current_request.set(info)
+        queries_token = current_queries.set(queries)
+        _active[id(scope)] = scope
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                info["status"] = message["status"]
+                info["first_byte"] = time.perf_counter()
+                if SERVER_TIMING:
+                    message = {**message, "headers": [*message.get("headers", []), _server_timing(queries, started)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.pop(id(scope), None)
+            current_request.reset(token)
+            current_queries.reset(queries_token)
+            _record(scope, info, queries, started, time.perf_counter())
+
+
+def _server_timing(queries: QueryStats, started: float) -> Tuple[bytes, bytes]:
+    app_ms = (time.perf_counter() - started) * 1000
+    value = f'db;dur={queries.seconds * 1000:.1f};desc="{queries.commands} queries", app;dur={app_ms:.1f}'
+    return b"server-timing", value.encode()
+
+
+def _record(scope: dict, info: dict, queries: QueryStats, started: float, finished: float):
+    method, route, status = scope["method"], _route_of(scope), info["status"]
+    elapsed = finished - started
+    
+    if queries.commands:
+        info["db_ms"] = queries.seconds * 1000
+        totals = _db.setdefault((method, route), [0, 0.0])
+        totals[0] += queries.commands
+        totals[1] += queries.seconds
+        for f in report(queries, f"{method} {route}", info.get("role")):
+            key = (method, route, f["command"], f["collection"])
+            _n_plus_one[key] = _n_plus_one.get(key, 0) + 1
+
+    histogram = _latency.get((method, route))
+    if histogram is None:
+        histogram = _latency[(method, route)] = _Histogram(LATENCY_BUCKETS)
+    histogram.observe(elapsed)
+    key = (method, route, status)
+    _responses[key] = _responses.get(key, 0) + 1
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        first_byte = info["first_byte"] or finished
+        timings = {
+            "handler_ms": (first_byte - started) * 1000,
+            "stream_ms": (finished - first_byte) * 1000,
+        }
+        # Extra *_ms timings added by the request's handlers
+        timings.update({k: v for k, v in info.items() if k.endswith("_ms")})
+        breakdown = " ".join(f"{k}={v:.1f}" for k, v in timings.items())
+        logger.warning(
+            f"Slow request {method} {route} status={status} role={info.get('role') or '-'} "
+            f"total_ms={elapsed * 1000:.1f} {breakdown} db_commands={queries.commands}"
+        )
+
+
+# ==================== SCHEDULER JOBS ====================
+
+def observe_job(job_id: str, seconds: float, status: str = "success"):
+    histogram = _job_duration.get(job_id)
+    if histogram is None:
+        histogram = _job_duration[job_id] = _Histogram(JOB_BUCKETS)
+    histogram.observe(seconds)
+    _job_runs[(job_id, status)] = _job_runs.get((job_id, status), 0) + 1
+    _job_last[job_id] = {"finished_at": time.time(), "duration_seconds": seconds, "status": status}
+
+
+# ==================== EXPORT ====================
+
+def _in_flight() -> Dict[Tuple[str, str], int]:
+    # Grouped at read time - a request's route is known once the router matched it
+    counts: Dict[Tuple[str, str], int] = {}
+    for scope in list(_active.values()):
+        key = (scope["method"], getattr(scope.get("route"), "path", None) or ROUTING)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: _Histogram, labels: dict) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route template",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), histogram in sorted(_latency.items()):
+        lines += _histogram_lines("http_request_duration_seconds", histogram, {"method": method, "route": route})
+
+    lines += [
+        "# HELP http_responses_total Responses by route template and status code",
+        "# TYPE http_responses_total counter",
+    ]
+    for (method, route, status), count in sorted(_responses.items()):
+        lines.append(f"http_responses_total{_labels(method=method, route=route, status=status)} {count}")
+
+    lines += [
+        "# HELP http_requests_in_flight Requests currently being handled",
+        "# TYPE http_requests_in_flight gauge",
+    ]
+    for (method, route), count in sorted(_in_flight().items()):
+        lines.append(f"http_requests_in_flight{_labels(method=method, route=route)} {count}")
+
+    lines += [
+        "# HELP http_request_db_commands_total MongoDB commands issued while handling requests",
+        "# TYPE http_request_db_commands_total counter",
+    ]
+    for (method, route), (commands, _) in sorted(_db.items()):
+        lines.append(f"http_request_db_commands_total{_labels(method=method, route=route)} {commands}")
+
+    lines += [
+        "# HELP http_request_db_seconds_total Time spent in MongoDB commands while handling requests",
+        "# TYPE http_request_db_seconds_total counter",
+    ]
+    for (method, route), (_, seconds) in sorted(_db.items()):
+        lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {seconds:.6f}")
+
+    lines += [
+        "# HELP http_request_n_plus_one_total Requests that repeated one query shape past the N+1 threshold",
+        "# TYPE http_request_n_plus_one_total counter",
+    ]
+    for (method, route, command, collection), count in sorted(_n_plus_one.items()):
+        labels = _labels(method=method, route=route, command=command, collection=collection)
+        lines.append(f"http_request_n_plus_one_total{labels} {count}")
+
+    lines += [
+        "# HELP scheduler_job_duration_seconds Scheduled job run time",
+        "# TYPE scheduler_job_duration_seconds histogram",
+    ]
+    for job_id, histogram in sorted(_job_duration.items()):
+        lines += _histogram_lines("scheduler_job_duration_seconds", histogram, {"job": job_id})
+
+    lines += [
+        "# HELP scheduler_job_runs_total Scheduled job runs by outcome",
+        "# TYPE scheduler_job_runs_total counter",
+    ]
+    for (job_id, status), count in sorted(_job_runs.items()):
+        lines.append(f"scheduler_job_runs_total{_labels(job=job_id, status=status)} {count}")
+
+    lines += [
+        "# HELP scheduler_job_last_finished_timestamp_seconds Unix time the job last finished",
+        "# TYPE scheduler_job_last_finished_timestamp_seconds gauge",
+    ]
+    for job_id, last in sorted(_job_last.items()):
+        lines.append(f"scheduler_job_last_finished_timestamp_seconds{_labels(job=job_id)} {last['finished_at']:.3f}")
+
+    return "\n".join(lines) + "\n"
+
+
+def summary(limit: int = 10) -> Dict:
+    """ملخص للوحة STAS: المسارات الأكثر استهلاكاً للوقت (المجموع) مع p95 تقريبي"""
+    errors: Dict[Tuple[str, str], int] = {}
+    for (method, route, status), count in _responses.items():
+        if status >= 500:
+            errors[(method, route)] = errors.get((method, route), 0) + count
+    in_flight = _in_flight()
+
+    n_plus_one: Dict[Tuple[str, str], int] = {}
+    for (method, route, _, _), count in _n_plus_one.items():
+        n_plus_one[(method, route)] = n_plus_one.get((method, route), 0) + count
+
+    routes = []
+    for (method, route), h in _latency.items():
+        p95 = h.quantile(0.95)
+        db_commands, db_seconds = _db.get((method, route), (0, 0.0))
+        routes.append({
+            "method": method,
+            "route": route,
+            "requests": h.count,
+            "avg_ms": round(h.sum / h.count * 1000, 1),
+            # Beyond the last bucket: unknown
+            "p95_ms": round(p95 * 1000) if p95 != float("inf") else None,
+            "total_seconds": round(h.sum, 2),
+            "server_errors": errors.get((method, route), 0),
+            "db_commands_avg": round(db_commands / h.count, 1),
+            "db_ms_avg": round(db_seconds / h.count * 1000, 1),
+            "n_plus_one_requests": n_plus_one.get((method, route), 0),
+        })
+    routes.sort(key=lambda r: r["total_seconds"], reverse=True)
+    return {
+        "requests": sum(h.count for h in _latency.values()),
+        "in_flight": sum(in_flight.values()),
+        "slow_request_ms": SLOW_REQUEST_MS,
+        "top_routes": routes[:limit],
+        "jobs": {job_id: {**last, "runs": _job_duration[job_id].count} for job_id, last in _job_last.items()},
+    }
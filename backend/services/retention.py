@@ -0,0 +1,232 @@
+"""
+Retention Service - سياسات الاحتفاظ بسجلات الجلسات والأمان
+============================================================
+- revoked_tokens: لكل توكن مُبطل expires_at (انتهاء صلاحية التوكن، 12 ساعة كحد أقصى)
+  مع فهرس TTL - MongoDB يحذفه تلقائياً بعدها (لا فائدة منه بعد انتهاء التوكن)
+- user_sessions / login_sessions / security_audit_log: مهمة يومية تحذف الأقدم من
+  مدة الاحتفاظ (قابلة للتعديل من البيئة) بعد:
+  1. تصدير أرشيفي: ملف NDJSON مضغوط (gzip) لكل مجموعة في RETENTION_ARCHIVE_DIR
+  2. تجميع (rollup) للتقارير: login_sessions_daily و security_audit_daily
+  ثم الحذف بالمعرفات المصدّرة فقط
+- فهارس تبقي الاستعلامات المتكررة (جلسات المستخدم، آخر جلسة، سجل موظف) صغيرة
+============================================================
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.auth import MAX_TOKEN_HOURS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.environ.get(
+    "RETENTION_ARCHIVE_DIR", str(Path(__file__).parent.parent / "uploads" / "retention")
+))
+MAX_DOCS_PER_RUN = int(os.environ.get("RETENTION_MAX_DOCS_PER_RUN", "200000"))
+DELETE_BATCH = 1000
+
+
+class RetentionPolicy:
+    """
+    collection: المجموعة
+    time_field: حقل الوقت (نص ISO أو datetime)
+    days: مدة الاحتفاظ - 0 يعطّل الحذف
+    rollup: خطوات التجميع قبل الحذف (تُدمج في مجموعة التقارير) أو None
+    """
+
+    def __init__(self, collection: str, time_field: str, days: int, rollup: Optional[list] = None):
+        self.collection = collection
+        self.time_field = time_field
+        self.days = days
+        self.rollup = rollup
+
+    def cutoff(self, now: datetime) -> datetime:
+        """بداية اليوم (UTC) - كل يوم يُجمّع ويُحذف مرة واحدة كاملاً"""
+        day = (now - timedelta(days=self.days)).date()
+        return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+    def expired_query(self, cutoff: datetime) -> dict:
+        # Older documents may hold a datetime instead of an ISO string
+        return {"$or": [
+            {self.time_field: {"$lt": cutoff.isoformat()}},
+            {self.time_field: {"$lt": cutoff}},
+        ]}
+
+
+def _day(field: str) -> dict:
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": {"$toDate": f"${field}"}}}
+
+
+# Additive merge: a day split across runs (MAX_DOCS_PER_RUN) keeps adding to the same row
+LOGIN_SESSIONS_ROLLUP = [
+    {"$group": {
+        "_id": {"employee_id": "$employee_id", "date": _day("login_at")},
+        "logins": {"$sum": 1},
+        "mobile_logins": {"$sum": {"$cond": [{"$eq": ["$is_mobile", True]}, 1, 0]}},
+        "devices": {"$addToSet": "$device_id"},
+        "first_login": {"$min": "$login_at"},
+        "last_login": {"$max": "$login_at"},
+    }},
+    {"$project": {
+        "_id": 0,
+        "employee_id": "$_id.employee_id",
+        "date": "$_id.date",
+        "logins": 1,
+        "mobile_logins": 1,
+        "devices": 1,
+        "first_login": 1,
+        "last_login": 1,
+    }},
+    {"$merge": {
+        "into": "login_sessions_daily",
+        "on": ["employee_id", "date"],
+        "whenMatched": [{"$set": {
+            "logins": {"$add": ["$logins", "$$new.logins"]},
+            "mobile_logins": {"$add": ["$mobile_logins", "$$new.mobile_logins"]},
+            "devices": {"$setUnion": ["$devices", "$$new.devices"]},
+            "first_login": {"$min": ["$first_login", "$$new.first_login"]},
+            "last_login": {"$max": ["$last_login", "$$new.last_login"]},
+        }}],
+    }},
+]
+
+SECURITY_AUDIT_ROLLUP = [
+    {"$group": {
+        "_id": {"action": "$action", "date": _day("timestamp")},
+        "count": {"$sum": 1},
+        "employees": {"$addToSet": "$employee_id"},
+    }},
+    {"$project": {"_id": 0, "action": "$_id.action", "date": "$_id.date", "count": 1, "employees": 1}},
+    {"$merge": {
+        "into": "security_audit_daily",
+        "on": ["action", "date"],
+        "whenMatched": [{"$set": {
+            "count": {"$add": ["$count", "$$new.count"]},
+            "employees": {"$setUnion": ["$employees", "$$new.employees"]},
+        }}],
+    }},
+]
+
+RETENTION_POLICIES: List[RetentionPolicy] = [
+    RetentionPolicy("user_sessions", "created_at", int(os.environ.get("USER_SESSIONS_RETENTION_DAYS", "30"))),
+    RetentionPolicy(
+        "login_sessions", "login_at",
+        int(os.environ.get("LOGIN_SESSIONS_RETENTION_DAYS", "90")), LOGIN_SESSIONS_ROLLUP,
+    ),
+    RetentionPolicy(
+        "security_audit_log", "timestamp",
+        int(os.environ.get("SECURITY_AUDIT_RETENTION_DAYS", "180")), SECURITY_AUDIT_ROLLUP,
+    ),
+]
+
+
+# ==================== INDEXES ====================
+
+async def ensure_retention_indexes(db):
+    """فهرس TTL للتوكنات المُبطلة + فهارس الاستعلامات المتكررة وسياسات الحذف"""
+    # Revocations written before expires_at existed: expire 12h after revocation
+    await db.revoked_tokens.update_many(
+        {"expires_at": {"$exists": False}, "revoked_at": {"$type": "date"}},
+        [{"$set": {"expires_at": {"$add": ["$revoked_at", MAX_TOKEN_HOURS * 3600 * 1000]}}}],
+    )
+    await db.revoked_tokens.delete_many({"expires_at": {"$exists": False}})
+    await db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0, name="revoked_tokens_ttl")
+    await db.revoked_tokens.create_index("revoked_at", name="revoked_tokens_revoked_at")
+
+    await db.user_sessions.create_index([("user_id", 1), ("is_active", 1)], name="user_sessions_user_active")
+    await db.user_sessions.create_index("created_at", name="user_sessions_created_at")
+    await db.login_sessions.create_index(
+        [("employee_id", 1), ("status", 1), ("login_at", -1)], name="login_sessions_employee_status"
+    )
+    await db.login_sessions.create_index("login_at", name="login_sessions_login_at")
+    await db.security_audit_log.create_index(
+        [("employee_id", 1), ("timestamp", -1)], name="security_audit_employee_time"
+    )
+    await db.security_audit_log.create_index("timestamp", name="security_audit_timestamp")
+
+    await db.login_sessions_daily.create_index([("employee_id", 1), ("date", 1)], unique=True)
+    await db.security_audit_daily.create_index([("action", 1), ("date", 1)], unique=True)
+
+
+# ==================== ARCHIVE + PURGE ====================
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _write_lines(path: Path, lines: List[str]):
+    with gzip.open(path, "at", encoding="utf-8") as fh:
+        fh.writelines(lines)
+
+
+async def _archive(db, policy: RetentionPolicy, query: dict, path: Path) -> list:
+    """تصدير المستندات المنتهية إلى ملف NDJSON مضغوط - يعيد معرفاتها (_id) للحذف"""
+    ids = []
+    lines = []
+    cursor = db[policy.collection].find(query).limit(MAX_DOCS_PER_RUN)
+    async for doc in cursor.batch_size(DELETE_BATCH):
+        ids.append(doc.pop("_id"))
+        lines.append(json.dumps(doc, default=_json_default, ensure_ascii=False) + "\n")
+        if len(lines) >= DELETE_BATCH:
+            await asyncio.to_thread(_write_lines, path, lines)
+            lines = []
+    if lines:
+        await asyncio.to_thread(_write_lines, path, lines)
+    return ids
+
+
+async def apply_policy(db, policy: RetentionPolicy, now: Optional[datetime] = None) -> Dict:
+    """تطبيق سياسة واحدة: تصدير ← تجميع ← حذف"""
+    now = now or datetime.now(timezone.utc)
+    cutoff = policy.cutoff(now)
+    result = {"collection": policy.collection, "cutoff": cutoff.isoformat(), "archived": 0, "deleted": 0}
+    if policy.days <= 0:
+        result["skipped"] = "disabled"
+        return result
+
+    query = policy.expired_query(cutoff)
+    if not await db[policy.collection].find_one(query, {"_id": 1}):
+        return result
+
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = ARCHIVE_DIR / f"{policy.collection}-{now.strftime('%Y%m%d-%H%M%S')}.ndjson.gz"
+    ids = await _archive(db, policy, query, path)
+    result["archived"] = len(ids)
+    result["archive_file"] = path.name
+
+    coll = db[policy.collection]
+    for start in range(0, len(ids), DELETE_BATCH):
+        batch = {"_id": {"$in": ids[start:start + DELETE_BATCH]}}
+        if policy.rollup:
+            await coll.aggregate([{"$match": batch}] + policy.rollup).to_list(None)
+        deleted = await coll.delete_many(batch)
+        result["deleted"] += deleted.deleted_count
+    return result
+
+
+async def run_retention(db) -> List[Dict]:
+    """تطبيق كل السياسات - خطأ في مجموعة لا يوقف الباقي"""
+    results = []
+    for policy in RETENTION_POLICIES:
+        try:
+            results.append(await apply_policy(db, policy))
+        except Exception as e:
+            logger.error(f"Retention failed for {policy.collection}: {e}")
+            results.append({"collection": policy.collection, "error": str(e)})
+
+    if any(r.get("deleted") for r in results):
+        from services.storage_insights import invalidate_cache
+        invalidate_cache()
+    return results
+
+
+def list_policies() -> List[Dict]:
+    return [
+        {"collection": p.collection, "time_field": p.time_field, "retention_days": p.days, "rollup": bool(p.rollup)}
+        for p in RETENTION_POLICIES
+    ] + [{"collection": "revoked_tokens", "time_field": "expires_at", "retention_days": 0, "ttl_index": True}]
@@ -2,14 +2,18 @@
 Scheduler Service - جدولة المهام التلقائية
 - التحضير الذاتي في بداية كل يوم عمل (7:00 صباحاً)
 - ملخص الحضور الشهري (أول كل شهر)
+- سياسات الاحتفاظ بسجلات الجلسات والأمان (يومياً)
+- جدول حقائق التحليلات (ليلياً + ترقيع الشهر الحالي دورياً)
 - التحضير عند بدء التشغيل إذا فات الوقت
 """
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 logger = logging.getLogger(__name__)
 
@@ -157,11 +161,118 @@ async def run_monthly_summary_job():
         logger.error(f"❌ فشل في الملخص الشهري: {e}")
 
 
+async def run_retention_job():
+    """أرشفة وتجميع وحذف سجلات الجلسات والأمان الأقدم من مدة الاحتفاظ"""
+    from services.retention import run_retention
+    from database import db
+    
+    logger.info("⏰ بدء تطبيق سياسات الاحتفاظ")
+    results = await run_retention(db)
+    errors = [r for r in results if r.get("error")]
+    
+    await db.job_logs.insert_one({
+        "job_type": "retention",
+        "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+        "results": results,
+        "deleted_count": sum(r.get("deleted", 0) for r in results),
+        "executed_at": datetime.now(timezone.utc).isoformat(),
+        "status": "success" if not errors else "partial"
+    })
+    
+    logger.info(f"✅ سياسات الاحتفاظ: حُذف {sum(r.get('deleted', 0) for r in results)} سجل، أخطاء={len(errors)}")
+
+
+async def run_storage_snapshot_job():
+    """لقطة يومية لأحجام المجموعات (لحساب النمو في /api/maintenance/storage-insights)"""
+    from services.storage_insights import snapshot_storage
+    from database import db
+    
+    names = [n for n in await db.list_collection_names() if not n.startswith("system.")]
+    snapshot = await snapshot_storage(db, names)
+    
+    await db.job_logs.insert_one({
+        "job_type": "storage_snapshot",
+        "date": snapshot["date"],
+        "collections": len(snapshot["collections"]),
+        "data_size_bytes": snapshot["database"]["data_size_bytes"],
+        "executed_at": datetime.now(timezone.utc).isoformat(),
+        "status": "success"
+    })
+    
+    logger.info(f"✅ لقطة التخزين: {len(snapshot['collections'])} مجموعة")
+
+
+async def run_analytics_facts_job():
+    """بناء جدول حقائق التحليلات ليلياً (services/analytics_facts.py)"""
+    from services.analytics_facts import run_nightly_build
+    from database import db
+    
+    result = await run_nightly_build(db)
+    
+    await db.job_logs.insert_one({
+        "job_type": "analytics_facts",
+        "date": datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+        "rebuilt_months": result["rebuilt"],
+        "backfilled_months": result["backfilled"],
+        "facts": result["facts"],
+        "executed_at": datetime.now(timezone.utc).isoformat(),
+        "status": "success"
+    })
+    
+    logger.info(f"✅ حقائق التحليلات: أُعيد بناء {result['rebuilt']}، أُكمل {len(result['backfilled'])} شهر")
+
+
+async def run_analytics_patch_job():
+    """ترقيع حقائق الشهر الحالي - بدون سجل في job_logs (يعمل كل بضع دقائق)"""
+    from services.analytics_facts import patch_current_month
+    from database import db
+    
+    await patch_current_month(db)
+
+
+async def run_ats_requeue_job():
+    """إعادة طلبات ATS التي توقف عاملها (انتهى عقد الحجز) إلى الطابور"""
+    from services.ats_ingestion import requeue_stale_applications
+    
+    await requeue_stale_applications()
+
+
+async def run_fraud_sweep_job():
+    """إغلاق تنبيهات التلاعب التي انتهت جلساتها (توكن منتهٍ بلا تسجيل خروج)"""
+    from services.fraud_engine import sweep_expired
+    
+    resolved = await sweep_expired()
+    if resolved:
+        logger.info(f"Fraud sweep: {resolved} alerts resolved")
+
+
+def _timed(job_id: str, func):
+    """تسجيل مدة المهمة ونتيجتها في مقاييس الخادم (/api/system/metrics) وأنماط N+1 في أوامرها"""
+    from services.request_metrics import observe_job
+    from services.query_monitor import QueryStats, current_queries, report
+    
+    async def run():
+        started = time.perf_counter()
+        status = "success"
+        queries = QueryStats()
+        token = current_queries.set(queries)
+        try:
+            await func()
+        except Exception:
+            status = "failed"
+            raise
+        finally:
+            current_queries.reset(token)
+            observe_job(job_id, time.perf_counter() - started, status)
+            report(queries, f"job {job_id}")
+    return run
+
+
 def init_scheduler():
     """تهيئة وتشغيل الـ scheduler"""
     # التحضير الذاتي - كل يوم الساعة 7:00 صباحاً (توقيت الرياض = 04:00 UTC)
     scheduler.add_job(
-        run_daily_auto_attendance,
+        _timed('daily_auto_attendance', run_daily_auto_attendance),
         CronTrigger(hour=4, minute=0),  # 7 AM Riyadh time (UTC+3)
         id='daily_auto_attendance',
         name='Daily Auto Attendance',
@@ -170,13 +281,68 @@ def init_scheduler():
     
     # الملخص الشهري - أول كل شهر الساعة 3:00 صباحاً (توقيت الرياض = 00:00 UTC)
     scheduler.add_job(
-        run_monthly_summary_job,
+        _timed('monthly_summary', run_monthly_summary_job),
         CronTrigger(day=1, hour=0, minute=0),  # 3 AM Riyadh time on 1st
         id='monthly_summary',
         name='Monthly Attendance Summary',
         replace_existing=True
     )
     
+    # سياسات الاحتفاظ - كل يوم الساعة 4:00 صباحاً (توقيت الرياض = 01:00 UTC)
+    scheduler.add_job(
+        _timed('retention', run_retention_job),
+        CronTrigger(hour=1, minute=0),
+        id='retention',
+        name='Session & Audit Retention',
+        replace_existing=True
+    )
+    
+    # لقطة أحجام التخزين - كل يوم الساعة 3:30 صباحاً (توقيت الرياض = 00:30 UTC)
+    scheduler.add_job(
+        _timed('storage_snapshot', run_storage_snapshot_job),
+        CronTrigger(hour=0, minute=30),
+        id='storage_snapshot',
+        name='Daily Storage Snapshot',
+        replace_existing=True
+    )
+    
+    # حقائق التحليلات - كل يوم الساعة 5:00 صباحاً (توقيت الرياض = 02:00 UTC)
+    scheduler.add_job(
+        _timed('analytics_facts', run_analytics_facts_job),
+        CronTrigger(hour=2, minute=0),
+        id='analytics_facts',
+        name='Nightly Analytics Facts',
+        replace_existing=True
+    )
+    
+    # ترقيع حقائق الشهر الحالي - كل ANALYTICS_PATCH_MINUTES دقيقة
+    from services.analytics_facts import PATCH_MINUTES
+    scheduler.add_job(
+        _timed('analytics_patch', run_analytics_patch_job),
+        IntervalTrigger(minutes=PATCH_MINUTES),
+        id='analytics_patch',
+        name='Analytics Facts Patch',
+        replace_existing=True
+    )
+    
+    # طلبات ATS العالقة في processing - كل بضع دقائق
+    scheduler.add_job(
+        _timed('ats_requeue', run_ats_requeue_job),
+        IntervalTrigger(minutes=5),
+        id='ats_requeue',
+        name='ATS Stale Processing Requeue',
+        replace_existing=True
+    )
+    
+    # تنبيهات التلاعب المنتهية - كل 15 دقيقة
+    scheduler.add_job(
+        _timed('fraud_sweep', run_fraud_sweep_job),
+        IntervalTrigger(minutes=15),
+        id='fraud_sweep',
+        name='Fraud Alerts Expiry Sweep',
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("✅ تم تشغيل جدولة المهام - التحضير الذاتي 7:00 صباحاً")
     
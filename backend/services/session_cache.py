@@ -0,0 +1,265 @@
+"""
+Session Cache - التحقق من الجلسات من الذاكرة
+============================================================
+get_current_user يعمل مع كل طلب، وكان يقرأ revoked_tokens و users من القاعدة
+في كل مرة. الآن الحالة محفوظة في الذاكرة:
+- التوكنات المُبطلة (jti) حتى انتهاء صلاحيتها
+- المستخدمون المحظورون / المعطلون (is_blocked، is_active=false)
+- المستخدمون الموقوفون (is_suspended مع suspended_until)
+- وقت إنهاء الجلسات لكل مستخدم (sessions_revoked_at): أي توكن صدر قبله مرفوض
+  (خروج إجباري، تعطيل) + وقت عام لخروج الطوارئ لكل المستخدمين
+
+التناسق بين العمليات: مستند session_state يحمل رقم إصدار (version) يزيد مع كل تغيير.
+كل عملية تقرأ الرقم كل SESSION_CACHE_REFRESH ثانية (قراءة واحدة صغيرة)،
+وعند تغيره تُحدّث ما تغير فقط. العملية التي أجرت التغيير تُحدّث ذاكرتها فوراً.
+============================================================
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from utils.auth import MAX_TOKEN_HOURS
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.environ.get("SESSION_CACHE_REFRESH", "5"))
+STATE_KEY = "session_state"
+
+USER_STATE_QUERY = {"$or": [
+    {"is_blocked": True},
+    {"is_active": False},
+    {"is_suspended": True},
+    {"sessions_revoked_at": {"$exists": True}},
+]}
+USER_STATE_FIELDS = {
+    "_id": 0, "id": 1, "is_blocked": 1, "is_active": 1,
+    "is_suspended": 1, "suspended_until": 1, "sessions_revoked_at": 1,
+}
+
+
+class SessionState:
+    def __init__(self):
+        self.loaded = False
+        self.version = -1
+        self.checked_at = 0.0
+        self.revoked: Dict[str, float] = {}          # jti -> expires (epoch)
+        self.revoked_watermark: Optional[datetime] = None
+        self.blocked: Set[str] = set()               # user_id
+        self.suspended: Dict[str, Optional[float]] = {}  # user_id -> until (epoch) or None = until lifted
+        self.sessions_revoked_at: Dict[str, float] = {}  # user_id -> epoch
+        self.all_revoked_at: float = 0.0
+        self.all_revoked_by: Optional[str] = None
+
+
+_state = SessionState()
+_refresh_lock = asyncio.Lock()
+
+
+# ==================== HELPERS ====================
+
+def _epoch(value) -> Optional[float]:
+    """datetime أو نص ISO → epoch"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _apply_user(user: dict, state: SessionState):
+    user_id = user["id"]
+    if user.get("is_blocked") or not user.get("is_active", True):
+        state.blocked.add(user_id)
+    else:
+        state.blocked.discard(user_id)
+
+    if user.get("is_suspended"):
+        state.suspended[user_id] = _epoch(user.get("suspended_until"))
+    else:
+        state.suspended.pop(user_id, None)
+
+    revoked_at = _epoch(user.get("sessions_revoked_at"))
+    if revoked_at:
+        state.sessions_revoked_at[user_id] = revoked_at
+    else:
+        state.sessions_revoked_at.pop(user_id, None)
+
+
+def _add_revoked(token_id: str, expires_at: Optional[datetime], revoked_at: Optional[datetime] = None):
+    expires = _epoch(expires_at) or (_epoch(revoked_at) or time.time()) + MAX_TOKEN_HOURS * 3600
+    _state.revoked[token_id] = expires
+
+
+async def _bump_version(db, **fields):
+    """
+    إعلام العمليات الأخرى. ذاكرة هذه العملية محدثة مسبقاً، والإصدار المحلي لا يُغيَّر
+    هنا حتى لا يُتجاوز تغيير متزامن من عملية أخرى - المزامنة التالية تقرأ الفرق.
+    """
+    update = {"$inc": {"version": 1}}
+    if fields:
+        update["$set"] = fields
+    await db.session_state.update_one({"key": STATE_KEY}, update, upsert=True)
+
+
+# ==================== LOAD / REFRESH ====================
+
+async def _load_revoked(db, since: Optional[datetime]):
+    query = {"revoked_at": {"$gt": since}} if since else {
+        "revoked_at": {"$gte": datetime.now(timezone.utc) - timedelta(hours=MAX_TOKEN_HOURS)}
+    }
+    cursor = db.revoked_tokens.find(query, {"_id": 0, "token_id": 1, "revoked_at": 1, "expires_at": 1})
+    async for doc in cursor.batch_size(1000):
+        _add_revoked(doc["token_id"], doc.get("expires_at"), doc.get("revoked_at"))
+        revoked_at = doc.get("revoked_at")
+        if isinstance(revoked_at, datetime):
+            if revoked_at.tzinfo is None:
+                revoked_at = revoked_at.replace(tzinfo=timezone.utc)
+            if not _state.revoked_watermark or revoked_at > _state.revoked_watermark:
+                _state.revoked_watermark = revoked_at
+
+
+async def _load_users(db):
+    # Built aside and swapped in: checks running meanwhile keep seeing the old sets
+    fresh = SessionState()
+    async for user in db.users.find(USER_STATE_QUERY, USER_STATE_FIELDS):
+        _apply_user(user, fresh)
+    _state.blocked = fresh.blocked
+    _state.suspended = fresh.suspended
+    _state.sessions_revoked_at = fresh.sessions_revoked_at
+
+
+async def refresh(force: bool = False):
+    """
+    مزامنة الذاكرة مع القاعدة إذا تغير رقم الإصدار.
+    تُستدعى من get_current_user - القراءة الفعلية مرة كل REFRESH_SECONDS كحد أقصى.
+    """
+    now = time.monotonic()
+    if not force and _state.loaded and now - _state.checked_at < REFRESH_SECONDS:
+        return
+
+    async with _refresh_lock:
+        if not force and _state.loaded and time.monotonic() - _state.checked_at < REFRESH_SECONDS:
+            return
+        from database import db
+
+        doc = await db.session_state.find_one({"key": STATE_KEY}, {"_id": 0}) or {}
+        version = doc.get("version", 0)
+        if force or not _state.loaded or version != _state.version:
+            # Overlap by a second: revocations written by another process around the watermark
+            since = _state.revoked_watermark - timedelta(seconds=1) if _state.revoked_watermark else None
+            await _load_revoked(db, since)
+            await _load_users(db)
+            _state.all_revoked_at = _epoch(doc.get("all_sessions_revoked_at")) or 0.0
+            _state.all_revoked_by = doc.get("all_sessions_revoked_by")
+            _state.version = version
+            _state.loaded = True
+
+            cutoff = time.time()
+            _state.revoked = {jti: exp for jti, exp in _state.revoked.items() if exp > cutoff}
+        _state.checked_at = time.monotonic()
+
+
+async def load_session_state():
+    """تحميل كامل عند بدء التشغيل"""
+    await refresh(force=True)
+    logger.info(
+        f"Session cache loaded: {len(_state.revoked)} revoked tokens, "
+        f"{len(_state.blocked)} blocked, {len(_state.suspended)} suspended users"
+    )
+
+
+# ==================== CHECK (pure CPU) ====================
+
+def check_session(payload: dict) -> Optional[str]:
+    """
+    التحقق من التوكن مقابل الذاكرة.
+    Returns: None إذا كانت الجلسة صالحة، وإلا "revoked" أو "blocked"
+    """
+    token_id = payload.get("jti")
+    if token_id and token_id in _state.revoked:
+        return "revoked"
+
+    user_id = payload.get("user_id")
+    if not user_id:
+        return None
+    if user_id in _state.blocked:
+        return "blocked"
+
+    if user_id in _state.suspended:
+        until = _state.suspended[user_id]
+        if until is None or time.time() < until:
+            return "blocked"
+
+    issued_at = payload.get("iat") or 0
+    revoked_at = _state.sessions_revoked_at.get(user_id)
+    if revoked_at and issued_at < revoked_at:
+        return "revoked"
+    if _state.all_revoked_at and issued_at < _state.all_revoked_at and user_id != _state.all_revoked_by:
+        return "revoked"
+    return None
+
+
+# ==================== WRITES ====================
+
+async def revoke_tokens(tokens: Iterable[str], user_id: str, reason: str, expires_at: Optional[datetime] = None):
+    """إبطال توكنات: تُكتب في revoked_tokens وتُضاف للذاكرة فوراً"""
+    from database import db
+
+    now = datetime.now(timezone.utc)
+    docs = [{
+        "token_id": token_id,
+        "user_id": user_id,
+        "revoked_at": now,
+        "expires_at": expires_at or now + timedelta(hours=MAX_TOKEN_HOURS),
+        "reason": reason,
+    } for token_id in dict.fromkeys(t for t in tokens if t)]
+    if not docs:
+        return
+    for doc in docs:
+        _add_revoked(doc["token_id"], doc["expires_at"])
+    await db.revoked_tokens.insert_many(docs)
+    await _bump_version(db)
+
+
+async def revoke_user_sessions(query: dict) -> int:
+    """
+    إنهاء كل جلسات المستخدمين المطابقين (خروج إجباري / تعطيل):
+    أي توكن صدر قبل الآن يُرفض
+    """
+    from database import db
+
+    # Token iat has second resolution - a login in the same second stays valid
+    now = datetime.fromtimestamp(int(time.time()), tz=timezone.utc)
+    result = await db.users.update_many(query, {"$set": {"sessions_revoked_at": now.isoformat()}})
+    await refresh_users(query)
+    return result.modified_count
+
+
+async def revoke_all_sessions(performed_by: str):
+    """خروج طوارئ لكل المستخدمين (عدا من نفّذه)"""
+    from database import db
+
+    now = datetime.fromtimestamp(int(time.time()), tz=timezone.utc)
+    _state.all_revoked_at = now.timestamp()
+    _state.all_revoked_by = performed_by
+    await _bump_version(db, all_sessions_revoked_at=now.isoformat(), all_sessions_revoked_by=performed_by)
+
+
+async def refresh_users(query: dict):
+    """
+    بعد أي تعديل على is_blocked / is_active / is_suspended:
+    إعادة قراءة حالة المستخدمين المعنيين + إعلام العمليات الأخرى
+    """
+    from database import db
+
+    async for user in db.users.find(query, USER_STATE_FIELDS):
+        _apply_user(user, _state)
+    await _bump_version(db)
@@ -19,6 +19,7 @@ Settlement Service - خدمة المخالصة
 from datetime import datetime, timezone
 from typing import Optional, Dict, List, Tuple
 from database import db
+from services.session_cache import refresh_users
 from services.service_calculator import (
     calculate_service_years, 
     calculate_monthly_wage, 
@@ -477,6 +478,7 @@ async def execute_settlement(
         {"employee_id": employee_id},
         {"$set": {"is_active": False, "deactivated_at": now}}
     )
+    await refresh_users({"employee_id": employee_id})
     
     await db.employees.update_one(
         {"id": employee_id},
@@ -0,0 +1,186 @@
+"""
+Storage Insights - إحصائيات التخزين الفعلية من MongoDB
+============================================================
+بدلاً من count_documents({}) لكل مجموعة (مسح كامل) وضرب حجم مستند عيّنة في العدد:
+- $collStats (storageStats): العدد وحجم البيانات الفعلي وحجم التخزين على القرص
+  وحجم كل فهرس - من بيانات المحرك الوصفية، بدون قراءة المستندات
+- dbStats: إجمالي قاعدة البيانات (البيانات، التخزين، الفهارس، مساحة القرص)
+- $indexStats: عدد مرات استخدام كل فهرس منذ تشغيل الخادم (فهارس غير مستخدمة = تكلفة كتابة بلا فائدة)
+- storage_growth: لقطة يومية (مهمة مجدولة) لحساب النمو اليومي لكل مجموعة
+
+النتائج محفوظة في الذاكرة STORAGE_STATS_TTL_SECONDS ثانية (لوحة STAS تُحدَّث كثيراً).
+============================================================
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = int(os.environ.get("STORAGE_STATS_TTL_SECONDS", "60"))
+GROWTH_HISTORY_DAYS = 90
+
+# key -> (expires_at, value)
+_cache: Dict[str, tuple] = {}
+
+
+async def _cached(key: str, loader):
+    entry = _cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    value = await loader()
+    _cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, value)
+    return value
+
+
+def invalidate_cache():
+    """بعد عمليات تغيّر الحجم كثيراً (حذف المعاملات، الحذف النووي، الاستعادة، الاحتفاظ)"""
+    _cache.clear()
+
+
+# ==================== RAW STATS ====================
+
+async def _collection_stats(db, name: str) -> Dict:
+    empty = {"name": name, "documents": 0, "size_bytes": 0, "avg_document_bytes": 0,
+             "storage_size_bytes": 0, "index_size_bytes": 0, "indexes": {}}
+    try:
+        # One document per shard - summed
+        shards = await db[name].aggregate([{"$collStats": {"storageStats": {}}}]).to_list(None)
+    except Exception as e:
+        # Collection not created yet
+        logger.debug(f"collStats {name}: {e}")
+        return empty
+
+    stats = dict(empty)
+    stats["indexes"] = {}
+    for shard in shards:
+        storage = shard.get("storageStats", {})
+        stats["documents"] += storage.get("count", 0)
+        stats["size_bytes"] += storage.get("size", 0)
+        stats["storage_size_bytes"] += storage.get("storageSize", 0)
+        stats["index_size_bytes"] += storage.get("totalIndexSize", 0)
+        for index, size in storage.get("indexSizes", {}).items():
+            stats["indexes"][index] = stats["indexes"].get(index, 0) + size
+    if stats["documents"]:
+        stats["avg_document_bytes"] = round(stats["size_bytes"] / stats["documents"])
+    return stats
+
+
+async def _index_usage(db, name: str) -> List[Dict]:
+    try:
+        indexes = await db[name].aggregate([{"$indexStats": {}}]).to_list(None)
+    except Exception as e:
+        logger.debug(f"indexStats {name}: {e}")
+        return []
+    return [
+        {
+            "name": index["name"],
+            "key": index.get("key", {}),
+            "ops": index.get("accesses", {}).get("ops", 0),
+            "since": index.get("accesses", {}).get("since"),
+        }
+        for index in indexes
+    ]
+
+
+async def _database_stats(db) -> Dict:
+    stats = await db.command("dbStats")
+    return {
+        "collections": stats.get("collections", 0),
+        "documents": stats.get("objects", 0),
+        "data_size_bytes": stats.get("dataSize", 0),
+        "storage_size_bytes": stats.get("storageSize", 0),
+        "index_size_bytes": stats.get("indexSize", 0),
+        "fs_used_bytes": stats.get("fsUsedSize"),
+        "fs_total_bytes": stats.get("fsTotalSize"),
+    }
+
+
+# ==================== PUBLIC ====================
+
+async def get_collection_stats(db, collections: List[str]) -> Dict[str, Dict]:
+    """إحصائيات المجموعات (اسم ← إحصائياتها) - من الذاكرة إذا كانت حديثة"""
+    async def load():
+        results = await asyncio.gather(*(_collection_stats(db, name) for name in collections))
+        return {stats["name"]: stats for stats in results}
+
+    return await _cached("collections:" + ",".join(collections), load)
+
+
+async def get_database_stats(db) -> Dict:
+    return await _cached("database", lambda: _database_stats(db))
+
+
+async def get_index_usage(db, collections: List[str]) -> Dict[str, List[Dict]]:
+    """استخدام الفهارس لكل مجموعة (الأقل استخداماً أولاً)"""
+    async def load():
+        usage = await asyncio.gather(*(_index_usage(db, name) for name in collections))
+        return {name: sorted(indexes, key=lambda i: i["ops"]) for name, indexes in zip(collections, usage)}
+
+    return await _cached("indexes:" + ",".join(collections), load)
+
+
+# ==================== GROWTH ====================
+
+async def snapshot_storage(db, collections: List[str]) -> Dict:
+    """لقطة اليوم في storage_growth (واحدة لكل يوم - تُستبدل إذا أُعيدت)"""
+    now = datetime.now(timezone.utc)
+    stats = await get_collection_stats(db, collections)
+    snapshot = {
+        "date": now.strftime("%Y-%m-%d"),
+        "taken_at": now.isoformat(),
+        "database": await _database_stats(db),
+        "collections": {
+            name: {
+                "documents": s["documents"],
+                "size_bytes": s["size_bytes"],
+                "storage_size_bytes": s["storage_size_bytes"],
+                "index_size_bytes": s["index_size_bytes"],
+            }
+            for name, s in stats.items()
+        },
+    }
+    await db.storage_growth.update_one({"date": snapshot["date"]}, {"$set": snapshot}, upsert=True)
+    cutoff = (now - timedelta(days=GROWTH_HISTORY_DAYS)).strftime("%Y-%m-%d")
+    await db.storage_growth.delete_many({"date": {"$lt": cutoff}})
+    return snapshot
+
+
+async def get_growth(db, days: int = 30) -> Dict:
+    """
+    النمو خلال آخر days يوم: سلسلة يومية لقاعدة البيانات + نمو كل مجموعة
+    (الفرق بين أول وآخر لقطة ومتوسط النمو اليومي)
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    snapshots = await db.storage_growth.find(
+        {"date": {"$gte": since}}, {"_id": 0}
+    ).sort("date", 1).to_list(days + 1)
+
+    series = [
+        {
+            "date": s["date"],
+            "documents": s["database"].get("documents", 0),
+            "data_size_bytes": s["database"].get("data_size_bytes", 0),
+            "storage_size_bytes": s["database"].get("storage_size_bytes", 0),
+            "index_size_bytes": s["database"].get("index_size_bytes", 0),
+        }
+        for s in snapshots
+    ]
+
+    collections = {}
+    if len(snapshots) >= 2:
+        first, last = snapshots[0], snapshots[-1]
+        span_days = max((datetime.fromisoformat(last["date"]) - datetime.fromisoformat(first["date"])).days, 1)
+        for name, current in last["collections"].items():
+            previous = first["collections"].get(name, {})
+            size_growth = current["size_bytes"] - previous.get("size_bytes", 0)
+            collections[name] = {
+                "documents_growth": current["documents"] - previous.get("documents", 0),
+                "size_growth_bytes": size_growth,
+                "daily_growth_bytes": round(size_growth / span_days),
+            }
+
+    return {"days": days, "snapshots": len(snapshots), "series": series, "collections": collections}
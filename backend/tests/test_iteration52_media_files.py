@@ -0,0 +1,85 @@
+"""
+Iteration 52 - Media Files Tests
+Tests the media subsystem used by uploads and employee photos:
+1. Medical uploads are streamed to disk and return size + sha256
+2. Uploaded files are served with ETag / Last-Modified and answer 304
+3. Range requests return 206 with the requested bytes, 416 when out of range
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Minimal valid PDF
+PDF_BYTES = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 100 100]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+
+class TestMediaFiles:
+    """Test /api/upload/medical and /api/upload/files/{filename}"""
+
+    @pytest.fixture(scope="class")
+    def stas_token(self):
+        """Get auth token for stas user (stas506)"""
+        response = requests.post(
+            f"{BASE_URL}/api/auth/login",
+            json={"username": "stas506", "password": "654321"}
+        )
+        if response.status_code == 200:
+            return response.json().get("token")
+        pytest.skip("Unable to login as stas506")
+
+    @pytest.fixture(scope="class")
+    def uploaded(self, stas_token):
+        """Upload a small medical PDF"""
+        response = requests.post(
+            f"{BASE_URL}/api/upload/medical",
+            headers={"Authorization": f"Bearer {stas_token}"},
+            files={"file": ("report.pdf", PDF_BYTES, "application/pdf")}
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    def test_upload_returns_size_and_hash(self, uploaded):
+        """Test that the streamed upload reports size and content hash"""
+        assert uploaded["size"] == len(PDF_BYTES)
+        assert len(uploaded["sha256"]) == 64
+        print(f"✓ Uploaded {uploaded['filename']} ({uploaded['size']} bytes)")
+
+    def test_file_has_validators(self, uploaded):
+        """Test that the file is served with ETag, Last-Modified and Accept-Ranges"""
+        response = requests.get(f"{BASE_URL}{uploaded['url']}")
+        assert response.status_code == 200
+        assert response.content == PDF_BYTES
+        assert response.headers.get("etag")
+        assert response.headers.get("last-modified")
+        assert response.headers.get("accept-ranges") == "bytes"
+
+    def test_if_none_match_returns_304(self, uploaded):
+        """Test conditional GET with the returned ETag"""
+        etag = requests.get(f"{BASE_URL}{uploaded['url']}").headers["etag"]
+        response = requests.get(f"{BASE_URL}{uploaded['url']}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_range_request_returns_partial_content(self, uploaded):
+        """Test that a byte range returns 206 with only those bytes"""
+        response = requests.get(f"{BASE_URL}{uploaded['url']}", headers={"Range": "bytes=0-7"})
+        assert response.status_code == 206
+        assert response.content == PDF_BYTES[:8]
+        assert response.headers.get("content-range") == f"bytes 0-7/{len(PDF_BYTES)}"
+
+    def test_unsatisfiable_range_returns_416(self, uploaded):
+        """Test that a range past the end of the file returns 416"""
+        response = requests.get(f"{BASE_URL}{uploaded['url']}", headers={"Range": "bytes=999999-"})
+        assert response.status_code == 416
+        assert response.headers.get("content-range") == f"bytes */{len(PDF_BYTES)}"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,151 @@
+"""
+Iteration 53 - ATS Background Scoring Tests
+Tests the offloaded CV pipeline and bulk re-scoring:
+1. Public apply returns immediately with processing_status=queued
+2. Admin poll endpoint reports processing status until the worker finishes
+3. Job weights are validated (known keys, components add up to 100)
+4. Changing job requirements starts a re-score run with progress
+"""
+
+import time
+import uuid
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+class TestAtsBackgroundScoring:
+    """Test /api/ats/public/apply processing and /api/ats/admin re-scoring"""
+
+    @pytest.fixture(scope="class")
+    def sultan_token(self):
+        """Get auth token for sultan (ATS access)"""
+        response = requests.post(
+            f"{BASE_URL}/api/auth/login",
+            json={"username": "sultan", "password": "123456"}
+        )
+        if response.status_code == 200:
+            return response.json().get("token")
+        pytest.skip("Unable to login as sultan")
+
+    @pytest.fixture(scope="class")
+    def job(self, sultan_token):
+        """Create a job to apply to"""
+        response = requests.post(
+            f"{BASE_URL}/api/ats/admin/jobs",
+            headers={"Authorization": f"Bearer {sultan_token}"},
+            json={
+                "title_ar": "محاسب - اختبار",
+                "title_en": "Accountant - TEST",
+                "required_skills": "accounting, excel",
+                "experience_years": 3,
+                "required_languages": ["en"],
+            }
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    @pytest.fixture(scope="class")
+    def application(self, job):
+        """Apply with a text CV"""
+        response = requests.post(
+            f"{BASE_URL}/api/ats/public/apply/{job['slug']}",
+            data={
+                "full_name": "TEST Applicant",
+                "email": f"test_{uuid.uuid4().hex[:8]}@example.com",
+                "phone": "+966500000000",
+            },
+            files={"files": ("cv.docx", b"not a real docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")}
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    def test_apply_returns_queued(self, application):
+        """Test that apply does not wait for extraction/scoring"""
+        assert application["success"] is True
+        assert application["processing_status"] == "queued"
+        assert application["application_id"]
+        print(f"✓ Application {application['application_id']} queued")
+
+    def test_processing_status_completes(self, sultan_token, application):
+        """Test that the poll endpoint reaches a final status"""
+        headers = {"Authorization": f"Bearer {sultan_token}"}
+        url = f"{BASE_URL}/api/ats/admin/applications/{application['application_id']}/processing-status"
+
+        status = None
+        for _ in range(30):
+            response = requests.get(url, headers=headers)
+            assert response.status_code == 200
+            status = response.json()["processing_status"]
+            if status in ("completed", "failed"):
+                break
+            time.sleep(1)
+
+        assert status in ("completed", "failed")
+        assert response.json()["tier"] in ("A", "B", "C")
+        print(f"✓ Processing finished: {status}, tier {response.json()['tier']}")
+
+    def test_invalid_weights_rejected(self, sultan_token, job):
+        """Test that weights must be known keys and add up to 100"""
+        headers = {"Authorization": f"Bearer {sultan_token}"}
+
+        response = requests.put(
+            f"{BASE_URL}/api/ats/admin/jobs/{job['id']}",
+            headers=headers,
+            json={"weights": {"not_a_weight": 10}}
+        )
+        assert response.status_code == 400
+
+        response = requests.put(
+            f"{BASE_URL}/api/ats/admin/jobs/{job['id']}",
+            headers=headers,
+            json={"weights": {"skill_match": 60}}
+        )
+        assert response.status_code == 400
+
+    def test_requirement_change_starts_rescore(self, sultan_token, job, application):
+        """Test that changing required skills re-scores existing applications"""
+        headers = {"Authorization": f"Bearer {sultan_token}"}
+
+        response = requests.put(
+            f"{BASE_URL}/api/ats/admin/jobs/{job['id']}",
+            headers=headers,
+            json={"required_skills": "accounting, excel, sap"}
+        )
+        assert response.status_code == 200
+        rescore = response.json().get("rescore")
+        assert rescore and rescore["status"] == "running"
+
+        for _ in range(30):
+            progress = requests.get(f"{BASE_URL}/api/ats/admin/rescore/{rescore['id']}", headers=headers).json()
+            if progress["status"] != "running":
+                break
+            time.sleep(1)
+
+        assert progress["status"] == "completed"
+        assert progress["processed"] == progress["total"]
+        print(f"✓ Re-scored {progress['processed']} applications, {progress['tier_changes']} tier changes")
+
+    def test_unchanged_requirements_do_not_rescore(self, sultan_token, job):
+        """Test that editing non-scoring fields does not start a re-score"""
+        response = requests.put(
+            f"{BASE_URL}/api/ats/admin/jobs/{job['id']}",
+            headers={"Authorization": f"Bearer {sultan_token}"},
+            json={"location": "Riyadh"}
+        )
+        assert response.status_code == 200
+        assert "rescore" not in response.json()
+
+    def test_cleanup(self, sultan_token, job):
+        """Delete the test job"""
+        requests.delete(
+            f"{BASE_URL}/api/ats/admin/jobs/{job['id']}",
+            headers={"Authorization": f"Bearer {sultan_token}"}
+        )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,64 @@
+"""
+Login Rate Limit - X-Forwarded-For spoofing
+Tests that the per-IP login limit keys on the address the trusted proxy saw:
+1. client_ip ignores client-supplied X-Forwarded-For entries
+2. Rotating X-Forwarded-For on every attempt still gets the IP blocked
+"""
+
+import sys
+sys.path.insert(0, '/app/backend')
+
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from services.rate_limiter import TRUSTED_PROXY_HOPS, client_ip
+from routes.auth import MAX_LOGIN_ATTEMPTS, check_rate_limit, login_attempts, record_failed_attempt
+
+PROXY_IP = "10.0.0.7"
+
+
+def make_request(spoofed: str, real_ip: str = "203.0.113.50") -> Request:
+    """Request as it reaches the app: client-supplied entry, then what each trusted proxy appended"""
+    forwarded = ", ".join([spoofed, real_ip] + [PROXY_IP] * (TRUSTED_PROXY_HOPS - 1))
+    return Request({
+        "type": "http",
+        "headers": [(b"x-forwarded-for", forwarded.encode())],
+        "client": (PROXY_IP, 443),
+    })
+
+
+@pytest.mark.skipif(TRUSTED_PROXY_HOPS < 1, reason="No trusted proxy configured")
+class TestLoginRateLimitSpoofing:
+    """Test per-IP login limiting with a rotating X-Forwarded-For header"""
+
+    def test_client_ip_ignores_spoofed_entry(self):
+        """Test that the leftmost (client-written) entry is not used"""
+        assert client_ip(make_request("1.2.3.4")) == "203.0.113.50"
+        assert client_ip(make_request("5.6.7.8")) == "203.0.113.50"
+        print("✓ client_ip returns the address seen by the trusted proxy")
+
+    def test_rotating_forwarded_for_is_blocked(self):
+        """Test that new X-Forwarded-For values per attempt do not reset the IP limit"""
+        real_ip = f"198.51.100.{uuid.uuid4().int % 250 + 1}"
+        login_attempts.pop(f"ip:{real_ip}", None)
+
+        for i in range(MAX_LOGIN_ATTEMPTS):
+            request = make_request(f"192.0.2.{i + 1}", real_ip)
+            # Different username each time so only the IP limit applies
+            username = f"test_{uuid.uuid4().hex[:8]}"
+            check_rate_limit(request, username)
+            record_failed_attempt(request, username)
+
+        with pytest.raises(HTTPException) as exc:
+            check_rate_limit(make_request("192.0.2.200", real_ip), f"test_{uuid.uuid4().hex[:8]}")
+        assert exc.value.status_code == 429
+        print(f"✓ Blocked after {MAX_LOGIN_ATTEMPTS} attempts despite rotating X-Forwarded-For")
+
+        login_attempts.pop(f"ip:{real_ip}", None)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -113,6 +113,36 @@ class TestPwaIconEndpoints:
         assert data.get("dir") == "rtl"
         print("Manifest has correct RTL/Arabic support")
 
+    def test_pwa_icon_has_strong_etag_and_cache_control(self):
+        """Test that pre-rendered icons are served with a strong ETag and long caching"""
+        response = requests.get(f"{BASE_URL}/api/company-settings/pwa-icon/192?v=test")
+
+        assert response.status_code == 200
+        etag = response.headers.get("etag")
+        assert etag and not etag.startswith("W/"), "ETag should be strong"
+        assert "max-age=31536000" in response.headers.get("cache-control", "")
+        print(f"ETag: {etag}")
+
+    def test_pwa_icon_if_none_match_returns_304(self):
+        """Test that a matching If-None-Match returns 304 without a body"""
+        first = requests.get(f"{BASE_URL}/api/company-settings/pwa-icon/512")
+        assert first.status_code == 200
+
+        response = requests.get(
+            f"{BASE_URL}/api/company-settings/pwa-icon/512",
+            headers={"If-None-Match": first.headers["etag"]}
+        )
+
+        assert response.status_code == 304
+        assert len(response.content) == 0
+        print("Conditional request correctly returned 304")
+
+    def test_unknown_branding_asset_returns_404(self):
+        """Test that only public branding assets are served"""
+        response = requests.get(f"{BASE_URL}/api/company-settings/assets/not-an-asset")
+
+        assert response.status_code == 404
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
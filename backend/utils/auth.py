@@ -3,6 +3,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
 
 SECRET_KEY = os.environ.get('JWT_SECRET', 'dar-al-code-hr-os-2026-x9k2m')
@@ -19,10 +21,17 @@ TOKEN_EXPIRE_HOURS = {
     "employee": 4    # الموظفين - أقصر مدة
 }
 DEFAULT_TOKEN_EXPIRE = 4  # الافتراضي 4 ساعات
+# أطول مدة توكن - الإلغاءات والجلسات الأقدم منها لم تعد تهم
+MAX_TOKEN_HOURS = max(*TOKEN_EXPIRE_HOURS.values(), DEFAULT_TOKEN_EXPIRE)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# bcrypt يستغرق 100-300ms لكل عملية - يُنفذ في مجموعة خيوط محدودة خارج حلقة الأحداث
+# (bcrypt يحرر الـ GIL، فباقي الطلبات تستمر أثناء الحساب)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "4"))
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -32,13 +41,26 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+async def hash_password_async(password: str) -> str:
+    """hash_password بدون حجب حلقة الأحداث - للاستخدام داخل المسارات"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """verify_password بدون حجب حلقة الأحداث - للاستخدام داخل المسارات"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain, hashed)
+
+
 def create_access_token(data: dict, role: str = "employee") -> str:
     """إنشاء توكن مع مدة صلاحية حسب الدور"""
     to_encode = data.copy()
     expire_hours = TOKEN_EXPIRE_HOURS.get(role, DEFAULT_TOKEN_EXPIRE)
     to_encode["exp"] = datetime.now(timezone.utc) + timedelta(hours=expire_hours)
     to_encode["iat"] = datetime.now(timezone.utc)  # وقت الإصدار
-    to_encode["jti"] = os.urandom(16).hex()  # معرف فريد للتوكن
+    # معرف فريد للتوكن - تسجيل الدخول يمرر token_id الجلسة حتى يمكن إبطاله لاحقاً
+    to_encode.setdefault("jti", os.urandom(16).hex())
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -47,20 +69,22 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         
+        # التحقق من الجلسة والحساب من الذاكرة (services/session_cache.py)
+        from services.session_cache import refresh, check_session
+        await refresh()
+        state = check_session(payload)
+        
         # التحقق من أن الجلسة لم تُبطل
-        from database import db
-        token_id = payload.get("jti")
-        if token_id:
-            revoked = await db.revoked_tokens.find_one({"token_id": token_id})
-            if revoked:
-                raise HTTPException(status_code=401, detail="تم إنهاء هذه الجلسة")
+        if state == "revoked":
+            raise HTTPException(status_code=401, detail="تم إنهاء هذه الجلسة")
+        
+        # التحقق من أن المستخدم لم يُحظر أو يُعطل
+        if state == "blocked":
+            raise HTTPException(status_code=401, detail="الحساب معطل أو محظور")
         
-        # التحقق من أن المستخدم لم يُحظر
-        user_id = payload.get("user_id")
-        if user_id:
-            user = await db.users.find_one({"id": user_id}, {"is_blocked": 1, "is_active": 1})
-            if user and (user.get("is_blocked") or not user.get("is_active", True)):
-                raise HTTPException(status_code=401, detail="الحساب معطل أو محظور")
+        # دور المستخدم لسجل الطلبات البطيئة (services/request_metrics.py)
+        from services.request_metrics import note_user
+        note_user(payload)
         
         return payload
     except JWTError:
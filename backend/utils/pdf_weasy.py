@@ -8,14 +8,35 @@ import uuid
 import base64
 import io
 import os
+import threading
+import time
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
 import qrcode
 from PIL import Image
 
 # Fonts directory
 FONTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fonts')
 
+# Templates directory (HTML + CSS)
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'pdf')
+
+# القوالب تُترجم مرة واحدة وتبقى في ذاكرة البيئة (auto_reload معطل)
+_jinja_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+)
+
+# FontConfiguration و CSS مشتركة بين كل عمليات التوليد
+_font_config = None
+_stylesheet = None
+_assets_lock = threading.Lock()
+_render_lock = threading.Lock()
+
 
 def format_saudi_time(ts):
     """Format timestamp to Saudi Arabia time (UTC+3)"""
@@ -56,8 +77,9 @@ def format_date_only(date_str):
         return str(date_str)
 
 
+@lru_cache(maxsize=512)
 def generate_qr_base64(data: str, size: int = 100) -> str:
-    """Generate QR code as base64 image"""
+    """Generate QR code as base64 image (cached - same data always yields the same image)"""
     qr = qrcode.QRCode(version=1, box_size=4, border=1)
     qr.add_data(data)
     qr.make(fit=True)
@@ -136,13 +158,28 @@ def get_labels(lang: str) -> dict:
         }
 
 
-def generate_transaction_pdf(transaction: dict, employee: dict = None, lang: str = 'ar', branding: dict = None) -> tuple:
+def get_render_assets():
     """
-    Generate professional PDF using WeasyPrint with proper Arabic support
+    Shared WeasyPrint assets: (FontConfiguration, CSS)
     
-    Returns: (pdf_bytes, pdf_hash, integrity_id)
+    The stylesheet is parsed and the @font-face rules loaded once per process,
+    then reused by every render instead of being rebuilt per document.
     """
-    
+    global _font_config, _stylesheet
+    if _stylesheet is None:
+        with _assets_lock:
+            if _stylesheet is None:
+                font_config = FontConfiguration()
+                _stylesheet = CSS(
+                    filename=os.path.join(TEMPLATES_DIR, 'transaction.css'),
+                    font_config=font_config,
+                )
+                _font_config = font_config
+    return _font_config, _stylesheet
+
+
+def build_transaction_context(transaction: dict, employee: dict = None, lang: str = 'ar', branding: dict = None) -> dict:
+    """Prepare the template context for a transaction document"""
     labels = get_labels(lang)
     
     # Extract data
@@ -171,10 +208,6 @@ def generate_transaction_pdf(transaction: dict, employee: dict = None, lang: str
     content_hash = hashlib.sha256(f"{ref_no}{created_at}{emp_name}".encode()).hexdigest()[:8].upper()
     integrity_id = f"{ref_no[-6:]}-{content_hash}"
     
-    # Generate QR codes
-    main_qr = generate_qr_base64(f"VERIFY:{integrity_id}", 80)
-    stas_qr = generate_qr_base64(f"STAS-EXEC:{ref_no}", 60)
-    
     # Type labels
     type_labels = {
         'leave_request': 'طلب إجازة' if lang == 'ar' else 'Leave Request',
@@ -182,18 +215,15 @@ def generate_transaction_pdf(transaction: dict, employee: dict = None, lang: str
         'settlement': 'تسوية' if lang == 'ar' else 'Settlement',
         'contract': 'عقد' if lang == 'ar' else 'Contract',
     }
-    type_label = type_labels.get(tx_type, tx_type)
     
     # Build data rows
-    data_rows_html = ""
+    data_rows = []
     skip_fields = {'employee_name_ar', 'balance_before', 'balance_after', 'adjusted_end_date', 'sick_tier_info', 'leave_type_ar', 'medical_file_url'}
     
     for key, value in tx_data.items():
         if key in skip_fields or isinstance(value, (dict, list)) or value is None:
             continue
         
-        field_label = labels.get(key, key.replace('_', ' ').title())
-        
         # Format value
         if key == 'leave_type':
             formatted_val = tx_data.get('leave_type_ar', '') if lang == 'ar' else labels.get(str(value), str(value))
@@ -208,536 +238,91 @@ def generate_transaction_pdf(transaction: dict, employee: dict = None, lang: str
         else:
             formatted_val = str(value)
         
-        data_rows_html += f"""
-        <tr>
-            <td class="label">{field_label}</td>
-            <td class="value">{formatted_val}</td>
-        </tr>
-        """
+        data_rows.append({
+            'label': labels.get(key, key.replace('_', ' ').title()),
+            'value': formatted_val,
+        })
     
     # Build approval chain
-    approval_html = ""
+    approvals = []
     for entry in approval_chain:
         stage = entry.get('stage', '')
-        stage_label = labels.get(stage, stage)
         entry_status = entry.get('status', 'pending')
-        status_label = labels.get(entry_status, entry_status)
-        approver = entry.get('approver_name', '-')
-        timestamp = format_saudi_time(entry.get('timestamp'))
-        
-        # Status color
-        status_class = 'status-approved' if entry_status == 'approved' else 'status-executed' if entry_status == 'executed' else 'status-pending'
-        
-        # QR for each approval
-        approval_qr = generate_qr_base64(f"{stage.upper()}-{ref_no[-4:]}", 40)
-        
-        approval_html += f"""
-        <tr>
-            <td>{stage_label}</td>
-            <td class="{status_class}">{status_label}</td>
-            <td>{approver}</td>
-            <td>{timestamp}</td>
-            <td><img src="data:image/png;base64,{approval_qr}" class="qr-small" alt="QR"></td>
-        </tr>
-        """
+        approvals.append({
+            'stage_label': labels.get(stage, stage),
+            'status_label': labels.get(entry_status, entry_status),
+            'status_class': 'status-approved' if entry_status == 'approved' else 'status-executed' if entry_status == 'executed' else 'status-pending',
+            'approver': entry.get('approver_name', '-'),
+            'timestamp': format_saudi_time(entry.get('timestamp')),
+            'qr': generate_qr_base64(f"{stage.upper()}-{ref_no[-4:]}", 40),
+        })
     
     # Employee deduction consent section (for sick leave > 30 days)
-    consent_html = ""
+    consent = None
     if tx_type == 'leave_request' and tx_data.get('leave_type') == 'sick':
         sick_tier_info = tx_data.get('sick_tier_info', {})
         if isinstance(sick_tier_info, dict):
-            tier_distribution = sick_tier_info.get('distribution', [])
-            has_deduction = any(t.get('salary_percent', 100) < 100 for t in tier_distribution if isinstance(t, dict))
-            
-            if has_deduction:
-                emp_first_name = emp_name.split()[0] if emp_name else 'الموظف' if lang == 'ar' else 'Employee'
-                consent_qr = generate_qr_base64(f"CONSENT-{emp_no or 'EMP'}-{ref_no[-6:]}", 80)
-                
-                deduction_details = ""
-                for tier in tier_distribution:
-                    if isinstance(tier, dict) and tier.get('salary_percent', 100) < 100:
-                        days = tier.get('days', 0)
-                        percent = tier.get('salary_percent', 0)
-                        if lang == 'ar':
-                            deduction_details += f"<li>{days} يوم بنسبة خصم {100-percent}%</li>"
-                        else:
-                            deduction_details += f"<li>{days} days at {100-percent}% deduction</li>"
-                
-                if lang == 'ar':
-                    consent_html = f"""
-                    <div class="consent-section">
-                        <h3>موافقة الموظف على الخصم - المادة 117</h3>
-                        <p>عزيزي {emp_first_name}،</p>
-                        <p>بناءً على المادة 117 من نظام العمل السعودي، سيتم تطبيق الخصم التالي:</p>
-                        <ul>{deduction_details}</ul>
-                        <p class="consent-text">بتوقيعي أدناه، أوافق على تطبيق الخصم المذكور أعلاه.</p>
-                        <div class="consent-signature">
-                            <p>توقيع الموظف</p>
-                            <img src="data:image/png;base64,{consent_qr}" class="qr-consent" alt="Employee Consent">
-                        </div>
-                    </div>
-                    """
-                else:
-                    consent_html = f"""
-                    <div class="consent-section">
-                        <h3>Employee Deduction Consent - Article 117</h3>
-                        <p>Dear {emp_first_name},</p>
-                        <p>According to Article 117 of Saudi Labor Law, the following deduction will apply:</p>
-                        <ul>{deduction_details}</ul>
-                        <p class="consent-text">By signing below, I agree to the above deduction.</p>
-                        <div class="consent-signature">
-                            <p>Employee Signature</p>
-                            <img src="data:image/png;base64,{consent_qr}" class="qr-consent" alt="Employee Consent">
-                        </div>
-                    </div>
-                    """
+            deductions = [
+                {'days': t.get('days', 0), 'deduction_percent': 100 - t.get('salary_percent', 0)}
+                for t in sick_tier_info.get('distribution', [])
+                if isinstance(t, dict) and t.get('salary_percent', 100) < 100
+            ]
+            if deductions:
+                consent = {
+                    'first_name': emp_name.split()[0] if emp_name else 'الموظف' if lang == 'ar' else 'Employee',
+                    'deductions': deductions,
+                    'qr': generate_qr_base64(f"CONSENT-{emp_no or 'EMP'}-{ref_no[-6:]}", 80),
+                }
+    
+    return {
+        'lang': lang,
+        'direction': 'rtl' if lang == 'ar' else 'ltr',
+        'labels': labels,
+        'company_name': company_name,
+        'slogan': slogan,
+        'ref_no': ref_no,
+        'status': status,
+        'type_label': type_labels.get(tx_type, tx_type),
+        'created_at': created_at,
+        'executed_at': executed_at,
+        'emp_name': emp_name,
+        'emp_no': emp_no,
+        'data_rows': data_rows,
+        'approvals': approvals,
+        'consent': consent,
+        'main_qr': generate_qr_base64(f"VERIFY:{integrity_id}", 80),
+        'stas_qr': generate_qr_base64(f"STAS-EXEC:{ref_no}", 60),
+        'integrity_id': integrity_id,
+        'content_hash': content_hash,
+    }
+
+
+def render_transaction_html(transaction: dict, employee: dict = None, lang: str = 'ar', branding: dict = None) -> tuple:
+    """
+    Render the transaction document HTML from the precompiled template
     
-    # Direction
-    direction = 'rtl' if lang == 'ar' else 'ltr'
-    text_align = 'right' if lang == 'ar' else 'left'
+    Returns: (html, integrity_id)
+    """
+    context = build_transaction_context(transaction, employee, lang, branding)
+    html = _jinja_env.get_template('transaction.html').render(context)
+    return html, context['integrity_id']
+
+
+def generate_transaction_pdf(transaction: dict, employee: dict = None, lang: str = 'ar', branding: dict = None) -> tuple:
+    """
+    Generate professional PDF using WeasyPrint with proper Arabic support
     
-    # Build HTML
-    html_content = f"""
-    <!DOCTYPE html>
-    <html dir="{direction}" lang="{lang}">
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            @font-face {{
-                font-family: 'NotoNaskh';
-                src: url('file://{FONTS_DIR}/NotoNaskhArabic-Regular.ttf');
-            }}
-            @font-face {{
-                font-family: 'NotoNaskh';
-                src: url('file://{FONTS_DIR}/NotoNaskhArabic-Bold.ttf');
-                font-weight: bold;
-            }}
-            
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            
-            body {{
-                font-family: 'NotoNaskh', 'Arial', sans-serif;
-                font-size: 10pt;
-                line-height: 1.4;
-                color: #333;
-                direction: {direction};
-                text-align: {text_align};
-            }}
-            
-            .page {{
-                width: 210mm;
-                min-height: 297mm;
-                padding: 15mm;
-                background: white;
-            }}
-            
-            /* Header */
-            .header {{
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                border-bottom: 2px solid #1a365d;
-                padding-bottom: 10px;
-                margin-bottom: 15px;
-            }}
-            
-            .company-info {{
-                text-align: {text_align};
-            }}
-            
-            .company-name {{
-                font-size: 16pt;
-                font-weight: bold;
-                color: #1a365d;
-            }}
-            
-            .slogan {{
-                font-size: 9pt;
-                color: #666;
-            }}
-            
-            .qr-header {{
-                width: 60px;
-                height: 60px;
-            }}
-            
-            /* Title */
-            .title {{
-                text-align: center;
-                margin: 15px 0;
-            }}
-            
-            .title h1 {{
-                font-size: 14pt;
-                color: #1a365d;
-                margin-bottom: 5px;
-            }}
-            
-            .ref-no {{
-                font-size: 11pt;
-                color: #666;
-            }}
-            
-            /* Employee Info */
-            .employee-section {{
-                background: #f7fafc;
-                border: 1px solid #e2e8f0;
-                border-radius: 5px;
-                padding: 10px;
-                margin-bottom: 15px;
-            }}
-            
-            .employee-section table {{
-                width: 100%;
-            }}
-            
-            .employee-section td {{
-                padding: 5px;
-            }}
-            
-            .employee-section .label {{
-                color: #666;
-                width: 100px;
-            }}
-            
-            /* Data Table */
-            .data-section {{
-                margin-bottom: 15px;
-            }}
-            
-            .data-section h3 {{
-                font-size: 11pt;
-                color: #1a365d;
-                margin-bottom: 8px;
-                border-bottom: 1px solid #e2e8f0;
-                padding-bottom: 5px;
-            }}
-            
-            .data-section table {{
-                width: 100%;
-                border-collapse: collapse;
-            }}
-            
-            .data-section td {{
-                padding: 6px 8px;
-                border-bottom: 1px solid #eee;
-            }}
-            
-            .data-section .label {{
-                color: #666;
-                width: 150px;
-            }}
-            
-            .data-section .value {{
-                font-weight: 500;
-            }}
-            
-            /* Approval Chain */
-            .approval-section {{
-                margin-bottom: 15px;
-            }}
-            
-            .approval-section h3 {{
-                font-size: 11pt;
-                color: #1a365d;
-                margin-bottom: 8px;
-            }}
-            
-            .approval-table {{
-                width: 100%;
-                border-collapse: collapse;
-                font-size: 9pt;
-            }}
-            
-            .approval-table th {{
-                background: #1a365d;
-                color: white;
-                padding: 8px;
-                text-align: {text_align};
-            }}
-            
-            .approval-table td {{
-                padding: 8px;
-                border-bottom: 1px solid #e2e8f0;
-                vertical-align: middle;
-            }}
-            
-            .qr-small {{
-                width: 35px;
-                height: 35px;
-            }}
-            
-            .status-approved {{
-                color: #38a169;
-                font-weight: bold;
-            }}
-            
-            .status-executed {{
-                color: #2b6cb0;
-                font-weight: bold;
-            }}
-            
-            .status-pending {{
-                color: #d69e2e;
-            }}
-            
-            /* Consent Section */
-            .consent-section {{
-                background: #ebf8ff;
-                border: 2px solid #2b6cb0;
-                border-radius: 8px;
-                padding: 15px;
-                margin: 20px 0;
-            }}
-            
-            .consent-section h3 {{
-                color: #2b6cb0;
-                margin-bottom: 10px;
-            }}
-            
-            .consent-section ul {{
-                margin: 10px 20px;
-            }}
-            
-            .consent-text {{
-                font-weight: bold;
-                margin-top: 15px;
-            }}
-            
-            .consent-signature {{
-                text-align: center;
-                margin-top: 15px;
-                padding: 10px;
-                background: white;
-                border-radius: 5px;
-            }}
-            
-            .qr-consent {{
-                width: 70px;
-                height: 70px;
-            }}
-            
-            /* STAS Seal */
-            .stas-seal {{
-                text-align: center;
-                margin: 20px 0;
-                padding: 15px;
-                border: 2px dashed #1a365d;
-                border-radius: 10px;
-            }}
-            
-            .stas-seal h4 {{
-                color: #1a365d;
-                margin-bottom: 10px;
-            }}
-            
-            .qr-stas {{
-                width: 80px;
-                height: 80px;
-            }}
-            
-            /* Footer */
-            .footer {{
-                margin-top: 20px;
-                padding-top: 10px;
-                border-top: 1px solid #e2e8f0;
-                font-size: 8pt;
-                color: #666;
-                text-align: center;
-            }}
-            
-            .footer .integrity {{
-                font-family: monospace;
-                background: #f7fafc;
-                padding: 3px 8px;
-                border-radius: 3px;
-            }}
-            
-            /* Tear-off Section - قسم القص */
-            .tear-off {{
-                margin-top: 30px;
-                padding-top: 20px;
-            }}
-            
-            .tear-line {{
-                border-top: 2px dashed #999;
-                text-align: center;
-                margin-bottom: 15px;
-                position: relative;
-            }}
-            
-            .tear-line span {{
-                background: white;
-                padding: 0 15px;
-                color: #666;
-                font-size: 10pt;
-                position: relative;
-                top: -12px;
-            }}
-            
-            .tear-content {{
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                padding: 15px;
-                background: #f8fafc;
-                border: 1px solid #e2e8f0;
-                border-radius: 8px;
-            }}
-            
-            .tear-qr-left, .tear-qr-right {{
-                text-align: center;
-            }}
-            
-            .qr-tear {{
-                width: 70px;
-                height: 70px;
-            }}
-            
-            .tear-label {{
-                font-size: 8pt;
-                color: #666;
-                margin-top: 5px;
-            }}
-            
-            .tear-info {{
-                text-align: center;
-                flex: 1;
-                padding: 0 20px;
-            }}
-            
-            .tear-ref {{
-                font-size: 16pt;
-                font-weight: bold;
-                color: #1a365d;
-                font-family: monospace;
-            }}
-            
-            .tear-emp {{
-                font-size: 11pt;
-                margin: 5px 0;
-            }}
-            
-            .tear-type {{
-                font-size: 9pt;
-                color: #666;
-            }}
-            
-            .tear-status {{
-                font-size: 11pt;
-                font-weight: bold;
-                margin-top: 5px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="page">
-            <!-- Header -->
-            <div class="header">
-                <div class="company-info">
-                    <div class="company-name">{company_name}</div>
-                    <div class="slogan">{slogan}</div>
-                </div>
-                <img src="data:image/png;base64,{main_qr}" class="qr-header" alt="Verify QR">
-            </div>
-            
-            <!-- Title -->
-            <div class="title">
-                <h1>{type_label}</h1>
-                <div class="ref-no">{ref_no}</div>
-            </div>
-            
-            <!-- Employee Info -->
-            <div class="employee-section">
-                <table>
-                    <tr>
-                        <td class="label">{'اسم الموظف' if lang == 'ar' else 'Employee Name'}</td>
-                        <td><strong>{emp_name}</strong></td>
-                        <td class="label">{'رقم الموظف' if lang == 'ar' else 'Employee No.'}</td>
-                        <td><strong>{emp_no}</strong></td>
-                    </tr>
-                </table>
-            </div>
-            
-            <!-- Request Data -->
-            <div class="data-section">
-                <h3>{'تفاصيل الطلب' if lang == 'ar' else 'Request Details'}</h3>
-                <table>
-                    {data_rows_html}
-                </table>
-            </div>
-            
-            <!-- Approval Chain -->
-            <div class="approval-section">
-                <h3>{'سلسلة الموافقات' if lang == 'ar' else 'Approval Chain'}</h3>
-                <table class="approval-table">
-                    <thead>
-                        <tr>
-                            <th>{labels['stage']}</th>
-                            <th>{labels['status']}</th>
-                            <th>{labels['approver']}</th>
-                            <th>{labels['time']}</th>
-                            <th>{labels['signature']}</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {approval_html}
-                    </tbody>
-                </table>
-            </div>
-            
-            {consent_html}
-            
-            <!-- STAS Execution Seal -->
-            <div class="stas-seal">
-                <h4>{'ختم التنفيذ - STAS' if lang == 'ar' else 'Execution Seal - STAS'}</h4>
-                <img src="data:image/png;base64,{stas_qr}" class="qr-stas" alt="STAS Seal">
-                <p>{executed_at if status == 'executed' else '-'}</p>
-            </div>
-            
-            <!-- Footer with Tear-off Section -->
-            <div class="footer">
-                <p>{'تم الإنشاء' if lang == 'ar' else 'Generated'}: {created_at}</p>
-                <p class="integrity">{integrity_id}</p>
-                <p>DAR AL CODE HR OS | {content_hash}</p>
-            </div>
-            
-            <!-- Tear-off Section - قسم القص -->
-            <div class="tear-off">
-                <div class="tear-line">
-                    <span>{'✂️ قص هنا' if lang == 'ar' else '✂️ Cut Here'}</span>
-                </div>
-                <div class="tear-content">
-                    <div class="tear-qr-left">
-                        <img src="data:image/png;base64,{main_qr}" class="qr-tear" alt="QR1">
-                        <p class="tear-label">{'QR التحقق' if lang == 'ar' else 'Verify QR'}</p>
-                    </div>
-                    <div class="tear-info">
-                        <p class="tear-ref">{ref_no}</p>
-                        <p class="tear-emp">{emp_name}</p>
-                        <p class="tear-type">{type_label}</p>
-                        <p class="tear-status" style="color: {'#22c55e' if status == 'executed' else '#f59e0b'}">
-                            {'منفذ' if status == 'executed' and lang == 'ar' else 'Executed' if status == 'executed' else 'معلق' if lang == 'ar' else 'Pending'}
-                        </p>
-                    </div>
-                    <div class="tear-qr-right">
-                        <img src="data:image/png;base64,{stas_qr}" class="qr-tear" alt="QR2">
-                        <p class="tear-label">{'QR المعاملة' if lang == 'ar' else 'Transaction QR'}</p>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
+    Returns: (pdf_bytes, pdf_hash, integrity_id)
     """
+    html_content, integrity_id = render_transaction_html(transaction, employee, lang, branding)
+    font_config, stylesheet = get_render_assets()
     
-    # Generate PDF
-    html = HTML(string=html_content)
-    pdf_bytes = html.write_pdf()
+    # Generate PDF - FontConfiguration غير آمن بين الخيوط، لذلك التوليد متسلسل
+    with _render_lock:
+        pdf_bytes = HTML(string=html_content, base_url=TEMPLATES_DIR).write_pdf(
+            stylesheets=[stylesheet],
+            font_config=font_config,
+        )
     
     # Calculate hash
     pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
@@ -745,7 +330,31 @@ def generate_transaction_pdf(transaction: dict, employee: dict = None, lang: str
     return pdf_bytes, pdf_hash, integrity_id
 
 
-# Test function
+def benchmark_pdf_renderers(transaction: dict, employee: dict = None, iterations: int = 20) -> dict:
+    """
+    Compare the WeasyPrint template path against the reportlab generator used by
+    the transactions routes. Returns average milliseconds per document.
+    """
+    from utils.professional_pdf import generate_professional_transaction_pdf
+    
+    def _avg_ms(fn):
+        fn()  # warm-up: fonts, templates and stylesheet are loaded once
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return round((time.perf_counter() - start) * 1000 / iterations, 2)
+    
+    results = {
+        'iterations': iterations,
+        'weasyprint_ar_ms': _avg_ms(lambda: generate_transaction_pdf(transaction, employee, lang='ar')),
+        'weasyprint_en_ms': _avg_ms(lambda: generate_transaction_pdf(transaction, employee, lang='en')),
+        'reportlab_ms': _avg_ms(lambda: generate_professional_transaction_pdf(transaction, employee)),
+    }
+    results['weasyprint_vs_reportlab'] = round(results['weasyprint_ar_ms'] / results['reportlab_ms'], 2) if results['reportlab_ms'] else None
+    return results
+
+
+# Test function - run from backend/: python -m utils.pdf_weasy
 if __name__ == "__main__":
     test_tx = {
         "id": "test-123",
@@ -794,3 +403,6 @@ if __name__ == "__main__":
     with open('/tmp/test_weasy_en.pdf', 'wb') as f:
         f.write(pdf_bytes_en)
     print(f"✓ English PDF: /tmp/test_weasy_en.pdf ({len(pdf_bytes_en)} bytes)")
+    
+    bench = benchmark_pdf_renderers(test_tx, test_emp)
+    print(f"✓ Benchmark ({bench['iterations']} docs): WeasyPrint ar={bench['weasyprint_ar_ms']}ms, en={bench['weasyprint_en_ms']}ms, reportlab={bench['reportlab_ms']}ms (ratio {bench['weasyprint_vs_reportlab']}x)")
@@ -243,8 +243,8 @@ export default function SystemMaintenancePage() {
   const handleFileSelect = (e) => {
     const file = e.target.files?.[0];
     if (file) {
-      if (!file.name.endsWith('.json')) {
-        toast.error('يجب اختيار ملف JSON');
+      if (!['.json', '.ndjson', '.ndjson.gz', '.jsonl', '.jsonl.gz'].some(ext => file.name.endsWith(ext))) {
+        toast.error('يجب اختيار ملف JSON أو NDJSON');
         return;
       }
       setUploadFile(file);
@@ -957,7 +957,7 @@ export default function SystemMaintenancePage() {
                 <input
                   ref={fileInputRef}
                   type="file"
-                  accept=".json"
+                  accept=".json,.ndjson,.jsonl,.gz"
                   onChange={handleFileSelect}
                   className="hidden"
                   data-testid="file-input"